@@ -0,0 +1,376 @@
+"""
+自动回复器压测脚本
+
+按脚本化的对话驱动 AiAutoReplier（main.py 或 feature/main_offline_model.py），
+统计吞吐量、端到端延迟、CPU 和内存占用，结果保存为 JSON，便于在不同提交之间对比。
+
+微信和 AI 窗口都运行在虚拟桌面（feature/virtual_desktop.py）或模拟的 wxauto
+（feature/fake_wxauto.py）上，模型替换为延迟可配置的 StubModel，不需要显示器、Windows 或 ollama。
+
+每条脚本消息带一个编号（如 "#12"），StubModel 在回复中列出提问里出现的全部编号，
+据此计算每条消息从到达到收到回复的时间。合并回复的多条消息各自计算延迟，
+没有收到回复的消息（被过滤、被去重、复制不到文本等）计入 unanswered。
+
+使用示例:
+    python benchmark.py --flavour main --scenario steady
+    python benchmark.py --flavour offline --scenario group --backend wxauto --latency 0.5
+    python benchmark.py --compare benchmark_results/a.json benchmark_results/b.json
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计内存峰值
+    resource = None
+
+# 与 settings.json 保持一致的坐标；压测不读取 settings.json，保证每次运行的配置相同
+BASE_SETTINGS = {
+    "backend": "screen",
+    "virtual_desktop": True,
+    "wx_send_coordinate": [680, 823],
+    "wx_reply_coordinate": [736, 731],
+    "wx_reply_window": [[666, 500], [850, 753]],
+    "ai_reply_coordinate": [114, 848],
+    "ai_send_coordinate": [100, 929],
+    "ai_reply_window": [[58, 461], [282, 808]],
+    "wxauto.fake": True,
+    "wxauto.contact": "压测群",
+    "message_filter": {"require_mention": False},
+    "model.ai_system_prompt": "",
+    "model.message_memory_rounds": 10,
+    "control.enabled": False,
+}
+
+# 内置场景，命令行参数可以覆盖其中任意一项
+SCENARIOS = {
+    # 单个联系人，平稳地每 5 秒左右来一条消息
+    "steady": {"rate": 0.2, "burst": 1, "media_ratio": 0.0, "contacts": 1, "duration": 60},
+    # 每 10 秒左右连续来 5 条消息
+    "burst": {"rate": 0.1, "burst": 5, "media_ratio": 0.0, "contacts": 1, "duration": 60},
+    # 三成是图片、表情等非文本消息
+    "media": {"rate": 0.2, "burst": 1, "media_ratio": 0.3, "contacts": 1, "duration": 60},
+    # 群聊中 5 个人同时发言
+    "group": {"rate": 0.5, "burst": 2, "media_ratio": 0.1, "contacts": 5, "duration": 60},
+}
+
+TOKEN_PATTERN = re.compile(r"#(\d+)")
+
+
+class StubModel:
+    """
+    替代本地模型和 AI 网页的桩模型
+
+    属性:
+        latency (float): 每次生成的平均耗时（秒）
+        jitter (float): 耗时的随机浮动范围（秒）
+        calls (int): 调用次数
+    """
+
+    def __init__(self, latency=1.0, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def delay(self):
+        """本次生成的耗时"""
+        return max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def reply(self, content):
+        """回复中列出提问里的全部消息编号"""
+        self.calls += 1
+        tokens = TOKEN_PATTERN.findall(content)
+        return "收到 " + " ".join(f"#{token}" for token in tokens) if tokens else "收到"
+
+    def chat(self, messages, params=None):
+        """与 model.inference.chat 同签名"""
+        time.sleep(self.delay())
+        return self.reply(messages[-1]["content"])
+
+
+def build_script(scenario, seed=0):
+    """
+    生成对话脚本
+
+    到达间隔服从指数分布（泊松到达），每次到达连续发 burst 条消息，间隔 0.2 秒。
+
+    返回:
+        list[dict]: 按时间排序的消息，字段 at（相对开始的秒数）/ sender / content / media / token
+    """
+    rng = random.Random(seed)
+    script = []
+    at = 0.0
+    token = 0
+    while True:
+        at += rng.expovariate(scenario["rate"])
+        if at >= scenario["duration"]:
+            break
+        for i in range(scenario["burst"]):
+            token += 1
+            media = rng.random() < scenario["media_ratio"]
+            script.append({
+                "at": at + 0.2 * i,
+                "sender": f"用户{rng.randrange(scenario['contacts']) + 1}",
+                "content": "[图片]" if media else f"消息 #{token}",
+                "media": media,
+                "token": None if media else str(token),
+            })
+    return sorted(script, key=lambda item: item["at"])
+
+
+def percentile(values, p):
+    """最近秩法计算百分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def max_rss_kb():
+    """进程内存峰值（KB），无法统计时返回 None"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def git_commit():
+    """当前提交，便于对比不同提交的结果"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+class Benchmark:
+    """
+    一次压测
+
+    属性:
+        flavour (str): "main"（AI 网页窗口）或 "offline"（本地模型）
+        scenario (dict): 场景参数
+        settings (dict): 传给回复器的配置
+        model (StubModel): 桩模型
+        script (list[dict]): 对话脚本
+        sent_at (dict): 消息编号 -> 到达时间
+        replies (list): [(收到时间, 回复内容), ...]
+    """
+
+    def __init__(self, flavour, scenario, settings, model, seed=0):
+        self.flavour = flavour
+        self.scenario = scenario
+        self.settings = settings
+        self.model = model
+        self.script = build_script(scenario, seed)
+        self.sent_at = {}
+        self.replies = []
+        self.replier = None
+        self.inject = None
+        self.outbox = None
+
+    def setup(self):
+        """创建回复器，把微信一侧的收发接到脚本上"""
+        from chat_core.message_backend import create_desktop
+
+        desktop = create_desktop(self.settings)
+        if desktop is not None:
+            desktop.windows["AI"].responder = self.model.reply
+            desktop.windows["AI"].reply_delay = self.model.latency
+
+        if self.flavour == "main":
+            import main
+            self.replier = main.AiAutoReplier(desktop=desktop, **self.settings)
+        elif self.flavour == "offline":
+            import feature.main_offline_model as offline
+            offline.chat = self.model.chat
+            self.replier = offline.AiAutoReplier(desktop=desktop, settings=self.settings)
+        else:
+            raise ValueError(f"未知的回复器: {self.flavour}")
+
+        if self.settings.get("backend", "screen") == "wxauto":
+            wx = self.replier.wx_session.wx
+            group = self.settings["wxauto.contact"]
+            self.inject = lambda item: wx.receive(group, item["content"], sender=item["sender"])
+            self.outbox = lambda: [message for _, message in wx.sent]
+        else:
+            window = desktop.windows["WeChat"]
+            self.inject = lambda item: window.receive(item["content"], media=item["media"])
+            self.outbox = lambda: window.sent
+
+    def stop(self):
+        if self.flavour == "main":
+            self.replier.pipeline.stop()
+        else:
+            self.replier.stopped.set()
+
+    def collect(self, seen):
+        """记录新发出的回复，返回已记录的条数"""
+        outbox = self.outbox()
+        now = time.time()
+        for message in outbox[seen:]:
+            self.replies.append((now, message))
+        return len(outbox)
+
+    def run(self, warmup=2.0, drain=None, poll_interval=0.01):
+        """
+        回放脚本并等待回复
+
+        参数:
+            warmup (float): 回放前等待回复器就绪的时间（秒）
+            drain (float): 脚本结束后最多等待回复的时间（秒），默认为模型耗时的 3 倍加 15 秒
+            poll_interval (float): 检查回复的间隔（秒）
+        """
+        if drain is None:
+            drain = 3 * self.model.latency + 15.0
+        self.setup()
+        time.sleep(warmup)
+
+        cpu_start = time.process_time()
+        start = time.time()
+        seen = 0
+        pending = list(self.script)
+        expected = {item["token"] for item in self.script if item["token"]}
+        while pending:
+            now = time.time()
+            while pending and start + pending[0]["at"] <= now:
+                item = pending.pop(0)
+                if item["token"]:
+                    self.sent_at[item["token"]] = now
+                self.inject(item)
+            seen = self.collect(seen)
+            time.sleep(poll_interval)
+
+        deadline = time.time() + drain
+        while time.time() < deadline and not expected <= self.answered().keys():
+            seen = self.collect(seen)
+            time.sleep(poll_interval)
+        seen = self.collect(seen)
+
+        elapsed = time.time() - start
+        cpu = time.process_time() - cpu_start
+        self.stop()
+        return self.report(elapsed, cpu)
+
+    def answered(self):
+        """已收到回复的消息编号 -> 首次收到回复的时间"""
+        answered = {}
+        for received_at, message in self.replies:
+            for token in TOKEN_PATTERN.findall(message):
+                answered.setdefault(token, received_at)
+        return answered
+
+    def report(self, elapsed, cpu):
+        answered = self.answered()
+        latencies = [round(answered[token] - sent, 3) for token, sent in self.sent_at.items() if token in answered]
+        media = sum(1 for item in self.script if item["media"])
+        return {
+            "flavour": self.flavour,
+            "backend": self.settings.get("backend", "screen"),
+            "scenario": self.scenario,
+            "model": {"latency": self.model.latency, "jitter": self.model.jitter, "calls": self.model.calls},
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "duration": round(elapsed, 3),
+            "messages": len(self.script),
+            "media_messages": media,
+            "replies": len(self.replies),
+            "answered": len(latencies),
+            "unanswered": len(self.sent_at) - len(latencies),
+            "replies_per_sec": round(len(self.replies) / elapsed, 4) if elapsed > 0 else 0.0,
+            "latency": {
+                "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "max": max(latencies) if latencies else None,
+            },
+            "cpu_seconds": round(cpu, 3),
+            "cpu_percent": round(100 * cpu / elapsed, 2) if elapsed > 0 else 0.0,
+            "max_rss_kb": max_rss_kb(),
+        }
+
+
+def compare(old_path, new_path):
+    """打印两次压测结果的主要指标对比"""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    rows = [
+        ("replies_per_sec", old["replies_per_sec"], new["replies_per_sec"]),
+        ("latency.p50", old["latency"]["p50"], new["latency"]["p50"]),
+        ("latency.p99", old["latency"]["p99"], new["latency"]["p99"]),
+        ("unanswered", old["unanswered"], new["unanswered"]),
+        ("cpu_percent", old["cpu_percent"], new["cpu_percent"]),
+        ("max_rss_kb", old["max_rss_kb"], new["max_rss_kb"]),
+    ]
+    print(f"{'指标':<16}{old.get('commit') or old_path:>14}{new.get('commit') or new_path:>14}")
+    for name, before, after in rows:
+        fmt = lambda value: "-" if value is None else f"{value:.3f}" if isinstance(value, float) else str(value)
+        print(f"{name:<16}{fmt(before):>14}{fmt(after):>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="自动回复器压测")
+    parser.add_argument("--flavour", choices=["main", "offline"], default="main")
+    parser.add_argument("--backend", choices=["screen", "wxauto"], default="screen")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="steady")
+    parser.add_argument("--rate", type=float, help="每秒到达次数")
+    parser.add_argument("--burst", type=int, help="每次到达连续发送的消息数")
+    parser.add_argument("--media-ratio", type=float, help="非文本消息的比例")
+    parser.add_argument("--contacts", type=int, help="同时发言的人数（wxauto 后端为群成员）")
+    parser.add_argument("--duration", type=float, help="脚本时长（秒）")
+    parser.add_argument("--latency", type=float, default=1.0, help="模型生成耗时（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="模型耗时随机浮动（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--settings", help="覆盖默认配置的 JSON 文件")
+    parser.add_argument("--output", help="结果文件，默认保存到 benchmark_results/")
+    parser.add_argument("--verbose", action="store_true", help="显示回复器日志")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="对比两次压测结果")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    scenario = dict(SCENARIOS[args.scenario], name=args.scenario)
+    for key in ("rate", "burst", "media_ratio", "contacts", "duration"):
+        if getattr(args, key) is not None:
+            scenario[key] = getattr(args, key)
+
+    settings = dict(BASE_SETTINGS, backend=args.backend)
+    if args.settings:
+        with open(args.settings, "r", encoding="utf-8") as f:
+            settings.update(json.load(f))
+
+    benchmark = Benchmark(args.flavour, scenario, settings, StubModel(args.latency, args.jitter, args.seed), args.seed)
+    # 回复器每一步都会打印日志，压测时默认不输出到终端
+    with open(os.devnull, "w") as devnull:
+        with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull):
+            result = benchmark.run()
+
+    output = args.output or os.path.join(
+        "benchmark_results",
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{args.flavour}-{args.backend}-{args.scenario}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"结果已保存到 {output}")
+
+
+if __name__ == "__main__":
+    main()
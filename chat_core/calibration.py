@@ -0,0 +1,378 @@
+"""
+截图区域和点击坐标的自动标定
+
+settings.json 中的 wx_reply_window、wx_reply_coordinate、ai_reply_window、ai_reply_coordinate
+原来要在 TUI 里手工填写。填得太大，每次轮询都要截取和比较多余的像素；点偏了，复制就会落空。
+
+标定时在当前配置的区域外扩 margin 像素录制画面，期间发来几条测试消息（AI 窗口可以自动发送一个测试问题），
+逐帧比较找出真正发生变化的最小矩形作为新的截图区域，并从变化中找出：
+    - 微信窗口：最新一条对方消息的气泡，点击坐标放在气泡左下角内侧，气泡长短、高矮不同时都能点中
+    - AI 窗口：回答显示完后最后出现的元素（复制按钮），点击坐标放在它的中心；
+      回答从上往下增长，截图区域只收紧左、右、上三边
+结果先打印出来，确认后加 --write 写回 settings.json；程序正在运行时配置热更新会立即换上新坐标。
+写回时同时从最后一帧截下气泡底边和复制按钮保存为模板（templates/ 目录），复制时由 chat_core.locator
+按模板在画面中查找目标，目标移动后也能点中。
+
+使用示例:
+    python -m chat_core.calibration --window wx --seconds 20          # 录制 20 秒，期间用另一个账号发几条长短不同的消息
+    python -m chat_core.calibration --window ai --prompt "你好" --write
+    python -m chat_core.calibration --virtual                         # 在虚拟桌面上演示，自动发送测试消息
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from PIL import ImageChops
+
+import logs
+from chat_core import config
+
+# 像素差超过这个值才算变化；截图是无损的，阈值只用来忽略抗锯齿等细微抖动。
+# 微信的白色气泡和浅灰背景只差 10 左右，阈值不能太大
+DIFF_THRESHOLD = 8
+
+# 相距不超过这么多像素的变化行（列）合并为同一块；行间距取得小，
+# 最后一行字和紧挨在下面的复制按钮在同一帧出现时也能分开
+ROW_GAP = 1
+COLUMN_GAP = 8
+
+
+def runs(flags, gap=0):
+    """
+    把 0/1 序列中连续的 1 合并为区间，间隔不超过 gap 的区间也合并
+
+    返回:
+        list: [(开始, 结束), ...]，结束不包含在内
+    """
+    result = []
+    for index, flag in enumerate(flags):
+        if not flag:
+            continue
+        if result and index - result[-1][1] <= gap:
+            result[-1] = (result[-1][0], index + 1)
+        else:
+            result.append((index, index + 1))
+    return result
+
+
+def threshold_mask(image, threshold=DIFF_THRESHOLD):
+    return image.convert("L").point(lambda value: 255 if value > threshold else 0)
+
+
+def change_mask(before, after, threshold=DIFF_THRESHOLD):
+    """两帧之间变化的像素，变化处为 255"""
+    return threshold_mask(ImageChops.difference(before.convert("RGB"), after.convert("RGB")), threshold)
+
+
+def union(box, other):
+    if box is None:
+        return other
+    return (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+
+
+class FrameRecorder:
+    """
+    逐帧录制一块屏幕区域，记录画面变化的位置
+
+    每次变化只保留最下方一块变化（最新的消息、最后出现的按钮都在最下方）的位置和其中最左边一段
+    （气泡、按钮）的位置，不保存画面本身，录制时间长也不占内存。
+
+    属性:
+        region (tuple): 录制区域 (x, y, 宽, 高)
+        frames (int): 已录制的帧数
+        bbox (tuple): 全部变化的外接矩形 (x1, y1, x2, y2)，相对录制区域，没有变化时为 None
+        events (list): 每次变化一项 {"at": 时间, "band": 最下方变化块, "element": 块中最左边的一段}，
+            band 和 element 都是相对录制区域的 (x1, y1, x2, y2)
+        last_change (float): 最近一次变化的时间
+    """
+
+    def __init__(self, gui, region, threshold=DIFF_THRESHOLD):
+        self.gui = gui
+        self.region = tuple(region)
+        self.threshold = threshold
+        self.frames = 0
+        self.bbox = None
+        self.events = []
+        self.last_change = None
+        self.previous = None
+
+    def capture(self, now=None):
+        """
+        截取一帧并与上一帧比较
+
+        返回:
+            dict: 这一帧的变化（见 events），没有变化时为 None
+        """
+        now = time.time() if now is None else now
+        frame = self.gui.screenshot(region=self.region)
+        self.frames += 1
+        previous, self.previous = self.previous, frame
+        if previous is None:
+            return None
+        mask = change_mask(previous, frame, self.threshold)
+        box = mask.getbbox()
+        if box is None:
+            return None
+        self.bbox = union(self.bbox, box)
+        self.last_change = now
+
+        rows = runs(mask.getprojection()[1], ROW_GAP)
+        top, bottom = rows[-1]
+        columns = runs(mask.crop((0, top, mask.width, bottom)).getprojection()[0], COLUMN_GAP)
+        left, right = columns[0]
+        element_rows = runs(mask.crop((left, top, right, bottom)).getprojection()[1], ROW_GAP)
+        event = {
+            "at": now,
+            "band": (left, top, columns[-1][1], bottom),
+            "element": (left, top + element_rows[0][0], right, top + element_rows[-1][1]),
+        }
+        self.events.append(event)
+        return event
+
+    def record(self, seconds, interval=0.2, settle=None):
+        """
+        按间隔录制
+
+        参数:
+            seconds (float): 最长录制时间
+            interval (float): 截图间隔（秒）
+            settle (float): 出现过变化后画面连续这么多秒不再变化时提前结束，为 None 时录满 seconds
+        """
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            now = time.time()
+            self.capture(now)
+            if settle is not None and self.last_change is not None and now - self.last_change >= settle:
+                break
+            time.sleep(interval)
+
+    def to_screen(self, box):
+        x, y = self.region[:2]
+        return (box[0] + x, box[1] + y, box[2] + x, box[3] + y)
+
+
+def tight_window(recorder, padding=4):
+    """
+    全部变化的外接矩形，四周留 padding 像素，不超出录制区域
+
+    返回:
+        list: [[x1, y1], [x2, y2]] 屏幕坐标，没有变化时为 None
+    """
+    if recorder.bbox is None:
+        return None
+    x1, y1, x2, y2 = recorder.bbox
+    width, height = recorder.region[2:]
+    box = (max(x1 - padding, 0), max(y1 - padding, 0), min(x2 + padding, width), min(y2 + padding, height))
+    x1, y1, x2, y2 = recorder.to_screen(box)
+    return [[x1, y1], [x2, y2]]
+
+
+def last_incoming_bubble(recorder):
+    """
+    最近一次出现在左半边的气泡（对方的消息），点击坐标在气泡左下角内侧
+
+    微信的消息贴着底部排列，最新气泡的底边和左边位置固定，顶边和右边随消息长短变化，
+    所以点左下角附近，长短不同的消息都能点中；横向离左边 12 像素，落在模板的范围内（见 calibrate）。
+
+    返回:
+        tuple: (气泡 (x1, y1, x2, y2), 点击坐标 [x, y])，都是屏幕坐标；没有找到时为 None
+    """
+    half = recorder.region[2] / 2
+    for event in reversed(recorder.events):
+        x1, y1, x2, y2 = event["element"]
+        if x1 < half:
+            x, y = min(x1 + 12, (x1 + x2) // 2), max(y2 - 10, (y1 + y2) // 2)
+            sx, sy = recorder.region[:2]
+            return recorder.to_screen(event["element"]), [x + sx, y + sy]
+    return None
+
+
+def copy_button(recorder):
+    """
+    最后一次变化中最下方的元素：AI 回答显示完后才出现的复制按钮，点击坐标在它的中心
+
+    返回:
+        tuple: (按钮 (x1, y1, x2, y2), 点击坐标 [x, y])，都是屏幕坐标；没有变化时为 None
+    """
+    if not recorder.events:
+        return None
+    box = recorder.to_screen(recorder.events[-1]["element"])
+    return box, [(box[0] + box[2]) // 2, (box[1] + box[3]) // 2]
+
+
+def save_template(recorder, box, point, path):
+    """
+    从最后一帧截取 box（屏幕坐标）保存为模板
+
+    返回:
+        dict: 模板路径和点击位置相对模板左上角的偏移
+    """
+    x, y, width, height = recorder.region
+    crop = (max(box[0] - x, 0), max(box[1] - y, 0), min(box[2] - x, width), min(box[3] - y, height))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    recorder.previous.crop(crop).save(path)
+    return {"template": path, "anchor": [point[0] - x - crop[0], point[1] - y - crop[1]]}
+
+
+def area(window):
+    (x1, y1), (x2, y2) = window
+    return (x2 - x1) * (y2 - y1)
+
+
+def expand(window, margin, screen=None):
+    """把 [[x1, y1], [x2, y2]] 向外扩 margin 像素，转换为截图区域 (x, y, 宽, 高)，不超出屏幕"""
+    (x1, y1), (x2, y2) = window
+    x1, y1 = max(x1 - margin, 0), max(y1 - margin, 0)
+    x2, y2 = x2 + margin, y2 + margin
+    if screen is not None:
+        x2, y2 = min(x2, screen[0]), min(y2, screen[1])
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def calibrate(gui, settings, prefix, seconds=20.0, interval=0.2, margin=80, padding=4, send=None, template_dir=None):
+    """
+    标定一个窗口
+
+    参数:
+        gui: pyautogui 或虚拟桌面
+        settings (Settings): 当前配置，录制区域由当前的 reply_window 外扩 margin 得到
+        prefix (str): "wx" 或 "ai"
+        send (callable): 录制开始后调用一次，用来发送测试问题；不为 None 时画面稳定 3 秒即结束录制
+        template_dir (str): 不为 None 时把目标截成模板保存到这个目录
+
+    返回:
+        dict: 新的 {prefix}_reply_window 和 {prefix}_reply_coordinate，保存了模板时还有
+            {prefix}_reply_template、{prefix}_reply_anchor 和 {prefix}_reply_search_window；找不到的项不包含在内
+    """
+    screen = gui.size() if callable(getattr(gui, "size", None)) else getattr(gui, "size", None)
+    recorder = FrameRecorder(gui, expand(settings[f"{prefix}_reply_window"], margin, screen))
+    recorder.capture()
+    if send is not None:
+        threading.Thread(target=send, daemon=True).start()
+    recorder.record(seconds, interval, settle=3.0 if send is not None else None)
+
+    result = {}
+    window = tight_window(recorder, padding)
+    if window is not None:
+        if prefix == "ai":
+            # 网页上的回答从上往下增长，测试问题的回答比平时短，底边保持原来的位置，以免长回答超出截图区域
+            window[1][1] = max(window[1][1], settings["ai_reply_window"][1][1])
+        result[f"{prefix}_reply_window"] = window
+    target = last_incoming_bubble(recorder) if prefix == "wx" else copy_button(recorder)
+    if target is not None:
+        result[f"{prefix}_reply_coordinate"] = target[1]
+    # 目标要在最后一帧中还在原处才能截取模板
+    if template_dir is not None and target is not None and recorder.to_screen(recorder.events[-1]["element"]) == target[0]:
+        (x1, y1, x2, y2), point = target
+        path = os.path.join(template_dir, f"{prefix}_reply.png")
+        if prefix == "wx":
+            # 气泡底边内侧几行加下方几行背景：所有对方气泡的底边都长这样，避开左侧色块和文字，取最下面一个就是最新的。
+            # 底边横向没有变化，匹配位置可能沿底边左右偏移，点击位置横向落在模板范围内，偏移后仍在气泡上
+            saved = save_template(recorder, (x1 + 4, y2 - 6, min(x1 + 20, x2 - 2), y2 + 3), point, path)
+        else:
+            # 按钮连同四周几个像素的背景
+            saved = save_template(recorder, (x1 - 3, y1 - 3, x2 + 3, y2 + 3), point, path)
+            # 按钮随回答长度上下移动，在整个录制区域内查找
+            x, y, width, height = recorder.region
+            result["ai_reply_search_window"] = [[x, y], [x + width, y + height]]
+        result[f"{prefix}_reply_template"] = saved["template"]
+        result[f"{prefix}_reply_anchor"] = saved["anchor"]
+    logs.logging().log(
+        f"{prefix} 标定完成: 录制 {recorder.frames} 帧，变化 {len(recorder.events)} 次，结果 {result}", "key"
+    )
+    return result
+
+
+def describe(settings, values):
+    """新旧坐标的对比，以及每次截图少截的像素"""
+    lines = []
+    for key, value in values.items():
+        old = settings.get(key)
+        line = f"{key}: {old} -> {value}"
+        if key.endswith("_reply_window") and old is not None:
+            line += f"（每次截图 {area(old)} -> {area(value)} 像素，减少 {1 - area(value) / area(old):.0%}）"
+        lines.append(line)
+    return "\n".join(lines) or "录制期间画面没有变化，没有得到结果"
+
+
+def write_settings(path, values):
+    """把标定结果写回配置文件，其他配置项保持不变"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data.update(values)
+    config.Settings(data)  # 先校验，有误时不写入
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def demo_messages(desktop, seconds):
+    """虚拟桌面演示：在录制期间往微信窗口发几条长短不同的消息"""
+    window = desktop.windows["WeChat"]
+    samples = ["在吗", "今天下午三点的会还开吗？", "好的，我把资料整理好了发你，记得看一下第二页的表格"]
+    for sample in samples:
+        time.sleep(seconds / (len(samples) + 1))
+        window.receive(sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制画面变化，标定截图区域和点击坐标")
+    parser.add_argument("--settings", default="settings.json", help="配置文件，默认为运行目录下的 settings.json")
+    parser.add_argument("--window", choices=["wx", "ai", "both"], default="both", help="要标定的窗口")
+    parser.add_argument("--seconds", type=float, default=20.0, help="每个窗口最长录制时间（秒）")
+    parser.add_argument("--interval", type=float, default=0.2, help="截图间隔（秒）")
+    parser.add_argument("--margin", type=int, default=80, help="录制区域在当前配置的区域外扩的像素")
+    parser.add_argument("--padding", type=int, default=4, help="新的截图区域四周留出的像素")
+    parser.add_argument("--prompt", help="标定 AI 窗口时自动发送的测试问题，不指定时需要手动提问")
+    parser.add_argument("--virtual", action="store_true", help="在虚拟桌面上演示，自动发送测试消息")
+    parser.add_argument("--write", action="store_true", help="把结果写回配置文件，同时保存模板")
+    parser.add_argument("--template-dir", default="templates", help="模板保存目录，默认为 templates")
+    args = parser.parse_args()
+
+    try:
+        settings = config.load_settings(args.settings)
+        prefixes = ["wx", "ai"] if args.window == "both" else [args.window]
+        settings.require(*(f"{prefix}_{key}" for prefix in prefixes
+                           for key in ("send_coordinate", "reply_coordinate", "reply_window")))
+    except config.SettingsError as e:
+        sys.exit(str(e))
+
+    from chat_core.chat_window import ChatWindow
+    desktop = None
+    if args.virtual:
+        from feature.virtual_desktop import VirtualDesktop
+        desktop = VirtualDesktop.from_settings(settings)
+    prompt = args.prompt or ("你好" if args.virtual else None)
+
+    values = {}
+    for prefix in prefixes:
+        window = ChatWindow(
+            settings[f"{prefix}_send_coordinate"], settings[f"{prefix}_reply_coordinate"],
+            settings[f"{prefix}_reply_window"], name=prefix, desktop=desktop
+        )
+        send = None
+        if prefix == "wx":
+            print(f"录制微信窗口 {args.seconds:.0f} 秒，请用另一个账号发几条长短不同的消息...")
+            if desktop is not None:
+                threading.Thread(target=demo_messages, args=(desktop, args.seconds), daemon=True).start()
+        elif prompt:
+            print(f"向 AI 发送测试问题“{prompt}”，回答显示完后结束录制...")
+            send = lambda window=window: window.send_message(prompt)
+        else:
+            print(f"录制 AI 窗口 {args.seconds:.0f} 秒，请在 AI 网页上提一个问题并等回答显示完...")
+        values.update(calibrate(window.gui, settings, prefix, args.seconds, args.interval,
+                                args.margin, args.padding, send, args.template_dir if args.write else None))
+
+    print(describe(settings, values))
+    if args.write and values:
+        try:
+            write_settings(args.settings, values)
+        except (OSError, ValueError) as e:
+            sys.exit(f"写入 {args.settings} 失败: {e}")
+        print(f"已写入 {args.settings}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 import time
-from chat_window import ChatWindow
+from chat_core import metrics
+from chat_core.chat_window import ChatWindow
+from chat_core.message_backend import IncomingMessage, MessageBackend
 
-class ChatSession:
+class ChatSession(MessageBackend):
     """
     聊天会话管理器，提供高级的消息交互功能。
     
     这个类在 ChatWindow 的基础上添加了消息状态管理、冷却控制、变化检测等功能，
-    使得消息交互更加稳定和智能。
+    使得消息交互更加稳定和智能。它实现了 MessageBackend 接口，可以作为回复器的消息后端。
 
     主要功能：
     1. 消息状态管理：跟踪窗口内容的变化和稳定状态
@@ -21,7 +23,13 @@ class ChatSession:
         last_send_time (float): 上次发送消息的时间戳
         had_change (bool): 是否检测到新消息
         stable_count (int): 消息稳定性计数
-        last_image: 上次截取的窗口图像
+        last_image: 上次截取的窗口图像，第一次轮询前为 None
+        polls (int): 轮询次数
+        last_status (str): 最近一次轮询的监控状态，还没有轮询时为 "idle"
+        dedup (MessageFingerprintStore): 消息指纹库，为 None 时不去重
+        stickers (StickerResponder): 表情识别，为 None 时不识别表情，见 chat_core.stickers
+        last_copy_status (str): 最近一次 copy_message 的结果："ok"、"cooling"、"seen"（画面已处理过）、
+            "duplicate"（重复消息）或 "empty"（复制不到文本）
 
     使用示例：
         # 创建一个聊天窗口实例
@@ -60,14 +68,20 @@ class ChatSession:
         4. 状态变化和错误都会记录到日志
     """
 
-    def __init__(self, window: ChatWindow, cooldown=2.0):
+    def __init__(self, window: ChatWindow, cooldown=2.0, dedup=None, stickers=None):
         self.window = window
         self.cooldown = cooldown
+        self.dedup = dedup
+        self.stickers = stickers
+        self.last_copy_status = None
         self.last_content = None
         self.last_send_time = 0
         self.had_change = False
         self.stable_count = 0
-        self.last_image = self.window.get_window_content()
+        self.polls = 0
+        self.last_status = "idle"
+        # 基准画面在第一次轮询时截取，创建会话时不截图
+        self.last_image = None
 
     def check_new_message(self):
         """
@@ -77,6 +91,9 @@ class ChatSession:
             bool: 是否检测到新消息
         """
         current_image = self.window.get_window_content()
+        if self.last_image is None:
+            self.last_image = current_image
+            return False
         if not self.window.images_equal(current_image, self.last_image):
             self.last_image = current_image
             self.stable_count = 0
@@ -102,22 +119,25 @@ class ChatSession:
             return self.stable_count >= required_stable_count
         return False
 
-    def copy_message(self, **kwargs):
+    def copy_message(self, wait=False, **kwargs):
         """
         复制消息并管理状态
         
         这个方法会：
-        1. 检查冷却时间
-        2. 调用窗口的复制功能
-        3. 更新状态
+        1. 检查冷却时间（wait=True 时等冷却结束再复制，否则直接放弃）
+        2. 检查当前画面是否已经处理过（启用去重时）
+        3. 调用窗口的复制功能
+        4. 检查复制到的文本是否已经处理过（启用去重时）
+        5. 更新状态
         
         参数：
+            wait (bool): 冷却中是否等待冷却结束，复制 AI 回复时应当等待，以免回复丢失
             **kwargs: 传递给 ChatWindow.copy_message 的参数
                 clicks (int): 点击次数
                 copy_by_button (bool): 是否使用复制按钮
         
         返回：
-            str: 复制的内容，失败返回空字符串
+            str: 复制的内容，失败或重复时返回空字符串
         
         使用示例：
             # 普通复制
@@ -128,15 +148,36 @@ class ChatSession:
         """
         if not self.can_send_message():
             remaining = self.cooldown - (time.time() - self.last_send_time)
-            self.window.log.log(f"冷却中，还需等待 {remaining:.1f} 秒")
+            if not wait:
+                self.window.log.log(f"冷却中，还需等待 {remaining:.1f} 秒")
+                metrics.COOLDOWN_REJECTIONS.inc(window=self.window.name)
+                self.last_copy_status = "cooling"
+                return ""
+            self.window.log.log(f"冷却中，等待 {remaining:.1f} 秒后复制")
+            time.sleep(max(remaining, 0))
+
+        # 画面与已处理过的完全一致（如切回窗口、重绘），无需再复制
+        if self.frame_seen():
+            self.window.log.log(f"{self.window.name} 画面已处理过，跳过复制", level="state")
+            self.last_copy_status = "seen"
             return ""
 
         content = self.window.copy_message(**kwargs)
+        if content and self.dedup is not None and self.dedup.seen(self.window.name, content):
+            self.window.log.log(f"{self.window.name} 重复消息，已丢弃: [{content}]", level="state")
+            self.last_copy_status = "duplicate"
+            return ""
         if content:
             self.last_send_time = time.time()
             self.had_change = True
+        self.last_copy_status = "ok" if content else "empty"
         return content
 
+    def frame_seen(self):
+        """当前画面是否已经处理过（启用去重时），没处理过的画面同时记为已处理"""
+        return (self.dedup is not None and self.last_image is not None
+                and self.dedup.seen(f"{self.window.name}#frame", self.last_image.tobytes()))
+
     def send_message(self, message):
         """
         发送消息并更新状态
@@ -162,6 +203,86 @@ class ChatSession:
             return True
         return False
 
+    def receive_messages(self, **kwargs):
+        """
+        MessageBackend 接口：窗口稳定后复制最新来信
+        
+        参数：
+            **kwargs: 传递给 copy_message 的参数，默认双击复制
+        
+        返回：
+            list[IncomingMessage]: 新来信，没有或复制失败时为空列表
+        """
+        detected = self.detect_messages()
+        if detected is None:
+            return []
+        return self.extract_messages(detected, **kwargs)
+
+    def detect_messages(self):
+        """MessageBackend 接口：只截图比较，窗口稳定时返回当前画面"""
+        if self.monitor_changes() != "stable":
+            return None
+        return self.last_image
+
+    def extract_messages(self, detected, **kwargs):
+        """
+        MessageBackend 接口：点击复制最新来信
+        
+        参数：
+            detected: detect_messages 返回的画面
+            **kwargs: 传递给 copy_message 的参数，默认双击复制
+        
+        启用表情识别时先在画面上截取最新一条来信算感知哈希，认出来的表情直接返回带固定回复的来信，不用复制；
+        复制不到文本时把它记为不认识的表情。冷却中不复制，画面保持"有变化"的状态，冷却结束后的轮询会重新取这条消息。
+        
+        返回：
+            list[IncomingMessage]: 新来信，复制失败时为空列表
+        """
+        value, crop = None, None
+        if self.stickers is not None and detected is not None:
+            value, sticker, crop = self.stickers.match(detected)
+            if sticker is not None:
+                return self.sticker_message(sticker)
+        content = self.copy_message(**(kwargs or {"clicks": 2}))
+        if self.last_copy_status == "cooling":
+            self.retry_later()
+            return []
+        if not content.strip():
+            # "seen"、"duplicate" 在 copy_message 中已经记过原因，只有真的复制不到文本才是表情或图片
+            if self.last_copy_status == "empty":
+                self.window.log.log("未检测到文本内容，可能是表情或图片，跳过处理", level="state")
+                if value is not None:
+                    self.stickers.record_unknown(value, crop)
+                    metrics.STICKER_UNKNOWN.inc(window=self.window.name)
+            return []
+        return [IncomingMessage(self.window.name, content)]
+
+    def sticker_message(self, sticker):
+        """认出来的表情和复制到的文本一样受冷却时间和画面去重限制"""
+        if not self.can_send_message():
+            self.retry_later()
+            return []
+        if self.frame_seen():
+            return []
+        self.last_send_time = time.time()
+        metrics.STICKER_HITS.inc(window=self.window.name)
+        self.window.log.log(f"{self.window.name} 认出表情 [{sticker.name}]，使用固定回复", level="state")
+        if not sticker.reply:
+            return []
+        return [IncomingMessage(self.window.name, f"[表情:{sticker.name}]", reply=sticker.reply)]
+
+    def retry_later(self):
+        """
+        冷却中没有取消息：恢复"有变化"的状态，画面不再变化时下一次轮询重新报告稳定，
+        冷却结束后再取，新消息不会因为冷却被丢掉
+        """
+        self.had_change = True
+        self.stable_count = max(self.stable_count, 1)
+
+    def send_reply(self, contact, message):
+        """MessageBackend 接口：窗口只对应一个会话，忽略 contact 直接发送"""
+        return self.send_message(message)
+
     def reset_state(self):
         """重置所有状态"""
         self.had_change = False
@@ -195,11 +316,24 @@ class ChatSession:
                 # 可以处理消息了
                 content = session.copy_message()
         """
+        self.polls += 1
+        self.last_status = self.check_window()
+        return self.last_status
+
+    def check_window(self):
+        """monitor_changes 的实现：截图比较一次，返回监控状态"""
+        metrics.POLLS.inc(window=self.window.name)
         try:
             current_image = self.window.get_window_content()
             
+            # 第一次轮询只记录基准画面
+            if self.last_image is None:
+                self.last_image = current_image
+                return "unchanged"
+            
             # 检查是否有变化
             if not self.window.images_equal(current_image, self.last_image):
+                metrics.CHANGES.inc(window=self.window.name)
                 # 只有当状态从稳定变为不稳定时才记录日志
                 if not self.had_change:
                     self.window.log.log(f"{self.window.name} 窗口正在变化...", level="state")
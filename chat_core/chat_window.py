@@ -1,8 +1,42 @@
-import pyautogui
+import importlib.util
 import time
-import win32clipboard
-from PIL import Image
 import logs
+from chat_core import metrics, startup
+from chat_core.config import region_of
+
+
+class FailSafeException(Exception):
+    """鼠标移到屏幕角落触发的故障安全异常，pyautogui 抛出的同名异常会被转换成这个异常"""
+
+
+class PyAutoGui(startup.LazyModule):
+    """
+    第一次操作窗口时才导入 pyautogui（导入要几百毫秒），不拖慢启动
+
+    pyautogui 抛出的 FailSafeException 转换为本模块的 FailSafeException，
+    调用方不用先导入 pyautogui 就能捕获它。
+    """
+
+    def __init__(self):
+        super().__init__("pyautogui")
+
+    def _load(self):
+        try:
+            return super()._load()
+        except Exception as e:  # 没有图形环境时 pyautogui 导入会失败
+            raise RuntimeError(f"pyautogui 不可用: {e}") from e
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        if not callable(value) or isinstance(value, type):
+            return value
+
+        def call(*args, **kwargs):
+            try:
+                return value(*args, **kwargs)
+            except self._module.FailSafeException as e:
+                raise FailSafeException(str(e)) from e
+        return call
 
 class ChatWindow:
     """
@@ -10,12 +44,20 @@ class ChatWindow:
     
     这个类封装了对聊天窗口的基本操作，包括消息的监控、复制和发送。
     它使用 pyautogui 进行窗口操作，支持中英文文本处理。
+    传入 desktop（feature.virtual_desktop.VirtualDesktop）时改为操作虚拟桌面，
+    无需显示器和 Windows。
 
     属性:
         send_coordinate (list): 发送框的坐标 [x, y]
         reply_coordinate (list): 消息区域的坐标 [x, y]
         reply_window (list): 监控区域 [(x1,y1), (x2,y2)]
+        region (tuple): 由 reply_window 算出的截图区域 (x, y, 宽, 高)
         name (str): 窗口标识名（用于日志）
+        gui: 鼠标键盘和截图接口，默认为 pyautogui（第一次使用时导入）
+        clipboard: 剪贴板接口，默认为 win32clipboard（第一次使用时导入）
+        locator (TemplateLocator): 复制前按模板查找点击位置，为 None 时直接点击 reply_coordinate
+        last_capture_at (float): 最近一次截图的时间，还没有截图时为 None
+        last_capture_seconds (float): 最近一次截图的耗时（秒）
         log (logs.logging): 日志记录器实例
 
     示例:
@@ -39,18 +81,52 @@ class ChatWindow:
         3. 操作间有适当的延时以确保稳定性
     """
 
-    def __init__(self, send_coordinate, reply_coordinate, reply_window, name="ChatWindow"):
+    def __init__(self, send_coordinate, reply_coordinate, reply_window, name="ChatWindow", desktop=None, locator=None):
+        self.set_coordinates(send_coordinate, reply_coordinate, reply_window)
+        self.name = name
+        self.locator = locator
+        if desktop is not None:
+            self.gui = desktop
+            self.clipboard = desktop.clipboard
+        else:
+            # 只检查模块是否安装，第一次截图或点击时才真正导入
+            for module in ("pyautogui", "win32clipboard"):
+                if importlib.util.find_spec(module) is None:
+                    raise RuntimeError(f"{module} 不可用，请在有图形环境的 Windows 上运行，或使用虚拟桌面")
+            startup.preload("pyautogui", "win32clipboard")
+            self.gui = PyAutoGui()
+            self.clipboard = startup.LazyModule("win32clipboard")
+        self.last_capture_at = None
+        self.last_capture_seconds = None
+        self.log = logs.logging()
+
+    def set_coordinates(self, send_coordinate, reply_coordinate, reply_window):
+        """更新窗口坐标（配置热更新时调用），截图区域一并算好"""
         self.send_coordinate = send_coordinate
         self.reply_coordinate = reply_coordinate
         self.reply_window = reply_window
-        self.name = name
-        self.log = logs.logging()
+        self.region = region_of(reply_window)
 
     def get_window_content(self):
         """截取监控区域的图像"""
-        x1, y1 = self.reply_window[0]
-        x2, y2 = self.reply_window[1]
-        return pyautogui.screenshot(region=(x1, y1, x2-x1, y2-y1))
+        start = time.perf_counter()
+        image = self.gui.screenshot(region=self.region)
+        self.last_capture_seconds = time.perf_counter() - start
+        self.last_capture_at = time.time()
+        metrics.CAPTURE_SECONDS.observe(self.last_capture_seconds, window=self.name)
+        return image
+
+    def reply_target(self):
+        """复制时点击的位置：配置了定位器时在画面中查找，找不到时退回 reply_coordinate"""
+        if self.locator is None:
+            return self.reply_coordinate
+        point = self.locator.locate(self.gui)
+        metrics.LOCATE_SECONDS.observe(self.locator.last_seconds, window=self.name)
+        if point is None:
+            metrics.LOCATE_MISSES.inc(window=self.name)
+            self.log.log(f"{self.name} 未找到复制目标，使用配置的坐标 {self.reply_coordinate}", "state")
+            return self.reply_coordinate
+        return point
 
     def images_equal(self, img1, img2):
         """比较两张图片是否相同"""
@@ -59,11 +135,11 @@ class ChatWindow:
     def get_clipboard_content(self):
         """获取剪贴板中的文本内容"""
         try:
-            win32clipboard.OpenClipboard()
+            self.clipboard.OpenClipboard()
             try:
                 # 尝试 Unicode 格式
                 try:
-                    data = win32clipboard.GetClipboardData(win32clipboard.CF_UNICODETEXT)
+                    data = self.clipboard.GetClipboardData(self.clipboard.CF_UNICODETEXT)
                     if data and data.strip():
                         return data
                 except:
@@ -71,7 +147,7 @@ class ChatWindow:
 
                 # 尝试普通文本格式
                 try:
-                    data = win32clipboard.GetClipboardData(win32clipboard.CF_TEXT)
+                    data = self.clipboard.GetClipboardData(self.clipboard.CF_TEXT)
                     for encoding in ['utf-8', 'gbk', 'gb2312', 'gb18030']:
                         try:
                             text = data.decode(encoding)
@@ -83,10 +159,10 @@ class ChatWindow:
                     pass
                 return ""
             finally:
-                win32clipboard.CloseClipboard()
+                self.clipboard.CloseClipboard()
         except:
             try:
-                win32clipboard.CloseClipboard()
+                self.clipboard.CloseClipboard()
             except:
                 pass
             return ""
@@ -94,12 +170,12 @@ class ChatWindow:
     def clear_clipboard(self):
         """清空剪贴板内容"""
         try:
-            win32clipboard.OpenClipboard()
-            win32clipboard.EmptyClipboard()
-            win32clipboard.CloseClipboard()
+            self.clipboard.OpenClipboard()
+            self.clipboard.EmptyClipboard()
+            self.clipboard.CloseClipboard()
         except:
             try:
-                win32clipboard.CloseClipboard()
+                self.clipboard.CloseClipboard()
             except:
                 pass
 
@@ -121,19 +197,22 @@ class ChatWindow:
         """
         try:
             self.clear_clipboard()
-            pyautogui.moveTo(self.reply_coordinate[0], self.reply_coordinate[1])
+            x, y = self.reply_target()
+            self.gui.moveTo(x, y)
             time.sleep(0.2)
             
             if copy_by_button:
-                pyautogui.click()
+                self.gui.click()
                 time.sleep(0.3)
             else:
-                pyautogui.click(clicks=clicks)
+                self.gui.click(clicks=clicks)
                 time.sleep(0.2)
-                pyautogui.hotkey('ctrl', 'c')
+                self.gui.hotkey('ctrl', 'c')
                 time.sleep(0.3)
                 
             content = self.get_clipboard_content()
+            if not content:
+                metrics.EMPTY_COPIES.inc(window=self.name)
             self.log.log(f"{self.name} 复制内容: [{content}]")
             return content
         except Exception as e:
@@ -143,23 +222,25 @@ class ChatWindow:
     def send_message(self, message):
         """发送消息"""
         try:
-            pyautogui.moveTo(self.send_coordinate[0], self.send_coordinate[1])
+            self.gui.moveTo(self.send_coordinate[0], self.send_coordinate[1])
             time.sleep(0.1)
-            pyautogui.click()
+            self.gui.click()
             time.sleep(0.1)
             
             self.clear_clipboard()
-            win32clipboard.OpenClipboard()
-            win32clipboard.SetClipboardText(message, win32clipboard.CF_UNICODETEXT)
-            win32clipboard.CloseClipboard()
+            self.clipboard.OpenClipboard()
+            self.clipboard.SetClipboardText(message, self.clipboard.CF_UNICODETEXT)
+            self.clipboard.CloseClipboard()
             
-            pyautogui.hotkey('ctrl', 'v')
+            self.gui.hotkey('ctrl', 'v')
             time.sleep(0.1)
-            pyautogui.press('enter')
+            self.gui.press('enter')
             self.log.log(f"{self.name} 发送消息: {message}")
+            metrics.SENDS.inc(window=self.name)
             return True
         except Exception as e:
             self.log.log(f"{self.name} 发送消息失败: {e}", "error")
+            metrics.SEND_FAILURES.inc(window=self.name)
             return False
 
     def copy_by_button(self):
@@ -174,11 +255,14 @@ class ChatWindow:
         try:
             self.clear_clipboard()
             # 点击复制按钮位置
-            pyautogui.moveTo(self.reply_coordinate[0], self.reply_coordinate[1])
+            x, y = self.reply_target()
+            self.gui.moveTo(x, y)
             time.sleep(0.2)
-            pyautogui.click()
+            self.gui.click()
             time.sleep(0.5)  # 等待复制完成
             content = self.get_clipboard_content()
+            if not content:
+                metrics.EMPTY_COPIES.inc(window=self.name)
             self.log.log(f"{self.name} 通过按钮复制内容: [{content}]")
             return content
         except Exception as e:
@@ -0,0 +1,412 @@
+"""
+settings.json 的加载、校验和热更新
+
+Settings 是校验过的只读配置：已知的键按 SCHEMA 检查类型和取值范围，缺省的键填入默认值，
+未知的键原样保留。它实现了 Mapping 接口，原来按 settings.get("键", 默认值) 读取配置的代码不用修改。
+
+SettingsWatcher 定期检查配置文件，文件变化后重新加载并校验，通过后一次性交给回调，
+回调里替换正在运行的会话使用的坐标、冷却时间、提示词等；校验失败时保留旧配置。
+
+使用示例:
+    settings = load_settings("settings.json")
+    settings["pipeline.check_interval"]       # 1.0（未配置时为默认值）
+    settings.prompt_prefix                    # [系统提示, 示例对话...]
+
+    watcher = SettingsWatcher("settings.json", on_change=replier.apply_settings, current=settings)
+    watcher.start()
+"""
+import copy
+import json
+import os
+import threading
+from collections.abc import Mapping
+
+import logs
+
+
+class SettingsError(ValueError):
+    """配置文件无法解析或校验失败，errors 为全部问题的列表"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("配置有误:\n  " + "\n  ".join(self.errors))
+
+
+# 以下校验函数返回校验（必要时转换）后的值，不合法时抛出 ValueError，说明期望的取值
+
+def boolean(value):
+    if not isinstance(value, bool):
+        raise ValueError("应为 true 或 false")
+    return value
+
+
+def string(value):
+    if not isinstance(value, str):
+        raise ValueError("应为字符串")
+    return value
+
+
+def number(minimum=None, exclusive=False):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("应为数字")
+        if minimum is not None and (value <= minimum if exclusive else value < minimum):
+            raise ValueError(f"应{'大于' if exclusive else '不小于'} {minimum}")
+        return float(value)
+    return check
+
+
+def integer(minimum=None, maximum=None):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError("应为整数")
+        if minimum is not None and value < minimum:
+            raise ValueError(f"应不小于 {minimum}")
+        if maximum is not None and value > maximum:
+            raise ValueError(f"应不大于 {maximum}")
+        return value
+    return check
+
+
+def choice(*options):
+    def check(value):
+        if value not in options:
+            raise ValueError(f"应为 {' / '.join(options)} 之一")
+        return value
+    return check
+
+
+def mapping(value):
+    if not isinstance(value, dict):
+        raise ValueError("应为对象")
+    return value
+
+
+def list_of(item):
+    def check(value):
+        if not isinstance(value, list):
+            raise ValueError("应为列表")
+        return [item(element) for element in value]
+    return check
+
+
+def point(value):
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or not all(isinstance(v, int) and not isinstance(v, bool) for v in value)):
+        raise ValueError("应为 [x, y] 整数坐标")
+    return list(value)
+
+
+def region(value):
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError("应为 [[x1, y1], [x2, y2]]")
+    (x1, y1), (x2, y2) = point(value[0]), point(value[1])
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError("右下角坐标应大于左上角坐标")
+    return [[x1, y1], [x2, y2]]
+
+
+def chat_message(value):
+    if not isinstance(value, dict) or not isinstance(value.get("role"), str) or not isinstance(value.get("content"), str):
+        raise ValueError('应为 {"role": ..., "content": ...} 形式的对话')
+    return value
+
+
+def faq_entry(value):
+    if (not isinstance(value, dict) or not isinstance(value.get("answer"), str)
+            or not (isinstance(value.get("question"), str) or value.get("questions"))):
+        raise ValueError('应为 {"question" 或 "questions": ..., "answer": ...} 形式的问答')
+    return value
+
+
+def inference_endpoint(value):
+    if not isinstance(value, dict) or not isinstance(value.get("url"), str):
+        raise ValueError('应为 {"url": ..., "backend": ..., "model": ..., "max_concurrency": ...} 形式的推理服务')
+    choice("ollama", "openai")(value.get("backend", "ollama"))
+    integer(1)(value.get("max_concurrency", 1))
+    for key in ("model", "name"):
+        if key in value:
+            string(value[key])
+    return value
+
+
+def deadlines(value):
+    return {state: number(0, exclusive=True)(seconds) for state, seconds in mapping(value).items()}
+
+
+# 已知的配置项：键 -> (默认值, 校验函数)，默认值为 None 的键未配置时不填入
+SCHEMA = {
+    "backend": ("screen", choice("screen", "wxauto")),
+    "virtual_desktop": (False, boolean),
+    "virtual_desktop.reply_delay": (1.0, number(0)),
+    "virtual_desktop.stream_seconds": (1.0, number(0)),
+
+    "wx_send_coordinate": (None, point),
+    "wx_reply_coordinate": (None, point),
+    "wx_reply_window": (None, region),
+    "ai_send_coordinate": (None, point),
+    "ai_reply_coordinate": (None, point),
+    "ai_reply_window": (None, region),
+
+    "wx_reply_template": (None, string),
+    "wx_reply_anchor": (None, point),
+    "wx_reply_search_window": (None, region),
+    "ai_reply_template": (None, string),
+    "ai_reply_anchor": (None, point),
+    "ai_reply_search_window": (None, region),
+    "locator.threshold": (0.8, number(0, exclusive=True)),
+    "locator.levels": (3, integer(1, 6)),
+    "locator.near": (24, integer(0)),
+
+    "stickers.enabled": (False, boolean),
+    "stickers.file": ("stickers.json", string),
+    "stickers.max_distance": (4, integer(0, 15)),
+    "stickers.unknown_dir": ("stickers", string),
+
+    "faq.entries": ([], list_of(faq_entry)),
+    "faq.file": (None, string),
+    "faq.threshold": (0.6, number(0, exclusive=True)),
+    "faq.ngram": (2, integer(1, 4)),
+
+    "wxauto.contact": (None, string),
+    "wxauto.fake": (False, boolean),
+    "listen_contacts": ([], list_of(string)),
+
+    "cooldown.wx": (2.0, number(0)),
+    "cooldown.ai": (3.0, number(0)),
+
+    "dedup.ttl": (120.0, number(0, exclusive=True)),
+    "dedup.bucket_seconds": (60.0, number(0, exclusive=True)),
+
+    "send_queue.rate": (1.0, number(0, exclusive=True)),
+    "send_queue.burst": (1, integer(1)),
+    "send_queue.contact_rate": (0.5, number(0, exclusive=True)),
+    "send_queue.contact_burst": (1, integer(1)),
+    "send_queue.replace_pending": (False, boolean),
+
+    "pipeline.check_interval": (1.0, number(0, exclusive=True)),
+    "pipeline.queue_size": (4, integer(1)),
+    "pipeline.stats_interval": (60.0, number(0, exclusive=True)),
+
+    "watchdog.deadlines": ({"sending": 30.0, "waiting_ai": 120.0}, deadlines),
+    "watchdog.max_retries": (1, integer(0)),
+
+    "async.max_concurrent_generations": (4, integer(1)),
+
+    "metrics.enabled": (False, boolean),
+    "metrics.host": ("127.0.0.1", string),
+    "metrics.port": (9464, integer(1, 65535)),
+
+    "control.enabled": (False, boolean),
+    "control.address": (None, string),
+    "control.key_file": ("control.key", string),
+
+    "profiler.enabled": (False, boolean),
+    "profiler.interval": (0.01, number(0, exclusive=True)),
+    "profiler.duration": (30.0, number(0, exclusive=True)),
+    "profiler.output_dir": ("profiles", string),
+
+    "message_filter": ({}, mapping),
+
+    "model.ai_system_prompt": ("", string),
+    "model.message_examples": ([], list_of(chat_message)),
+    "model.message_memory_rounds": (10, integer(1)),
+    "model.temperature": (0.7, number(0)),
+    "model.topic_keywords": (None, mapping),
+    "model.contact_profiles": ({}, mapping),
+
+    "inference.endpoints": ([], list_of(inference_endpoint)),
+    "inference.timeout": (120.0, number(0, exclusive=True)),
+    "inference.health_interval": (10.0, number(0, exclusive=True)),
+    "inference.queue_timeout": (120.0, number(0, exclusive=True)),
+
+    "memory.enabled": (False, boolean),
+    "memory.embedder": ("hashing", string),
+    "memory.dim": (128, integer(8)),
+    "memory.top_k": (3, integer(1)),
+    "memory.min_score": (0.25, number()),
+
+    "settings.hot_reload": (True, boolean),
+    "settings.reload_interval": (1.0, number(0, exclusive=True)),
+}
+
+# 修改后需要重启才能生效的配置项
+RESTART_KEYS = {
+    "backend", "virtual_desktop", "wxauto.contact", "wxauto.fake", "listen_contacts",
+    "dedup.ttl", "dedup.bucket_seconds", "pipeline.queue_size",
+    "async.max_concurrent_generations", "metrics.enabled", "metrics.host", "metrics.port",
+    "control.enabled", "control.address", "control.key_file",
+    "memory.enabled", "memory.embedder", "memory.dim",
+    "inference.endpoints", "inference.timeout", "inference.health_interval", "inference.queue_timeout",
+    "settings.hot_reload", "settings.reload_interval",
+}
+
+
+def region_of(reply_window):
+    """把 [[x1, y1], [x2, y2]] 转换为截图区域 (x, y, 宽, 高)"""
+    (x1, y1), (x2, y2) = reply_window
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+class Settings(Mapping):
+    """
+    校验过的只读配置
+
+    属性:
+        path (str): 配置文件路径，不是从文件加载时为 None
+        prompt_prefix (list): 系统提示加示例对话，每次调用模型时放在对话历史前面
+    """
+
+    def __init__(self, values=None, path=None):
+        values = dict(values or {})
+        errors = []
+        data = {}
+        for key, value in values.items():
+            if key not in SCHEMA:
+                data[key] = value
+                continue
+            try:
+                data[key] = SCHEMA[key][1](value)
+            except (ValueError, TypeError) as e:
+                errors.append(f"{key}: {e}（当前为 {value!r}）")
+        for key, (default, _) in SCHEMA.items():
+            if key not in data and key not in values and default is not None:
+                data[key] = copy.deepcopy(default)
+
+        if data.get("backend") == "screen":
+            errors.extend(
+                f"{key}: 截图后端需要配置此项" for key in ("wx_send_coordinate", "wx_reply_coordinate", "wx_reply_window")
+                if key not in data and key not in values
+            )
+        if errors:
+            raise SettingsError(errors)
+
+        self._data = data
+        self.path = path
+        self.prompt_prefix = [{"role": "system", "content": data["model.ai_system_prompt"]}] + list(data["model.message_examples"])
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def require(self, *keys):
+        """检查必须配置的项，缺少时抛出 SettingsError"""
+        missing = [f"{key}: 需要配置此项" for key in keys if key not in self._data]
+        if missing:
+            raise SettingsError(missing)
+
+    def changed_keys(self, other):
+        """与另一份配置相比取值不同的键"""
+        return {key for key in set(self) | set(other) if self.get(key) != other.get(key)}
+
+
+def load_settings(path="settings.json"):
+    """
+    加载并校验配置文件
+
+    返回:
+        Settings: 配置
+
+    异常:
+        SettingsError: 文件无法读取、不是合法的 JSON 或校验失败
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            values = json.load(f)
+    except OSError as e:
+        raise SettingsError([f"无法读取 {path}: {e}"])
+    except json.JSONDecodeError as e:
+        raise SettingsError([f"{path} 不是合法的 JSON（第 {e.lineno} 行第 {e.colno} 列）: {e.msg}"])
+    if not isinstance(values, dict):
+        raise SettingsError([f"{path} 的顶层应为对象"])
+    return Settings(values, path=path)
+
+
+class SettingsWatcher:
+    """
+    配置文件热更新
+
+    定期检查文件的修改时间和大小，变化后重新加载；校验通过且内容确有变化时，
+    调用 on_change(新配置, 变化的键)。需要重启才能生效的配置项只记录日志。
+
+    属性:
+        path (str): 配置文件路径
+        current (Settings): 当前生效的配置
+        interval (float): 检查间隔（秒）
+        reloads (int): 成功应用的次数
+        errors (int): 加载或校验失败的次数
+    """
+
+    def __init__(self, path, on_change, current=None, interval=1.0):
+        self.path = path
+        self.on_change = on_change
+        self.current = current
+        self.interval = interval
+        self.reloads = 0
+        self.errors = 0
+        self.signature = self.file_signature()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.log = logs.logging()
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def check(self):
+        """
+        检查一次配置文件
+
+        返回:
+            set: 已应用的变化的键，没有变化或加载失败时为空集合
+        """
+        signature = self.file_signature()
+        if signature is None or signature == self.signature:
+            return set()
+        self.signature = signature
+
+        try:
+            settings = load_settings(self.path)
+        except SettingsError as e:
+            self.errors += 1
+            self.log.log(f"配置文件已修改但未生效，{e}", "error")
+            return set()
+
+        changed = settings.changed_keys(self.current) if self.current is not None else set(settings)
+        if not changed:
+            return set()
+        restart = sorted(changed & RESTART_KEYS)
+        if restart:
+            self.log.log(f"以下配置需要重启后生效: {', '.join(restart)}", "key")
+        try:
+            self.on_change(settings, changed)
+        except Exception as e:
+            self.errors += 1
+            self.log.log(f"应用新配置失败: {e}", "error")
+            return set()
+        self.current = settings
+        self.reloads += 1
+        self.log.log(f"配置已更新: {', '.join(sorted(changed))}", "key")
+        return changed
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """在守护线程上开始检查"""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="settings-watcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,77 @@
+"""
+提示词中的临时上下文
+
+时间段、当前话题、对方资料这类信息每一轮都可能变化，以前是作为系统消息追加进对话历史的：
+每次变化都多一条 "继续关于学习的话题"、"现在是晚上，"，它们挤占记忆轮数，
+还让每一轮的提示词都在不同位置多出几条内容。
+
+ContextSlots 把这些信息作为结构化的状态保存，每个槽位只有一个当前值，
+组装提示词时渲染成一条系统消息，放在固定的位置（紧挨在最新一条用户消息之前）；
+对话历史里只有真正的对话，系统提示、示例对话和之前的历史每一轮都保持不变，推理服务可以复用前缀的缓存，
+每轮变化的上下文也离当前问题最近。
+
+槽位按 SLOTS 的顺序渲染，值为空的槽位不输出:
+    time    -> "现在是晚上。"
+    topic   -> "正在聊学习相关的话题。"
+    profile -> "关于对方：大学同学，在杭州工作。"
+
+使用示例:
+    slots = ContextSlots()
+    slots.set("time", "晚上")
+    slots.set("topic", "学习")
+    slots.render()
+    # {"role": "system", "content": "现在是晚上。正在聊学习相关的话题。"}
+    slots.set("topic", None)   # 清空槽位
+"""
+
+# 槽位名 -> 渲染模板，按这个顺序输出
+SLOTS = {
+    "time": "现在是{}。",
+    "topic": "正在聊{}相关的话题。",
+    "profile": "关于对方：{}",
+}
+
+
+class ContextSlots:
+    """
+    固定槽位的上下文状态
+
+    属性:
+        values (dict): 槽位名 -> 当前值，没有值的槽位不在其中
+    """
+
+    def __init__(self, **values):
+        self.values = {}
+        for name, value in values.items():
+            self.set(name, value)
+
+    def set(self, name, value):
+        """
+        设置槽位的值，值为 None 或空字符串时清空
+
+        异常:
+            KeyError: 未知的槽位
+        """
+        if name not in SLOTS:
+            raise KeyError(f"未知的上下文槽位: {name}")
+        if value:
+            self.values[name] = value
+        else:
+            self.values.pop(name, None)
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def render(self, **overrides):
+        """
+        渲染成一条系统消息
+
+        参数:
+            **overrides: 只在这一次渲染中替换的槽位值（如按会话取的对方资料），不改变保存的状态
+
+        返回:
+            dict: {"role": "system", "content": ...}，所有槽位都为空时为 None
+        """
+        values = dict(self.values, **overrides)
+        content = "".join(template.format(values[name]) for name, template in SLOTS.items() if values.get(name))
+        return {"role": "system", "content": content} if content else None
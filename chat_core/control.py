@@ -0,0 +1,372 @@
+"""
+回复器的本机控制通道
+
+回复器作为常驻进程运行时，在本机的 Unix socket（Windows 上为命名管道）上监听控制连接。
+TUI（python -m feature.tui --attach）和命令行（python -m chat_core.control）可以随时连上查看状态、
+暂停/恢复回复、推送配置、读取指标，断开后回复器照常运行，不需要重启，也不需要重新加载模型。
+
+连接使用 multiprocessing.connection，启动时生成随机密钥写入 "control.key_file"（仅当前用户可读），
+客户端读取同一个文件完成认证，其他用户和进程无法连接。
+
+命令（请求和响应都是字典）:
+    {"command": "status"}                       -> 回复器的 status() 快照
+    {"command": "pause"} / {"command": "resume"} -> 暂停/恢复处理新消息，已排队的回复照常发出
+    {"command": "settings", "values": {...}}     -> 覆盖部分配置，校验通过后立即生效，返回变化的键
+    {"command": "metrics"}                      -> Prometheus 文本格式的指标
+    {"command": "watch", "interval": 1.0, "metrics": False}
+                                                -> 每隔 interval 秒推送一次状态（和指标），直到客户端断开
+    {"command": "stop"}                         -> 停止回复器
+响应为 {"ok": True, "result": ...} 或 {"ok": False, "error": "原因"}。
+
+命令行示例:
+    python -m chat_core.control status
+    python -m chat_core.control pause
+    python -m chat_core.control set cooldown.wx=5 pipeline.check_interval=0.5
+    python -m chat_core.control watch --metrics
+"""
+import argparse
+import errno
+import json
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import logs
+from chat_core import config, metrics
+
+
+def default_address():
+    """Windows 上使用命名管道，其他系统使用运行目录下的 Unix socket"""
+    return r"\\.\pipe\wxbot" if sys.platform == "win32" else "wxbot.sock"
+
+
+def address_family(address):
+    return "AF_PIPE" if address.startswith("\\\\") else "AF_UNIX"
+
+
+def write_key(path):
+    """生成随机密钥写入文件，文件只有当前用户可读写"""
+    key = secrets.token_hex(16)
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(key)
+    return key.encode()
+
+
+def read_key(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip().encode()
+
+
+class ControlServer:
+    """
+    控制通道服务端，每个客户端连接一个守护线程
+
+    replier 需要提供 settings、status()、pause()、resume()、apply_settings(settings, changed) 和 stop()；
+    有 settings_watcher（config.SettingsWatcher）时，推送的配置会同步为它的比较基准。
+
+    属性:
+        address (str): 监听地址（socket 路径或命名管道名）
+        key_file (str): 密钥文件路径
+        clients (int): 当前连接的客户端数
+    """
+
+    def __init__(self, replier, address=None, key_file="control.key"):
+        self.replier = replier
+        self.address = address or default_address()
+        self.key_file = key_file
+        self.clients = 0
+        self.listener = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.log = logs.logging()
+
+    def start(self):
+        """
+        开始监听
+
+        异常:
+            OSError: 地址已被另一个正在运行的回复器占用等
+        """
+        family = address_family(self.address)
+        if family == "AF_UNIX" and os.path.exists(self.address):
+            self.remove_stale_socket()
+        authkey = write_key(self.key_file)
+        self.listener = Listener(self.address, family, authkey=authkey)
+        threading.Thread(target=self.serve, name="control", daemon=True).start()
+        self.log.log(f"控制通道已启动: {self.address}", "key")
+        return self
+
+    def remove_stale_socket(self):
+        """
+        上次异常退出留下的 socket 文件没有进程在监听，删除后才能重新监听
+
+        只做一次原始连接探测，不走认证握手，正在运行的回复器不会因此收到一个中途断开的握手
+        """
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.address)
+        except ConnectionRefusedError:
+            os.remove(self.address)
+            return
+        except FileNotFoundError:
+            return
+        finally:
+            probe.close()
+        raise OSError(f"{self.address} 已被另一个正在运行的回复器使用")
+
+    def serve(self):
+        while not self.stopped.is_set():
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError):
+                self.log.log("拒绝了一个未通过认证的控制连接", "error")
+                continue
+            except OSError as e:
+                if self.stopped.is_set() or e.errno in (errno.EBADF, errno.EINVAL):
+                    return  # 监听已关闭
+                # 客户端在握手中途断开（BrokenPipe、ConnectionReset 等），不影响后续连接
+                self.log.log(f"控制连接握手失败: {e}", "error")
+                continue
+            threading.Thread(target=self.handle, args=(conn,), name="control-client", daemon=True).start()
+
+    def handle(self, conn):
+        """处理一个客户端的请求，直到客户端断开"""
+        with self.lock:
+            self.clients += 1
+        try:
+            while not self.stopped.is_set():
+                request = conn.recv()
+                if isinstance(request, dict) and request.get("command") == "watch":
+                    self.stream(conn, request)
+                    return
+                conn.send(self.dispatch(request))
+        except (EOFError, OSError):
+            pass  # 客户端断开
+        finally:
+            conn.close()
+            with self.lock:
+                self.clients -= 1
+
+    def stream(self, conn, request):
+        """按间隔推送状态，客户端断开时 send 抛出异常结束；间隔不是正数时返回一条错误响应后结束"""
+        try:
+            interval = float(request.get("interval", 1.0))
+        except (TypeError, ValueError):
+            interval = None
+        if interval is None or not interval > 0:
+            conn.send({"ok": False, "error": f"interval 应为正数: {request.get('interval')!r}"})
+            return
+        while not self.stopped.is_set():
+            response = self.dispatch({"command": "status"})
+            if request.get("metrics"):
+                response["metrics"] = metrics.REGISTRY.render()
+            conn.send(response)
+            time.sleep(interval)
+
+    def dispatch(self, request):
+        """执行一条命令，返回响应字典"""
+        try:
+            command = request["command"]
+            if command == "status":
+                result = self.replier.status()
+            elif command == "pause":
+                self.replier.pause()
+                result = True
+            elif command == "resume":
+                self.replier.resume()
+                result = True
+            elif command == "settings":
+                result = self.push_settings(request.get("values") or {})
+            elif command == "metrics":
+                result = metrics.REGISTRY.render()
+            elif command == "stop":
+                self.log.log("收到控制通道的停止命令", "key")
+                threading.Thread(target=self.replier.stop, daemon=True).start()
+                result = True
+            else:
+                return {"ok": False, "error": f"未知命令: {command}"}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "result": result}
+
+    def push_settings(self, values):
+        """
+        在当前配置上覆盖部分配置项并立即应用
+
+        推送后的配置同时成为热更新的比较基准，之后修改 settings.json 时，
+        只有文件中与推送后的配置不同的键才会重新应用。
+
+        返回:
+            list: 变化的键
+        """
+        current = self.replier.settings
+        settings = config.Settings(dict(current, **values), path=current.path)
+        changed = settings.changed_keys(current)
+        if changed:
+            restart = sorted(changed & config.RESTART_KEYS)
+            if restart:
+                self.log.log(f"以下配置需要重启后生效: {', '.join(restart)}", "key")
+            self.replier.apply_settings(settings, changed)
+            watcher = getattr(self.replier, "settings_watcher", None)
+            if watcher is not None:
+                watcher.current = settings
+            self.log.log(f"控制通道推送的配置已生效: {', '.join(sorted(changed))}", "key")
+        return sorted(changed)
+
+    def stop(self):
+        """停止监听并删除 socket 和密钥文件"""
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        if self.listener is not None:
+            self.listener.close()
+        for path in (self.key_file,) + ((self.address,) if address_family(self.address) == "AF_UNIX" else ()):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ControlClient:
+    """
+    控制通道客户端，方法与回复器同名，TUI 可以像使用本进程内的回复器一样使用它
+
+    使用示例:
+        client = ControlClient()
+        client.status()
+        client.pause()
+        client.push_settings({"cooldown.wx": 5})
+        for status in client.watch(interval=1.0):
+            ...
+        client.close()
+    """
+
+    def __init__(self, address=None, key_file="control.key"):
+        self.address = address or default_address()
+        self.conn = Client(self.address, address_family(self.address), authkey=read_key(key_file))
+
+    def call(self, command, **params):
+        """
+        发送一条命令并等待响应
+
+        异常:
+            RuntimeError: 回复器返回了错误
+        """
+        self.conn.send(dict(params, command=command))
+        response = self.conn.recv()
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def status(self):
+        return self.call("status")
+
+    def pause(self):
+        return self.call("pause")
+
+    def resume(self):
+        return self.call("resume")
+
+    def push_settings(self, values):
+        return self.call("settings", values=values)
+
+    def metrics(self):
+        return self.call("metrics")
+
+    def stop(self):
+        return self.call("stop")
+
+    def watch(self, interval=1.0, metrics=False):
+        """持续接收状态推送，返回 (状态, 指标文本) 的生成器；之后这个连接不能再发送其他命令"""
+        self.conn.send({"command": "watch", "interval": interval, "metrics": metrics})
+        while True:
+            response = self.conn.recv()
+            if not response["ok"]:
+                raise RuntimeError(response["error"])
+            yield response["result"], response.get("metrics")
+
+    def close(self):
+        self.conn.close()
+
+
+def setup(replier, settings):
+    """
+    按配置启动控制通道
+
+    参数:
+        replier: 回复器
+        settings (dict): 配置
+            - "control.enabled": 是否启用，默认 false
+            - "control.address": 监听地址，默认 Windows 上为 \\\\.\\pipe\\wxbot，其他系统为 wxbot.sock
+            - "control.key_file": 密钥文件，默认 control.key
+
+    返回:
+        ControlServer: 控制通道，未启用或启动失败时返回 None
+    """
+    if not settings.get("control.enabled", False):
+        return None
+    server = ControlServer(replier, settings.get("control.address"), settings.get("control.key_file", "control.key"))
+    try:
+        return server.start()
+    except OSError as e:
+        logs.logging().log(f"控制通道启动失败: {e}", "error")
+        return None
+
+
+def parse_value(text):
+    """命令行中的配置值按 JSON 解析，解析失败时当作字符串"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="连接正在运行的回复器")
+    parser.add_argument("command", choices=["status", "pause", "resume", "set", "metrics", "watch", "stop"])
+    parser.add_argument("values", nargs="*", help="set 命令的配置项，格式为 键=值，值按 JSON 解析")
+    parser.add_argument("--address", help="控制通道地址，默认与回复器相同")
+    parser.add_argument("--key-file", default="control.key", help="密钥文件，默认为运行目录下的 control.key")
+    parser.add_argument("--interval", type=float, default=1.0, help="watch 的刷新间隔（秒）")
+    parser.add_argument("--metrics", action="store_true", help="watch 时同时输出指标")
+    args = parser.parse_args()
+
+    try:
+        client = ControlClient(args.address, args.key_file)
+    except (OSError, AuthenticationError) as e:
+        sys.exit(f"无法连接回复器: {e}")
+    try:
+        if args.command == "set":
+            values = {}
+            for item in args.values:
+                key, sep, value = item.partition("=")
+                if not sep:
+                    sys.exit(f"配置项格式应为 键=值: {item}")
+                values[key] = parse_value(value)
+            print(json.dumps(client.push_settings(values), ensure_ascii=False))
+        elif args.command == "metrics":
+            print(client.metrics(), end="")
+        elif args.command == "watch":
+            for status, text in client.watch(args.interval, args.metrics):
+                print(json.dumps(status, ensure_ascii=False, default=str), flush=True)
+                if text:
+                    print(text, end="", flush=True)
+        else:
+            print(json.dumps(getattr(client, args.command)(), ensure_ascii=False, indent=2, default=str))
+    except RuntimeError as e:
+        sys.exit(str(e))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
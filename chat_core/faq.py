@@ -0,0 +1,346 @@
+"""
+常见问题快速回复
+
+"营业时间？"、"怎么退货" 这类问题答案是固定的，不需要每次都调用模型。
+FAQ 表在启动时编译成字符 n-gram 倒排索引：每个问题切成相邻 n 个字符的片段，片段 -> 包含它的问题。
+收到消息后只需查出与消息有共同片段的问题，按 Dice 系数 2|A∩B| / (|A|+|B|) 计算相似度，
+最高分达到阈值就直接回复对应的答案，耗时只与消息长度和命中的问题数有关，通常在几十微秒以内；
+没有命中的消息照常交给模型。
+
+比较前统一转为全角/半角一致的小写，并去掉标点和空白，"营业时间？" 和 "营业时间" 完全相同。
+同一个答案可以配置多种问法，问法越全命中率越高。
+
+FAQ 表写在 settings.json 的 "faq.entries" 中，或写在 "faq.file" 指定的 JSON 文件中（两者合并），格式相同:
+    [
+        {"questions": ["营业时间", "几点开门", "几点关门"], "answer": "每天 9:00-21:00 营业"},
+        {"question": "怎么退货", "answer": "七天内在订单页申请退货即可"}
+    ]
+FAQ 文件修改后自动重新加载：查找时最多每秒检查一次文件的修改时间，不会每条消息都访问磁盘。
+
+命令行:
+    python -m chat_core.faq 你们几点开门 "怎么退货呀"    # 查找并输出相似度和耗时
+    python -m chat_core.faq < questions.txt             # 每行一个问题，最后输出命中率和平均耗时
+
+使用示例:
+    index = FaqIndex([{"questions": ["营业时间"], "answer": "9:00-21:00"}])
+    match = index.lookup("营业时间?")
+    match.answer, match.score          # ("9:00-21:00", 1.0)
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import unicodedata
+
+import logs
+from chat_core import config, metrics
+
+
+def normalize(text):
+    """统一全角/半角和大小写，去掉标点、符号和空白"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(char for char in text if char.isalnum())
+
+
+def ngrams(text, n=2):
+    """
+    文本的字符 n-gram 集合，文本不足 n 个字符时整段作为一个片段
+
+    返回:
+        set: 片段集合，文本为空时为空集合
+    """
+    text = normalize(text)
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def parse_entries(entries):
+    """
+    把 FAQ 表展开为 (问题, 答案) 列表
+
+    异常:
+        ValueError: 格式不对
+    """
+    if not isinstance(entries, list):
+        raise ValueError("FAQ 表应为列表")
+    pairs = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get("answer"), str):
+            raise ValueError(f"FAQ 条目应包含 answer: {entry!r}")
+        questions = entry.get("questions", [])
+        if "question" in entry:
+            questions = [entry["question"], *questions]
+        if not questions or not all(isinstance(question, str) for question in questions):
+            raise ValueError(f"FAQ 条目应包含 question 或 questions: {entry!r}")
+        pairs.extend((question, entry["answer"]) for question in questions)
+    return pairs
+
+
+class FaqMatch:
+    """
+    一次命中
+
+    属性:
+        question (str): 命中的问法
+        answer (str): 答案
+        score (float): 相似度，0 到 1
+    """
+
+    def __init__(self, question, answer, score):
+        self.question = question
+        self.answer = answer
+        self.score = score
+
+    def __repr__(self):
+        return f"FaqMatch({self.question!r}, {self.answer!r}, score={self.score:.2f})"
+
+
+class FaqIndex:
+    """
+    字符 n-gram 倒排索引
+
+    属性:
+        threshold (float): 相似度达到这个值才算命中
+        n (int): n-gram 长度
+        questions (list[str]) / answers (list[str]) / sizes (list[int]): 每个问法的原文、答案和片段数
+        postings (dict): 片段 -> 包含它的问法编号列表
+        build_seconds (float): 构建索引的耗时（秒）
+        lookups / hits (int): 查找次数和命中次数
+        lookup_seconds (float): 查找累计耗时（秒）
+    """
+
+    def __init__(self, entries=(), threshold=0.6, n=2):
+        start = time.perf_counter()
+        self.threshold = threshold
+        self.n = n
+        self.questions = []
+        self.answers = []
+        self.sizes = []
+        self.postings = {}
+        for question, answer in parse_entries(list(entries)):
+            grams = ngrams(question, n)
+            if not grams:
+                continue
+            doc = len(self.questions)
+            self.questions.append(question)
+            self.answers.append(answer)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(doc)
+        self.build_seconds = time.perf_counter() - start
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+
+    def lookup(self, text):
+        """
+        查找最相似的问法
+
+        返回:
+            FaqMatch: 相似度达到阈值的最佳问法，没有时为 None
+        """
+        start = time.perf_counter()
+        grams = ngrams(text, self.n)
+        overlaps = {}
+        for gram in grams:
+            for doc in self.postings.get(gram, ()):
+                overlaps[doc] = overlaps.get(doc, 0) + 1
+        best, best_score = None, self.threshold
+        size = len(grams)
+        for doc, overlap in overlaps.items():
+            score = 2 * overlap / (size + self.sizes[doc])
+            # 同分时取先配置的问法
+            if score > best_score or (score == best_score and (best is None or doc < best)):
+                best, best_score = doc, score
+        match = None if best is None else FaqMatch(self.questions[best], self.answers[best], best_score)
+
+        elapsed = time.perf_counter() - start
+        self.lookups += 1
+        self.lookup_seconds += elapsed
+        metrics.FAQ_LOOKUP_SECONDS.observe(elapsed)
+        if match is not None:
+            self.hits += 1
+            metrics.FAQ_HITS.inc()
+        else:
+            metrics.FAQ_MISSES.inc()
+        return match
+
+    def stats(self):
+        """
+        返回:
+            dict: questions 问法数，ngrams 片段数，build_ms 构建耗时（毫秒），lookups 查找次数，
+                hits 命中次数，hit_rate 命中率，mean_lookup_us 平均查找耗时（微秒）
+        """
+        return {
+            "questions": len(self.questions),
+            "ngrams": len(self.postings),
+            "build_ms": self.build_seconds * 1000,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else None,
+            "mean_lookup_us": self.lookup_seconds / self.lookups * 1e6 if self.lookups else None,
+        }
+
+    def __len__(self):
+        return len(self.questions)
+
+
+class FaqResponder:
+    """
+    回复器使用的 FAQ：合并配置和文件中的 FAQ 表，文件修改后自动重新加载
+
+    属性:
+        entries (list): settings.json 中的 FAQ 表
+        path (str): FAQ 文件，为 None 时只用配置中的表
+        index (FaqIndex): 当前的索引
+        check_interval (float): 检查 FAQ 文件是否修改的最短间隔（秒）
+    """
+
+    def __init__(self, entries=(), path=None, threshold=0.6, n=2, check_interval=1.0):
+        self.entries = list(entries)
+        self.path = path
+        self.threshold = threshold
+        self.n = n
+        self.check_interval = check_interval
+        self.checked_at = time.monotonic()
+        self.signature = None
+        self.lock = threading.Lock()
+        self.log = logs.logging()
+        self.index = self.build(self.read_file() if path else [])
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def read_file(self):
+        """
+        读取 FAQ 文件
+
+        异常:
+            OSError: 文件无法读取
+            ValueError: 不是合法的 JSON
+        """
+        self.signature = self.file_signature()
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def build(self, file_entries):
+        index = FaqIndex(self.entries + file_entries, self.threshold, self.n)
+        self.log.log(
+            f"FAQ 索引构建完成: {len(index)} 个问法，{len(index.postings)} 个片段，"
+            f"耗时 {index.build_seconds * 1000:.2f} 毫秒", "key"
+        )
+        return index
+
+    def reload(self):
+        """FAQ 文件有变化时重建索引，加载失败时保留原来的索引；距上次检查不到 check_interval 秒时直接返回"""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        if self.file_signature() == self.signature:
+            return
+        try:
+            index = self.build(self.read_file())
+        except (OSError, ValueError) as e:
+            self.log.log(f"FAQ 文件 {self.path} 加载失败，继续使用原来的索引: {e}", "error")
+            return
+        # 统计跨重建累计
+        index.lookups, index.hits, index.lookup_seconds = self.index.lookups, self.index.hits, self.index.lookup_seconds
+        self.index = index
+
+    def lookup(self, text):
+        with self.lock:
+            self.reload()
+            return self.index.lookup(text)
+
+    def answer(self, messages):
+        """
+        给命中 FAQ 的来信填上固定回复，之后由 split_canned 分出来直接发送
+
+        返回:
+            list[IncomingMessage]: 原来的来信列表
+        """
+        for message in messages:
+            if message.reply is not None:
+                continue
+            match = self.lookup(message.content)
+            if match is not None:
+                message.reply = match.answer
+                self.log.log(f"FAQ 命中 [{match.question}]（相似度 {match.score:.2f}），直接回复: {match.answer}", "state")
+        return messages
+
+    def stats(self):
+        return self.index.stats()
+
+
+SETTINGS_KEYS = {"faq.entries", "faq.file", "faq.threshold", "faq.ngram"}
+
+
+def from_settings(settings):
+    """
+    按配置创建 FAQ
+
+    参数:
+        settings (dict): 配置
+            - "faq.entries": FAQ 表，默认为空
+            - "faq.file": FAQ 文件，格式与 "faq.entries" 相同
+            - "faq.threshold": 相似度阈值，默认 0.6
+            - "faq.ngram": n-gram 长度，默认 2
+
+    返回:
+        FaqResponder: 没有配置 FAQ 或 FAQ 文件无法加载时返回 None
+    """
+    entries = settings.get("faq.entries", [])
+    path = settings.get("faq.file")
+    if not entries and not path:
+        return None
+    try:
+        return FaqResponder(entries, path, settings.get("faq.threshold", 0.6), settings.get("faq.ngram", 2))
+    except (OSError, ValueError) as e:
+        logs.logging().log(f"FAQ 加载失败，所有消息都交给模型: {e}", "error")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在 FAQ 中查找问题，输出相似度、耗时和命中率")
+    parser.add_argument("questions", nargs="*", help="要查找的问题，不给时从标准输入每行读一个")
+    parser.add_argument("--settings", default="settings.json", help="配置文件，默认 settings.json")
+    args = parser.parse_args()
+
+    try:
+        responder = from_settings(config.load_settings(args.settings))
+    except (OSError, ValueError) as e:
+        sys.exit(f"配置加载失败: {e}")
+    if responder is None:
+        sys.exit('没有配置 FAQ，请设置 "faq.entries" 或 "faq.file"')
+    index = responder.index
+    print(f"索引: {len(index)} 个问法，{len(index.postings)} 个片段，构建耗时 {index.build_seconds * 1000:.2f} 毫秒")
+
+    questions = args.questions or (line.strip() for line in sys.stdin)
+    for question in questions:
+        if not question:
+            continue
+        start = time.perf_counter()
+        match = index.lookup(question)
+        elapsed = (time.perf_counter() - start) * 1e6
+        if match is None:
+            print(f"未命中  {elapsed:7.1f} 微秒  {question}")
+        else:
+            print(f"{match.score:.2f}    {elapsed:7.1f} 微秒  {question} -> [{match.question}] {match.answer}")
+
+    stats = index.stats()
+    if stats["lookups"]:
+        print(f"命中 {stats['hits']}/{stats['lookups']}（{stats['hit_rate']:.0%}），平均查找耗时 {stats['mean_lookup_us']:.1f} 微秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+按模板在画面中查找点击目标
+
+AI 网页的复制按钮跟在回答下面，位置随回答长短变化；微信最新气泡的位置随气泡高度变化。
+固定的 reply_coordinate 经常点偏，复制到错误的内容或什么都复制不到。
+
+配置了模板图片时，复制前先在搜索区域内截图，用归一化互相关（NCC）找到模板的位置再点击：
+    1. 先在上一次命中的位置附近（near 像素内）按原图匹配，目标没动时只需要几毫秒
+    2. 附近没找到时，把截图和模板逐级缩小一半建立图像金字塔，在最小的一级上整体匹配，
+       再把候选位置逐级放大、只在候选附近细化，最后在原图上确认
+画面中有多个匹配（每条回答都有复制按钮、每条消息都有气泡）时取最下面的一个，即最新的一个；
+附近命中后只需要再查它下面有没有更新的目标。找不到时退回配置的 reply_coordinate。
+
+模板由 python -m chat_core.calibration --write 自动截取，也可以手工截图保存。相关配置:
+    "ai_reply_template": "templates/ai_reply.png"     模板图片
+    "ai_reply_anchor": [10, 10]                        点击位置相对模板左上角的偏移，默认为模板中心
+    "ai_reply_search_window": [[x1, y1], [x2, y2]]     搜索区域，默认为 ai_reply_window
+    "locator.threshold" / "locator.levels" / "locator.near"
+
+使用示例:
+    locator = TemplateLocator.from_file("templates/ai_reply.png", [[58, 461], [282, 868]])
+    locator.locate(pyautogui)    # [114, 848]，找不到时为 None
+"""
+import time
+
+from PIL import Image
+
+import logs
+from chat_core import startup
+from chat_core.config import region_of
+
+# numpy 只在配置了模板时才用到，第一次匹配时导入
+numpy = startup.LazyModule("numpy")
+
+# 金字塔最小一级的模板边长不小于这个值，再小就没有细节可比了
+MIN_TEMPLATE_SIDE = 6
+
+# 缩小后细节变少，较粗的各级放宽阈值，留到原图上再按 threshold 确认
+COARSE_SLACK = 0.15
+
+# 每一级最多保留的候选位置
+MAX_CANDIDATES = 16
+
+
+def to_gray(image):
+    return numpy.asarray(image.convert("L"), dtype=numpy.float32)
+
+
+def downsample(array):
+    """长宽各缩小一半，每 2x2 个像素取平均"""
+    height, width = array.shape[0] // 2 * 2, array.shape[1] // 2 * 2
+    return array[:height, :width].reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3))
+
+
+def window_sums(array, height, width):
+    """每个 height x width 窗口内的元素和，用积分图计算"""
+    integral = numpy.zeros((array.shape[0] + 1, array.shape[1] + 1), dtype=numpy.float64)
+    integral[1:, 1:] = array.cumsum(axis=0).cumsum(axis=1)
+    return (integral[height:, width:] - integral[:-height, width:]
+            - integral[height:, :-width] + integral[:-height, :-width])
+
+
+def match_template(image, template):
+    """
+    模板在图像每个位置的归一化互相关，取值 -1 到 1，亮度整体偏移或缩放不影响结果
+
+    返回:
+        ndarray: 形状为 (图像高 - 模板高 + 1, 图像宽 - 模板宽 + 1)，图像比模板小时为空数组
+    """
+    th, tw = template.shape
+    rows, cols = image.shape[0] - th + 1, image.shape[1] - tw + 1
+    if rows <= 0 or cols <= 0:
+        return numpy.zeros((0, 0), dtype=numpy.float32)
+    centered = template - template.mean()
+    template_norm = float(numpy.sqrt((centered * centered).sum()))
+    # 模板各像素与对应位置图像的乘积之和；模板均值为 0，不需要再减去窗口均值
+    numerator = numpy.zeros((rows, cols), dtype=numpy.float64)
+    for y in range(th):
+        for x in range(tw):
+            weight = centered[y, x]
+            if weight:
+                numerator += weight * image[y:y + rows, x:x + cols]
+    count = th * tw
+    sums = window_sums(image, th, tw)
+    squares = window_sums(image.astype(numpy.float64) ** 2, th, tw)
+    variance = numpy.maximum(squares - sums * sums / count, 0)
+    denominator = numpy.sqrt(variance) * template_norm
+    # 纯色区域或纯色模板没有可比的结构，记为 0
+    return numpy.where(denominator > 1e-6, numerator / numpy.maximum(denominator, 1e-6), 0.0)
+
+
+def peaks(scores, threshold, min_distance, limit=MAX_CANDIDATES):
+    """
+    得分不低于 threshold 的位置，相距小于 min_distance（高, 宽）的只保留得分最高的一个
+
+    气泡底边这类横向没有变化的模板会沿着边缘得到一排同分的位置，同分时靠下的优先，
+    候选数量有限时也不会漏掉最下面（最新）的目标。
+
+    返回:
+        list: [(得分, y, x), ...]，按得分从高到低
+    """
+    indices = numpy.flatnonzero(scores >= threshold)
+    if len(indices) > limit * 32:
+        indices = indices[numpy.argpartition(scores.ravel()[indices], -limit * 32)[-limit * 32:]]
+    rounded = numpy.round(scores.ravel()[indices], 3)
+    order = indices[numpy.lexsort((-indices, -rounded))]
+    result = []
+    for index in order:
+        y, x = divmod(int(index), scores.shape[1])
+        if all(abs(y - py) >= min_distance[0] or abs(x - px) >= min_distance[1] for _, py, px in result):
+            result.append((float(scores[y, x]), y, x))
+            if len(result) >= limit:
+                break
+    return result
+
+
+class TemplateLocator:
+    """
+    模板匹配定位器
+
+    属性:
+        template (Image): 模板图片
+        search_window (list): 搜索区域 [[x1, y1], [x2, y2]]
+        anchor (list): 点击位置相对模板左上角的偏移 [dx, dy]
+        threshold (float): 原图上的 NCC 阈值，低于它算没找到
+        levels (int): 金字塔的最多级数，1 表示只在原图上匹配
+        near (int): 先在上一次命中位置周围多少像素内查找，0 表示不使用缓存
+        pick (str): 有多个匹配时取哪一个："bottom" 最下面的（最新的），"best" 得分最高的
+        last_hit (tuple): 上一次命中位置 (y, x)，相对搜索区域
+        hits / near_hits / misses (int): 命中次数、其中在上次位置附近命中的次数、没找到的次数
+        last_seconds (float): 最近一次定位的耗时（秒）
+    """
+
+    def __init__(self, template, search_window, anchor=None, threshold=0.8, levels=3, near=24, pick="bottom"):
+        self.template = template
+        self.search_window = search_window
+        self.region = region_of(search_window)
+        self.anchor = list(anchor) if anchor is not None else [template.width // 2, template.height // 2]
+        self.threshold = threshold
+        self.levels = levels
+        self.near = near
+        self.pick = pick
+        self.last_hit = None
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.last_seconds = None
+        self.templates = None
+
+    @classmethod
+    def from_file(cls, path, search_window, **kwargs):
+        """
+        异常:
+            OSError: 模板图片无法读取
+        """
+        with Image.open(path) as image:
+            return cls(image.convert("RGB"), search_window, **kwargs)
+
+    def pyramid(self, template):
+        """模板的各级缩小版本，从原图开始，最小一级的边长不小于 MIN_TEMPLATE_SIDE"""
+        levels = [template]
+        while len(levels) < self.levels and min(levels[-1].shape) >= MIN_TEMPLATE_SIDE * 2:
+            levels.append(downsample(levels[-1]))
+        return levels
+
+    def choose(self, matches):
+        if not matches:
+            return None
+        if self.pick == "bottom":
+            return max(matches, key=lambda match: (match[1], match[0]))
+        return max(matches)
+
+    def search(self, image):
+        """
+        在整幅图像上由粗到细查找
+
+        返回:
+            list: 原图上得分不低于 threshold 的匹配 [(得分, y, x), ...]
+        """
+        images = [image]
+        for template in self.templates[1:]:
+            smaller = downsample(images[-1])
+            if smaller.shape[0] < template.shape[0] or smaller.shape[1] < template.shape[1]:
+                break
+            images.append(smaller)
+
+        level = len(images) - 1
+        template = self.templates[level]
+        threshold = self.threshold - (COARSE_SLACK if level else 0)
+        candidates = peaks(match_template(images[level], template), threshold, template.shape)
+        # 逐级放大候选位置，只在候选周围 2 个像素内细化
+        for level in range(level - 1, -1, -1):
+            template = self.templates[level]
+            threshold = self.threshold - (COARSE_SLACK if level else 0)
+            refined = []
+            for _, y, x in candidates:
+                match = self.best_near(images[level], template, y * 2, x * 2, 2)
+                if match is not None and match[0] >= threshold:
+                    refined.append(match)
+            candidates = refined
+        return candidates
+
+    def best_near(self, image, template, y, x, radius):
+        """在 (y, x) 周围 radius 像素内匹配，返回得分最高的 (得分, y, x)"""
+        th, tw = template.shape
+        top, left = max(y - radius, 0), max(x - radius, 0)
+        patch = image[top:y + radius + th, left:x + radius + tw]
+        scores = match_template(patch, template)
+        if scores.size == 0:
+            return None
+        dy, dx = numpy.unravel_index(int(numpy.argmax(scores)), scores.shape)
+        return float(scores[dy, dx]), top + int(dy), left + int(dx)
+
+    def find(self, image):
+        """
+        先查上一次命中位置附近，再在整幅图像上查找
+
+        返回:
+            tuple: (y, x, 是否在上次位置附近命中)，没找到时为 None
+        """
+        template = self.templates[0]
+        if self.last_hit is not None and self.near:
+            match = self.best_near(image, template, *self.last_hit, self.near)
+            if match is not None and match[0] >= self.threshold:
+                if self.pick != "bottom":
+                    return match[1], match[2], True
+                # 附近的目标下面可能出现了更新的目标，只需再查它下面
+                start = match[1] + template.shape[0] // 2
+                below = self.choose(self.search(image[start:]))
+                if below is None:
+                    return match[1], match[2], True
+                return below[1] + start, below[2], False
+        match = self.choose(self.search(image))
+        return None if match is None else (match[1], match[2], False)
+
+    def locate(self, gui):
+        """
+        截取搜索区域并查找模板
+
+        参数:
+            gui: pyautogui 或虚拟桌面
+
+        返回:
+            list: 点击坐标 [x, y]，没找到时为 None
+        """
+        start = time.perf_counter()
+        image = to_gray(gui.screenshot(region=self.region))
+        if self.templates is None:
+            self.templates = self.pyramid(to_gray(self.template))
+        found = self.find(image)
+        self.last_seconds = time.perf_counter() - start
+        if found is None:
+            self.misses += 1
+            return None
+        y, x, near = found
+        self.last_hit = (y, x)
+        self.hits += 1
+        self.near_hits += near
+        return [self.region[0] + x + self.anchor[0], self.region[1] + y + self.anchor[1]]
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "last_seconds": self.last_seconds,
+        }
+
+
+def settings_keys(prefix):
+    """影响 "wx" 或 "ai" 窗口定位器的配置项，其中任何一项变化时需要重新创建定位器"""
+    return {
+        f"{prefix}_reply_template", f"{prefix}_reply_anchor", f"{prefix}_reply_search_window",
+        f"{prefix}_reply_window", "locator.threshold", "locator.levels", "locator.near",
+    }
+
+
+def from_settings(settings, prefix):
+    """
+    按配置创建 "wx" 或 "ai" 窗口的定位器
+
+    参数:
+        settings (dict): 配置
+            - "{prefix}_reply_template": 模板图片路径，未配置时不使用定位器
+            - "{prefix}_reply_anchor": 点击位置相对模板左上角的偏移，默认为模板中心
+            - "{prefix}_reply_search_window": 搜索区域，默认为 "{prefix}_reply_window"
+            - "locator.threshold": 匹配阈值，默认 0.8
+            - "locator.levels": 金字塔级数，默认 3
+            - "locator.near": 先在上次命中位置周围多少像素内查找，默认 24
+        prefix (str): "wx" 或 "ai"
+
+    返回:
+        TemplateLocator: 定位器，未配置模板或模板无法读取时返回 None
+    """
+    path = settings.get(f"{prefix}_reply_template")
+    if not path:
+        return None
+    try:
+        return TemplateLocator.from_file(
+            path,
+            settings.get(f"{prefix}_reply_search_window") or settings[f"{prefix}_reply_window"],
+            anchor=settings.get(f"{prefix}_reply_anchor"),
+            threshold=settings.get("locator.threshold", 0.8),
+            levels=settings.get("locator.levels", 3),
+            near=settings.get("locator.near", 24)
+        )
+    except OSError as e:
+        logs.logging().log(f"无法读取模板 {path}，{prefix} 窗口使用配置的坐标: {e}", "error")
+        return None
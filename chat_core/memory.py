@@ -0,0 +1,280 @@
+"""
+按会话保存的向量记忆
+
+对话历史只保留最近 "model.message_memory_rounds" 条，更早的内容模型就看不到了。
+向量记忆把每一条对话转成单位向量，按会话追加到一个 NumPy 矩阵中；生成回复前用当前消息的向量
+与矩阵做一次矩阵乘法得到全部余弦相似度，取最相关的几条较早对话放进提示词，
+代替更长的原始历史：提示词长度不变，几百轮之前提到过的事情也能想起来。
+
+矩阵按容量翻倍扩展，追加一条是均摊 O(1)；检索是一次 (条数 x 维数) 的矩阵向量乘法加 argpartition，
+128 维、10 万条时在几毫秒以内（矩阵 50 MB，耗时主要是读内存，维数加倍耗时也大约加倍）。
+
+向量化函数可以替换：embedder 接收文本列表，返回 (条数, 维数) 的矩阵（不要求已归一化）。
+默认的 HashingEmbedder 把字符一元、二元片段用 blake2b 哈希到固定维数（带符号，减少冲突的影响），
+结果完全确定，不需要模型也不需要联网，适合按用词找回相关对话。
+需要语义检索时可以配置自己的函数，如 "memory.embedder": "my_embedder:embed"。
+
+使用示例:
+    memory = ConversationMemory(top_k=3)
+    memory.remember("张三", "user", "我下个月去杭州出差")
+    ...
+    memory.recall("张三", "杭州出差要带什么", skip_recent=10)
+    # [(0.53, "user", "我下个月去杭州出差")]
+"""
+import hashlib
+import importlib
+import math
+import threading
+import time
+
+import logs
+from chat_core import metrics, startup
+from chat_core.faq import normalize
+
+# numpy 只在启用向量记忆时才用到
+numpy = startup.LazyModule("numpy")
+
+
+class HashingEmbedder:
+    """
+    确定性的哈希向量化：字符一元、二元片段按 blake2b 哈希到 dim 维，词频取对数后归一化
+
+    属性:
+        dim (int): 向量维数
+        cache (dict): 片段 -> (维度, 符号)，避免重复计算哈希
+    """
+
+    MAX_CACHE = 1 << 18
+
+    def __init__(self, dim=128):
+        self.dim = dim
+        self.cache = {}
+
+    def slot(self, gram):
+        slot = self.cache.get(gram)
+        if slot is None:
+            value = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "little")
+            slot = (value % self.dim, 1.0 if value >> 63 else -1.0)
+            if len(self.cache) >= self.MAX_CACHE:
+                self.cache.clear()
+            self.cache[gram] = slot
+        return slot
+
+    def grams(self, text):
+        text = normalize(text)
+        return list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+
+    def __call__(self, texts):
+        vectors = numpy.zeros((len(texts), self.dim), dtype=numpy.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for gram in self.grams(text):
+                counts[gram] = counts.get(gram, 0) + 1
+            for gram, count in counts.items():
+                index, sign = self.slot(gram)
+                vectors[row, index] += sign * (1.0 + math.log(count))
+        return vectors
+
+
+def load_embedder(spec, dim=128):
+    """
+    按配置取得向量化函数
+
+    参数:
+        spec (str): "hashing"（默认）或 "模块:函数"，函数接收文本列表，返回 (条数, 维数) 的矩阵
+        dim (int): HashingEmbedder 的维数
+
+    异常:
+        ValueError: 格式不对或找不到函数
+    """
+    if spec == "hashing":
+        return HashingEmbedder(dim)
+    module_name, sep, attr = spec.partition(":")
+    if not sep:
+        raise ValueError(f'向量化函数应为 "hashing" 或 "模块:函数": {spec}')
+    try:
+        return getattr(importlib.import_module(module_name), attr)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"找不到向量化函数 {spec}: {e}") from e
+
+
+class VectorMemory:
+    """
+    一个会话的向量存储
+
+    属性:
+        vectors: (容量, 维数) 的 float32 矩阵，前 len(self) 行有效，每行都是单位向量（全零文本除外）
+        entries (list): 与每一行对应的 (角色, 文本)
+    """
+
+    def __init__(self, dim, capacity=64):
+        self.dim = dim
+        self.vectors = numpy.zeros((capacity, dim), dtype=numpy.float32)
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, vectors, entries):
+        """追加若干行，容量不够时翻倍"""
+        count = len(self.entries)
+        needed = count + len(entries)
+        if needed > len(self.vectors):
+            capacity = len(self.vectors)
+            while capacity < needed:
+                capacity *= 2
+            grown = numpy.zeros((capacity, self.dim), dtype=numpy.float32)
+            grown[:count] = self.vectors[:count]
+            self.vectors = grown
+        norms = numpy.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors[count:needed] = vectors / numpy.maximum(norms, 1e-12)
+        self.entries.extend(entries)
+
+    def search(self, query, k, limit=None):
+        """
+        余弦相似度最高的 k 行
+
+        参数:
+            query: 单位向量
+            limit (int): 只在前 limit 行中查找，默认全部
+
+        返回:
+            list: [(相似度, 行号), ...]，相似度从高到低
+        """
+        count = len(self.entries) if limit is None else max(min(limit, len(self.entries)), 0)
+        if count == 0 or k <= 0:
+            return []
+        scores = self.vectors[:count] @ query
+        if count > k:
+            top = numpy.argpartition(scores, -k)[-k:]
+        else:
+            top = numpy.arange(count)
+        top = top[numpy.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+
+class ConversationMemory:
+    """
+    按会话的对话记忆
+
+    属性:
+        embedder (callable): 向量化函数
+        top_k (int): 每次最多取回的条数
+        min_score (float): 相似度低于这个值的不取回
+        stores (dict): 会话 -> VectorMemory
+        last_recall_seconds (float): 最近一次检索的耗时（秒）
+    """
+
+    def __init__(self, embedder=None, top_k=3, min_score=0.25):
+        self.embedder = embedder or HashingEmbedder()
+        self.top_k = top_k
+        self.min_score = min_score
+        self.stores = {}
+        self.last_recall_seconds = None
+        self.lock = threading.Lock()
+
+    def embed(self, texts):
+        return numpy.asarray(self.embedder(texts), dtype=numpy.float32)
+
+    def remember(self, contact, role, text):
+        """记下一条对话"""
+        self.remember_many(contact, [(role, text)])
+
+    def remember_many(self, contact, entries):
+        """
+        批量记下对话
+
+        参数:
+            entries (list): [(角色, 文本), ...]
+        """
+        entries = [(role, text) for role, text in entries if text and text.strip()]
+        if not entries:
+            return
+        vectors = self.embed([text for _, text in entries])
+        with self.lock:
+            store = self.stores.get(contact)
+            if store is None:
+                store = self.stores[contact] = VectorMemory(vectors.shape[1])
+            store.add(vectors, entries)
+
+    def recall(self, contact, query, skip_recent=0, k=None):
+        """
+        取回与 query 最相关的较早对话
+
+        参数:
+            skip_recent (int): 最近这么多条已经在原始历史中，不再取回
+            k (int): 最多取回的条数，默认 top_k
+
+        返回:
+            list: [(相似度, 角色, 文本), ...]，按对话先后排列
+        """
+        start = time.perf_counter()
+        with self.lock:
+            store = self.stores.get(contact)
+            if store is None:
+                return []
+            query_vector = self.embed([query])[0]
+            norm = numpy.linalg.norm(query_vector)
+            if norm == 0:
+                return []
+            hits = store.search(query_vector / norm, self.top_k if k is None else k, len(store) - skip_recent)
+            result = [(score, *store.entries[row]) for score, row in sorted(hits, key=lambda hit: hit[1])
+                      if score >= self.min_score]
+        self.last_recall_seconds = time.perf_counter() - start
+        metrics.MEMORY_RECALL_SECONDS.observe(self.last_recall_seconds)
+        return result
+
+    def turns(self, contact):
+        store = self.stores.get(contact)
+        return 0 if store is None else len(store)
+
+    def stats(self):
+        return {
+            "contacts": len(self.stores),
+            "turns": sum(len(store) for store in self.stores.values()),
+            "last_recall_ms": None if self.last_recall_seconds is None else self.last_recall_seconds * 1000,
+        }
+
+
+ROLE_NAMES = {"user": "对方", "assistant": "你"}
+
+
+def format_recalled(recalled):
+    """
+    把取回的对话排成一条系统消息
+
+    返回:
+        dict: {"role": "system", "content": ...}，没有取回内容时为 None
+    """
+    if not recalled:
+        return None
+    lines = [f"- {ROLE_NAMES.get(role, role)}: {text}" for _, role, text in recalled]
+    return {"role": "system", "content": "以下是与当前消息相关的较早对话，供参考:\n" + "\n".join(lines)}
+
+
+SETTINGS_KEYS = {"memory.top_k", "memory.min_score"}
+
+
+def from_settings(settings):
+    """
+    按配置创建向量记忆
+
+    参数:
+        settings (dict): 配置
+            - "memory.enabled": 是否启用，默认 false
+            - "memory.embedder": "hashing"（默认）或 "模块:函数"
+            - "memory.dim": HashingEmbedder 的维数，默认 128
+            - "memory.top_k": 每次最多取回的条数，默认 3
+            - "memory.min_score": 相似度低于这个值的不取回，默认 0.25
+
+    返回:
+        ConversationMemory: 未启用或向量化函数无法加载时返回 None
+    """
+    if not settings.get("memory.enabled", False):
+        return None
+    try:
+        embedder = load_embedder(settings.get("memory.embedder", "hashing"), settings.get("memory.dim", 128))
+    except ValueError as e:
+        logs.logging().log(f"向量记忆未启用: {e}", "error")
+        return None
+    return ConversationMemory(embedder, settings.get("memory.top_k", 3), settings.get("memory.min_score", 0.25))
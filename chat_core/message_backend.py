@@ -0,0 +1,173 @@
+import abc
+
+
+class IncomingMessage:
+    """
+    一条待回复的来信
+
+    属性:
+        contact (str): 会话名称（联系人、群名或窗口名），回复会发到这里
+        content (str): 消息文本
+        sender (str): 发送者，群聊中与 contact 不同；取不到时为 None
+        raw: 后端返回的原始消息对象，供需要更多元数据的规则使用
+        reply (str): 后端已经确定的固定回复（如认出来的表情），不为 None 时不交给模型
+    """
+
+    def __init__(self, contact, content, sender=None, raw=None, reply=None):
+        self.contact = contact
+        self.content = content
+        self.sender = sender
+        self.raw = raw
+        self.reply = reply
+
+    def __repr__(self):
+        return f"IncomingMessage({self.contact!r}, {self.content!r}, sender={self.sender!r})"
+
+
+def split_canned(messages):
+    """
+    把带固定回复的来信分出来，它们直接放入发送队列，不需要调用模型
+
+    返回:
+        tuple: (带固定回复的来信, 需要生成回复的来信)
+    """
+    canned = [message for message in messages if message.reply is not None]
+    return canned, [message for message in messages if message.reply is None]
+
+
+class MessageBackend(abc.ABC):
+    """
+    消息来源/去向的统一接口。
+
+    ChatSession（截图 + 点击 + 剪贴板）和 WxHandler（wxauto 接口）都实现了这个接口，
+    AiAutoReplier 只通过它读取来信、发送回复，不关心具体用的是哪种方式。
+
+    子类必须实现（抽象方法，缺少时无法实例化）:
+        receive_messages(): 返回已经稳定、可以处理的新来信列表，没有时返回空列表
+        send_reply(contact, message): 把回复发给指定会话，返回是否成功
+
+    读取来信可以拆成"检测"和"提取"两步，供流水线分阶段执行：
+        detect_messages(): 只判断有没有新来信，返回交给 extract_messages 的标记，没有时返回 None
+        extract_messages(detected): 根据标记取出来信内容
+    默认实现在检测时就完成读取，提取时原样返回；检测和提取开销差别大的后端（如 ChatSession）应当分别实现。
+    """
+
+    def detect_messages(self):
+        """
+        检测新来信
+
+        返回:
+            交给 extract_messages 的标记，没有新来信时返回 None
+        """
+        return self.receive_messages() or None
+
+    def extract_messages(self, detected):
+        """
+        提取来信内容
+
+        参数:
+            detected: detect_messages 返回的标记
+
+        返回:
+            list[IncomingMessage]: 新来信
+        """
+        return detected
+
+    @abc.abstractmethod
+    def receive_messages(self):
+        """
+        读取新来信
+
+        返回:
+            list[IncomingMessage]: 新来信，按时间顺序排列
+        """
+
+    @abc.abstractmethod
+    def send_reply(self, contact, message):
+        """
+        发送回复
+
+        参数:
+            contact (str): 会话名称
+            message (str): 回复内容
+
+        返回:
+            bool: 是否发送成功
+        """
+
+
+def create_desktop(settings):
+    """
+    按 settings.json 中的 "virtual_desktop" 创建虚拟桌面
+
+    参数:
+        settings (dict): 配置
+            - "virtual_desktop": 为 true 时截图、点击和剪贴板都作用在内存中的虚拟窗口上，
+              无需显示器和 Windows 即可运行完整流程
+
+    返回:
+        VirtualDesktop: 虚拟桌面，使用真实桌面时返回 None
+    """
+    if not settings.get("virtual_desktop", False):
+        return None
+    from feature.virtual_desktop import VirtualDesktop
+    return VirtualDesktop.from_settings(settings)
+
+
+def create_backend(settings, dedup=None, desktop=None):
+    """
+    按 settings.json 中的 "backend" 创建微信一侧的消息后端
+
+    参数:
+        settings (dict): 配置
+            - "backend": "screen"（默认，截图 + 剪贴板）或 "wxauto"（wxauto 接口）
+            - "wxauto.contact": wxauto 后端只监控这一个联系人
+            - "listen_contacts": 没有设置 "wxauto.contact" 时监控的联系人，越靠前优先级越高；
+              有多个时返回 feature.wx_scheduler.WxScheduler，按会话列表的未读标记调度
+            - "wxauto.fake": 为 true 时使用 feature.fake_wxauto，无需 Windows 和微信即可运行
+            - "cooldown.wx": 微信一侧的冷却时间（秒）
+            - "wx_reply_template" 等: 复制前按模板查找最新气泡，见 chat_core.locator
+            - "stickers.enabled" 等: 复制前按感知哈希识别表情并使用固定回复，见 chat_core.stickers
+        dedup (MessageFingerprintStore): 消息指纹库
+        desktop (VirtualDesktop): 截图后端使用的虚拟桌面，为 None 时操作真实桌面
+
+    返回:
+        MessageBackend: 消息后端
+    """
+    backend = settings.get("backend", "screen")
+
+    if backend == "wxauto":
+        from feature.wx_handler import WxHandler
+
+        wx = None
+        if settings.get("wxauto.fake", False):
+            from feature.fake_wxauto import WeChat
+            wx = WeChat()
+        contacts = settings.get("listen_contacts") or []
+        contact = settings.get("wxauto.contact") or (contacts or [None])[0]
+        handler = WxHandler(contact=contact, cooldown=settings.get("cooldown.wx", 2.0), dedup=dedup, wx=wx)
+        if settings.get("wxauto.contact") or len(contacts) < 2:
+            return handler
+        from feature.wx_scheduler import WxScheduler
+        return WxScheduler(handler, contacts)
+
+    if backend == "screen":
+        from chat_core import locator, stickers
+        from chat_core.chat_window import ChatWindow
+        from chat_core.chat_session import ChatSession
+
+        return ChatSession(
+            ChatWindow(
+                send_coordinate=settings["wx_send_coordinate"],
+                reply_coordinate=settings["wx_reply_coordinate"],
+                reply_window=settings["wx_reply_window"],
+                name="WeChat",
+                desktop=desktop,
+                locator=locator.from_settings(settings, "wx")
+            ),
+            cooldown=settings.get("cooldown.wx", 2.0),
+            dedup=dedup,
+            stickers=stickers.from_settings(settings)
+        )
+
+    raise ValueError(f"未知的消息后端: {backend}")
@@ -0,0 +1,107 @@
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+class MessageFingerprintStore:
+    """
+    最近已处理消息的指纹库，用于消息去重。
+
+    窗口重绘、滚动、切换窗口都会让监控误以为来了新消息，导致同一句话被回复两次。
+    这个类为每条已处理的来信记录一个指纹（联系人 + 归一化文本 + 近似时间桶），
+    在复制和调用模型之前先查一遍，重复的消息直接丢弃。
+
+    时间桶让"同一个人隔了很久又说了一遍同样的话"仍然会被当作新消息处理。
+    查询时会同时检查当前桶和前一个桶，避免恰好跨过桶边界的重复漏判，
+    因此实际的去重窗口在 bucket_seconds 到 2 * bucket_seconds 之间。
+
+    属性:
+        ttl (float): 指纹保留时间（秒），过期自动淘汰
+        bucket_seconds (float): 时间桶宽度（秒）
+        max_entries (int): 最多保留的指纹数量
+        entries (OrderedDict): 指纹 -> 记录时间，按记录先后排列
+        hits (int): 命中（被丢弃的重复消息）次数
+        misses (int): 未命中（新消息）次数
+
+    使用示例:
+        store = MessageFingerprintStore(ttl=120, bucket_seconds=60)
+        if store.seen("张三", message):
+            return  # 重复消息，跳过
+        # 处理新消息...
+    """
+
+    def __init__(self, ttl=120.0, bucket_seconds=60.0, max_entries=2048):
+        self.ttl = max(ttl, bucket_seconds * 2)
+        self.bucket_seconds = bucket_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text):
+        """统一全半角、大小写和空白，避免复制时的细微差异影响判断"""
+        text = unicodedata.normalize("NFKC", text).casefold()
+        return re.sub(r"\s+", " ", text).strip()
+
+    def fingerprint(self, contact, content, bucket):
+        """
+        计算消息指纹
+
+        参数:
+            contact (str): 联系人或窗口名称
+            content (str | bytes): 消息文本，或截图等原始字节
+            bucket (int): 时间桶编号
+
+        返回:
+            str: 指纹
+        """
+        if isinstance(content, str):
+            content = self.normalize(content).encode("utf-8")
+        digest = hashlib.blake2b(content, digest_size=16)
+        digest.update(b"\x00" + str(contact).encode("utf-8"))
+        digest.update(b"\x00" + str(bucket).encode("ascii"))
+        return digest.hexdigest()
+
+    def evict(self, now):
+        """淘汰过期和超出容量的指纹"""
+        while self.entries:
+            fingerprint, recorded = next(iter(self.entries.items()))
+            if now - recorded <= self.ttl and len(self.entries) <= self.max_entries:
+                break
+            self.entries.popitem(last=False)
+
+    def seen(self, contact, content, now=None):
+        """
+        检查消息是否已处理过，未处理过则记录下来
+
+        参数:
+            contact (str): 联系人或窗口名称
+            content (str | bytes): 消息文本，或截图等原始字节
+            now (float): 当前时间戳，默认取 time.time()
+
+        返回:
+            bool: True 表示重复消息，应当丢弃
+        """
+        now = time.time() if now is None else now
+        self.evict(now)
+
+        bucket = int(now // self.bucket_seconds)
+        current = self.fingerprint(contact, content, bucket)
+        if current in self.entries or self.fingerprint(contact, content, bucket - 1) in self.entries:
+            self.hits += 1
+            return True
+
+        self.entries[current] = now
+        self.misses += 1
+        return False
+
+    def stats(self):
+        """返回去重统计信息"""
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
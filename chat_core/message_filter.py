@@ -0,0 +1,141 @@
+import re
+import time
+from collections import deque
+
+from chat_core.topic_classifier import TopicClassifier
+
+
+class MessageFilter:
+    """
+    调用模型之前的消息过滤规则。
+
+    群聊里大部分消息都不需要回复，只有被 @、特定的人发言或提到特定关键词时才回复。
+    这些规则只看消息的元数据（会话、发送者、文本），在推理之前执行，
+    被忽略的消息不会占用任何模型时间。
+
+    规则按以下顺序执行：
+        1. 发送者在 deny_senders 中：忽略
+        2. 包含 ignore_keywords 中的关键词：忽略
+        3. 群聊消息需要满足任一条件：@了 mention_names 中的名字、
+           发送者在 allow_senders 中、包含 trigger_keywords 中的关键词
+           （require_mention 为 false 时不检查这一条）
+        4. 群聊回复频率超过 group_rate_limit：忽略
+
+    判断群聊的方式：会话名在 groups 中，或者发送者与会话名不同（wxauto 群消息的发送者是群成员）。
+
+    配置格式（settings.json 中的 "message_filter"）：
+        {
+            "groups": ["项目群"],
+            "mention_names": ["小助手"],
+            "require_mention": true,
+            "allow_senders": ["老板"],
+            "deny_senders": ["广告机器人"],
+            "trigger_keywords": ["报价", "售后"],
+            "ignore_keywords": ["广告", "推广"],
+            "group_rate_limit": {"max": 5, "per_seconds": 60}
+        }
+
+    属性:
+        stats (dict): 各结果的计数，键为 passed 或忽略原因
+
+    使用示例:
+        message_filter = MessageFilter(settings.get("message_filter", {}))
+        messages = message_filter.filter_messages(backend.receive_messages())
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.groups = set(config.get("groups", []))
+        self.mention_names = list(config.get("mention_names", []))
+        self.require_mention = config.get("require_mention", True)
+        self.allow_senders = set(config.get("allow_senders", []))
+        self.deny_senders = set(config.get("deny_senders", []))
+
+        # 关键词表可能很大，复用主题分类器的自动机，一次扫描完成匹配
+        self.trigger_matcher = TopicClassifier({"trigger": config.get("trigger_keywords", [])})
+        self.ignore_matcher = TopicClassifier({"ignore": config.get("ignore_keywords", [])})
+
+        rate_limit = config.get("group_rate_limit") or {}
+        self.rate_max = rate_limit.get("max", 0)
+        self.rate_window = rate_limit.get("per_seconds", 60)
+        self.group_history = {}
+
+        # 微信 @ 某人后会跟一个四分之一空格（U+2005）
+        self.mention_pattern = re.compile(
+            "|".join(f"@{re.escape(name)}[\u2005 ]?" for name in self.mention_names)
+        ) if self.mention_names else None
+
+        self.stats = {}
+
+    def is_group(self, message):
+        """判断是否为群聊消息"""
+        if message.contact in self.groups:
+            return True
+        return bool(message.sender) and message.sender != message.contact
+
+    def is_mentioned(self, message):
+        """判断消息是否 @ 了自己"""
+        return self.mention_pattern is not None and self.mention_pattern.search(message.content) is not None
+
+    def within_rate_limit(self, contact, now):
+        """检查并记录群聊回复频率"""
+        if self.rate_max <= 0:
+            return True
+        history = self.group_history.setdefault(contact, deque())
+        while history and now - history[0] > self.rate_window:
+            history.popleft()
+        if len(history) >= self.rate_max:
+            return False
+        history.append(now)
+        return True
+
+    def check(self, message, now=None):
+        """
+        判断一条消息是否需要交给模型
+
+        参数:
+            message (IncomingMessage): 来信
+            now (float): 当前时间戳，默认取 time.time()
+
+        返回:
+            bool: 是否需要处理
+            str: 结果，"passed" 或忽略原因
+        """
+        if message.sender in self.deny_senders:
+            return False, "denied_sender"
+        if self.ignore_matcher.best_topic(message.content):
+            return False, "ignored_keyword"
+
+        if self.is_group(message):
+            if self.require_mention and not (
+                self.is_mentioned(message)
+                or message.sender in self.allow_senders
+                or self.trigger_matcher.best_topic(message.content)
+            ):
+                return False, "not_triggered"
+            if not self.within_rate_limit(message.contact, time.time() if now is None else now):
+                return False, "rate_limited"
+
+        return True, "passed"
+
+    def filter_messages(self, messages, now=None):
+        """
+        过滤一批来信，去掉消息中 @ 自己的部分
+
+        参数:
+            messages (list[IncomingMessage]): 来信
+            now (float): 当前时间戳
+
+        返回:
+            list[IncomingMessage]: 需要交给模型处理的来信
+        """
+        passed = []
+        for message in messages:
+            allowed, reason = self.check(message, now)
+            self.stats[reason] = self.stats.get(reason, 0) + 1
+            if not allowed:
+                continue
+            if self.mention_pattern is not None:
+                message.content = self.mention_pattern.sub("", message.content).strip()
+            passed.append(message)
+        return passed
@@ -0,0 +1,262 @@
+"""
+进程内指标，按 Prometheus 文本格式在本机 HTTP 端口上提供
+
+默认关闭，关闭时每个埋点只是一次方法调用和一次布尔判断。
+settings.json 中 "metrics.enabled" 为 true 时由 setup() 打开，
+并在 127.0.0.1:"metrics.port"（默认 9464）/metrics 上提供指标。
+
+使用示例:
+    from chat_core import metrics
+
+    metrics.POLLS.inc(window="WeChat")
+    metrics.CAPTURE_SECONDS.observe(0.03, window="WeChat")
+    metrics.register_gauge("wxbot_send_queue_depth", "发送队列中等待的回复数",
+                           lambda: send_queue.stats()["depth"])
+    metrics.setup(settings)
+
+    # curl http://127.0.0.1:9464/metrics
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import logs
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape_label(value):
+    """转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels, extra=()):
+    """把标签格式化为 {a="1",b="2"}，没有标签时返回空字符串"""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    指标注册表
+
+    属性:
+        enabled (bool): 是否记录指标，为 False 时所有埋点直接返回
+        metrics (list): 已注册的指标，按注册顺序输出
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """按 Prometheus 文本格式输出全部指标"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    type = "counter"
+
+    def __init__(self, name, help, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.registry = registry
+        self.values = {}
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.registry.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{format_labels(key)} {format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    """按区间统计取值分布，适合耗时类指标"""
+
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.registry = registry
+        self.values = {}
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self.registry.lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, amount in zip(self.buckets, counts):
+                cumulative += amount
+                lines.append(f"{self.name}_bucket{format_labels(key, [('le', format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class CallbackGauge:
+    """
+    抓取时才计算的瞬时值，例如队列深度；平时没有任何开销
+
+    function() 返回一个数值，或 [(标签字典, 数值), ...]
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, function, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.function = function
+        registry.register(self)
+
+    def samples(self):
+        try:
+            result = self.function()
+        except Exception:
+            return []
+        if isinstance(result, (int, float)):
+            return [f"{self.name} {format_value(result)}"]
+        return [
+            f"{self.name}{format_labels(sorted(labels.items()))} {format_value(value)}"
+            for labels, value in result
+        ]
+
+
+def register_gauge(name, help, function, registry=REGISTRY):
+    """注册一个抓取时计算的瞬时值，同名的旧值会被替换"""
+    registry.metrics = [metric for metric in registry.metrics if metric.name != name]
+    return CallbackGauge(name, help, function, registry)
+
+
+# 各模块的埋点
+POLLS = Counter("wxbot_polls_total", "监控轮询次数")
+CHANGES = Counter("wxbot_changes_detected_total", "检测到窗口或消息变化的次数")
+EMPTY_COPIES = Counter("wxbot_empty_copies_total", "复制结果为空的次数")
+COOLDOWN_REJECTIONS = Counter("wxbot_cooldown_rejections_total", "因冷却时间被拒绝的复制或发送次数")
+SENDS = Counter("wxbot_sends_total", "发送成功的消息数")
+SEND_FAILURES = Counter("wxbot_send_failures_total", "发送失败的消息数")
+CAPTURE_SECONDS = Histogram("wxbot_capture_seconds", "截取监控区域的耗时（秒）")
+LOCATE_SECONDS = Histogram("wxbot_locate_seconds", "按模板查找点击目标的耗时（秒）")
+LOCATE_MISSES = Counter("wxbot_locate_misses_total", "按模板没有找到点击目标、退回配置坐标的次数")
+STICKER_HITS = Counter("wxbot_sticker_hits_total", "认出表情、使用固定回复的次数")
+STICKER_UNKNOWN = Counter("wxbot_sticker_unknown_total", "复制不到文本、记录为不认识的表情的次数")
+FAQ_HITS = Counter("wxbot_faq_hits_total", "命中 FAQ、直接回复的消息数")
+FAQ_MISSES = Counter("wxbot_faq_misses_total", "没有命中 FAQ、交给模型的消息数")
+FAQ_LOOKUP_SECONDS = Histogram("wxbot_faq_lookup_seconds", "在 FAQ 索引中查找一条消息的耗时（秒）",
+                               buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005))
+MEMORY_RECALL_SECONDS = Histogram("wxbot_memory_recall_seconds", "从向量记忆中取回相关对话的耗时（秒）",
+                                  buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05))
+MODEL_CALLS = Counter("wxbot_model_calls_total", "模型调用次数")
+INFERENCE_REQUESTS = Counter("wxbot_inference_requests_total", "推理池发给各服务的请求数")
+MODEL_LATENCY = Histogram("wxbot_model_latency_seconds", "模型调用耗时（秒）")
+STALLS = Counter("wxbot_stalls_total", "握手状态机卡死（超时或发送失败）的次数")
+BLOCKED_SECONDS = Counter("wxbot_blocked_seconds_total", "卡死累计阻塞流水线的时间（秒）")
+SKIPPED_BATCHES = Counter("wxbot_skipped_batches_total", "重试用完后跳过的消息批次数")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求很频繁，不写入日志
+        pass
+
+
+def serve(port=9464, host="127.0.0.1", registry=REGISTRY):
+    """
+    打开指标记录，并在守护线程上启动 HTTP 服务
+
+    返回:
+        ThreadingHTTPServer: HTTP 服务，调用 shutdown() 停止
+    """
+    handler = type("Handler", (MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    registry.enabled = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def setup(settings):
+    """
+    按配置启动指标服务
+
+    参数:
+        settings (dict): 配置
+            - "metrics.enabled": 是否启用，默认 false
+            - "metrics.host": 监听地址，默认 127.0.0.1，只允许本机访问
+            - "metrics.port": 端口，默认 9464
+
+    返回:
+        ThreadingHTTPServer: HTTP 服务，未启用或启动失败时返回 None
+    """
+    if not settings.get("metrics.enabled", False):
+        return None
+    host = settings.get("metrics.host", "127.0.0.1")
+    port = settings.get("metrics.port", 9464)
+    try:
+        server = serve(port, host)
+    except OSError as e:
+        logs.logging().log(f"指标服务启动失败: {e}", "error")
+        return None
+    logs.logging().log(f"指标服务已启动: http://{host}:{port}/metrics", "key")
+    return server
@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+import logs
+
+
+class PipelineStage:
+    """
+    流水线中的一个阶段，在自己的线程上运行。
+
+    每个阶段从输入队列取任务，交给 handler 处理，把非 None 的结果放入输出队列。
+    队列都是有界的，下游处理不过来时上游会阻塞，不会无限堆积。
+
+    没有输入队列的阶段是数据源，每隔 interval 秒调用一次 handler(None)。
+    on_idle 为 True 时，输入队列 interval 秒内没有任务也会调用一次 handler(None)，
+    适合需要定期执行的阶段（例如发出排队中的回复）。
+
+    属性:
+        name (str): 阶段名称
+        handler (callable): handler(item) -> 结果或 None
+        inbox (queue.Queue): 输入队列，数据源阶段为 None
+        outbox (queue.Queue): 输出队列，最后一个阶段为 None
+        interval (float): 轮询间隔（秒）
+        processed (int): 已处理的任务数（数据源阶段为产出的任务数）
+        busy_time (float): handler 累计耗时（秒）
+    """
+
+    def __init__(self, name, handler, inbox=None, outbox=None, interval=1.0, on_idle=False):
+        self.name = name
+        self.handler = handler
+        self.inbox = inbox
+        self.outbox = outbox
+        self.interval = interval
+        self.on_idle = on_idle
+        self.processed = 0
+        self.busy_time = 0.0
+        self.started_at = None
+        self.polled = False
+        self.thread = None
+        self.pipeline = None
+
+    def next_item(self):
+        """取下一个任务，返回 (是否需要处理, 任务)"""
+        if self.inbox is None:
+            # 数据源启动后立即轮询一次，之后每隔 interval 秒一次
+            if self.polled:
+                time.sleep(self.interval)
+            self.polled = True
+            return True, None
+        try:
+            return True, self.inbox.get(timeout=self.interval)
+        except queue.Empty:
+            return self.on_idle, None
+
+    def run(self):
+        """阶段主循环"""
+        self.started_at = time.time()
+        while not self.pipeline.stopped.is_set():
+            ready, item = self.next_item()
+            if not ready:
+                continue
+
+            start = time.time()
+            try:
+                result = self.handler(item)
+            except self.pipeline.fatal_exceptions as e:
+                self.pipeline.log.log(f"{self.name} 阶段遇到致命错误，流水线停止: {e!r}", "key")
+                self.pipeline.stop()
+                return
+            except Exception as e:
+                self.pipeline.log.log(f"{self.name} 阶段出错: {e}", "error")
+                result = None
+            finally:
+                self.busy_time += time.time() - start
+
+            # 数据源阶段按产出计数，其他阶段按处理的任务计数
+            if item is not None or (self.inbox is None and result is not None):
+                self.processed += 1
+            if result is not None and self.outbox is not None:
+                self.put(result)
+
+    def put(self, result):
+        """放入输出队列，队列满时等待，流水线停止时放弃"""
+        while not self.pipeline.stopped.is_set():
+            try:
+                self.outbox.put(result, timeout=self.interval)
+                return
+            except queue.Full:
+                continue
+
+    def stats(self):
+        """
+        返回阶段统计信息
+
+        返回:
+            dict: processed 已处理数，queue_depth/queue_size 输入队列深度和容量，
+                utilisation handler 占用时间比例（0~1）
+        """
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            "processed": self.processed,
+            "queue_depth": self.inbox.qsize() if self.inbox is not None else 0,
+            "queue_size": self.inbox.maxsize if self.inbox is not None else 0,
+            "utilisation": min(self.busy_time / elapsed, 1.0) if elapsed > 0 else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    由多个阶段串联成的生产者/消费者流水线。
+
+    相邻阶段之间用有界队列连接，每个阶段各占一个线程，
+    这样上一条消息还在等待 AI 生成时，下一条消息已经可以被检测和提取。
+
+    属性:
+        stages (list[PipelineStage]): 各阶段，按数据流向排列
+        fatal_exceptions (tuple): 遇到这些异常时停止整条流水线（如 pyautogui.FailSafeException）
+        stopped (threading.Event): 流水线是否已停止
+
+    使用示例:
+        pipeline = Pipeline(queue_size=4, fatal_exceptions=(pyautogui.FailSafeException,))
+        pipeline.add_stage("detect", detect, interval=1.0)
+        pipeline.add_stage("extract", extract)
+        pipeline.add_stage("generate", generate)
+        pipeline.add_stage("deliver", deliver, on_idle=True)
+        pipeline.start()
+        print(pipeline.stats())
+    """
+
+    def __init__(self, queue_size=4, fatal_exceptions=()):
+        self.queue_size = queue_size
+        self.fatal_exceptions = tuple(fatal_exceptions)
+        self.stages = []
+        self.stopped = threading.Event()
+        self.log = logs.logging()
+
+    def add_stage(self, name, handler, interval=1.0, on_idle=False):
+        """
+        在流水线末尾添加一个阶段，第一个阶段是数据源
+
+        返回:
+            PipelineStage: 新添加的阶段
+        """
+        inbox = None
+        if self.stages:
+            inbox = queue.Queue(maxsize=self.queue_size)
+            self.stages[-1].outbox = inbox
+        stage = PipelineStage(name, handler, inbox=inbox, interval=interval, on_idle=on_idle)
+        stage.pipeline = self
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        """为每个阶段启动一个守护线程"""
+        self.stopped.clear()
+        for stage in self.stages:
+            stage.thread = threading.Thread(target=stage.run, name=f"pipeline-{stage.name}", daemon=True)
+            stage.thread.start()
+
+    def stop(self):
+        """通知所有阶段停止"""
+        self.stopped.set()
+
+    def is_running(self):
+        """是否仍有阶段在运行"""
+        return not self.stopped.is_set() and any(
+            stage.thread is not None and stage.thread.is_alive() for stage in self.stages
+        )
+
+    def stats(self):
+        """返回各阶段的统计信息"""
+        return {stage.name: stage.stats() for stage in self.stages}
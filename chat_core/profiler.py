@@ -0,0 +1,192 @@
+"""
+运行中的回复器的采样分析器
+
+回复变慢时不需要外部分析器附加到进程上：发送信号或在 settings.json 中打开 "profiler.enabled"，
+采样线程按固定频率抓取所有线程（监控线程、流水线各阶段、模型调用、日志等）的调用栈，
+持续 duration 秒后按 collapsed stack 格式写入文件，可以直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+
+关闭时没有任何采样线程，只注册了一个信号处理函数，对运行没有影响。
+
+触发方式:
+    - Linux / macOS: kill -USR1 <pid>
+    - Windows: 在控制台窗口按 Ctrl+Break
+    - 把 settings.json 中的 "profiler.enabled" 改为 true（启动时或热更新时都会开始一次采样）
+
+输出示例（每行一个调用栈，从线程名到最内层函数，末尾是采样次数）:
+    detect;run (chat_core/pipeline.py:54);detect_wx_message (main.py:107);... 37
+
+使用示例:
+    sampler = profiler.setup(settings)    # 注册信号，"profiler.enabled" 为 true 时立即开始
+    sampler.start(duration=10)            # 手动采样 10 秒
+"""
+import os
+import signal
+import sys
+import threading
+import time
+
+import logs
+
+# 触发采样的信号，Windows 上没有 SIGUSR1，使用 Ctrl+Break 对应的 SIGBREAK
+PROFILE_SIGNAL = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+
+
+def frame_label(code):
+    """函数在火焰图中的名字：函数名 (上级目录/文件名:定义行号)"""
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """
+    调用栈采样器
+
+    属性:
+        interval (float): 采样间隔（秒）
+        duration (float): 每次采样持续的时间（秒）
+        output_dir (str): 结果保存目录
+        counts (dict): 调用栈 -> 采样次数，只在采样期间使用
+        samples (int): 本次采样的次数
+        last_output (str): 最近一次写入的文件路径
+    """
+
+    def __init__(self, interval=0.01, duration=30.0, output_dir="profiles"):
+        self.interval = interval
+        self.duration = duration
+        self.output_dir = output_dir
+        self.counts = {}
+        self.samples = 0
+        self.last_output = None
+        self.labels = {}
+        self.thread = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.log = logs.logging()
+
+    def configure(self, interval=0.01, duration=30.0, output_dir="profiles"):
+        """更新采样参数，正在进行的采样结束后生效"""
+        self.interval = interval
+        self.duration = duration
+        self.output_dir = output_dir
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration=None):
+        """
+        开始一次采样，已经在采样时忽略
+
+        返回:
+            bool: 是否开始了新的采样
+        """
+        with self.lock:
+            if self.running():
+                return False
+            self.stopped.clear()
+            self.thread = threading.Thread(
+                target=self.run, args=(self.duration if duration is None else duration,),
+                name="profiler", daemon=True
+            )
+            self.thread.start()
+        return True
+
+    def stop(self):
+        """提前结束采样，已采到的数据照常写入文件"""
+        self.stopped.set()
+
+    def sample(self):
+        """抓取一次除采样线程外所有线程的调用栈"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        current = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == current:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = self.labels.get(code)
+                if label is None:
+                    label = self.labels[code] = frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def run(self, duration):
+        self.counts = {}
+        self.samples = 0
+        self.log.log(f"开始采样调用栈，{duration:.0f} 秒后写入 {self.output_dir}/", "key")
+        deadline = time.perf_counter() + duration
+        next_sample = time.perf_counter()
+        while not self.stopped.is_set() and next_sample < deadline:
+            self.sample()
+            next_sample += self.interval
+            self.stopped.wait(max(next_sample - time.perf_counter(), 0))
+        try:
+            path = self.write()
+        except OSError as e:
+            self.log.log(f"写入采样结果失败: {e}", "error")
+            return
+        self.log.log(f"采样结束，共 {self.samples} 次，结果已写入 {path}；耗时最多的函数: {self.summary()}", "key")
+
+    def write(self):
+        """把采样结果按 collapsed stack 格式写入文件，返回文件路径"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"wxbot-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.collapsed"
+        path = os.path.join(self.output_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+        self.last_output = path
+        return path
+
+    def summary(self, top=5):
+        """按最内层函数汇总采样次数，返回占比最高的几个"""
+        leaves = {}
+        total = sum(self.counts.values()) or 1
+        for stack, count in self.counts.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        ranked = sorted(leaves.items(), key=lambda item: item[1], reverse=True)[:top]
+        return ", ".join(f"{leaf} {count / total:.0%}" for leaf, count in ranked)
+
+    def install_signal(self):
+        """注册触发采样的信号，只能在主线程调用；平台不支持时返回 False"""
+        if PROFILE_SIGNAL is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(PROFILE_SIGNAL, lambda signum, frame: self.start())
+        return True
+
+    def apply_settings(self, settings, changed=None):
+        """
+        按配置更新采样参数；"profiler.enabled" 由 false 改为 true（或启动时为 true）时开始一次采样
+        """
+        self.configure(
+            interval=settings.get("profiler.interval", 0.01),
+            duration=settings.get("profiler.duration", 30.0),
+            output_dir=settings.get("profiler.output_dir", "profiles")
+        )
+        if settings.get("profiler.enabled", False) and (changed is None or "profiler.enabled" in changed):
+            self.start()
+
+
+def setup(settings):
+    """
+    按配置创建采样器并注册触发信号
+
+    参数:
+        settings (dict): 配置
+            - "profiler.enabled": 为 true 时立即采样一次，默认 false
+            - "profiler.interval": 采样间隔（秒），默认 0.01
+            - "profiler.duration": 每次采样的时间（秒），默认 30
+            - "profiler.output_dir": 结果保存目录，默认 profiles
+
+    返回:
+        Profiler: 采样器
+    """
+    profiler = Profiler()
+    profiler.install_signal()
+    profiler.apply_settings(settings)
+    return profiler
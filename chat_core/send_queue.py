@@ -0,0 +1,240 @@
+import threading
+import time
+import logs
+
+
+class TokenBucket:
+    """
+    令牌桶限速器
+
+    以 rate 个/秒的速度往桶里加令牌，桶最多存 burst 个，每发送一条消息消耗一个令牌。
+
+    属性:
+        rate (float): 每秒补充的令牌数
+        burst (float): 桶容量，即允许的瞬时突发条数
+        tokens (float): 当前令牌数
+        updated (float): 上次补充令牌的时间戳
+    """
+
+    def __init__(self, rate, burst=1, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time() if now is None else now
+
+    def refill(self, now):
+        """按经过的时间补充令牌"""
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        """距离下一个令牌可用还需等待的秒数，0 表示现在就可以发送"""
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        """消耗一个令牌"""
+        self.refill(now)
+        self.tokens -= 1
+
+
+class SendQueue:
+    """
+    带令牌桶限速的发送队列。
+
+    原来的 send_message 在冷却期内直接返回 False，回复就此丢失。发送队列把回复先存起来，
+    等全局和该联系人的令牌桶都允许时再发出去，保证回复不会因为限速被丢弃。
+
+    队列本身不开线程：由监控循环每轮调用 pump() 把到期的消息发出去。
+    这样发送和截图、复制等窗口操作始终在同一个线程里执行，不会互相抢鼠标和剪贴板。
+
+    属性:
+        global_rate / global_burst: 全局令牌桶参数（条/秒，突发条数）
+        contact_rate / contact_burst: 每个联系人的令牌桶参数
+        replace_pending (bool): 同一联系人有回复还在排队时，新回复是否替换旧回复
+        max_retries (int): 发送失败的最大重试次数
+        items (list): 排队中的消息，每项为 {"contact", "message", "enqueued_at", "attempts"}
+        sent / replaced / failed (int): 已发送、被替换、重试后仍失败的条数
+        total_wait / max_wait (float): 已发送消息的累计、最大排队时间（秒）
+
+    使用示例:
+        queue = SendQueue(global_rate=1.0, contact_rate=0.5, replace_pending=True)
+        queue.put("张三", "你好")
+
+        # 在监控循环里
+        queue.pump(lambda contact, message: session.send_message(message))
+        print(queue.stats())
+    """
+
+    def __init__(self, global_rate=1.0, global_burst=1, contact_rate=0.5, contact_burst=1,
+                 replace_pending=False, max_retries=3):
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.contact_rate = contact_rate
+        self.contact_burst = contact_burst
+        self.replace_pending = replace_pending
+        self.max_retries = max_retries
+
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.contact_buckets = {}
+        self.items = []
+        self.lock = threading.RLock()
+
+        self.sent = 0
+        self.replaced = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self.log = logs.logging()
+
+    def configure(self, global_rate=None, global_burst=None, contact_rate=None, contact_burst=None,
+                  replace_pending=None):
+        """
+        修改限速参数（配置热更新时调用），排队中的消息和已有的令牌保留
+
+        参数为 None 的项保持不变。
+        """
+        with self.lock:
+            # 先按旧速率结算已经过去的时间
+            now = time.time()
+            self.global_bucket.refill(now)
+            for bucket in self.contact_buckets.values():
+                bucket.refill(now)
+            if global_rate is not None:
+                self.global_rate = self.global_bucket.rate = global_rate
+            if global_burst is not None:
+                self.global_burst = self.global_bucket.burst = global_burst
+            if contact_rate is not None:
+                self.contact_rate = contact_rate
+            if contact_burst is not None:
+                self.contact_burst = contact_burst
+            for bucket in self.contact_buckets.values():
+                bucket.rate = self.contact_rate
+                bucket.burst = self.contact_burst
+            if replace_pending is not None:
+                self.replace_pending = replace_pending
+
+    def bucket_for(self, contact, now):
+        """取出（或创建）联系人的令牌桶"""
+        bucket = self.contact_buckets.get(contact)
+        if bucket is None:
+            bucket = self.contact_buckets[contact] = TokenBucket(self.contact_rate, self.contact_burst, now)
+        return bucket
+
+    def put(self, contact, message, replace=None):
+        """
+        把回复放入队列
+
+        参数:
+            contact (str): 接收消息的联系人
+            message (str): 回复内容
+            replace (bool): 是否替换该联系人仍在排队的回复，默认取 replace_pending
+
+        返回:
+            bool: True 表示替换了排队中的旧回复，False 表示新增了一条
+        """
+        replace = self.replace_pending if replace is None else replace
+        now = time.time()
+        with self.lock:
+            if replace:
+                for item in reversed(self.items):
+                    if item["contact"] == contact:
+                        item["message"] = message
+                        item["attempts"] = 0
+                        self.replaced += 1
+                        self.log.log(f"{contact} 的排队回复已被新回复替换", level="state")
+                        return True
+            self.items.append({"contact": contact, "message": message, "enqueued_at": now, "attempts": 0})
+            return False
+
+    def next_ready_in(self, now=None):
+        """
+        距离下一条消息可以发送还需等待的秒数
+
+        返回:
+            float: 等待秒数，队列为空时返回 None
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            if not self.items:
+                return None
+            global_wait = self.global_bucket.wait_time(now)
+            contact_wait = min(self.bucket_for(item["contact"], now).wait_time(now) for item in self.items)
+            return max(global_wait, contact_wait)
+
+    def pump(self, sender, now=None):
+        """
+        按先进先出顺序发送所有当前允许发送的消息
+
+        某个联系人被限速时跳过它，继续看后面其他联系人的消息；全局被限速时本轮结束。
+
+        参数:
+            sender (callable): sender(contact, message)，返回是否发送成功
+            now (float): 当前时间戳，默认取 time.time()
+
+        返回:
+            int: 本轮成功发送的条数
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            sent = 0
+            index = 0
+            while index < len(self.items):
+                if self.global_bucket.wait_time(now) > 0:
+                    break
+                item = self.items[index]
+                bucket = self.bucket_for(item["contact"], now)
+                if bucket.wait_time(now) > 0:
+                    index += 1
+                    continue
+
+                self.global_bucket.consume(now)
+                bucket.consume(now)
+                if sender(item["contact"], item["message"]):
+                    del self.items[index]
+                    wait = max(now - item["enqueued_at"], 0.0)
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                    self.sent += 1
+                    sent += 1
+                    continue
+
+                item["attempts"] += 1
+                if item["attempts"] > self.max_retries:
+                    del self.items[index]
+                    self.failed += 1
+                    self.log.log(f"发送给 {item['contact']} 的回复重试 {self.max_retries} 次后仍失败: {item['message']}", "error")
+                else:
+                    index += 1
+            return sent
+
+    def stats(self, now=None):
+        """
+        返回队列统计信息
+
+        返回:
+            dict: depth 队列深度，depth_by_contact 各联系人排队数，oldest_wait 队首已等待秒数，
+                sent/replaced/failed 计数，avg_wait/max_wait 已发送消息的平均、最大排队时间
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            depth_by_contact = {}
+            for item in self.items:
+                depth_by_contact[item["contact"]] = depth_by_contact.get(item["contact"], 0) + 1
+            oldest_wait = now - self.items[0]["enqueued_at"] if self.items else 0.0
+        return {
+            "depth": sum(depth_by_contact.values()),
+            "depth_by_contact": depth_by_contact,
+            "oldest_wait": oldest_wait,
+            "sent": self.sent,
+            "replaced": self.replaced,
+            "failed": self.failed,
+            "avg_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait,
+        }
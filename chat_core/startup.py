@@ -0,0 +1,180 @@
+"""
+启动耗时统计和重型模块的延迟导入
+
+pyautogui、win32clipboard、ollama 等模块导入要几百毫秒，启动时全部导入会拖慢到开始监控的时间。
+这些模块改为第一次用到时才导入（LazyModule / lazy_import），preload 可以在后台线程上提前导入，
+与加载配置、创建会话同时进行。
+
+启动过程按阶段打点，第一次轮询完成时输出一份启动耗时报告：各阶段的耗时、各延迟导入模块的耗时，
+以及从启动到开始监控的总时间。需要逐个模块的导入明细时可以运行
+    python -X importtime main.py 2> importtime.txt
+
+使用示例:
+    from chat_core import startup       # 入口脚本最先导入，从这里开始计时
+
+    startup.preload("pyautogui")        # 后台提前导入
+    startup.mark("导入模块")
+    replier = AiAutoReplier()
+    ...
+    startup.first_poll()                # 每次轮询后调用，只有第一次会输出报告
+
+    ollama = startup.LazyModule("ollama")
+    ollama.chat(...)                    # 第一次访问属性时才导入
+"""
+import importlib
+import sys
+import threading
+import time
+
+import logs
+
+# 超过这个时间（秒）还没开始监控时，报告中提示查看导入明细
+SLOW_STARTUP = 1.0
+
+
+class StartupTimer:
+    """
+    启动耗时统计
+
+    属性:
+        started (float): 开始计时的时间（time.perf_counter）
+        phases (list): [(阶段名, 耗时), ...]，按打点顺序排列
+        imports (dict): 模块名 -> (导入耗时, 是否在后台导入)
+        reported (bool): 是否已经输出过报告
+    """
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.last_mark = self.started
+        self.phases = []
+        self.imports = {}
+        self.reported = False
+        self.lock = threading.Lock()
+
+    def mark(self, phase):
+        """记录一个阶段结束，耗时从上一次打点算起"""
+        now = time.perf_counter()
+        with self.lock:
+            self.phases.append((phase, now - self.last_mark))
+            self.last_mark = now
+
+    def record_import(self, name, seconds, background=False):
+        with self.lock:
+            self.imports.setdefault(name, (seconds, background))
+
+    def report(self):
+        """
+        返回启动耗时统计
+
+        返回:
+            dict: total 从开始计时到最后一次打点的时间，phases 各阶段耗时，imports 各延迟导入模块的耗时
+        """
+        with self.lock:
+            return {
+                "total": round(self.last_mark - self.started, 3),
+                "phases": [(phase, round(seconds, 3)) for phase, seconds in self.phases],
+                "imports": {name: round(seconds, 3) for name, (seconds, _) in self.imports.items()},
+            }
+
+    def format(self):
+        """把启动耗时统计格式化为一行日志"""
+        report = self.report()
+        phases = " / ".join(f"{phase} {seconds:.2f}" for phase, seconds in report["phases"])
+        with self.lock:
+            imports = ", ".join(
+                f"{name} {seconds:.2f}{'（后台）' if background else ''}"
+                for name, (seconds, background) in self.imports.items()
+            )
+        text = f"启动耗时 {report['total']:.2f} 秒: {phases}"
+        if imports:
+            text += f"；延迟导入: {imports}"
+        if report["total"] > SLOW_STARTUP:
+            text += "；超过 1 秒，可用 python -X importtime 查看导入明细"
+        return text
+
+    def first_poll(self):
+        """
+        第一次轮询完成时打点并输出报告，之后的调用直接返回
+
+        返回:
+            dict: 启动耗时统计，不是第一次调用时返回 None
+        """
+        with self.lock:
+            if self.reported:
+                return None
+            self.reported = True
+        self.mark("首次轮询")
+        logs.logging().log(self.format(), "key")
+        return self.report()
+
+
+TIMER = StartupTimer()
+
+# 已经交给后台线程导入的模块，避免重复启动导入线程
+_preloading = set()
+_preloading_lock = threading.Lock()
+
+
+def mark(phase):
+    TIMER.mark(phase)
+
+
+def first_poll():
+    return TIMER.first_poll()
+
+
+def lazy_import(name, background=False):
+    """导入模块，第一次导入时记录耗时；其他线程正在导入时等它导入完成"""
+    already_loaded = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    if not already_loaded:
+        TIMER.record_import(name, time.perf_counter() - start, background)
+    return module
+
+
+def preload(*names):
+    """
+    在后台线程上依次导入模块，导入失败时忽略，等真正用到时再报错
+
+    返回:
+        threading.Thread: 导入线程，模块都已导入或正在导入时返回 None
+    """
+    with _preloading_lock:
+        names = [name for name in names if name not in sys.modules and name not in _preloading]
+        _preloading.update(names)
+    if not names:
+        return None
+
+    def run():
+        for name in names:
+            try:
+                lazy_import(name, background=True)
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=run, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+class LazyModule:
+    """
+    模块的占位对象，第一次访问属性时才导入
+
+    使用示例:
+        ollama = LazyModule("ollama")
+        ollama.chat(...)   # 这里才导入 ollama
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = lazy_import(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
@@ -0,0 +1,78 @@
+"""
+回复器的运行状态快照，供 feature/tui.py 的实时面板显示
+
+与 chat_core.metrics 不同，这里不需要打开指标服务：回复器随时记录最近的回复和生成耗时，
+面板按自己的刷新间隔调用回复器的 status() 取一份快照。
+
+使用示例:
+    activity = ActivityLog()
+    activity.record_generation(2.4)
+    activity.record_reply("张三", "好的")
+    activity.snapshot()
+    # {"generations": 1, "last_latency": 2.4, "avg_latency": 2.4, "replies": [(时间, "张三", "好的")]}
+
+    session_status("WeChat", wx_session)
+    # {"name": "WeChat", "state": "unchanged", "polls": 12, "last_capture_at": ..., "last_capture_seconds": 0.03}
+"""
+import collections
+import threading
+import time
+
+
+class ActivityLog:
+    """
+    最近的回复和生成耗时
+
+    属性:
+        generations (int): 生成回复的次数
+        latencies (deque): 最近若干次生成的耗时（秒）
+        replies (deque): 最近发出的回复 (时间, 会话, 内容)
+    """
+
+    def __init__(self, max_replies=10, max_latencies=50):
+        self.generations = 0
+        self.latencies = collections.deque(maxlen=max_latencies)
+        self.replies = collections.deque(maxlen=max_replies)
+        self.lock = threading.Lock()
+
+    def record_generation(self, seconds):
+        with self.lock:
+            self.generations += 1
+            self.latencies.append(seconds)
+
+    def record_reply(self, contact, message, now=None):
+        with self.lock:
+            self.replies.append((time.time() if now is None else now, contact, message))
+
+    def snapshot(self):
+        """
+        返回:
+            dict: generations 生成次数，last_latency / avg_latency 最近一次和最近若干次平均的生成耗时，
+                replies 最近的回复（从旧到新）
+        """
+        with self.lock:
+            latencies = list(self.latencies)
+            return {
+                "generations": self.generations,
+                "last_latency": latencies[-1] if latencies else None,
+                "avg_latency": sum(latencies) / len(latencies) if latencies else None,
+                "replies": list(self.replies),
+            }
+
+
+def session_status(name, session):
+    """
+    读取一个消息后端（ChatSession / WxHandler）的状态
+
+    返回:
+        dict: name 会话名，state 最近一次轮询的状态，polls 轮询次数，
+            last_capture_at / last_capture_seconds 最近一次截图的时间和耗时（wxauto 后端没有截图，为 None）
+    """
+    window = getattr(session, "window", None)
+    return {
+        "name": name,
+        "state": getattr(session, "last_status", "idle"),
+        "polls": getattr(session, "polls", 0),
+        "last_capture_at": getattr(window, "last_capture_at", None),
+        "last_capture_seconds": getattr(window, "last_capture_seconds", None),
+    }
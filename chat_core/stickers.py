@@ -0,0 +1,387 @@
+"""
+表情包的感知哈希索引和固定回复
+
+表情、图片复制不到文本，原来要白白复制一次再跳过。熟人翻来覆去就发那几个表情，
+所以复制前先把最新一条消息从画面中截出来算感知哈希（pHash），在本地表情库中按汉明距离查找：
+    - 认识的表情：直接用表情库里配置的回复（可以写 "[旺柴]" 这类微信表情代码，发出去就是表情），不复制也不调用模型
+    - 不认识的：照常复制；复制不到文本（确实是表情或图片）时把哈希和截图记下来，方便往表情库里添加
+
+pHash 把图像缩成 32x32 灰度图做二维 DCT，取左上角 8x8 的低频系数与中位数比较得到 64 位哈希，
+同一个表情缩放、轻微压缩后哈希只差几位。查找时把 64 位分成 max_distance + 1 段，
+距离不超过 max_distance 的两个哈希至少有一段完全相同，按段建字典，只比较段相同的候选。
+
+表情库文件（"stickers.file"，默认 stickers.json），修改后下一次查找时自动重新加载:
+    [
+        {"hash": "e1c3b0f0f8f0e0c0", "name": "旺柴", "reply": "[旺柴]"},
+        {"hash": "9f3c0e0e1e3c7cf8", "name": "收到", "reply": "收到～"}
+    ]
+不认识的表情记录在 "stickers.unknown_dir"（默认 stickers/）下：unknown.jsonl 每个哈希一行，
+同名 .png 是截图。python -m chat_core.stickers 按出现次数列出不认识的表情。
+
+使用示例:
+    index = StickerIndex.from_file("stickers.json")
+    sticker = index.lookup(phash(image))    # 不认识时为 None
+    sticker.reply
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+import logs
+from chat_core import startup
+
+# numpy 只在启用表情库时才用到，第一次计算哈希时导入
+numpy = startup.LazyModule("numpy")
+
+HASH_BITS = 64
+
+# 与背景颜色相差超过这个值的像素算作消息内容，微信的白色气泡和浅灰背景只差 10 左右
+FOREGROUND_THRESHOLD = 8
+
+# 相距不超过这么多行的内容算同一条消息。透明背景的表情中间有整行背景色时只截到最下面一块，
+# 同一个表情每次截到的都是同一块，不影响识别
+ROW_GAP = 2
+
+_dct_matrices = {}
+
+
+def dct_matrix(size):
+    """size x size 的 DCT-II 变换矩阵"""
+    if size not in _dct_matrices:
+        k = numpy.arange(size).reshape(-1, 1)
+        n = numpy.arange(size).reshape(1, -1)
+        matrix = numpy.cos(numpy.pi * (2 * n + 1) * k / (2 * size)) * numpy.sqrt(2 / size)
+        matrix[0] /= numpy.sqrt(2)
+        _dct_matrices[size] = matrix
+    return _dct_matrices[size]
+
+
+def phash(image, size=32, low=8):
+    """
+    感知哈希
+
+    返回:
+        int: 64 位哈希
+    """
+    from PIL import Image
+
+    pixels = numpy.asarray(image.convert("L").resize((size, size), Image.LANCZOS), dtype=numpy.float64)
+    matrix = dct_matrix(size)
+    coefficients = (matrix @ pixels @ matrix.T)[:low, :low].ravel()
+    # 直流分量只反映整体亮度，不参与取中位数
+    bits = coefficients > numpy.median(coefficients[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def format_hash(value):
+    return f"{value:0{HASH_BITS // 4}x}"
+
+
+def newest_message_box(image, threshold=FOREGROUND_THRESHOLD, gap=ROW_GAP):
+    """
+    画面最下方一条消息的范围
+
+    背景取画面中出现最多的颜色，从下往上找第一块与背景不同的内容，行间距不超过 gap 的算同一块。
+
+    返回:
+        tuple: (x1, y1, x2, y2)，画面中没有内容时为 None
+    """
+    from PIL import Image, ImageChops
+
+    rgb = image.convert("RGB")
+    background = max(rgb.getcolors(rgb.width * rgb.height))[1]
+    mask = ImageChops.difference(rgb, Image.new("RGB", rgb.size, background)).convert("L")
+    mask = mask.point(lambda value: 255 if value > threshold else 0)
+    rows = mask.getprojection()[1]
+    bottom = next((y for y in range(len(rows) - 1, -1, -1) if rows[y]), None)
+    if bottom is None:
+        return None
+    top = bottom
+    blank = 0
+    for y in range(bottom - 1, -1, -1):
+        if rows[y]:
+            top, blank = y, 0
+        else:
+            blank += 1
+            if blank > gap:
+                break
+    columns = mask.crop((0, top, rgb.width, bottom + 1)).getprojection()[0]
+    left = columns.index(1)
+    right = len(columns) - columns[::-1].index(1)
+    return left, top, right, bottom + 1
+
+
+def incoming_crop(image):
+    """画面最下方一条对方消息（靠左）的截图，最下方是自己的消息或没有内容时返回 None"""
+    box = newest_message_box(image)
+    if box is None or box[0] >= image.width / 2:
+        return None
+    return image.crop(box)
+
+
+def unknown_file(unknown_dir):
+    return os.path.join(unknown_dir, "unknown.jsonl")
+
+
+def read_unknown(unknown_dir):
+    """
+    读取记录的不认识的表情
+
+    返回:
+        dict: 哈希 -> 记录，没有记录或文件损坏时为空字典
+    """
+    records = {}
+    try:
+        with open(unknown_file(unknown_dir), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                records[record["hash"]] = record
+    except (OSError, ValueError, KeyError):
+        return {}
+    return records
+
+
+class Sticker:
+    """
+    表情库中的一个表情
+
+    属性:
+        hash (int): 感知哈希
+        name (str): 表情名，作为消息内容记录在日志和对话历史中
+        reply (str): 固定回复，为空时认出来但不回复
+    """
+
+    def __init__(self, hash, name="", reply=""):
+        self.hash = hash
+        self.name = name
+        self.reply = reply
+
+    def __repr__(self):
+        return f"Sticker({format_hash(self.hash)}, {self.name!r}, reply={self.reply!r})"
+
+
+class StickerIndex:
+    """
+    按汉明距离查找的哈希索引
+
+    属性:
+        max_distance (int): 汉明距离不超过这个值算同一个表情
+        stickers (list[Sticker]): 全部表情
+        lookups / hits (int): 查找次数和命中次数
+    """
+
+    def __init__(self, stickers=(), max_distance=4):
+        self.max_distance = max_distance
+        # 分成 max_distance + 1 段，每段的位数尽量平均
+        count = max_distance + 1
+        edges = [round(HASH_BITS * i / count) for i in range(count + 1)]
+        self.segments = [(edges[i], (1 << (edges[i + 1] - edges[i])) - 1) for i in range(count)]
+        self.buckets = [{} for _ in self.segments]
+        self.stickers = []
+        self.lookups = 0
+        self.hits = 0
+        for sticker in stickers:
+            self.add(sticker)
+
+    @classmethod
+    def from_file(cls, path, max_distance=4):
+        """
+        异常:
+            OSError: 文件无法读取
+            ValueError: 不是合法的 JSON 或哈希格式不对
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError(f"{path} 的顶层应为列表")
+        stickers = [
+            Sticker(int(entry["hash"], 16), entry.get("name", ""), entry.get("reply", ""))
+            for entry in entries
+        ]
+        return cls(stickers, max_distance)
+
+    def keys(self, value):
+        return [(value >> shift) & mask for shift, mask in self.segments]
+
+    def add(self, sticker):
+        self.stickers.append(sticker)
+        for bucket, key in zip(self.buckets, self.keys(sticker.hash)):
+            bucket.setdefault(key, []).append(sticker)
+
+    def lookup(self, value):
+        """
+        查找距离最近、且不超过 max_distance 的表情
+
+        返回:
+            Sticker: 没有时为 None
+        """
+        self.lookups += 1
+        best, best_distance = None, self.max_distance + 1
+        for bucket, key in zip(self.buckets, self.keys(value)):
+            for sticker in bucket.get(key, ()):
+                distance = (sticker.hash ^ value).bit_count()
+                if distance < best_distance:
+                    best, best_distance = sticker, distance
+        if best is not None:
+            self.hits += 1
+        return best
+
+    def __len__(self):
+        return len(self.stickers)
+
+
+class StickerResponder:
+    """
+    截图后端使用的表情识别：查表情库、记录不认识的表情，表情库文件修改后自动重新加载
+
+    属性:
+        path (str): 表情库文件
+        unknown_dir (str): 不认识的表情的记录目录
+        index (StickerIndex): 当前的表情库
+        unknown (dict): 不认识的哈希 -> {"count": 次数, "first_seen": ..., "last_seen": ..., "image": 截图路径}
+        last_seconds (float): 最近一次截取和查找的耗时（秒）
+    """
+
+    def __init__(self, path="stickers.json", max_distance=4, unknown_dir="stickers"):
+        self.path = path
+        self.max_distance = max_distance
+        self.unknown_dir = unknown_dir
+        self.index = StickerIndex(max_distance=max_distance)
+        self.signature = None
+        self.unknown = {}
+        self.unknown_index = StickerIndex(max_distance=max_distance)
+        self.last_seconds = None
+        self.lock = threading.Lock()
+        self.log = logs.logging()
+        self.reload()
+        self.load_unknown()
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self):
+        """表情库文件有变化时重新加载，加载失败时保留原来的表情库"""
+        signature = self.file_signature()
+        if signature == self.signature:
+            return
+        self.signature = signature
+        if signature is None:
+            self.index = StickerIndex(max_distance=self.max_distance)
+            return
+        try:
+            self.index = StickerIndex.from_file(self.path, self.max_distance)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.log.log(f"表情库 {self.path} 加载失败，继续使用原来的表情库: {e}", "error")
+            return
+        self.log.log(f"已加载表情库 {self.path}，共 {len(self.index)} 个表情", "key")
+
+    def unknown_file(self):
+        return unknown_file(self.unknown_dir)
+
+    def load_unknown(self):
+        """读取之前记录的不认识的表情，同一个表情不重复记录"""
+        self.unknown = read_unknown(self.unknown_dir)
+        for value in self.unknown:
+            self.unknown_index.add(Sticker(int(value, 16)))
+
+    def match(self, image):
+        """
+        从画面中截取最新一条对方消息并查找
+
+        返回:
+            tuple: (哈希, Sticker 或 None, 截图)，最下方不是对方的消息时为 (None, None, None)
+        """
+        start = time.perf_counter()
+        crop = incoming_crop(image)
+        if crop is None:
+            self.last_seconds = time.perf_counter() - start
+            return None, None, None
+        value = phash(crop)
+        with self.lock:
+            self.reload()
+            sticker = self.index.lookup(value)
+        self.last_seconds = time.perf_counter() - start
+        return value, sticker, crop
+
+    def record_unknown(self, value, crop):
+        """
+        记录一个不认识的表情：相近的表情只保存一次截图，之后只累加次数
+
+        返回:
+            dict: 记录
+        """
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            known = self.unknown_index.lookup(value)
+            key = format_hash(known.hash if known is not None else value)
+            record = self.unknown.get(key)
+            if record is None:
+                os.makedirs(self.unknown_dir, exist_ok=True)
+                image = os.path.join(self.unknown_dir, f"{key}.png")
+                crop.save(image)
+                record = self.unknown[key] = {"hash": key, "count": 0, "first_seen": now, "image": image}
+                self.unknown_index.add(Sticker(value))
+                self.log.log(f"新表情 {key}，截图已保存到 {image}，可以加入 {self.path}", "key")
+            record["count"] += 1
+            record["last_seen"] = now
+            with open(self.unknown_file(), "w", encoding="utf-8") as f:
+                for item in self.unknown.values():
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            return record
+
+    def stats(self):
+        return {
+            "stickers": len(self.index),
+            "lookups": self.index.lookups,
+            "hits": self.index.hits,
+            "unknown": len(self.unknown),
+            "last_seconds": self.last_seconds,
+        }
+
+
+SETTINGS_KEYS = {"stickers.enabled", "stickers.file", "stickers.max_distance", "stickers.unknown_dir"}
+
+
+def from_settings(settings):
+    """
+    按配置创建表情识别
+
+    参数:
+        settings (dict): 配置
+            - "stickers.enabled": 是否启用，默认 false
+            - "stickers.file": 表情库文件，默认 stickers.json
+            - "stickers.max_distance": 汉明距离不超过这个值算同一个表情，默认 4
+            - "stickers.unknown_dir": 不认识的表情的记录目录，默认 stickers
+
+    返回:
+        StickerResponder: 未启用时返回 None
+    """
+    if not settings.get("stickers.enabled", False):
+        return None
+    return StickerResponder(
+        settings.get("stickers.file", "stickers.json"),
+        settings.get("stickers.max_distance", 4),
+        settings.get("stickers.unknown_dir", "stickers")
+    )
+
+
+def main():
+    """按出现次数列出不认识的表情"""
+    unknown_dir = sys.argv[1] if len(sys.argv) > 1 else "stickers"
+    records = sorted(read_unknown(unknown_dir).values(), key=lambda record: record["count"], reverse=True)
+    if not records:
+        print(f"{unknown_dir} 下没有记录不认识的表情")
+        return
+    for record in records:
+        print(f"{record['hash']}  {record['count']:>4} 次  最近 {record.get('last_seen', '-')}  {record['image']}")
+    print('\n把常见的表情加入表情库，如 {"hash": "<哈希>", "name": "名字", "reply": "回复"}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+from collections import deque
+
+
+class TopicClassifier:
+    """
+    基于 Aho-Corasick 自动机的多关键词主题分类器。
+
+    所有主题的关键词在初始化时一次性编译成一个自动机，之后每条消息只需从头到尾
+    扫描一遍，就能找出命中的全部关键词。单条消息的耗时只与消息长度和命中数量有关，
+    与关键词总数无关，因此关键词表可以扩充到成千上万条。
+
+    每个关键词带有权重，同一主题下命中的不同关键词权重相加作为该主题的得分，
+    多个主题同时命中时按得分排序。
+
+    属性:
+        topics (list): 主题名称，按配置顺序排列（得分相同时靠前的优先）
+        goto (list[dict]): 自动机的转移表，goto[状态][字符] -> 下一个状态
+        fail (list[int]): 失配指针
+        output (list[list]): 每个状态命中的 (关键词编号, 主题编号, 权重)
+
+    配置格式（settings.json 中的 "model.topic_keywords"）：
+        {
+            "学习": ["考试", "作业"],                  # 列表形式，权重均为 1
+            "生活": {"吃饭": 1, "睡觉": 1, "心情": 2}    # 字典形式，指定权重
+        }
+
+    使用示例:
+        classifier = TopicClassifier({
+            "学习": ["考试", "作业"],
+            "生活": {"吃饭": 1.0, "心情": 2.0}
+        })
+        classifier.classify("考试前心情不好")   # [("生活", 2.0), ("学习", 1.0)]
+        classifier.best_topic("考试前心情不好")  # "生活"
+    """
+
+    def __init__(self, topic_keywords):
+        self.topics = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.keyword_count = 0
+
+        for topic, words in topic_keywords.items():
+            topic_index = len(self.topics)
+            self.topics.append(topic)
+            if isinstance(words, dict):
+                weighted = words.items()
+            else:
+                weighted = ((word, 1.0) for word in words)
+            for word, weight in weighted:
+                if word:
+                    self.add_keyword(word, topic_index, float(weight))
+
+        self.build()
+
+    def add_keyword(self, word, topic_index, weight):
+        """将关键词插入字典树"""
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((self.keyword_count, topic_index, weight))
+        self.keyword_count += 1
+
+    def build(self):
+        """按广度优先顺序计算失配指针，并把后缀状态的命中合并进来"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def scores(self, message):
+        """
+        扫描一遍消息，计算各主题得分
+
+        同一关键词在一条消息中多次出现只计一次，避免刷屏式的重复词拉高得分。
+
+        参数:
+            message (str): 消息内容
+
+        返回:
+            dict: {主题编号: 得分}
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        seen = set()
+        result = {}
+        for char in message:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword_id, topic_index, weight in output[state]:
+                if keyword_id not in seen:
+                    seen.add(keyword_id)
+                    result[topic_index] = result.get(topic_index, 0.0) + weight
+        return result
+
+    def classify(self, message):
+        """
+        返回按得分从高到低排列的主题列表
+
+        参数:
+            message (str): 消息内容
+
+        返回:
+            list: [(主题, 得分), ...]，没有命中时为空列表
+        """
+        ranked = sorted(self.scores(message).items(), key=lambda item: (-item[1], item[0]))
+        return [(self.topics[topic_index], score) for topic_index, score in ranked]
+
+    def best_topic(self, message):
+        """
+        返回得分最高的主题
+
+        参数:
+            message (str): 消息内容
+
+        返回:
+            str: 主题名称，没有命中时返回 None
+        """
+        ranked = self.classify(message)
+        return ranked[0][0] if ranked else None
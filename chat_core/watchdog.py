@@ -0,0 +1,112 @@
+import time
+
+from chat_core import metrics
+
+# 各状态允许停留的最长时间（秒），不在表中的状态（如 "idle"）没有期限
+DEFAULT_DEADLINES = {
+    "sending": 30.0,
+    "waiting_ai": 120.0,
+}
+
+
+class StallWatchdog:
+    """
+    微信/AI 握手状态机的卡死检测。
+
+    AI 网页出错、弹出验证码时，AI 窗口永远不会稳定，等待回复的阶段会一直卡住，
+    后面所有消息都得不到处理。看门狗记录当前所处的状态和进入时间，
+    超过该状态的期限就判定为卡死，由调用方重置会话后重试或跳过。
+
+    属性:
+        deadlines (dict): 状态 -> 期限（秒）
+        max_retries (int): 卡死后最多重试的次数，用完后跳过
+        state (str): 当前状态
+        entered_at (float): 进入当前状态的时间
+        stalls (dict): 状态 -> 卡死次数
+        blocked_time (float): 卡死累计阻塞的时间（秒）
+        skipped (int): 重试用完后跳过的批次数
+
+    使用示例:
+        watchdog = StallWatchdog({"waiting_ai": 60}, max_retries=1)
+        watchdog.enter("waiting_ai")
+        while not ai_stable():
+            if watchdog.expired():
+                blocked = watchdog.record_stall()
+                session.reset_state()
+                break
+        watchdog.leave()
+    """
+
+    def __init__(self, deadlines=None, max_retries=1):
+        self.deadlines = dict(DEFAULT_DEADLINES, **(deadlines or {}))
+        self.max_retries = max_retries
+        self.state = "idle"
+        self.entered_at = time.time()
+        self.stalls = {}
+        self.blocked_time = 0.0
+        self.skipped = 0
+
+    def enter(self, state, now=None):
+        """进入新状态，重新开始计时"""
+        self.state = state
+        self.entered_at = time.time() if now is None else now
+
+    def leave(self, now=None):
+        """回到空闲状态"""
+        self.enter("idle", now)
+
+    def elapsed(self, now=None):
+        """在当前状态停留的时间（秒）"""
+        return (time.time() if now is None else now) - self.entered_at
+
+    def expired(self, now=None):
+        """当前状态是否已超过期限"""
+        deadline = self.deadlines.get(self.state)
+        return deadline is not None and self.elapsed(now) > deadline
+
+    def remaining(self, now=None):
+        """
+        当前状态距期限还剩的时间（秒）
+
+        返回:
+            float: 剩余时间，已超期时为 0，当前状态没有期限时为 None
+        """
+        deadline = self.deadlines.get(self.state)
+        if deadline is None:
+            return None
+        return max(deadline - self.elapsed(now), 0.0)
+
+    def record_stall(self, now=None):
+        """
+        记录一次卡死
+
+        返回:
+            float: 这次卡死阻塞的时间（秒）
+        """
+        blocked = self.elapsed(now)
+        self.stalls[self.state] = self.stalls.get(self.state, 0) + 1
+        self.blocked_time += blocked
+        metrics.STALLS.inc(state=self.state)
+        metrics.BLOCKED_SECONDS.inc(blocked)
+        return blocked
+
+    def record_skip(self):
+        """记录一次重试用完后的跳过"""
+        self.skipped += 1
+        metrics.SKIPPED_BATCHES.inc()
+
+    def stats(self):
+        """
+        返回看门狗统计信息
+
+        返回:
+            dict: state/state_seconds 当前状态及停留时间，stalls 各状态卡死次数，
+                blocked_time 累计阻塞时间，skipped 跳过的批次数
+        """
+        return {
+            "state": self.state,
+            "state_seconds": round(self.elapsed(), 1),
+            "stalls": dict(self.stalls),
+            "blocked_time": round(self.blocked_time, 1),
+            "skipped": self.skipped,
+        }
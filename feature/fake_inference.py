@@ -0,0 +1,147 @@
+"""
+模拟的推理服务
+
+同时实现 Ollama（/api/chat、/api/tags）和 OpenAI 兼容接口（/v1/chat/completions、/v1/models）的非流式部分，
+按固定耗时返回 "[名字] re:最后一条消息"，不需要模型和显卡，用来在本机试用和压测 model.pool 的推理池。
+
+命令行（启动三个服务，配置到 "inference.endpoints" 后运行 python -m model.pool 查看分发情况）:
+    python -m feature.fake_inference --port 11501 --delay 0.5
+    python -m feature.fake_inference --port 11502 --delay 1.5
+    python -m feature.fake_inference --port 11503 --fail-after 5    # 处理 5 个请求后开始返回 500
+
+使用示例:
+    server = FakeInferenceServer(port=0, delay=0.2, name="a").start()
+    server.url            # http://127.0.0.1:<端口>
+    server.requests       # 已收到的对话请求数
+    server.down = True    # 之后的请求都返回 503，模拟服务故障
+    server.stop()
+
+    FakeInferenceServer(models=["qwen2.5:1.5b"])   # 请求其他模型时返回 404，模拟请求本身有误
+
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeInferenceServer:
+    """
+    属性:
+        delay (float): 每个请求的处理时间（秒）
+        name (str): 回复前缀，区分是哪个服务回复的
+        fail_after (int): 处理这么多个请求后开始返回 500，为 None 时不失败
+        down (bool): 为 True 时所有请求（包括健康检查）都返回 503
+        models (list): 提供的模型，请求其他模型时返回 404，为 None 时接受任何模型
+        requests (int): 已收到的对话请求数
+        active / peak (int): 正在处理的请求数和最大同时处理数
+    """
+
+    def __init__(self, port=0, delay=0.5, name=None, fail_after=None, host="127.0.0.1", models=None):
+        self.delay = delay
+        self.fail_after = fail_after
+        self.models = models
+        self.down = False
+        self.requests = 0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self.handler())
+        self.httpd.daemon_threads = True
+        self.name = name or str(self.port)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name=f"fake-inference-{self.port}", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reply(self, messages):
+        with self.lock:
+            self.requests += 1
+            count = self.requests
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self.lock:
+                self.active -= 1
+        if self.fail_after is not None and count > self.fail_after:
+            return None
+        return f"[{self.name}] re:{messages[-1]['content'] if messages else ''}"
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if server.down:
+                    return self.send_json(503, {"error": "down"})
+                if self.path == "/api/tags":
+                    return self.send_json(200, {"models": [{"name": "fake"}]})
+                if self.path == "/v1/models":
+                    return self.send_json(200, {"object": "list", "data": [{"id": "fake"}]})
+                self.send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if server.down:
+                    return self.send_json(503, {"error": "down"})
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path not in ("/api/chat", "/v1/chat/completions"):
+                    return self.send_json(404, {"error": "not found"})
+                if server.models is not None and request.get("model") not in server.models:
+                    return self.send_json(404, {"error": f"model \"{request.get('model')}\" not found"})
+                content = server.reply(request.get("messages", []))
+                if content is None:
+                    return self.send_json(500, {"error": "fake failure"})
+                message = {"role": "assistant", "content": content}
+                if self.path == "/api/chat":
+                    self.send_json(200, {"model": request.get("model"), "message": message, "done": True})
+                else:
+                    self.send_json(200, {"object": "chat.completion", "choices": [{"index": 0, "message": message}]})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动一个模拟的推理服务")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--delay", type=float, default=0.5, help="每个请求的处理时间（秒）")
+    parser.add_argument("--name", help="回复前缀，默认为端口号")
+    parser.add_argument("--fail-after", type=int, help="处理这么多个请求后开始返回 500")
+    args = parser.parse_args()
+    server = FakeInferenceServer(args.port, args.delay, args.name, args.fail_after).start()
+    print(f"模拟推理服务已启动: {server.url}（Ollama 与 OpenAI 兼容接口），Ctrl+C 退出", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
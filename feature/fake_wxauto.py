@@ -0,0 +1,110 @@
+"""
+wxauto 的内存模拟实现
+
+只实现 WxHandler / WxScheduler 用到的接口，消息对象的字段与 wxauto 3.9 保持一致
+（type / sender / content / id / info）。不需要 Windows 和微信客户端，
+可以在 Linux 上跑通 wxauto 后端，也方便用脚本模拟来信。
+
+使用示例:
+    wx = WeChat()
+    handler = WxHandler(contact="张三", wx=wx)
+    wx.receive("张三", "你好")                  # 模拟张三发来消息
+    wx.receive("项目群", "@小助手 在吗", sender="李四")  # 模拟群聊消息
+    print(wx.sent)                             # [(会话, 内容), ...] 已发送的消息
+"""
+import itertools
+import threading
+
+
+class Message:
+    type = 'message'
+
+    def __init__(self, sender, content, id):
+        self.sender = sender
+        self.content = content
+        self.id = id
+        self.info = [sender, content, id]
+
+    def __getitem__(self, index):
+        return self.info[index]
+
+    def __str__(self):
+        return self.content
+
+    def __repr__(self):
+        return str(self.info[:2])
+
+
+class FriendMessage(Message):
+    type = 'friend'
+
+
+class SelfMessage(Message):
+    type = 'self'
+
+
+class TimeMessage(Message):
+    type = 'time'
+
+
+class SysMessage(Message):
+    type = 'sys'
+
+
+class WeChat:
+    """
+    模拟的微信窗口
+
+    属性:
+        chats (dict): 会话名 -> 消息列表
+        unread (dict): 会话名 -> 未读条数（当前打开的会话不计未读）
+        current (str): 当前打开的会话
+        sent (list): 已发送的消息 [(会话, 内容), ...]
+    """
+
+    def __init__(self):
+        self.chats = {}
+        self.unread = {}
+        self.current = None
+        self.sent = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        return str(next(self.ids))
+
+    def receive(self, who, content, sender=None):
+        """模拟收到一条消息，sender 为空时表示私聊，发送者即会话本身"""
+        with self.lock:
+            message = FriendMessage(sender or who, content, self.next_id())
+            self.chats.setdefault(who, []).append(message)
+            if who != self.current:
+                self.unread[who] = self.unread.get(who, 0) + 1
+            return message
+
+    def ChatWith(self, who, timeout=2):
+        with self.lock:
+            self.chats.setdefault(who, [])
+            self.unread.pop(who, None)
+            self.current = who
+            return who
+
+    def CurrentChat(self):
+        return self.current
+
+    def GetAllMessage(self, savepic=False, savefile=False, savevoice=False):
+        with self.lock:
+            return list(self.chats.get(self.current, []))
+
+    def GetSessionList(self, reset=False, newmessage=False):
+        with self.lock:
+            if newmessage:
+                return {who: amount for who, amount in self.unread.items() if amount > 0}
+            return {who: self.unread.get(who, 0) for who in self.chats}
+
+    def SendMsg(self, msg, who=None, clear=True, at=None):
+        if who:
+            self.ChatWith(who)
+        with self.lock:
+            self.chats.setdefault(self.current, []).append(SelfMessage('Self', msg, self.next_id()))
+            self.sent.append((self.current, msg))
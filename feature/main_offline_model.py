@@ -1,79 +1,167 @@
+from chat_core import startup  # 最先导入，启动计时从这里开始
 import threading
 import time
-import pyautogui
 import logs
-import json
 import atexit
+from model import inference
 from model.inference import chat
-from chat_core.chat_window import ChatWindow
-from chat_core.chat_session import ChatSession
+from chat_core import config, control, faq, locator, memory, metrics, profiler, stickers
+from chat_core.chat_window import FailSafeException
+from chat_core.context_slots import ContextSlots
+from chat_core.message_backend import create_backend, create_desktop, split_canned
+from chat_core.message_dedup import MessageFingerprintStore
+from chat_core.message_filter import MessageFilter
+from chat_core.send_queue import SendQueue
+from chat_core.status import ActivityLog, session_status
+from chat_core.topic_classifier import TopicClassifier
 
-pyautogui.FAILSAFE = True
+# settings.json 未配置 "model.topic_keywords" 时使用的默认主题词表
+DEFAULT_TOPIC_KEYWORDS = {
+    "学习": ["考试", "作业", "课程", "学习", "复习"],
+    "生活": ["吃饭", "睡觉", "天气", "心情"],
+    "娱乐": ["游戏", "电影", "音乐", "运动"]
+}
 
 class AiAutoReplier:
     """
     自动回复器类，使用本地模型处理消息
     
     属性:
-        wx_session: 微信会话管理器
-        message_history: 对话历史记录
+        wx_session: 微信消息后端（ChatSession 或 WxHandler，由 "backend" 决定）
+        desktop: 虚拟桌面（"virtual_desktop" 为 true 时），否则为 None
+        stopped: 置位后监控线程退出
+        settings: 当前生效的配置（config.Settings），修改 settings.json 后自动更新
+        lock: 处理消息和应用新配置互斥，保证一次处理中看到的是同一份配置
+        histories: 会话 -> 对话历史，每个会话最多保留 message_memory_rounds 条
         message_memory_rounds: 记忆轮数
-        context: 对话上下文信息
+        memory: 按会话的向量记忆（"memory.enabled"），更早的相关对话从这里取回，为 None 时不启用
+        prompt_prefix: 系统提示加示例对话
+        topic_classifier: 主题分类器（由 "model.topic_keywords" 编译而来）
+        context: 时间段、当前话题等临时上下文（ContextSlots），组装提示词时渲染，不写入对话历史
+        contact_profiles: 会话 -> 对方资料（"model.contact_profiles"）
     """
 
-    def __init__(self):
-        settings = self.load_settings()
+    def __init__(self, desktop=None, settings=None):
+        # 校验配置并填入默认值，缺少的 "model.*" 配置使用默认值
+        settings = self.load_settings() if settings is None else config.Settings(settings)
+        self.settings = settings
+        self.lock = threading.Lock()
         
-        # 创建微信会话
-        self.wx_session = ChatSession(
-            ChatWindow(
-                send_coordinate=settings["wx_send_coordinate"],
-                reply_coordinate=settings["wx_reply_coordinate"],
-                reply_window=settings["wx_reply_window"],
-                name="WeChat"
-            )
+        # ollama 在后台导入，第一条回复不用再等
+        startup.preload("ollama")
+        
+        # 配置了多个推理服务（"inference.endpoints"）时按负载分发请求
+        inference.setup(settings)
+        
+        # "virtual_desktop" 为 true 时微信窗口是内存中的虚拟窗口，可以在 Linux 上完整运行
+        self.desktop = desktop if desktop is not None else create_desktop(settings)
+        
+        # 已处理消息的指纹库，用于丢弃重复消息
+        self.dedup = MessageFingerprintStore(
+            ttl=settings.get("dedup.ttl", 120.0),
+            bucket_seconds=settings.get("dedup.bucket_seconds", 60.0)
         )
         
-        # 分开存储系统提示和示例消息
-        self.system_prompt = {
-            "role": "system",
-            "content": settings["model.ai_system_prompt"]
-        }
-        self.examples = settings.get("model.message_examples", [])
+        # 推理前的消息过滤规则（群聊 @、发送者名单、关键词、频率上限）
+        self.message_filter = MessageFilter(settings.get("message_filter", {}))
+        
+        # 常见问题直接回复，不交给模型（"faq.entries" / "faq.file"）
+        self.faq = faq.from_settings(settings)
+        
+        # 回复发送队列，限速期间回复先排队而不是丢弃
+        self.send_queue = SendQueue(
+            global_rate=settings.get("send_queue.rate", 1.0),
+            global_burst=settings.get("send_queue.burst", 1),
+            contact_rate=settings.get("send_queue.contact_rate", 0.5),
+            contact_burst=settings.get("send_queue.contact_burst", 1),
+            replace_pending=settings.get("send_queue.replace_pending", False)
+        )
+        
+        # 创建微信会话，按 "backend" 选择截图或 wxauto 接口
+        self.wx_session = create_backend(settings, dedup=self.dedup, desktop=self.desktop)
+        
+        # 系统提示和示例消息在加载配置时已经拼好
+        self.prompt_prefix = settings.prompt_prefix
         
         # 初始化对话历史和设置
-        self.message_history = []
+        self.histories = {}
         self.message_memory_rounds = settings["model.message_memory_rounds"]
+        self.memory = memory.from_settings(settings)
+        
+        # 主题词表只在启动时编译一次
+        self.topic_classifier = TopicClassifier(
+            settings.get("model.topic_keywords", DEFAULT_TOPIC_KEYWORDS)
+        )
         
         self.log = logs.logging()
         
-        # 添加上下文管理
-        self.context = {
-            "time_of_day": self.get_time_period(),
-            "last_topic": None,
-            "conversation_start_time": time.time()
-        }
+        # 最近的回复和模型耗时，供 TUI 面板显示；generating_since 为正在调用模型的开始时间
+        self.activity = ActivityLog()
+        self.generating_since = None
+        
+        # 时间段、话题、对方资料保存在固定槽位中，不追加到对话历史
+        self.context = ContextSlots(time=self.get_time_period())
+        self.contact_profiles = settings.get("model.contact_profiles", {})
+        
+        # 可选的本机指标服务（"metrics.enabled"）
+        metrics.register_gauge("wxbot_send_queue_depth", "发送队列中等待的回复数",
+                               lambda: self.send_queue.stats()["depth"])
+        metrics.setup(settings)
         
-        # 启动监控线程
+        # 调用栈采样：kill -USR1 / Ctrl+Break 或 "profiler.enabled" 触发，平时不运行
+        self.profiler = profiler.setup(settings)
+        
+        # 启动监控线程；暂停时不再检测新消息，已排队的回复照常发出
+        startup.mark("初始化")
+        self.paused = threading.Event()
+        self.stopped = threading.Event()
         self.thread_monitor_window = threading.Thread(target=self.monitor_window, daemon=True)
         self.thread_monitor_window.start()
 
         # 注册退出时的回调函数
         atexit.register(self.save_message_history)
+        
+        # 从文件加载的配置支持热更新，修改提示词、坐标、冷却时间等不用重启，也不用重新加载模型
+        self.settings_watcher = None
+        if settings.path and settings.get("settings.hot_reload", True):
+            self.settings_watcher = config.SettingsWatcher(
+                settings.path, self.apply_settings, current=settings,
+                interval=settings.get("settings.reload_interval", 1.0)
+            ).start()
+        
+        # 本机控制通道：TUI 和命令行可以随时连上查看状态、暂停/恢复、推送配置，断开后照常运行，不用重新加载模型
+        self.control = control.setup(self, settings)
 
     def monitor_window(self):
-        """监控微信窗口变化的主循环"""
-        while True:
+        """监控微信窗口变化的主循环，stopped 置位后退出"""
+        while not self.stopped.is_set():
             try:
-                time.sleep(1)
+                with self.lock:
+                    # 发出队列中已到期的回复
+                    self.send_queue.pump(self.deliver_reply)
+                    
+                    # 监控微信窗口
+                    if self.paused.is_set():
+                        messages = []
+                    else:
+                        messages = self.message_filter.filter_messages(self.wx_session.receive_messages())
+                        startup.first_poll()
+                        if self.faq is not None:
+                            self.faq.answer(messages)
+                        # 带固定回复的来信（认出来的表情、命中的 FAQ）不需要调用模型
+                        canned, messages = split_canned(messages)
+                        for message in canned:
+                            self.send_queue.put(message.contact, message.reply)
+                        if canned:
+                            self.send_queue.pump(self.deliver_reply)
+                    if messages:
+                        self.log.log("检测到微信新消息", level="state")
+                        self.handle_message(messages)
                 
-                # 监控微信窗口
-                status = self.wx_session.monitor_changes()
-                if status == "stable":
-                    self.log.log("检测到微信窗口变化", level="state")
-                    self.handle_message()
+                # 启动后立即轮询一次，之后每秒一次
+                time.sleep(1)
 
-            except pyautogui.FailSafeException:
+            except FailSafeException:
                 self.log.log("程序已通过故障安全机制停止", "key")
                 raise
 
@@ -90,77 +178,162 @@ class AiAutoReplier:
             return "晚上"
 
     def analyze_topic(self, message):
-        """简单的主题分析"""
-        keywords = {
-            "学习": ["考试", "作业", "课程", "学习", "复习"],
-            "生活": ["吃饭", "睡觉", "天气", "心情"],
-            "娱乐": ["游戏", "电影", "音乐", "运动"]
-        }
-        
-        for topic, words in keywords.items():
-            if any(word in message for word in words):
-                return topic
-        return None
+        """主题分析，返回得分最高的主题，没有命中时返回 None"""
+        return self.topic_classifier.best_topic(message)
 
-    def handle_message(self):
-        """处理新消息并使用本地模型回复"""
+    def handle_message(self, messages):
+        """处理新消息并使用本地模型回复，连续收到的多条消息合并成一次提问"""
         try:
-            # 获取微信消息
-            message = self.wx_session.copy_message(clicks=2)
-            if not message.strip():
-                self.log.log("未检测到文本内容，可能是表情或图片，跳过处理", level="state")
-                return False
-                
+            message = "\n".join(incoming.content for incoming in messages)
+            contact = messages[-1].contact
             self.log.log(f"收到消息: {message}")
             
-            # 分析主题并维持连续性
-            current_topic = self.analyze_topic(message)
-            if current_topic and current_topic == self.context["last_topic"]:
-                self.message_history.append({
-                    "role": "system",
-                    "content": f"继续关于{current_topic}的话题"
-                })
-            self.context["last_topic"] = current_topic
+            # 更新上下文槽位：当前话题和时间段
+            self.context.set("topic", self.analyze_topic(message))
+            self.context.set("time", self.get_time_period())
             
-            # 根据上下文调整系统提示
-            current_time = self.get_time_period()
-            if current_time != self.context["time_of_day"]:
-                self.context["time_of_day"] = current_time
-                time_prompt = f"现在是{current_time}，"
-                self.message_history.append({
-                    "role": "system",
-                    "content": time_prompt
-                })
-            
-            # 构建完整的消息列表
-            self.message_history.append({"role": "user", "content": message})
-            last_n = max(len(self.message_history) - self.message_memory_rounds, 0)
-            messages_to_send = [self.system_prompt] + self.examples + self.message_history[last_n:]
+            # 构建完整的消息列表：固定前缀、最近的对话历史、上下文和取回的较早对话、最新一条消息；
+            # 上下文只在这里渲染，不写入历史，紧挨在最新一条消息之前，前缀和之前的历史每一轮都不变
+            history = self.histories.setdefault(contact, [])
+            history.append({"role": "user", "content": message})
+            window = history[max(len(history) - self.message_memory_rounds, 0):]
+            context = self.context.render(profile=self.contact_profiles.get(contact))
+            recalled = None
+            if self.memory is not None:
+                # 窗口里除刚收到的消息以外的条目模型已经能看到，不再取回
+                recalled = memory.format_recalled(self.memory.recall(contact, message, skip_recent=len(window) - 1))
+            notes = [note for note in (context, recalled) if note]
+            messages_to_send = self.prompt_prefix + window[:-1] + notes + window[-1:]
             
             self.log.log(f'模型对话历史传入：{str(messages_to_send)}', "model")
-            response = chat(messages_to_send)
+            self.generating_since = time.time()
+            try:
+                response = chat(messages_to_send)
+            finally:
+                self.activity.record_generation(time.time() - self.generating_since)
+                self.generating_since = None
             
             # 只将实际对话添加到历史记录
-            self.message_history.append({"role": "assistant", "content": response})
+            history.append({"role": "assistant", "content": response})
+            # 超出历史窗口的条目不会再发给模型，丢掉以免长期运行时无限增长；更早的对话由向量记忆取回
+            del history[:-self.message_memory_rounds]
+            if self.memory is not None:
+                self.memory.remember_many(contact, [("user", message), ("assistant", response)])
             
-            # 发送回复
-            return self.wx_session.send_message(response)
+            # 发送回复，限速期间先排队
+            self.send_queue.put(contact, response)
+            self.send_queue.pump(self.deliver_reply)
+            return True
             
-        except pyautogui.FailSafeException:
+        except FailSafeException:
             raise
         except Exception as e:
             self.log.log(f"处理消息时出错: {e}", "error")
             return False
 
+    def deliver_reply(self, contact, message):
+        """发送队列的发送函数，把回复发到微信"""
+        sent = self.wx_session.send_reply(contact, message)
+        if sent:
+            self.activity.record_reply(contact, message)
+        return sent
+
+    def status(self):
+        """
+        运行状态快照，供 TUI 面板显示，字段与 main.py 的 AiAutoReplier.status 相同
+        """
+        wx_name = getattr(self.wx_session, "current_contact", None) or "WeChat"
+        generating_since = self.generating_since
+        return {
+            "state": "generating" if generating_since else "idle",
+            "state_seconds": time.time() - generating_since if generating_since else 0.0,
+            "sessions": [session_status(wx_name, self.wx_session)],
+            "send_queue": self.send_queue.stats()["depth"],
+            "pipeline": {},
+            "activity": self.activity.snapshot(),
+            "running": self.thread_monitor_window.is_alive(),
+            "paused": self.paused.is_set(),
+            "faq": self.faq.stats() if self.faq is not None else None,
+        }
+
+    def pause(self):
+        """暂停处理新消息，已排队的回复照常发出"""
+        self.paused.set()
+        self.log.log("已暂停处理新消息", "key")
+
+    def resume(self):
+        self.paused.clear()
+        self.log.log("已恢复处理新消息", "key")
+
+    def apply_settings(self, settings, changed):
+        """
+        配置热更新：新配置校验通过后，在处理消息的间隙一次性替换运行中的各项参数
+        
+        参数:
+            settings (Settings): 新配置
+            changed (set): 变化的键
+        """
+        # 需要编译的对象先在锁外建好，构建失败时当前配置不受影响
+        # 过滤规则没变时沿用原来的对象，群聊限频的记录不会因为改了别的配置而清空
+        message_filter = (
+            MessageFilter(settings.get("message_filter", {}))
+            if "message_filter" in changed else self.message_filter
+        )
+        topic_classifier = (
+            TopicClassifier(settings.get("model.topic_keywords", DEFAULT_TOPIC_KEYWORDS))
+            if "model.topic_keywords" in changed else self.topic_classifier
+        )
+        faq_responder = faq.from_settings(settings) if changed & faq.SETTINGS_KEYS else self.faq
+        
+        with self.lock:
+            window = getattr(self.wx_session, "window", None)
+            keys = ["wx_send_coordinate", "wx_reply_coordinate", "wx_reply_window"]
+            if window is not None and changed & set(keys):
+                window.set_coordinates(*(settings[key] for key in keys))
+                self.wx_session.reset_state()  # 截图区域变了，重新取基准画面
+            if window is not None and changed & locator.settings_keys("wx"):
+                window.locator = locator.from_settings(settings, "wx")
+            if changed & stickers.SETTINGS_KEYS and hasattr(self.wx_session, "stickers"):
+                self.wx_session.stickers = stickers.from_settings(settings)
+            self.wx_session.cooldown = settings.get("cooldown.wx", 2.0)
+            
+            self.message_filter = message_filter
+            self.topic_classifier = topic_classifier
+            self.faq = faq_responder
+            self.send_queue.configure(
+                global_rate=settings.get("send_queue.rate", 1.0),
+                global_burst=settings.get("send_queue.burst", 1),
+                contact_rate=settings.get("send_queue.contact_rate", 0.5),
+                contact_burst=settings.get("send_queue.contact_burst", 1),
+                replace_pending=settings.get("send_queue.replace_pending", False)
+            )
+            self.prompt_prefix = settings.prompt_prefix
+            self.message_memory_rounds = settings["model.message_memory_rounds"]
+            if "model.temperature" in changed:
+                inference.configure(settings)
+            self.contact_profiles = settings.get("model.contact_profiles", {})
+            if self.memory is not None and changed & memory.SETTINGS_KEYS:
+                self.memory.top_k = settings.get("memory.top_k", 3)
+                self.memory.min_score = settings.get("memory.min_score", 0.25)
+            self.profiler.apply_settings(settings, changed)
+            self.settings = settings
+
     def load_settings(self):
-        with open('settings.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return config.load_settings("settings.json")
+
+    def stop(self):
+        """停止监控线程、配置热更新和控制通道（TUI 或控制通道的 stop 命令调用）"""
+        self.stopped.set()
+        if self.settings_watcher is not None:
+            self.settings_watcher.stop()
+        if self.control is not None:
+            self.control.stop()
 
     def save_message_history(self):
         """在程序退出时保存对话历史"""
         try:
             self.log.log("程序退出，保存对话历史...", "key")
-            self.log.log(f"完整对话历史：{str(self.message_history)}", "model")
+            self.log.log(f"完整对话历史：{str(self.histories)}", "model")
         except:
             pass
 
@@ -168,13 +341,16 @@ class AiAutoReplier:
         """启动自动回复程序"""
         self.log.log("自动回复程序已启动...", "key")
         try:
-            while True:
+            while not self.stopped.is_set() and self.thread_monitor_window.is_alive():
                 time.sleep(1)
-        except (KeyboardInterrupt, pyautogui.FailSafeException):
-            self.log.log("程序已停止", "key")
-            exit(0)
+        except (KeyboardInterrupt, FailSafeException):
+            pass
+        self.log.log("程序已停止", "key")
+        self.stop()
+        exit(0)
 
 if __name__ == "__main__":
+    startup.mark("导入模块")
     replier = AiAutoReplier()
     replier.start()
 
@@ -1,5 +1,15 @@
+import json
+import sys
+import threading
+import time
+
 import npyscreen
 
+import logs
+from chat_core import config, control
+
+# 表单读写的配置文件，与 main.py 一样相对于运行目录
+SETTINGS_FILE = "settings.json"
 
 msg = str()
 
@@ -12,7 +22,9 @@ class ACBForm(npyscreen.Form):
         super().__init__(name, parentApp, framed, help, color, widget_list, cycle_widgets, *args, **keywords)
     
     def afterEditing(self):
-        self.parentApp.setNextForm(None)
+        # RUN 切换到运行面板时不退出
+        if self.parentApp.NEXT_ACTIVE_FORM == "MAIN":
+            self.parentApp.setNextForm(None)
         
     def create(self):
         self.initialize_args()
@@ -303,14 +315,14 @@ class ACBForm(npyscreen.Form):
         )
 
         self.load_button = self.add(
-            npyscreen.ButtonPress,
+            LoadButtonPress,
             name="Load setting",
             relx=wx_start_relx,
             rely=self.lower_start_rely + 2
         )
 
         self.save_button = self.add(
-            npyscreen.ButtonPress,
+            SaveButtonPress,
             name="Save setting",
             relx=wx_start_relx,
             rely=self.lower_start_rely + 4
@@ -318,7 +330,7 @@ class ACBForm(npyscreen.Form):
         
         
         self.run_button = self.add(
-            npyscreen.ButtonPress,
+            RunButtonPress,
             name="RUN",
             relx=ai_start_relx,
             rely=self.lower_start_rely + 2
@@ -331,32 +343,343 @@ class ACBForm(npyscreen.Form):
             rely=self.lower_start_rely + 4,
             # whenPressed = self.on_quit_press
         )
+        
+        self.on_load_press()
+
+    def coordinate_fields(self):
+        """配置项 -> 对应的输入框列表，顺序与配置中的坐标一致"""
+        fields = {}
+        for prefix in ("wx", "ai"):
+            for key in (f"{prefix}_send_coordinate", f"{prefix}_reply_coordinate"):
+                fields[key] = [getattr(self, f"{key}_x"), getattr(self, f"{key}_y")]
+            key = f"{prefix}_reply_window"
+            fields[key] = [getattr(self, f"{key}_{axis}") for axis in ("x1", "y1", "x2", "y2")]
+        return fields
+
+    def read_coordinates(self):
+        """
+        读取输入框中的坐标
+        
+        返回:
+            dict: 配置项 -> 坐标，如 {"wx_send_coordinate": [x, y], "wx_reply_window": [[x1, y1], [x2, y2]]}
+        
+        异常:
+            ValueError: 输入框为空或不是整数
+        """
+        coordinates = {}
+        for key, fields in self.coordinate_fields().items():
+            values = []
+            for field in fields:
+                try:
+                    values.append(int(field.value))
+                except (TypeError, ValueError):
+                    raise ValueError(f"{key}{field.name.strip(' -:')} 应为整数")
+            coordinates[key] = values if len(values) == 2 else [values[:2], values[2:]]
+        return coordinates
+
+    def on_load_press(self):
+        """从 settings.json 读取坐标填入输入框"""
+        try:
+            values = read_settings_file()
+        except (OSError, ValueError) as e:
+            npyscreen.notify_confirm(f"无法读取 {SETTINGS_FILE}: {e}", title="Load setting")
+            return
+        for key, fields in self.coordinate_fields().items():
+            coordinate = values.get(key)
+            if coordinate is None:
+                continue
+            flat = coordinate if len(fields) == 2 else coordinate[0] + coordinate[1]
+            for field, value in zip(fields, flat):
+                field.value = str(value)
+        self.display()
+
+    def on_save_press(self):
+        """把输入框中的坐标写回 settings.json，其他配置项保持不变"""
+        try:
+            values = read_settings_file()
+            values.update(self.read_coordinates())
+            with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
+                json.dump(values, f, ensure_ascii=False, indent=2)
+        except (OSError, ValueError) as e:
+            npyscreen.notify_confirm(str(e), title="Save setting")
+            return
+        npyscreen.notify_wait(f"已保存到 {SETTINGS_FILE}", title="Save setting")
+
+    def on_run_press(self):
+        """用输入框中的坐标和 settings.json 的其他配置，在后台启动回复器并切换到运行面板"""
+        try:
+            values = read_settings_file()
+            values.update(self.read_coordinates())
+            config.Settings(values)  # 先校验，配置有误时留在当前界面
+        except (OSError, ValueError) as e:
+            npyscreen.notify_confirm(str(e), title="RUN", wide=True)
+            return
+        self.parentApp.start_replier(values)
+        self.parentApp.switchForm("DASHBOARD")
 
     def on_quit_press(self):
         self.editing = False
         self.parentApp.setNextForm(None)
         
+    
+class LoadButtonPress(npyscreen.ButtonPress):
+    def whenPressed(self):
+        self.parent.on_load_press()
+
+
+class SaveButtonPress(npyscreen.ButtonPress):
+    def whenPressed(self):
+        self.parent.on_save_press()
+
+
+class RunButtonPress(npyscreen.ButtonPress):
+    def whenPressed(self):
+        self.parent.on_run_press()
+
         
 class QuitButtonPress(npyscreen.ButtonPress):
     def whenPressed(self):
-        self.parent.setNextForm(None)
-        return super().whenPressed()
+        self.parent.on_quit_press()
+
+
+class StopButtonPress(npyscreen.ButtonPress):
+    def whenPressed(self):
+        self.parent.parentApp.stop_replier()
+        self.parent.on_quit_press()
+
+
+class PauseButtonPress(npyscreen.ButtonPress):
+    def whenPressed(self):
+        self.parent.on_pause_press()
+
+
+def read_settings_file():
+    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def format_seconds(seconds):
+    return "-" if seconds is None else f"{seconds:.1f}s"
+
+
+class PollRate:
+    """由两次刷新之间轮询次数的增量计算每秒轮询次数"""
+
+    def __init__(self):
+        self.previous = {}
+
+    def update(self, name, polls, now):
+        last = self.previous.get(name)
+        self.previous[name] = (polls, now)
+        if last is None or now <= last[1]:
+            return None
+        return (polls - last[0]) / (now - last[1])
+
+
+def format_status(status, rates, now):
+    """
+    把回复器的 status() 快照排成面板上的文字
     
+    返回:
+        tuple: (状态行, 会话表格的行, 最近回复的行)
+    """
+    activity = status["activity"]
+    pipeline = " ".join(f"{name}={depth}" for name, depth in status["pipeline"].items())
+    summary = (
+        f"{('PAUSED' if status.get('paused') else 'RUNNING') if status['running'] else 'STOPPED'} | state {status['state']} "
+        f"{format_seconds(status['state_seconds'])} | send queue {status['send_queue']}"
+        + (f" | pipeline {pipeline}" if pipeline else "")
+        + f" | model {activity['generations']} calls, last {format_seconds(activity['last_latency'])}, "
+        f"avg {format_seconds(activity['avg_latency'])}"
+    )
+    faq = status.get("faq")
+    if faq and faq["lookups"]:
+        summary += f" | faq {faq['hits']}/{faq['lookups']} hits, {faq['mean_lookup_us']:.0f}us"
+    
+    sessions = [f"{'SESSION':<16}{'STATE':<12}{'POLLS/S':>8}{'POLLS':>8}  LAST CAPTURE"]
+    for session in status["sessions"]:
+        rate = rates.update(session["name"], session["polls"], now)
+        if session["last_capture_at"] is None:
+            capture = "-"
+        else:
+            capture = (f"{now - session['last_capture_at']:.1f}s ago, "
+                       f"{session['last_capture_seconds'] * 1000:.0f}ms")
+        sessions.append(
+            f"{session['name'][:15]:<16}{session['state']:<12}"
+            f"{'-' if rate is None else f'{rate:.1f}':>8}{session['polls']:>8}  {capture}"
+        )
+    
+    replies = [
+        f"{time.strftime('%H:%M:%S', time.localtime(sent_at))} {contact}: {' '.join(message.split())}"
+        for sent_at, contact, message in reversed(activity["replies"])
+    ] or ["(no replies yet)"]
+    return summary, sessions, replies
+
+
+class DashboardForm(npyscreen.FormBaseNew):
+    """运行面板：按 keypress_timeout 定时刷新回复器的状态，刷新不影响按键操作"""
+
+    def create(self):
+        # 单位为 0.1 秒，没有按键时每秒调用一次 while_waiting
+        self.keypress_timeout = 10
+        self.rates = PollRate()
+        
+        box_height = max(6, (self.lines - 9) // 2)
+        self.summary = self.add(
+            npyscreen.FixedText,
+            value="Starting replier...",
+            relx=2,
+            rely=2,
+            editable=False
+        )
+        self.sessions_box = self.add(
+            npyscreen.BoxTitle,
+            name="SESSIONS",
+            relx=1,
+            rely=4,
+            max_height=box_height,
+            editable=False
+        )
+        self.replies_box = self.add(
+            npyscreen.BoxTitle,
+            name="RECENT REPLIES",
+            relx=1,
+            rely=4 + box_height,
+            max_height=box_height,
+            editable=False
+        )
+        self.pause_button = self.add(
+            PauseButtonPress,
+            name="Pause/Resume",
+            relx=2,
+            rely=4 + box_height * 2 + 1
+        )
+        # 连接到独立运行的回复器时，退出面板只断开连接，回复器继续运行
+        self.stop_button = self.add(
+            StopButtonPress,
+            name="Detach" if self.parentApp.attach else "Stop and quit",
+            relx=20,
+            rely=4 + box_height * 2 + 1
+        )
+
+    def while_waiting(self):
+        self.refresh_status()
+        self.display()
+
+    def refresh_status(self):
+        app = self.parentApp
+        if app.error is not None:
+            self.summary.value = f"ERROR: {app.error}"
+            return
+        if app.replier is None:
+            self.summary.value = "Starting replier..."
+            return
+        try:
+            status = app.replier.status()
+        except (EOFError, OSError, RuntimeError) as e:
+            # 独立运行的回复器已经退出
+            app.error = f"lost connection to replier: {e or type(e).__name__}"
+            self.summary.value = f"ERROR: {app.error}"
+            return
+        summary, sessions, replies = format_status(status, self.rates, time.time())
+        self.summary.value = summary
+        self.sessions_box.values = sessions
+        self.replies_box.values = replies
+
+    def on_pause_press(self):
+        replier = self.parentApp.replier
+        if replier is None or self.parentApp.error is not None:
+            return
+        try:
+            if replier.status().get("paused"):
+                replier.resume()
+            else:
+                replier.pause()
+        except (EOFError, OSError, RuntimeError) as e:
+            self.parentApp.error = f"lost connection to replier: {e or type(e).__name__}"
+        self.refresh_status()
+        self.display()
+
+    def on_quit_press(self):
+        self.editing = False
+        self.parentApp.setNextForm(None)
+
+
 class ACBApp(npyscreen.NPSAppManaged):
+    """
+    属性:
+        offline (bool): 为 True 时运行 main_offline_model 的本地模型回复器，否则运行 main.py 的回复器
+        attach (bool): 为 True 时不在本进程启动回复器，而是通过控制通道连接已经在运行的回复器
+        replier: 后台运行的回复器（attach 时为 ControlClient），启动或连接完成前为 None
+        error (str): 回复器启动失败或连接断开的原因
+    """
+
+    def __init__(self, offline=False, attach=False, *args, **keywords):
+        super().__init__(*args, **keywords)
+        self.offline = offline
+        self.attach = attach
+        self.replier = None
+        self.error = None
+
     def onStart(self):
         self.addForm("MAIN", ACBForm, name="AutoConvoBridge")
+        self.addForm("DASHBOARD", DashboardForm, name="AutoConvoBridge - Dashboard")
+        if self.attach:
+            self.attach_replier()
+            self.setNextForm("DASHBOARD")
         
         return super().onStart()
+
+    def attach_replier(self):
+        """连接已经在运行的回复器（python main.py 等），读取 settings.json 中的控制通道地址"""
+        try:
+            settings = read_settings_file()
+            self.replier = control.ControlClient(
+                settings.get("control.address"), settings.get("control.key_file", "control.key")
+            )
+        except Exception as e:
+            self.error = f"cannot attach to replier: {e}"
+
+    def start_replier(self, settings):
+        """在后台线程上创建回复器，创建时的截图、模型加载等不阻塞界面"""
+        def run():
+            try:
+                if self.offline:
+                    from feature.main_offline_model import AiAutoReplier
+                    self.replier = AiAutoReplier(settings=settings)
+                else:
+                    from main import AiAutoReplier
+                    self.replier = AiAutoReplier(**settings)
+            except Exception as e:
+                self.error = str(e)
+        
+        threading.Thread(target=run, name="replier", daemon=True).start()
+
+    def stop_replier(self):
+        """停止本进程内的回复器；attach 时只断开连接"""
+        if self.replier is None:
+            return
+        if self.attach:
+            self.replier.close()
+        else:
+            self.replier.stop()
+        self.replier = None
     
 class AutoConvoBridge:
-    def __init__(self):
-
-        self.app = ACBApp()
-        self.app.run()
+    def __init__(self, offline=False, attach=False):
+
+        # 界面运行期间日志只写入 logs.txt，打印到终端会弄乱界面
+        logs.logging().echo = False
+        self.app = ACBApp(offline, attach)
+        try:
+            self.app.run()
+        finally:
+            self.app.stop_replier()
         
         mainform = self.app.getForm("MAIN")
 
 
-
-
-AutoConvoBridge()
\ No newline at end of file
+if __name__ == "__main__":
+    # 在仓库根目录运行：python -m feature.tui [--offline]
+    # 连接已经在运行的回复器：python -m feature.tui --attach
+    AutoConvoBridge(offline="--offline" in sys.argv[1:], attach="--attach" in sys.argv[1:])
@@ -0,0 +1,394 @@
+"""
+虚拟桌面：pyautogui 和 win32clipboard 的内存模拟实现
+
+只实现 ChatWindow 用到的接口（screenshot / moveTo / click / hotkey / press，
+以及剪贴板的 Open/Close/Empty/Get/Set）。窗口画面按消息列表实时绘制，
+点击、双击选中、Ctrl+C、Ctrl+V、回车都会作用到对应的虚拟聊天窗口上。
+不需要显示器和 Windows，截图 → 检测变化 → 复制 → 发给 AI → 等待稳定 → 复制回复 → 发回微信
+的完整流程（包括 ChatSession 的状态机）都可以在 Linux 上跑通。
+
+虚拟 AI 窗口收到消息后按 responder 生成回复，回复在 reply_delay 秒后开始出现，
+stream_seconds 秒内逐字显示完，和网页上流式输出的效果一致。回答显示完后下方出现复制按钮，
+AI 窗口的消息从上往下排列，复制按钮的位置随回答长度变化；微信窗口的消息贴着底部排列，
+长消息折行，最新气泡的位置随它的高度变化。
+
+使用示例:
+    desktop = VirtualDesktop.from_settings(settings)
+    replier = AiAutoReplier(desktop=desktop, **settings)
+    desktop.windows["WeChat"].receive("你好")   # 模拟微信收到消息
+    print(desktop.windows["WeChat"].sent)       # 已发回微信的回复
+"""
+import hashlib
+import threading
+import time
+
+from PIL import Image, ImageDraw
+
+from chat_core.chat_window import FailSafeException
+
+
+def echo_responder(message):
+    """默认的 AI 回复：原样复述，便于核对回复是否发回了正确的会话"""
+    return f"收到：{message}"
+
+
+class VirtualMessage:
+    """
+    虚拟窗口中的一条消息
+
+    属性:
+        content (str): 消息文本
+        incoming (bool): 是否为对方发来的消息（显示在左侧）
+        shown_at (float): 开始显示的时间
+        stream_seconds (float): 逐字显示完需要的时间，0 表示立即完整显示
+        media (bool): 是否为图片、表情等非文本消息，复制不到文本
+    """
+
+    def __init__(self, content, incoming, shown_at, stream_seconds=0.0, media=False):
+        self.content = content
+        self.incoming = incoming
+        self.shown_at = shown_at
+        self.stream_seconds = stream_seconds
+        self.media = media
+
+    def visible(self, now):
+        """当前已经显示出来的文本"""
+        if now < self.shown_at:
+            return ""
+        if self.stream_seconds <= 0 or now >= self.shown_at + self.stream_seconds:
+            return self.content
+        shown = int(len(self.content) * (now - self.shown_at) / self.stream_seconds)
+        return self.content[:max(shown, 1)]
+
+
+class VirtualChatWindow:
+    """
+    虚拟聊天窗口
+
+    坐标与 ChatWindow 使用同一套配置：点击 send_coordinate 聚焦输入框，
+    点击 reply_coordinate 选中最新一条对方消息（copy_button 为 True 时直接复制到剪贴板）。
+    此外双击画面中对方消息的气泡会选中这条消息，单击复制按钮会复制最新的回答，
+    和真实窗口一样按画面上的位置操作。
+
+    属性:
+        name (str): 窗口名
+        send_coordinate (tuple): 输入框坐标
+        reply_coordinate (tuple): 最新消息（或复制按钮）坐标
+        reply_window (list): 消息区域 [(x1,y1), (x2,y2)]
+        copy_button (bool): 点击 reply_coordinate 是否直接复制
+        responder (callable): responder(消息) -> 回复，为 None 时不自动回复（如微信窗口）
+        reply_delay (float): 收到消息到开始回复的时间（秒）
+        stream_seconds (float): 回复逐字显示完的时间（秒）
+        messages (list[VirtualMessage]): 窗口中的全部消息
+        sent (list[str]): 从输入框发出的消息
+        input_text (str): 输入框中的文本
+    """
+
+    def __init__(self, name, send_coordinate, reply_coordinate, reply_window,
+                 copy_button=False, responder=None, reply_delay=0.0, stream_seconds=0.0):
+        self.name = name
+        self.send_coordinate = tuple(send_coordinate)
+        self.reply_coordinate = tuple(reply_coordinate)
+        self.reply_window = [tuple(point) for point in reply_window]
+        self.copy_button = copy_button
+        self.responder = responder
+        self.reply_delay = reply_delay
+        self.stream_seconds = stream_seconds
+        self.messages = []
+        self.sent = []
+        self.input_text = ""
+        self.selection = None
+
+    def receive(self, content, now=None, media=False):
+        """模拟对方发来一条消息，media 为 True 时是图片或表情（content 只用于绘制画面）"""
+        now = time.time() if now is None else now
+        self.messages.append(VirtualMessage(content, True, now, media=media))
+
+    def size(self):
+        (x1, y1), (x2, y2) = self.reply_window
+        return x2 - x1, y2 - y1
+
+    def submit(self, now=None):
+        """回车发送输入框中的文本"""
+        now = time.time() if now is None else now
+        content, self.input_text = self.input_text, ""
+        if not content:
+            return
+        self.messages.append(VirtualMessage(content, False, now))
+        self.sent.append(content)
+        if self.responder is not None:
+            self.messages.append(VirtualMessage(
+                self.responder(content), True, now + self.reply_delay, self.stream_seconds
+            ))
+
+    def last_incoming(self, now):
+        """最新一条已经显示出来的对方消息，图片和表情没有文本"""
+        for message in reversed(self.messages):
+            if message.incoming and message.visible(now):
+                return "" if message.media else message.visible(now)
+        return ""
+
+    def contains(self, x, y):
+        """坐标是否落在窗口内（消息区域或两个操作坐标上）"""
+        (x1, y1), (x2, y2) = self.reply_window
+        return (x1 <= x < x2 and y1 <= y < y2) or (x, y) in (self.send_coordinate, self.reply_coordinate)
+
+    def answer_complete(self, now):
+        """最新一条消息是否为已经显示完的对方消息（复制按钮此时出现）"""
+        if not self.messages:
+            return False
+        last = self.messages[-1]
+        return last.incoming and not last.media and now >= last.shown_at + last.stream_seconds
+
+    def layout(self, size, now):
+        """
+        画面中各元素的位置，坐标相对于消息区域左上角
+
+        对方消息和图片在左侧，自己的消息在右侧，气泡宽度随文本长度变化，放不下时折行。
+        有复制按钮的窗口（AI 网页）从上往下排列，回答显示完后在它下方放一个复制按钮，
+        内容超出窗口后和微信一样贴着底部排列。
+
+        返回:
+            list: [(种类, (x1, y1, x2, y2), 文本), ...]，从旧到新，种类为 incoming / outgoing / media / button
+        """
+        width, height = size
+        max_bubble = max(width - 24, 16)
+        chars_per_line = max((max_bubble - 16) // 6, 1)
+        items = []
+        for message in self.messages:
+            text = message.visible(now)
+            if not text:
+                continue
+            if message.media:
+                items.append(("media", 20, 20, text))
+                continue
+            lines = -(-len(text) // chars_per_line)
+            kind = "incoming" if message.incoming else "outgoing"
+            items.append((kind, min(16 + 6 * len(text), max_bubble), 4 + 16 * lines, text))
+        if self.copy_button and self.answer_complete(now):
+            items.append(("button", 14, 14, ""))
+
+        boxes = []
+        if self.copy_button and sum(h + 4 for _, _, h, _ in items) <= height - 4:
+            top = 4
+            for kind, w, h, text in items:
+                boxes.append((kind, w, h, top, text))
+                top += h + 4
+        else:
+            bottom = height - 4
+            for kind, w, h, text in reversed(items):
+                if bottom - h < 0:
+                    break
+                boxes.append((kind, w, h, bottom - h, text))
+                bottom -= h + 4
+            boxes.reverse()
+
+        result = []
+        for kind, w, h, top, text in boxes:
+            left = width - 8 - w if kind == "outgoing" else 8
+            result.append((kind, (left, top, left + w, top + h), text))
+        return result
+
+    def item_at(self, x, y, now):
+        """屏幕坐标处的画面元素 (种类, 文本)，不在任何元素上时返回 None"""
+        (x1, y1), _ = self.reply_window
+        for kind, (left, top, right, bottom), text in self.layout(self.size(), now):
+            if left <= x - x1 < right and top <= y - y1 < bottom:
+                return kind, text
+        return None
+
+    def render(self, size, now):
+        """
+        绘制消息区域的画面
+
+        对方消息是白色气泡，自己的消息是绿色气泡，图片是蓝色方块，复制按钮是灰色图标，
+        气泡左侧色条由文本内容决定，内容不同的消息画面一定不同。
+        """
+        image = Image.new("RGB", size, (245, 245, 245))
+        draw = ImageDraw.Draw(image)
+        colors = {"incoming": (255, 255, 255), "outgoing": (149, 236, 105), "media": (90, 140, 200)}
+        for kind, box, text in self.layout(size, now):
+            if kind == "button":
+                draw.rectangle(box, fill=(120, 120, 120))
+                draw.rectangle((box[0] + 3, box[1] + 3, box[2] - 5, box[3] - 5), fill=(230, 230, 230))
+                continue
+            draw.rectangle(box, fill=colors[kind])
+            digest = hashlib.blake2b(text.encode("utf-8"), digest_size=3).digest()
+            draw.rectangle((box[0], box[1], box[0] + 3, box[3]), fill=tuple(digest))
+        return image
+
+
+class VirtualClipboard:
+    """win32clipboard 的模拟实现，只保存一份文本"""
+
+    CF_TEXT = 1
+    CF_UNICODETEXT = 13
+
+    def __init__(self):
+        self.text = None
+        self.opened = False
+
+    def OpenClipboard(self, hwnd=None):
+        if self.opened:
+            raise RuntimeError("剪贴板已被打开")
+        self.opened = True
+
+    def CloseClipboard(self):
+        if not self.opened:
+            raise RuntimeError("剪贴板未打开")
+        self.opened = False
+
+    def EmptyClipboard(self):
+        if not self.opened:
+            raise RuntimeError("剪贴板未打开")
+        self.text = None
+
+    def GetClipboardData(self, format=CF_TEXT):
+        if not self.opened:
+            raise RuntimeError("剪贴板未打开")
+        if self.text is None:
+            raise TypeError("剪贴板中没有文本")
+        return self.text if format == self.CF_UNICODETEXT else self.text.encode("utf-8")
+
+    def SetClipboardText(self, text, format=CF_TEXT):
+        if not self.opened:
+            raise RuntimeError("剪贴板未打开")
+        self.text = text
+
+
+class VirtualDesktop:
+    """
+    虚拟桌面，替代 pyautogui 使用
+
+    属性:
+        windows (dict): 窗口名 -> VirtualChatWindow
+        clipboard (VirtualClipboard): 虚拟剪贴板，替代 win32clipboard 使用
+        size (tuple): 屏幕大小，不指定区域截图时返回整个屏幕
+        position (tuple): 鼠标位置
+        focused (VirtualChatWindow): 最近点击的窗口
+        FAILSAFE (bool): 与 pyautogui 一致，为 True 时鼠标位于 (0, 0) 会触发 FailSafeException
+        actions (dict): 各操作的调用次数
+    """
+
+    FailSafeException = FailSafeException
+
+    def __init__(self, windows=(), size=(1920, 1080)):
+        self.windows = {window.name: window for window in windows}
+        self.size = size
+        self.clipboard = VirtualClipboard()
+        self.position = (100, 100)
+        self.focused = None
+        self.FAILSAFE = True
+        self.actions = {}
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_settings(cls, settings, responder=None):
+        """
+        按 settings.json 中的坐标创建微信和 AI 两个虚拟窗口
+
+        参数:
+            settings (dict): 配置，使用 wx_* / ai_* 坐标，以及
+                - "virtual_desktop.reply_delay": AI 开始回复前的等待时间（秒）
+                - "virtual_desktop.stream_seconds": AI 回复逐字显示完的时间（秒）
+            responder (callable): AI 回复函数，默认原样复述
+        """
+        return cls([
+            VirtualChatWindow(
+                "WeChat",
+                settings["wx_send_coordinate"],
+                settings["wx_reply_coordinate"],
+                settings["wx_reply_window"]
+            ),
+            VirtualChatWindow(
+                "AI",
+                settings["ai_send_coordinate"],
+                settings["ai_reply_coordinate"],
+                settings["ai_reply_window"],
+                copy_button=True,
+                responder=responder or echo_responder,
+                reply_delay=settings.get("virtual_desktop.reply_delay", 1.0),
+                stream_seconds=settings.get("virtual_desktop.stream_seconds", 1.0)
+            ),
+        ])
+
+    def window_at(self, x, y):
+        """返回坐标所在的窗口"""
+        for window in self.windows.values():
+            if window.contains(x, y):
+                return window
+        return None
+
+    def record(self, action, fail_safe_check=True):
+        """记录一次操作，模拟 pyautogui 在鼠标键盘操作前的故障安全检查"""
+        self.actions[action] = self.actions.get(action, 0) + 1
+        if fail_safe_check and self.FAILSAFE and self.position == (0, 0):
+            raise FailSafeException("鼠标移到了屏幕角落，触发故障安全机制")
+
+    def fail_safe(self):
+        """模拟把鼠标移到屏幕角落，下一次操作将触发 FailSafeException"""
+        self.position = (0, 0)
+
+    # 以下方法与 pyautogui 同名同参数
+
+    def screenshot(self, region=None):
+        with self.lock:
+            self.record("screenshot", fail_safe_check=False)
+            x, y, width, height = region or (0, 0) + tuple(self.size)
+            # 桌面背景为黑色，与截图区域相交的窗口按各自的位置画上去
+            image = Image.new("RGB", (width, height))
+            now = time.time()
+            for window in self.windows.values():
+                (x1, y1), (x2, y2) = window.reply_window
+                if x1 < x + width and x2 > x and y1 < y + height and y2 > y:
+                    image.paste(window.render(window.size(), now), (x1 - x, y1 - y))
+            return image
+
+    def moveTo(self, x=None, y=None, duration=0.0):
+        with self.lock:
+            self.record("moveTo")
+            self.position = (x, y)
+
+    def click(self, x=None, y=None, clicks=1, button="left"):
+        with self.lock:
+            if x is not None and y is not None:
+                self.position = (x, y)
+            self.record("click")
+            window = self.window_at(*self.position)
+            self.focused = window
+            if window is None:
+                return
+            window.selection = None
+            now = time.time()
+            if self.position == window.reply_coordinate:
+                content = window.last_incoming(now)
+                if window.copy_button:
+                    self.clipboard.text = content
+                elif clicks >= 2:
+                    window.selection = content
+                return
+            item = window.item_at(*self.position, now)
+            if item is None:
+                return
+            kind, text = item
+            if kind == "button":
+                self.clipboard.text = window.last_incoming(now)
+            elif kind == "incoming" and clicks >= 2:
+                window.selection = text
+
+    def hotkey(self, *keys):
+        with self.lock:
+            self.record("hotkey")
+            window = self.focused
+            if window is None or "ctrl" not in keys:
+                return
+            if "c" in keys and window.selection:
+                self.clipboard.text = window.selection
+            elif "v" in keys and self.clipboard.text:
+                window.input_text += self.clipboard.text
+
+    def press(self, key):
+        with self.lock:
+            self.record("press")
+            if key == "enter" and self.focused is not None:
+                self.focused.submit()
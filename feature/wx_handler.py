@@ -1,51 +1,126 @@
 # 导入必要的库
-from wxauto import WeChat  # wxauto库的核心类
 import time  # 用于添加延时和时间戳
 import logs  # 项目中的日志模块
+from chat_core import metrics  # 运行指标
+from chat_core.message_backend import IncomingMessage, MessageBackend
 
-class WxHandler:
+
+def message_text(message):
+    """
+    取出 wxauto 消息的文本内容
+    
+    兼容不同版本 wxauto 的返回格式：带 content 属性的消息对象、
+    [发送者, 内容, 消息id] 形式的列表，以及纯字符串。
+    """
+    if hasattr(message, "content"):
+        return message.content or ""
+    if isinstance(message, (list, tuple)):
+        return message[1] if len(message) > 1 else ""
+    return message or ""
+
+
+def message_sender(message):
+    """取出 wxauto 消息的发送者，取不到时返回 None"""
+    if hasattr(message, "sender"):
+        return message.sender
+    if isinstance(message, (list, tuple)) and message:
+        return message[0]
+    return None
+
+
+def message_id(message):
+    """
+    取出 wxauto 消息的唯一标识
+    
+    wxauto 用消息控件的 RuntimeId 作为消息 id，取不到时退回消息本身。
+    """
+    if hasattr(message, "id"):
+        return message.id
+    if isinstance(message, (list, tuple)) and message:
+        return message[-1]
+    return message
+
+
+# 建立游标时聊天记录为空，之后出现的消息都是新消息
+EMPTY_CURSOR = ""
+
+# 不需要回复的消息类型：自己发的、时间、系统提示、撤回提示
+IGNORED_MESSAGE_TYPES = ("self", "time", "sys", "recall")
+
+
+def is_incoming(message):
+    """判断是否为对方发来的消息"""
+    if hasattr(message, "type"):
+        return message.type not in IGNORED_MESSAGE_TYPES
+    if isinstance(message, (list, tuple)) and message:
+        return str(message[0]).lower() not in IGNORED_MESSAGE_TYPES
+    return bool(message)
+
+
+def runtime_id(item):
+    """
+    消息控件的 RuntimeId，与 wxauto 消息对象的 id 格式一致
+    
+    消息列表里除了消息条目还可能有"查看更多消息"等其他控件，这些控件返回 None。
+    """
+    if item.ControlTypeName != 'ListItemControl':
+        return None
+    return ''.join(str(i) for i in item.GetRuntimeId())
+
+class WxHandler(MessageBackend):
     """
     基于wxauto的微信消息处理器，提供高级的消息交互功能。
     
     这个类封装了wxauto库的功能，并添加了消息状态管理、冷却控制、变化检测等功能，
-    使得消息交互更加稳定和智能，层次上与ChatSession等同。
+    使得消息交互更加稳定和智能，层次上与ChatSession等同，同样实现了 MessageBackend 接口。
 
     主要功能：
     1. 消息状态管理：跟踪消息的变化和稳定状态
     2. 冷却时间控制：防止消息发送过于频繁
-    3. 消息变化检测：智能检测新消息
+    3. 消息变化检测：按联系人游标增量获取新消息
     4. 完整的交互流程：包括获取、发送等操作的状态管理
 
     属性：
         wx (WeChat): wxauto的WeChat实例，处理具体的微信操作
         current_contact (str): 当前聊天的联系人
         cooldown (float): 发送消息的冷却时间（秒）
-        last_messages (dict): 各联系人的上次消息记录
+        cursors (dict): 各联系人的消息游标（最后处理过的消息 id）
+        pending_messages (dict): 各联系人尚未稳定的新消息
         last_send_time (float): 上次发送消息的时间戳
         had_change (bool): 是否检测到新消息
         stable_count (int): 消息稳定性计数
+        polls (int): 轮询次数
+        last_status (str): 最近一次轮询的监控状态，还没有轮询时为 "idle"
+        dedup (MessageFingerprintStore): 消息指纹库，为 None 时不去重
+        send_queue (SendQueue): 发送队列，设置后回复先排队、按限速发出，冷却期内不会丢失
     """
     
-    def __init__(self, contact=None, cooldown=2.0):
-        # 初始化微信实例，这会连接到当前打开的微信窗口
-        self.wx = WeChat()
+    def __init__(self, contact=None, cooldown=2.0, dedup=None, send_queue=None, wx=None):
+        if wx is None:
+            # 初始化微信实例，这会连接到当前打开的微信窗口
+            from wxauto import WeChat  # wxauto库的核心类，只能在 Windows 上导入
+            wx = WeChat()
+        # 也可以传入 feature.fake_wxauto.WeChat 等兼容实现
+        self.wx = wx
         self.current_contact = contact
         self.cooldown = cooldown
-        self.last_messages = {}
+        self.dedup = dedup
+        self.send_queue = send_queue
+        self.cursors = {}
+        self.pending_messages = {}
         self.last_send_time = 0
         self.had_change = False
         self.stable_count = 0
+        self.polls = 0
+        self.last_status = "idle"
         
-        if contact:
-            # 如果提供了联系人名称，尝试切换到该联系人的聊天窗口
-            self.wx.ChatWith(contact)
-            # 等待切换完成
-            time.sleep(0.5)
-            # 初始化该联系人的最后消息记录
-            self.last_messages[contact] = self.get_last_message()
-            
         # 获取日志记录器
         self.log = logs.logging()
+        
+        # 提供了联系人时，第一次获取消息时才切换到该联系人的聊天窗口并建立消息游标，
+        # 创建处理器时不用等待切换完成
+        self.chat_opened = not contact
+            
         # 记录初始化成功的日志
         self.log.log("微信处理器初始化成功")
     
@@ -63,17 +138,33 @@ class WxHandler:
             self.wx.ChatWith(contact)
             time.sleep(0.5)  # 等待切换完成
             self.current_contact = contact
-            
-            # 如果是首次切换到该联系人，初始化最后消息记录
-            if contact not in self.last_messages:
-                self.last_messages[contact] = self.get_last_message()
-                
+            self.chat_opened = True
+            # 首次切换到的联系人在第一次获取消息时建立游标
             self.log.log(f"切换到联系人: {contact}")
             return True
         except Exception as e:
             self.log.log(f"切换联系人失败: {e}", "error")
             return False
     
+    def open_chat(self, contact=None):
+        """
+        确保指定联系人的聊天窗口已经打开
+        
+        联系人与当前不同时切换过去；创建处理器后还没打开过当前联系人的聊天窗口时，
+        即使联系人相同也要先切换，否则操作的是微信里正好打开的其他聊天。
+        
+        参数:
+            contact (str): 联系人名称，为空时表示当前联系人
+            
+        返回:
+            bool: 聊天窗口是否已经打开
+        """
+        if contact and contact != self.current_contact:
+            return self.switch_contact(contact)
+        if not self.chat_opened:
+            return self.switch_contact(self.current_contact)
+        return True
+    
     def can_send_message(self):
         """检查是否可以发送消息（冷却时间）"""
         return time.time() - self.last_send_time > self.cooldown
@@ -83,29 +174,48 @@ class WxHandler:
         发送消息并更新状态
         
         这个方法会：
-        1. 检查冷却时间
-        2. 切换联系人（如果需要）
-        3. 发送消息
-        4. 更新状态
+        1. 设置了发送队列时，把消息放入队列，由 flush_queue 按限速发出
+        2. 否则检查冷却时间，冷却中直接放弃
+        3. 切换联系人（如果需要）
+        4. 发送消息
+        5. 更新状态
         
         参数:
             message (str): 要发送的消息内容
             contact (str): 接收消息的联系人名称
             
         返回:
-            bool: 是否发送成功
+            bool: 是否发送成功（使用发送队列时表示已入队）
         """
+        if self.send_queue is not None:
+            self.send_queue.put(contact or self.current_contact, message)
+            self.flush_queue()
+            return True
+        
         # 检查冷却时间
         if not self.can_send_message():
             remaining = self.cooldown - (time.time() - self.last_send_time)
             self.log.log(f"冷却中，还需等待 {remaining:.1f} 秒")
+            metrics.COOLDOWN_REJECTIONS.inc(window=self.current_contact)
             return False
+        
+        return self.deliver(message, contact)
+    
+    def deliver(self, message, contact=None):
+        """
+        立即发送消息，不检查冷却时间
+        
+        参数:
+            message (str): 要发送的消息内容
+            contact (str): 接收消息的联系人名称
             
+        返回:
+            bool: 是否发送成功
+        """
         try:
-            # 如果提供了联系人且与当前不同，切换联系人
-            if contact and contact != self.current_contact:
-                if not self.switch_contact(contact):
-                    return False
+            # 切换到接收消息的联系人，聊天窗口还没打开时也要先打开
+            if not self.open_chat(contact):
+                return False
                     
             # 发送消息
             self.wx.SendMsg(message)
@@ -116,12 +226,25 @@ class WxHandler:
             
             # 记录日志
             self.log.log(f"发送消息到 {self.current_contact}: {message}")
+            metrics.SENDS.inc(window=self.current_contact)
             return True
         except Exception as e:
             # 记录错误日志
             self.log.log(f"发送消息失败: {e}", "error")
+            metrics.SEND_FAILURES.inc(window=contact or self.current_contact)
             return False
     
+    def flush_queue(self):
+        """
+        发送队列中所有已经允许发出的消息
+        
+        返回:
+            int: 本次发出的条数
+        """
+        if self.send_queue is None:
+            return 0
+        return self.send_queue.pump(lambda contact, message: self.deliver(message, contact))
+    
     def get_last_message(self, contact=None):
         """
         获取指定联系人的最新消息
@@ -133,10 +256,9 @@ class WxHandler:
             str: 最新消息内容，如果没有则返回空字符串
         """
         try:
-            # 如果提供了联系人且与当前不同，切换联系人
-            if contact and contact != self.current_contact:
-                if not self.switch_contact(contact):
-                    return ""
+            # 切换到指定联系人，聊天窗口还没打开时也要先打开
+            if not self.open_chat(contact):
+                return ""
                     
             # 获取所有消息
             messages = self.wx.GetAllMessage()
@@ -152,45 +274,124 @@ class WxHandler:
             self.log.log(f"获取消息失败: {e}", "error")
             return ""
     
-    def check_new_message(self, contact=None):
+    def advance_cursor(self, items, key, unread=0, counts=None):
         """
-        检查指定联系人是否有新消息
+        从最新一条往回找游标，返回游标之后的条目（按时间顺序）并移动游标
+        
+        参数:
+            items (list): 当前窗口的消息条目（控件或消息对象），按时间顺序排列
+            key (callable): 取条目 id 的函数，返回 None 的条目会被跳过
+            unread (int): 会话列表显示的未读条数，仅在首次建立游标时使用
+            counts (callable): 判断条目是否计入未读条数，默认都计入；
+                未读条数只算对方发来的消息，夹在中间的时间、系统提示不应占用名额
+            
+        返回:
+            list: 游标之后的新条目
+        """
+        cursor = self.cursors.get(self.current_contact)
+        newest_id = None
+        new_items = []
+        counted = 0
+        for item in reversed(items):
+            item_id = key(item)
+            if item_id is None:
+                continue
+            if newest_id is None:
+                newest_id = item_id
+            if cursor is None:
+                # 首次获取只建立游标，不把历史消息当作新消息；
+                # 已知未读条数时，最后几条未读消息仍算作新消息
+                if counted < unread:
+                    new_items.append(item)
+                    if counts is None or counts(item):
+                        counted += 1
+                    continue
+                break
+            if item_id == cursor:
+                break
+            new_items.append(item)
+        else:
+            if cursor not in (None, EMPTY_CURSOR) and new_items:
+                # 游标已不在可见记录中（记录被清空或重新加载），只取最新一条重新同步
+                self.log.log(f"{self.current_contact} 消息游标丢失，重新同步", "state")
+                new_items = new_items[:1]
+        
+        if newest_id is not None:
+            self.cursors[self.current_contact] = newest_id
+        elif cursor is None:
+            self.cursors[self.current_contact] = EMPTY_CURSOR
+        new_items.reverse()
+        return new_items
+    
+    def fetch_new_messages(self, contact=None, unread=0):
+        """
+        增量获取指定联系人自游标以来的所有新消息
+        
+        每个联系人记录一个游标（最后处理过的消息 id），每次只解析游标之后的消息控件，
+        轮询的开销只与新消息数量有关，与聊天记录长度无关。连续收到的多条消息会按顺序全部返回。
+        首次获取某个联系人时只建立游标，不返回历史消息。
         
         参数:
             contact (str): 联系人名称
+            unread (int): 会话列表显示的未读条数，首次获取时据此取回未读消息
             
         返回:
-            bool: 是否有新消息
-            str: 新消息内容（如果有）
+            list: 新消息列表（按时间顺序），没有新消息或出错时返回空列表
         """
         try:
-            # 如果提供了联系人且与当前不同，切换联系人
-            if contact and contact != self.current_contact:
-                if not self.switch_contact(contact):
-                    return False, ""
-            
-            # 获取当前最新消息
-            current_msg = self.get_last_message()
-            
-            # 如果联系人不在记录中，初始化并返回False
-            if self.current_contact not in self.last_messages:
-                self.last_messages[self.current_contact] = current_msg
-                return False, ""
+            # 切换到指定联系人，聊天窗口还没打开时也要先打开
+            if not self.open_chat(contact):
+                return []
             
-            # 比较最新消息与上次记录的消息
-            last_msg = self.last_messages[self.current_contact]
+            msg_list = getattr(self.wx, "C_MsgList", None)
+            if msg_list is None or not hasattr(self.wx, "_getmsgs"):
+                # 不提供消息列表控件的实现只能取全部消息再按 id 截取
+                return self.advance_cursor(self.wx.GetAllMessage(), message_id, unread, is_incoming)
             
-            # 如果消息不同，更新记录并返回True
-            if current_msg != last_msg and current_msg:
-                self.last_messages[self.current_contact] = current_msg
-                self.stable_count = 0
-                self.had_change = True
-                return True, current_msg
+            if unread and self.current_contact not in self.cursors:
+                # 首次获取时不解析控件就分不出哪些是对方的消息，解析一次已加载的全部控件再按未读条数截取，
+                # 解析后的消息 id 与控件的 RuntimeId 相同，之后仍按控件增量获取
+                return self.advance_cursor(self.wx._getmsgs(msg_list.GetChildren()), message_id, unread, is_incoming)
             
-            return False, ""
+            # 只比对控件的 RuntimeId，只有新控件才交给 wxauto 解析
+            new_items = self.advance_cursor(msg_list.GetChildren(), runtime_id, unread)
+            return self.wx._getmsgs(new_items) if new_items else []
         except Exception as e:
-            self.log.log(f"检查新消息失败: {e}", "error")
-            return False, ""
+            self.log.log(f"获取新消息失败: {e}", "error")
+            return []
+    
+    def check_new_message(self, contact=None, unread=0):
+        """
+        检查指定联系人是否有新消息
+        
+        只返回对方发来的消息，自己发出的消息、时间和系统提示会被跳过；
+        启用去重时，已经处理过的重复消息也会被丢弃。
+        
+        参数:
+            contact (str): 联系人名称
+            unread (int): 会话列表显示的未读条数，见 fetch_new_messages
+            
+        返回:
+            bool: 是否有新消息
+            list: 新消息列表（按时间顺序）
+        """
+        new_messages = [
+            msg for msg in self.fetch_new_messages(contact, unread)
+            if is_incoming(msg) and message_text(msg)
+        ]
+        
+        # 重绘、切换窗口等原因导致的重复消息直接丢弃
+        if self.dedup is not None:
+            unique = [msg for msg in new_messages if not self.dedup.seen(self.current_contact, message_text(msg))]
+            if len(unique) < len(new_messages):
+                self.log.log(f"{self.current_contact} 丢弃 {len(new_messages) - len(unique)} 条重复消息", level="state")
+            new_messages = unique
+        
+        if new_messages:
+            self.stable_count = 0
+            self.had_change = True
+            return True, new_messages
+        return False, []
     
     def wait_for_stable(self, required_stable_count=2):
         """
@@ -212,9 +413,11 @@ class WxHandler:
         """重置所有状态"""
         self.had_change = False
         self.stable_count = 0
-        # 重新获取当前联系人的最新消息
+        # 丢弃未处理的消息，把游标重新对齐到当前联系人的最新消息
         if self.current_contact:
-            self.last_messages[self.current_contact] = self.get_last_message()
+            self.pending_messages.pop(self.current_contact, None)
+            self.cursors.pop(self.current_contact, None)
+            self.fetch_new_messages()
     
     def monitor_changes(self, contact=None, check_interval=1.0):
         """
@@ -237,41 +440,81 @@ class WxHandler:
                 - "cooling": 正在冷却
                 - "unchanged": 无变化
                 - "error": 发生错误
-            str: 新消息内容（如果有）
+            list: 新消息列表；"stable" 时为这一轮连续收到的全部消息
         """
+        self.polls += 1
+        status, messages = self.check_contact(contact)
+        self.last_status = status
+        return status, messages
+
+    def check_contact(self, contact=None):
+        """monitor_changes 的实现：拉取一次新消息，返回 (监控状态, 新消息列表)"""
         try:
             # 如果提供了联系人且与当前不同，切换联系人
             if contact and contact != self.current_contact:
                 if not self.switch_contact(contact):
-                    return "error", ""
+                    return "error", []
+            
+            # 只有当状态从稳定变为不稳定时才记录日志
+            was_changing = self.had_change
             
             # 检查是否有新消息
-            has_new, new_msg = self.check_new_message()
+            has_new, new_msgs = self.check_new_message()
+            metrics.POLLS.inc(window=self.current_contact)
             
             if has_new:
-                # 只有当状态从稳定变为不稳定时才记录日志
-                if not self.had_change:
+                metrics.CHANGES.inc(window=self.current_contact)
+                if not was_changing:
                     self.log.log(f"{self.current_contact} 有新消息...", level="state")
-                return "changed", new_msg
+                # 连续收到的消息先攒起来，稳定后一起处理
+                self.pending_messages.setdefault(self.current_contact, []).extend(new_msgs)
+                return "changed", new_msgs
             
             # 检查是否稳定
             if self.had_change:
                 self.stable_count += 1
                 if self.stable_count >= 2:  # 2次检查，确保真的稳定
                     self.had_change = False
-                    return "stable", new_msg
+                    return "stable", self.pending_messages.pop(self.current_contact, [])
+            
+            # 发出队列中已到期的回复
+            self.flush_queue()
             
             # 检查冷却时间
             if not self.can_send_message():
                 remaining = self.cooldown - (time.time() - self.last_send_time)
                 self.log.log(f"冷却中，还需等待 {remaining:.1f} 秒")
-                return "cooling", ""
+                return "cooling", []
             
-            return "unchanged", ""
+            return "unchanged", []
         
         except Exception as e:
             self.log.log(f"监控出错: {e}", "error")
-            return "error", ""
+            return "error", []
+    
+    def receive_messages(self):
+        """
+        MessageBackend 接口：当前联系人的消息稳定后，返回这一轮连续收到的全部来信
+        
+        返回:
+            list[IncomingMessage]: 新来信，按时间顺序排列
+        """
+        status, messages = self.monitor_changes()
+        if status != "stable":
+            return []
+        return [
+            IncomingMessage(self.current_contact, message_text(msg), message_sender(msg), msg)
+            for msg in messages
+        ]
+    
+    def send_reply(self, contact, message):
+        """
+        MessageBackend 接口：发送回复到指定联系人
+        
+        回复器的发送队列已经按令牌桶限速，这里直接发出，不再检查冷却时间；
+        否则冷却中的拒绝会被发送队列当作发送失败，重试几次后回复就被丢弃了。
+        """
+        return self.deliver(message, contact)
     
     def get_contacts(self):
         """
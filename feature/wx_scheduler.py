@@ -0,0 +1,227 @@
+import time
+import logs
+from chat_core.message_backend import IncomingMessage, MessageBackend
+from feature.wx_handler import message_sender, message_text
+
+
+class WxScheduler(MessageBackend):
+    """
+    按未读消息调度的多联系人监控器。
+
+    逐个 switch_contact 再 check_new_message 的方式每切换一次就要等 0.5 秒，
+    监控 20 个联系人一轮就要 10 秒以上。这个类改为先读取会话列表里的未读标记
+    （wxauto 的 GetSessionList(newmessage=True)），只访问有未读消息的联系人，
+    并按优先级排序；每次访问把该联系人的所有新消息一次取完、一次回复，尽量减少切换次数。
+
+    当前打开的聊天窗口在会话列表中不会显示未读标记，因此每轮总是先检查当前联系人，
+    这一步不需要切换。
+
+    既可以用 run() 配合 on_messages 回调独立运行，也可以作为 MessageBackend 交给回复器：
+    "backend" 为 "wxauto" 且 "listen_contacts" 有多个联系人时，create_backend 返回的就是它。
+
+    属性:
+        wx_handler (WxHandler): 微信消息处理器
+        priorities (dict): 联系人 -> 优先级，数值越大越先处理
+        on_messages (callable): 回调 on_messages(contact, messages)，返回要回复的文本，
+            返回空值表示不回复；只作为 MessageBackend 使用时可以为 None
+        sweeps (int): 已完成的调度轮数
+        visits (int): 实际处理过消息的访问次数
+        switches (int): 切换联系人的次数
+        last_sweep_time (float): 上一轮调度耗时（秒）
+        polls (int): receive_messages 的调用次数
+        last_status (str): 最近一次 receive_messages 的结果，"changed" 或 "unchanged"，还没有调用时为 "idle"
+
+    使用示例:
+        def reply(contact, messages):
+            return "收到：" + "；".join(message_text(m) for m in messages)
+
+        scheduler = WxScheduler(
+            WxHandler(),
+            contacts=["文件传输助手", "张三"],  # 列表顺序即优先级
+            on_messages=reply
+        )
+        scheduler.run(check_interval=1.0)
+    """
+
+    def __init__(self, wx_handler, contacts, on_messages=None):
+        self.wx_handler = wx_handler
+        if isinstance(contacts, dict):
+            self.priorities = dict(contacts)
+        else:
+            # 列表形式时，越靠前优先级越高
+            self.priorities = {name: len(contacts) - i for i, name in enumerate(contacts)}
+        self.on_messages = on_messages
+        self.sweeps = 0
+        self.visits = 0
+        self.switches = 0
+        self.last_sweep_time = 0.0
+        self.polls = 0
+        self.last_status = "idle"
+        self.log = logs.logging()
+
+    @property
+    def wx(self):
+        return self.wx_handler.wx
+
+    @property
+    def current_contact(self):
+        return self.wx_handler.current_contact
+
+    @property
+    def cursors(self):
+        return self.wx_handler.cursors
+
+    @property
+    def cooldown(self):
+        return self.wx_handler.cooldown
+
+    @cooldown.setter
+    def cooldown(self, value):
+        # 回复器热加载 "cooldown.wx" 时直接设置后端的 cooldown
+        self.wx_handler.cooldown = value
+
+    def get_unread(self):
+        """
+        读取会话列表中被监控联系人的未读条数
+
+        返回:
+            dict: 联系人 -> 未读条数，只包含有未读消息的被监控联系人
+        """
+        try:
+            sessions = self.wx_handler.wx.GetSessionList(newmessage=True)
+        except Exception as e:
+            self.log.log(f"读取会话列表失败: {e}", "error")
+            return {}
+        return {name: amount for name, amount in sessions.items() if name in self.priorities}
+
+    def plan(self, unread):
+        """
+        按优先级、未读条数排出本轮访问顺序，当前联系人总是排在第一位
+
+        参数:
+            unread (dict): 联系人 -> 未读条数
+
+        返回:
+            list: [(联系人, 未读条数), ...]
+        """
+        current = self.wx_handler.current_contact
+        order = sorted(
+            (name for name in unread if name != current),
+            key=lambda name: (-self.priorities[name], -unread[name])
+        )
+        if current in self.priorities:
+            order.insert(0, current)
+        return [(name, unread.get(name, 0)) for name in order]
+
+    def collect(self, contact, unread=0):
+        """
+        访问一个联系人并取回全部新消息，必要时先切换过去
+
+        参数:
+            contact (str): 联系人名称
+            unread (int): 会话列表显示的未读条数
+
+        返回:
+            list: 新消息列表（按时间顺序），没有新消息或切换失败时返回空列表
+        """
+        if contact != self.wx_handler.current_contact:
+            if not self.wx_handler.switch_contact(contact):
+                return []
+            self.switches += 1
+
+        has_new, messages = self.wx_handler.check_new_message(unread=unread)
+        if not has_new:
+            return []
+        self.visits += 1
+        self.log.log(f"{contact} 有 {len(messages)} 条新消息", level="state")
+        return messages
+
+    def visit(self, contact, unread=0):
+        """
+        访问一个联系人：取回全部新消息，交给回调处理并发送回复
+
+        参数:
+            contact (str): 联系人名称
+            unread (int): 会话列表显示的未读条数
+
+        返回:
+            bool: 是否处理了新消息
+        """
+        messages = self.collect(contact, unread)
+        if not messages:
+            return False
+
+        try:
+            reply = self.on_messages(contact, messages)
+        except Exception as e:
+            self.log.log(f"处理 {contact} 的消息时出错: {e}", "error")
+            return False
+        if reply:
+            self.wx_handler.send_message(reply, contact)
+        return True
+
+    def sweep(self):
+        """
+        执行一轮调度
+
+        返回:
+            int: 本轮处理了新消息的联系人数量
+        """
+        start = time.time()
+        # 先发出上一轮因限速还在排队的回复
+        self.wx_handler.flush_queue()
+        handled = 0
+        for contact, unread in self.plan(self.get_unread()):
+            if self.visit(contact, unread):
+                handled += 1
+        self.sweeps += 1
+        self.last_sweep_time = time.time() - start
+        return handled
+
+    def run(self, check_interval=1.0):
+        """循环调度，直到被中断"""
+        while True:
+            self.sweep()
+            time.sleep(check_interval)
+
+    def receive_messages(self):
+        """
+        MessageBackend 接口：按本轮调度顺序访问联系人，返回第一个有新消息的联系人的全部来信
+
+        一次只返回一个联系人的来信，回复器把它们合成一条回复发回这个联系人；
+        其余联系人的未读标记仍留在会话列表里，下一次调用时接着处理。
+
+        返回:
+            list[IncomingMessage]: 新来信，按时间顺序排列
+        """
+        self.polls += 1
+        start = time.time()
+        messages = []
+        for contact, unread in self.plan(self.get_unread()):
+            messages = self.collect(contact, unread)
+            if messages:
+                break
+        self.sweeps += 1
+        self.last_sweep_time = time.time() - start
+        self.last_status = "changed" if messages else "unchanged"
+        return [
+            IncomingMessage(self.current_contact, message_text(msg), message_sender(msg), msg)
+            for msg in messages
+        ]
+
+    def send_reply(self, contact, message):
+        """MessageBackend 接口：切换到指定联系人并直接发出回复，限速由回复器的发送队列负责"""
+        return self.wx_handler.deliver(message, contact)
+
+    def reset_state(self):
+        """重置当前联系人的状态"""
+        self.wx_handler.reset_state()
+
+    def stats(self):
+        """返回调度统计信息"""
+        return {
+            "sweeps": self.sweeps,
+            "visits": self.visits,
+            "switches": self.switches,
+            "last_sweep_time": self.last_sweep_time,
+        }
@@ -1,5 +1,6 @@
 import time
 import signal
+import threading
 
 class logging:
     _instance = None
@@ -11,18 +12,25 @@ class logging:
         return cls._instance
 
     def __init__(self, file="logs.txt"):
+        # 单例只初始化一次，之后的 logging() 直接返回同一个实例
+        if logging._initialized:
+            return
+        logging._initialized = True
         self.log_file = file
         self.begin_time = time.time()
         self.log_f = open(self.log_file, "a", encoding="utf-8")
-        if not logging._initialized:
-            print(f"\n=== {time.strftime('%Y-%m-%d %H:%M:%S')} ===")
-            logging._initialized = True
-        signal.signal(signal.SIGINT, self.handle_exit)
+        # 为 False 时只写入日志文件，不打印到终端（如 TUI 界面运行时）
+        self.echo = True
+        print(f"\n=== {time.strftime('%Y-%m-%d %H:%M:%S')} ===")
+        # 信号处理函数只能在主线程注册
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.handle_exit)
 
     def log(self, message, level="info"):
         with open(self.log_file, "a", encoding="utf-8") as f:
             f.write(f"[{int((time.time() - self.begin_time) * 10)}] - {level.upper()}: {message}\n")
-            print(message)
+            if self.echo:
+                print(message)
             
     def handle_exit(self, signum, frame):
         """处理退出信号"""
@@ -1,120 +1,413 @@
+from chat_core import startup  # 最先导入，启动计时从这里开始
 import threading
 import time
-import pyautogui
 import logs
-import json
-from chat_core.chat_window import ChatWindow
+from chat_core import config, control, faq, locator, metrics, profiler, stickers
+from chat_core.chat_window import ChatWindow, FailSafeException
 from chat_core.chat_session import ChatSession
-
-pyautogui.FAILSAFE = True
+from chat_core.message_backend import create_backend, create_desktop, split_canned
+from chat_core.message_dedup import MessageFingerprintStore
+from chat_core.message_filter import MessageFilter
+from chat_core.pipeline import Pipeline
+from chat_core.send_queue import SendQueue
+from chat_core.status import ActivityLog, session_status
+from chat_core.watchdog import DEFAULT_DEADLINES, StallWatchdog
 
 class AiAutoReplier:
-    def __init__(self, **settings):
-        if not settings:
-            settings = self.load_settings()
+    def __init__(self, desktop=None, **settings):
+        # 校验配置并填入默认值，配置有误时在这里就报出全部问题
+        settings = config.Settings(settings) if settings else self.load_settings()
+        settings.require("ai_send_coordinate", "ai_reply_coordinate", "ai_reply_window")
+        self.settings = settings
         
-        # 创建聊天会话
-        self.wx_session = ChatSession(
-            ChatWindow(
-                send_coordinate=settings["wx_send_coordinate"],
-                reply_coordinate=settings["wx_reply_coordinate"],
-                reply_window=settings["wx_reply_window"],
-                name="WeChat"
-            )
+        # "virtual_desktop" 为 true 时两个窗口都是内存中的虚拟窗口，可以在 Linux 上完整运行
+        self.desktop = desktop if desktop is not None else create_desktop(settings)
+        
+        # 已处理消息的指纹库，用于丢弃重复消息
+        self.dedup = MessageFingerprintStore(
+            ttl=settings.get("dedup.ttl", 120.0),
+            bucket_seconds=settings.get("dedup.bucket_seconds", 60.0)
+        )
+        
+        # 推理前的消息过滤规则（群聊 @、发送者名单、关键词、频率上限）
+        self.message_filter = MessageFilter(settings.get("message_filter", {}))
+        
+        # 常见问题直接回复，不交给模型（"faq.entries" / "faq.file"）
+        self.faq = faq.from_settings(settings)
+        
+        # 回复发送队列，限速期间回复先排队而不是丢弃
+        self.send_queue = SendQueue(
+            global_rate=settings.get("send_queue.rate", 1.0),
+            global_burst=settings.get("send_queue.burst", 1),
+            contact_rate=settings.get("send_queue.contact_rate", 0.5),
+            contact_burst=settings.get("send_queue.contact_burst", 1),
+            replace_pending=settings.get("send_queue.replace_pending", False)
         )
         
+        # 创建聊天会话，微信一侧按 "backend" 选择截图或 wxauto 接口
+        self.wx_session = create_backend(settings, dedup=self.dedup, desktop=self.desktop)
+        
         self.ai_session = ChatSession(
             ChatWindow(
                 send_coordinate=settings["ai_send_coordinate"],
                 reply_coordinate=settings["ai_reply_coordinate"],
                 reply_window=settings["ai_reply_window"],
-                name="AI"
+                name="AI",
+                desktop=self.desktop,
+                locator=locator.from_settings(settings, "ai")  # 复制按钮随回答长度移动，配置了模板时按画面查找
             ),
-            cooldown=3.0  # AI可能需要更长的冷却时间
+            cooldown=settings.get("cooldown.ai", 3.0)  # AI可能需要更长的冷却时间
         )
         
+        # 微信/AI 握手状态：wx_had_changed 表示问题已发给 AI、正在等待回复
         self.wx_had_changed = False
         self.ai_had_changed = False
         self.ai_stable_count = 0
+        self.reply_contact = None  # 正在等待 AI 回复的会话
+        self.ai_reset_pending = False  # 卡死后没能拿到 gui_lock 重置 AI 会话，下次提问前补上
+        
+        # 握手卡死检测：AI 迟迟不稳定或提问发送失败时重置 AI 会话，重试后仍失败则跳过
+        self.watchdog = StallWatchdog(
+            deadlines=settings.get("watchdog.deadlines"),
+            max_retries=settings.get("watchdog.max_retries", 1)
+        )
+        self.check_interval = settings.get("pipeline.check_interval", 1.0)
+        self.stats_interval = settings.get("pipeline.stats_interval", 60.0)
+        
+        # 最近的回复和 AI 回复耗时，供 TUI 面板显示
+        self.activity = ActivityLog()
         
         self.log = logs.logging()
         
-        self.thread_monitor_window = threading.Thread(target=self.monitor_window, daemon=True)
-        self.thread_monitor_window.start()
+        # 鼠标、键盘和剪贴板只有一套，各阶段操作窗口时必须串行
+        self.gui_lock = threading.Lock()
+        
+        # 暂停时不再检测新消息，已排队的回复照常发出；stop_requested 表示由 stop() 主动停止
+        self.paused = threading.Event()
+        self.stop_requested = False
+        
+        # 检测 → 提取 → 生成 → 发送，各阶段在自己的线程上运行，用有界队列连接，
+        # AI 生成回复期间下一条消息已经可以被检测和提取
+        self.pipeline = Pipeline(
+            queue_size=settings.get("pipeline.queue_size", 4),
+            fatal_exceptions=(FailSafeException,)
+        )
+        self.pipeline.add_stage("detect", self.detect_wx_message, interval=self.check_interval)
+        self.pipeline.add_stage("extract", self.extract_wx_message, interval=self.check_interval)
+        self.pipeline.add_stage("generate", self.generate_reply, interval=self.check_interval)
+        self.pipeline.add_stage("deliver", self.deliver_replies, interval=self.check_interval, on_idle=True)
+        
+        # 可选的本机指标服务（"metrics.enabled"），队列深度在抓取时计算
+        metrics.register_gauge("wxbot_send_queue_depth", "发送队列中等待的回复数",
+                               lambda: self.send_queue.stats()["depth"])
+        metrics.register_gauge("wxbot_pipeline_queue_depth", "流水线各阶段输入队列中的任务数",
+                               lambda: [({"stage": name}, stats["queue_depth"])
+                                        for name, stats in self.pipeline.stats().items()])
+        metrics.setup(settings)
+        
+        # 调用栈采样：kill -USR1 / Ctrl+Break 或 "profiler.enabled" 触发，平时不运行
+        self.profiler = profiler.setup(settings)
+        
+        startup.mark("初始化")
+        self.pipeline.start()
+        
+        # 从文件加载的配置支持热更新，修改坐标、提示词、冷却时间等不用重启
+        self.settings_watcher = None
+        if settings.path and settings.get("settings.hot_reload", True):
+            self.settings_watcher = config.SettingsWatcher(
+                settings.path, self.apply_settings, current=settings,
+                interval=settings.get("settings.reload_interval", 1.0)
+            ).start()
+        
+        # 本机控制通道：TUI 和命令行可以随时连上查看状态、暂停/恢复、推送配置，断开后照常运行
+        self.control = control.setup(self, settings)
+
+    def detect_wx_message(self, _):
+        """检测阶段：只判断微信是否有新消息"""
+        if self.paused.is_set():
+            return None
+        with self.gui_lock:
+            detected = self.wx_session.detect_messages()
+        startup.first_poll()
+        if detected is not None:
+            self.log.log("检测到微信窗口变化", level="state")
+        return detected
+
+    def extract_wx_message(self, detected):
+        """提取阶段：取出消息内容并执行过滤规则，带固定回复的来信（认出来的表情、命中的 FAQ）直接发出，不交给 AI"""
+        with self.gui_lock:
+            messages = self.message_filter.filter_messages(self.wx_session.extract_messages(detected))
+            if self.faq is not None:
+                self.faq.answer(messages)
+            canned, messages = split_canned(messages)
+            if canned:
+                for message in canned:
+                    self.send_queue.put(message.contact, message.reply)
+                self.send_queue.pump(self.deliver_reply)
+        return messages or None
+
+    def generate_reply(self, messages):
+        """
+        生成阶段：把消息发给 AI，等待 AI 回复稳定后复制回复
+        
+        等待期间不持有 gui_lock，其他阶段可以继续检测和提取新消息。
+        提问发送失败、AI 超过期限仍未稳定或复制不到回复时，由看门狗重置 AI 会话后重试，
+        重试次数用完就跳过这批消息，一条卡住的回复不会阻塞后面所有消息。
+        
+        返回:
+            tuple: (会话, 回复内容)，失败或跳过时返回 None
+        """
+        started = time.time()
+        try:
+            for attempt in range(self.watchdog.max_retries + 1):
+                if attempt:
+                    self.log.log(f"重新向 AI 提问（第 {attempt} 次重试）", "state")
+                reply, stalled = self.ask_ai(messages)
+                if not stalled:
+                    if reply is not None:
+                        self.activity.record_generation(time.time() - started)
+                    return reply
+            self.watchdog.record_skip()
+            self.log.log(
+                f"重试 {self.watchdog.max_retries} 次后仍未得到回复，跳过来自 {messages[-1].contact} 的消息，"
+                f"流水线共阻塞 {time.time() - started:.1f} 秒", "key"
+            )
+            return None
+        finally:
+            self.watchdog.leave()
+            self.wx_had_changed = False
 
-    def monitor_window(self):
-        check_interval = 1.0
+    def ask_ai(self, messages):
+        """
+        把消息发给 AI 并等待回复稳定
+        
+        返回:
+            tuple: 回复（同 generate_reply）和是否卡死
+        """
+        # 发送阶段同样受期限约束：其他阶段长时间占用界面时不无限等待，发送本身卡住超期也按卡死处理
+        self.watchdog.enter("sending")
+        remaining = self.watchdog.remaining()
+        if not self.gui_lock.acquire(timeout=-1 if remaining is None else remaining):
+            self.recover_from_stall()
+            return None, True
+        try:
+            if self.ai_reset_pending:
+                self.ai_session.reset_state()
+                self.ai_reset_pending = False
+            sent = self.handle_wx_message(messages)
+        finally:
+            self.gui_lock.release()
+        if not sent or self.watchdog.expired():
+            self.recover_from_stall()
+            return None, True
+        self.wx_had_changed = True
+        self.ai_had_changed = False
+        
+        # 监控AI窗口
+        self.watchdog.enter("waiting_ai")
+        while not self.pipeline.stopped.is_set():
+            time.sleep(self.check_interval)
+            if self.watchdog.expired():
+                self.recover_from_stall()
+                return None, True
+            with self.gui_lock:
+                ai_status = self.ai_session.monitor_changes()
+                if ai_status != "stable":
+                    continue
+                self.log.log("AI回复已稳定，准备处理回复", level="state")
+                self.watchdog.enter("copying")
+                reply = self.handle_ai_response()
+            if reply is None:
+                # 窗口稳定了却复制不到回复，多半是页面报错，按卡死处理
+                self.recover_from_stall()
+                return None, True
+            self.ai_had_changed = True
+            self.wx_had_changed = False
+            return reply, False
+        return None, False
 
-        while True:
+    def recover_from_stall(self):
+        """
+        记录卡死并重置 AI 会话，丢弃发送一半或迟迟不稳定留下的状态
+        
+        在 sending 状态拿不到 gui_lock 而卡死时，锁可能仍被其他阶段占着，这里最多只等一个轮询间隔；
+        仍然拿不到就把重置推迟到下次提问前（ai_reset_pending），不让生成阶段无限期地等下去。
+        """
+        state = self.watchdog.state
+        blocked = self.watchdog.record_stall()
+        self.log.log(f"AI 握手在 {state} 状态卡住 {blocked:.1f} 秒，重置 AI 会话", "error")
+        if self.gui_lock.acquire(timeout=self.check_interval):
             try:
-                time.sleep(check_interval)
-                
-                # 监控微信窗口
-                wx_status = self.wx_session.monitor_changes()
-                if wx_status == "stable" and not self.wx_had_changed:
-                    self.log.log("检测到微信窗口变化", level="state")
-                    if self.handle_wx_message():
-                        self.wx_had_changed = True
-                        self.ai_had_changed = False
-                
-                # 监控AI窗口
-                if self.wx_had_changed and not self.ai_had_changed:
-                    ai_status = self.ai_session.monitor_changes()
-                    if ai_status == "stable":
-                        self.log.log("AI回复已稳定，准备处理回复", level="state")
-                        self.handle_ai_response()
-                        self.ai_had_changed = True
-                        self.wx_had_changed = False
-
-            except pyautogui.FailSafeException:
-                self.log.log("程序已通过故障安全机制停止", "key")
-                raise
+                self.ai_session.reset_state()
+                self.ai_reset_pending = False
+            finally:
+                self.gui_lock.release()
+        else:
+            self.ai_reset_pending = True
+            self.log.log("界面仍被占用，AI 会话改在下次提问前重置", "state")
+        self.wx_had_changed = False
+        self.ai_had_changed = False
 
-    def handle_wx_message(self):
-        """处理微信新消息"""
+    def deliver_replies(self, reply):
+        """发送阶段：回复放入发送队列，并发出所有已到期的回复"""
+        if reply is not None:
+            self.send_queue.put(*reply)
+        with self.gui_lock:
+            self.send_queue.pump(self.deliver_reply)
+
+    def handle_wx_message(self, messages):
+        """处理微信新消息，连续收到的多条消息合并成一次提问"""
         try:
-            content = self.wx_session.copy_message(clicks=2)  # 微信用双击
-            # content = self.wx_session.copy_message(copy_by_button=True)  # 使用复制按钮
-            
-            if not content.strip():
-                self.log.log("未检测到文本内容，可能是表情或图片，跳过处理", level="state")
-                self.wx_had_changed = False
-                return False
-            
+            content = "\n".join(message.content for message in messages)
+            self.reply_contact = messages[-1].contact
             return self.ai_session.send_message(content)
             
-        except pyautogui.FailSafeException:
+        except FailSafeException:
             raise
         except Exception as e:
             self.log.log(f"处理微信消息时出错: {e}", "error")
-            self.wx_had_changed = False
             return False
 
     def handle_ai_response(self):
-        """处理AI的回复"""
+        """
+        处理AI的回复
+        
+        返回:
+            tuple: (会话, 回复内容)，没有复制到内容时返回 None
+        """
         try:
-            content = self.ai_session.copy_message(copy_by_button=True)  # 使用复制按钮
+            # 使用复制按钮，冷却中等待而不是放弃，避免回复丢失
+            content = self.ai_session.copy_message(copy_by_button=True, wait=True)
             if content:
-                self.wx_session.send_message(content)
-        except pyautogui.FailSafeException:
+                return self.reply_contact, content
+        except FailSafeException:
             raise
         except Exception as e:
             self.log.log(f"处理AI回复时出错: {e}", "error")
+        return None
+
+    def deliver_reply(self, contact, message):
+        """发送队列的发送函数，把回复发到微信"""
+        sent = self.wx_session.send_reply(contact, message)
+        if sent:
+            self.activity.record_reply(contact, message)
+        return sent
+
+    def status(self):
+        """
+        运行状态快照，供 TUI 面板显示
+        
+        返回:
+            dict: state/state_seconds 握手状态及停留时间，sessions 各会话状态，
+                send_queue 发送队列深度，pipeline 流水线各阶段输入队列深度，
+                activity 生成次数、耗时和最近的回复，running 流水线是否在运行，
+                faq FAQ 的命中率和查找耗时（没有配置 FAQ 时为 None）
+        """
+        wx_name = getattr(self.wx_session, "current_contact", None) or "WeChat"
+        return {
+            "state": self.watchdog.state,
+            "state_seconds": self.watchdog.elapsed(),
+            "sessions": [session_status(wx_name, self.wx_session), session_status("AI", self.ai_session)],
+            "send_queue": self.send_queue.stats()["depth"],
+            "pipeline": {name: stats["queue_depth"] for name, stats in self.pipeline.stats().items()},
+            "activity": self.activity.snapshot(),
+            "running": self.pipeline.is_running(),
+            "paused": self.paused.is_set(),
+            "faq": self.faq.stats() if self.faq is not None else None,
+        }
+
+    def pause(self):
+        """暂停处理新消息，正在生成的回复和已排队的回复照常发出"""
+        self.paused.set()
+        self.log.log("已暂停处理新消息", "key")
+
+    def resume(self):
+        self.paused.clear()
+        self.log.log("已恢复处理新消息", "key")
+
+    def apply_settings(self, settings, changed):
+        """
+        配置热更新：新配置校验通过后，在 gui_lock 内一次性替换运行中的各项参数
+        
+        参数:
+            settings (Settings): 新配置
+            changed (set): 变化的键
+        """
+        settings.require("ai_send_coordinate", "ai_reply_coordinate", "ai_reply_window")
+        # 需要构建的对象先在锁外建好，构建失败时当前配置不受影响
+        # 过滤规则没变时沿用原来的对象，群聊限频的记录不会因为改了别的配置而清空
+        message_filter = (
+            MessageFilter(settings.get("message_filter", {}))
+            if "message_filter" in changed else self.message_filter
+        )
+        faq_responder = faq.from_settings(settings) if changed & faq.SETTINGS_KEYS else self.faq
+        
+        with self.gui_lock:
+            for session, prefix in ((self.wx_session, "wx"), (self.ai_session, "ai")):
+                window = getattr(session, "window", None)
+                keys = [f"{prefix}_send_coordinate", f"{prefix}_reply_coordinate", f"{prefix}_reply_window"]
+                if window is not None and changed & set(keys) and all(key in settings for key in keys):
+                    window.set_coordinates(*(settings[key] for key in keys))
+                    session.reset_state()  # 截图区域变了，重新取基准画面
+                if window is not None and changed & locator.settings_keys(prefix):
+                    window.locator = locator.from_settings(settings, prefix)
+            if changed & stickers.SETTINGS_KEYS and hasattr(self.wx_session, "stickers"):
+                self.wx_session.stickers = stickers.from_settings(settings)
+            self.wx_session.cooldown = settings.get("cooldown.wx", 2.0)
+            self.ai_session.cooldown = settings.get("cooldown.ai", 3.0)
+            
+            self.message_filter = message_filter
+            self.faq = faq_responder
+            self.send_queue.configure(
+                global_rate=settings.get("send_queue.rate", 1.0),
+                global_burst=settings.get("send_queue.burst", 1),
+                contact_rate=settings.get("send_queue.contact_rate", 0.5),
+                contact_burst=settings.get("send_queue.contact_burst", 1),
+                replace_pending=settings.get("send_queue.replace_pending", False)
+            )
+            self.watchdog.deadlines = dict(DEFAULT_DEADLINES, **settings.get("watchdog.deadlines", {}))
+            self.watchdog.max_retries = settings.get("watchdog.max_retries", 1)
+            
+            self.check_interval = settings.get("pipeline.check_interval", 1.0)
+            self.stats_interval = settings.get("pipeline.stats_interval", 60.0)
+            for stage in self.pipeline.stages:
+                stage.interval = self.check_interval
+            self.profiler.apply_settings(settings, changed)
+            self.settings = settings
 
     def load_settings(self):
-        with open('settings.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return config.load_settings("settings.json")
+
+    def stop(self):
+        """停止流水线、配置热更新和控制通道（TUI 或控制通道的 stop 命令调用）"""
+        self.stop_requested = True
+        self.pipeline.stop()
+        if self.settings_watcher is not None:
+            self.settings_watcher.stop()
+        if self.control is not None:
+            self.control.stop()
 
     def start(self):
         self.log.log("自动回复程序已启动...", "key")
+        last_stats = time.time()
         try:
-            while True:
+            while self.pipeline.is_running():
                 time.sleep(1)
-        except (KeyboardInterrupt, pyautogui.FailSafeException):
+                if time.time() - last_stats >= self.stats_interval:
+                    last_stats = time.time()
+                    self.log.log(f"流水线状态: {self.pipeline.stats()}", "state")
+                    self.log.log(f"看门狗状态: {self.watchdog.stats()}", "state")
+            if self.stop_requested:
+                self.log.log("程序已停止", "key")
+            else:
+                self.log.log("程序已通过故障安全机制停止", "key")
+        except (KeyboardInterrupt, FailSafeException):
             self.log.log("程序已停止", "key")
-            exit(0)
+        self.stop()
+        exit(0)
 
 if __name__ == "__main__":
+    startup.mark("导入模块")
     replier = AiAutoReplier()
     replier.start()
 
@@ -0,0 +1,249 @@
+from chat_core import startup  # 最先导入，启动计时从这里开始
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import logs
+from chat_core import config, faq, memory, metrics
+from chat_core.chat_window import FailSafeException
+from chat_core.message_backend import create_backend, create_desktop, split_canned
+from chat_core.message_dedup import MessageFingerprintStore
+from chat_core.message_filter import MessageFilter
+from chat_core.send_queue import SendQueue
+from model import inference
+from model.inference import achat
+
+
+class AsyncAiAutoReplier:
+    """
+    基于 asyncio 事件循环的自动回复器，使用本地模型回复。
+
+    与 main.py 的线程版本并存：线程版本每个环节都靠 time.sleep 循环和守护线程驱动，
+    这里改为单个事件循环：
+        - 每个被监控的会话是一个定时协程，而不是一个线程，监控几百个会话也不需要几百个线程
+        - 模型调用使用 model.inference.achat，等待生成时不占用任何线程
+        - 截图、点击、剪贴板、wxauto 等阻塞的窗口操作统一交给一个单线程执行器，
+          保证同一时间只有一个操作在动鼠标和剪贴板
+
+    属性:
+        backends (list[MessageBackend]): 被监控的消息后端，每个后端一个监控协程
+        generate (callable): 异步生成函数 generate(contact, messages) -> 回复文本
+        gui_executor (ThreadPoolExecutor): 执行阻塞窗口操作的单线程执行器
+        histories (dict): 会话 -> 对话历史
+        contact_backends (dict): 会话 -> 收到该会话消息的后端，回复从同一个后端发出
+        send_queue (SendQueue): 回复发送队列
+
+    使用示例:
+        replier = AsyncAiAutoReplier()
+        replier.start()  # 阻塞运行，Ctrl+C 退出
+    """
+
+    def __init__(self, settings=None, backends=None, generate=None):
+        settings = self.load_settings() if settings is None else config.Settings(settings)
+        self.settings = settings
+
+        self.log = logs.logging()
+        self.check_interval = settings.get("pipeline.check_interval", 1.0)
+
+        self.dedup = MessageFingerprintStore(
+            ttl=settings.get("dedup.ttl", 120.0),
+            bucket_seconds=settings.get("dedup.bucket_seconds", 60.0)
+        )
+        self.message_filter = MessageFilter(settings.get("message_filter", {}))
+        
+        # 常见问题直接回复，不交给模型（"faq.entries" / "faq.file"）
+        self.faq = faq.from_settings(settings)
+        self.send_queue = SendQueue(
+            global_rate=settings.get("send_queue.rate", 1.0),
+            global_burst=settings.get("send_queue.burst", 1),
+            contact_rate=settings.get("send_queue.contact_rate", 0.5),
+            contact_burst=settings.get("send_queue.contact_burst", 1),
+            replace_pending=settings.get("send_queue.replace_pending", False)
+        )
+
+        # 所有阻塞的窗口操作都在这一个线程上排队执行
+        self.gui_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gui")
+        self.desktop = create_desktop(settings) if backends is None else None
+        if backends is None:
+            backends = [create_backend(settings, dedup=self.dedup, desktop=self.desktop)]
+        self.backends = backends
+        self.generate = generate or self.model_generate
+        if generate is None:
+            # ollama 在后台导入，第一条回复不用再等
+            startup.preload("ollama")
+            # 配置了多个推理服务（"inference.endpoints"）时按负载分发请求
+            inference.setup(settings)
+
+        self.prompt_prefix = settings.prompt_prefix
+        self.message_memory_rounds = settings.get("model.message_memory_rounds", 10)
+        self.histories = {}
+        # 超出记忆轮数的相关对话从向量记忆中取回（"memory.enabled"）
+        self.memory = memory.from_settings(settings)
+        self.contact_backends = {}
+
+        self.max_generations = settings.get("async.max_concurrent_generations", 4)
+        self.generation_slots = None
+        self.contact_locks = {}
+        self.tasks = set()
+        self.stopped = None
+        
+        # 可选的本机指标服务（"metrics.enabled"）
+        metrics.register_gauge("wxbot_send_queue_depth", "发送队列中等待的回复数",
+                               lambda: self.send_queue.stats()["depth"])
+        metrics.register_gauge("wxbot_pending_generations", "正在等待或进行中的回复生成任务数",
+                               lambda: len(self.tasks))
+        metrics.setup(settings)
+
+    async def run_gui(self, fn, *args, **kwargs):
+        """在单线程执行器上执行阻塞的窗口操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.gui_executor, partial(fn, *args, **kwargs))
+
+    async def model_generate(self, contact, messages):
+        """默认的生成函数：按会话维护历史，调用本地模型"""
+        history = self.histories.setdefault(contact, [])
+        content = "\n".join(message.content for message in messages)
+        history.append({"role": "user", "content": content})
+        window = history[max(len(history) - self.message_memory_rounds, 0):]
+        recalled = None
+        if self.memory is not None:
+            # 窗口里除刚收到的消息以外的条目模型已经能看到，不再取回
+            recalled = memory.format_recalled(self.memory.recall(contact, content, skip_recent=len(window) - 1))
+        # 取回的对话紧挨在最新一条消息之前，与离线回复器的提示词顺序一致
+        messages_to_send = self.prompt_prefix + window[:-1] + ([recalled] if recalled else []) + window[-1:]
+
+        self.log.log(f'模型对话历史传入：{str(messages_to_send)}', "model")
+        response = await achat(messages_to_send)
+        history.append({"role": "assistant", "content": response})
+        if self.memory is not None:
+            self.memory.remember_many(contact, [("user", content), ("assistant", response)])
+        return response
+
+    async def watch(self, backend):
+        """定时轮询一个后端，收到消息后交给 respond 处理，不等待回复生成完成"""
+        while not self.stopped.is_set():
+            try:
+                messages = await self.run_gui(backend.receive_messages)
+                startup.first_poll()
+                messages = self.message_filter.filter_messages(messages)
+                if self.faq is not None:
+                    self.faq.answer(messages)
+                canned, messages = split_canned(messages)
+                if canned:
+                    # 带固定回复的来信（认出来的表情、命中的 FAQ）不需要生成
+                    self.contact_backends[canned[-1].contact] = backend
+                    for message in canned:
+                        self.send_queue.put(message.contact, message.reply)
+                    await self.run_gui(self.send_queue.pump, self.deliver_reply)
+                if messages:
+                    self.log.log("检测到微信新消息", level="state")
+                    self.contact_backends[messages[-1].contact] = backend
+                    task = asyncio.create_task(self.respond(messages))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+            except FailSafeException:
+                self.log.log("程序已通过故障安全机制停止", "key")
+                self.stopped.set()
+                return
+            except Exception as e:
+                self.log.log(f"监控出错: {e}", "error")
+            await asyncio.sleep(self.check_interval)
+
+    async def respond(self, messages):
+        """生成回复并放入发送队列；同一会话的回复按顺序生成"""
+        contact = messages[-1].contact
+        lock = self.contact_locks.setdefault(contact, asyncio.Lock())
+        try:
+            async with lock, self.generation_slots:
+                reply = await self.generate(contact, messages)
+            if reply:
+                self.send_queue.put(contact, reply)
+                await self.run_gui(self.send_queue.pump, self.deliver_reply)
+        except Exception as e:
+            self.log.log(f"处理消息时出错: {e}", "error")
+
+    def deliver_reply(self, contact, message):
+        """发送队列的发送函数，在 gui 线程上执行"""
+        backend = self.contact_backends.get(contact, self.backends[0])
+        return backend.send_reply(contact, message)
+
+    async def deliver(self):
+        """定时发出发送队列中已到期的回复"""
+        while not self.stopped.is_set():
+            await asyncio.sleep(self.check_interval)
+            if self.send_queue.items:
+                try:
+                    await self.run_gui(self.send_queue.pump, self.deliver_reply)
+                except FailSafeException:
+                    self.log.log("程序已通过故障安全机制停止", "key")
+                    self.stopped.set()
+
+    async def run(self):
+        """启动所有监控协程，直到被停止"""
+        self.stopped = asyncio.Event()
+        self.generation_slots = asyncio.Semaphore(self.max_generations)
+        workers = [asyncio.create_task(self.watch(backend)) for backend in self.backends]
+        workers.append(asyncio.create_task(self.deliver()))
+        startup.mark("初始化")
+        self.log.log(f"异步自动回复程序已启动，监控 {len(self.backends)} 个会话...", "key")
+
+        # 从文件加载的配置支持热更新；监视线程发现变化后，新配置在事件循环里一次性应用
+        watcher = None
+        if self.settings.path and self.settings.get("settings.hot_reload", True):
+            loop = asyncio.get_running_loop()
+            watcher = config.SettingsWatcher(
+                self.settings.path,
+                lambda settings, changed: loop.call_soon_threadsafe(self.apply_settings, settings, changed),
+                current=self.settings,
+                interval=self.settings.get("settings.reload_interval", 1.0)
+            ).start()
+        try:
+            await self.stopped.wait()
+        finally:
+            if watcher is not None:
+                watcher.stop()
+            for task in workers + list(self.tasks):
+                task.cancel()
+            await asyncio.gather(*workers, *self.tasks, return_exceptions=True)
+            self.gui_executor.shutdown(wait=False)
+
+    def apply_settings(self, settings, changed):
+        """配置热更新：在事件循环中执行，两次协程切换之间一次性替换各项参数"""
+        # 过滤规则没变时沿用原来的对象，群聊限频的记录不会因为改了别的配置而清空
+        if "message_filter" in changed:
+            self.message_filter = MessageFilter(settings.get("message_filter", {}))
+        if changed & faq.SETTINGS_KEYS:
+            self.faq = faq.from_settings(settings)
+        self.send_queue.configure(
+            global_rate=settings.get("send_queue.rate", 1.0),
+            global_burst=settings.get("send_queue.burst", 1),
+            contact_rate=settings.get("send_queue.contact_rate", 0.5),
+            contact_burst=settings.get("send_queue.contact_burst", 1),
+            replace_pending=settings.get("send_queue.replace_pending", False)
+        )
+        self.prompt_prefix = settings.prompt_prefix
+        self.message_memory_rounds = settings.get("model.message_memory_rounds", 10)
+        if "model.temperature" in changed:
+            inference.configure(settings)
+        if self.memory is not None and changed & memory.SETTINGS_KEYS:
+            self.memory.top_k = settings.get("memory.top_k", 3)
+            self.memory.min_score = settings.get("memory.min_score", 0.25)
+        self.check_interval = settings.get("pipeline.check_interval", 1.0)
+        self.settings = settings
+
+    def load_settings(self):
+        return config.load_settings("settings.json")
+
+    def start(self):
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            pass
+        self.log.log("程序已停止", "key")
+
+
+if __name__ == "__main__":
+    startup.mark("导入模块")
+    replier = AsyncAiAutoReplier()
+    replier.start()
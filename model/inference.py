@@ -1,9 +1,38 @@
-import ollama
+import asyncio
 import json
+import time
+from chat_core import metrics, startup
+
+# ollama 导入较慢，第一次调用模型时才导入
+ollama = startup.LazyModule("ollama")
 
 MODEL = 'qwen2.5:1.5b'
 
-def chat(messages, params=None):
+_async_client = None
+
+# 配置了 "inference.endpoints" 时由推理池分发请求，见 model.pool
+_pool = None
+
+# 来自配置的采样参数（"model.temperature"），覆盖 build_params 中的默认值
+_options = {}
+
+def configure(settings):
+    """按配置更新采样参数，配置热更新时再次调用"""
+    _options["temperature"] = settings.get("model.temperature", 0.7)
+
+def setup(settings):
+    """按配置设置采样参数、创建推理池并启动健康检查，未配置服务时照常使用默认的本机 Ollama"""
+    global _pool
+    from model import pool
+    configure(settings)
+    if _pool is not None:
+        _pool.stop()
+    _pool = pool.from_settings(settings)
+    if _pool is not None:
+        _pool.start()
+    return _pool
+
+def build_params(params=None):
     # 调整默认参数使回复更自然
     default_params = {
         'options': {
@@ -13,20 +42,57 @@ def chat(messages, params=None):
             'num_predict': 512,    # 保持不变
         }
     }
+    default_params['options'].update(_options)
     # 如果传入了参数，更新默认参数
     if params:
         default_params['options'].update(params)
-    
+    return default_params
+
+def chat(messages, params=None):
+    start = time.perf_counter()
     try:
+        if _pool is not None:
+            content = _pool.chat(messages, build_params(params)['options'])
+            metrics.MODEL_CALLS.inc(status="ok")
+            return content
         response = ollama.chat(
             model=MODEL,
             messages=messages,
-            **default_params  # 现在参数在 options 字典中
+            **build_params(params)  # 现在参数在 options 字典中
         )
+        metrics.MODEL_CALLS.inc(status="ok")
         # 如果没有工具调用，直接返回原始回答
         return response['message']['content']
     except Exception as e:
+        metrics.MODEL_CALLS.inc(status="error")
+        return f"发生错误: {str(e)}"
+    finally:
+        metrics.MODEL_LATENCY.observe(time.perf_counter() - start)
+
+async def achat(messages, params=None):
+    """chat 的异步版本，等待模型生成时不阻塞事件循环"""
+    global _async_client
+    start = time.perf_counter()
+    try:
+        if _pool is not None:
+            # 推理池是线程安全的阻塞接口，放到线程中等待
+            content = await asyncio.to_thread(_pool.chat, messages, build_params(params)['options'])
+            metrics.MODEL_CALLS.inc(status="ok")
+            return content
+        if _async_client is None:
+            _async_client = ollama.AsyncClient()
+        response = await _async_client.chat(
+            model=MODEL,
+            messages=messages,
+            **build_params(params)
+        )
+        metrics.MODEL_CALLS.inc(status="ok")
+        return response['message']['content']
+    except Exception as e:
+        metrics.MODEL_CALLS.inc(status="error")
         return f"发生错误: {str(e)}"
+    finally:
+        metrics.MODEL_LATENCY.observe(time.perf_counter() - start)
 
 def main():
     # 可以自定义参数
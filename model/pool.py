@@ -0,0 +1,378 @@
+"""
+多个推理服务之间的负载均衡
+
+一个 Ollama 服务同一时间只能生成有限的几条回复，消息一多就要排队。推理池把请求分给配置的多个服务
+（不同端口、不同机器，也可以是不同的后端）:
+    - 最少未完成请求优先：每次选 "未完成请求数 / 并发上限" 最小的服务，相同时选最近平均耗时短的
+    - 每个服务有自己的并发上限，全部占满时请求排队等待，不会压垮慢的那台
+    - 请求失败或超时的服务标记为不可用，这条请求立即转给下一个服务；后台线程定期探测，恢复后重新启用
+    - 所有服务都不可用时仍会按顺序尝试一遍，探测线程还没发现恢复时也不至于直接失败
+
+支持的后端:
+    - "ollama": Ollama 服务，通过 ollama 库调用 /api/chat
+    - "openai": OpenAI 兼容接口（llama.cpp server、vLLM、LM Studio 等），POST /v1/chat/completions，
+      只用标准库，不需要额外依赖
+
+配置（settings.json）:
+    "inference.endpoints": [
+        {"url": "http://127.0.0.1:11434", "max_concurrency": 2},
+        {"url": "http://192.168.1.20:11434", "model": "qwen2.5:7b"},
+        {"url": "http://127.0.0.1:8080", "backend": "openai", "max_concurrency": 4}
+    ]
+没有配置时 model.inference 照常使用默认的本机 Ollama。
+可以用 python -m feature.fake_inference 在本机启动模拟服务试用。
+
+命令行（按配置并发发送一批请求，输出每个服务分到的请求数和耗时）:
+    python -m model.pool --requests 20 --concurrency 8
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import logs
+from chat_core import config, metrics, startup
+
+ollama = startup.LazyModule("ollama")
+
+DEFAULT_MODEL = "qwen2.5:1.5b"
+
+# 最近平均耗时的平滑系数
+LATENCY_SMOOTHING = 0.3
+
+
+class NoEndpointError(RuntimeError):
+    """所有推理服务都失败或排队超时"""
+
+
+def is_client_error(error):
+    """
+    是否为请求本身有误（4xx，如模型不存在、参数不对）
+
+    这类错误换一个服务也一样失败，服务本身是正常的，不标记为不可用，也不转给下一个服务。
+    408 和 429 是服务忙不过来，仍按服务故障处理。
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        status = error.code
+    else:
+        status = getattr(error, "status_code", None)  # ollama.ResponseError
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+
+class Endpoint:
+    """
+    一个推理服务
+
+    属性:
+        url (str): 服务地址
+        backend (str): "ollama" 或 "openai"
+        model (str): 模型名
+        max_concurrency (int): 同时处理的请求上限
+        timeout (float): 单个请求的超时时间（秒）
+        outstanding (int): 未完成的请求数
+        healthy (bool): 是否可用
+        requests / failures (int): 累计请求数和失败数
+        latency (float): 最近的平均耗时（秒），还没有成功请求时为 None
+        last_error (str): 最近一次失败的原因
+    """
+
+    def __init__(self, url, backend="ollama", model=None, max_concurrency=1, timeout=120.0, name=None):
+        self.url = url.rstrip("/")
+        self.backend = backend
+        self.model = model or DEFAULT_MODEL
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.name = name or self.url
+        self.outstanding = 0
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+        self.latency = None
+        self.last_error = None
+        self._client = None
+
+    def __repr__(self):
+        return f"Endpoint({self.name!r}, {self.backend}, outstanding={self.outstanding}, healthy={self.healthy})"
+
+    def load(self):
+        """负载：未完成请求数占并发上限的比例"""
+        return self.outstanding / self.max_concurrency
+
+    def client(self):
+        if self._client is None:
+            self._client = ollama.Client(host=self.url, timeout=self.timeout)
+        return self._client
+
+    def chat(self, messages, options):
+        """
+        发送一次对话请求
+
+        返回:
+            str: 回复内容
+
+        异常:
+            Exception: 连接失败、超时或服务返回错误
+        """
+        if self.backend == "ollama":
+            response = self.client().chat(model=self.model, messages=messages, options=options)
+            return response["message"]["content"]
+        body = {"model": self.model, "messages": messages, "stream": False}
+        for key, name in (("temperature", "temperature"), ("top_p", "top_p"), ("top_k", "top_k"), ("num_predict", "max_tokens")):
+            if key in options:
+                body[name] = options[key]
+        response = self.post("/v1/chat/completions", body, self.timeout)
+        return response["choices"][0]["message"]["content"]
+
+    def post(self, path, body, timeout):
+        request = urllib.request.Request(
+            self.url + path, data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+
+    def probe(self, timeout=2.0):
+        """健康检查：Ollama 查询 /api/tags，OpenAI 兼容接口查询 /v1/models"""
+        path = "/api/tags" if self.backend == "ollama" else "/v1/models"
+        try:
+            with urllib.request.urlopen(self.url + path, timeout=timeout) as response:
+                return response.status == 200
+        except (OSError, ValueError):
+            return False
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "model": self.model,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency": self.latency,
+            "last_error": self.last_error,
+        }
+
+
+class InferencePool:
+    """
+    推理服务池，线程安全
+
+    属性:
+        endpoints (list[Endpoint]): 全部服务，按配置顺序
+        health_interval (float): 健康检查间隔（秒）
+        queue_timeout (float): 所有服务都占满时最多排队等待的时间（秒）
+
+    使用示例:
+        pool = InferencePool([Endpoint("http://127.0.0.1:11434"), Endpoint("http://127.0.0.1:11435")])
+        pool.start()
+        pool.chat([{"role": "user", "content": "你好"}], {"temperature": 0.8})
+        pool.stop()
+    """
+
+    def __init__(self, endpoints, health_interval=10.0, queue_timeout=120.0):
+        if not endpoints:
+            raise ValueError("推理池至少需要一个服务")
+        self.endpoints = list(endpoints)
+        self.health_interval = health_interval
+        self.queue_timeout = queue_timeout
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.log = logs.logging()
+        metrics.register_gauge("wxbot_inference_outstanding", "各推理服务未完成的请求数",
+                               lambda: [({"endpoint": e.name}, e.outstanding) for e in self.endpoints])
+        metrics.register_gauge("wxbot_inference_healthy", "各推理服务是否可用（1 为可用）",
+                               lambda: [({"endpoint": e.name}, int(e.healthy)) for e in self.endpoints])
+
+    def start(self):
+        """启动健康检查线程"""
+        threading.Thread(target=self.check_health, name="inference-health", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def pick(self, tried):
+        """
+        选出负载最低、还有空位的服务，调用时需持有 condition
+
+        返回:
+            tuple: (服务, 是否还有没试过的服务)；服务为 None 且还有没试过的服务时应等待
+        """
+        untried = [endpoint for endpoint in self.endpoints if endpoint not in tried]
+        # 没有可用的服务时也尝试不可用的，探测线程还没发现恢复时不至于直接失败
+        candidates = [endpoint for endpoint in untried if endpoint.healthy] or untried
+        free = [endpoint for endpoint in candidates if endpoint.outstanding < endpoint.max_concurrency]
+        if not free:
+            return None, bool(candidates)
+        best = min(free, key=lambda endpoint: (
+            endpoint.load(), endpoint.outstanding, endpoint.latency or 0.0, self.endpoints.index(endpoint)
+        ))
+        return best, True
+
+    def acquire(self, tried, deadline):
+        """
+        占用一个服务，都占满时等待
+
+        返回:
+            Endpoint: 所有服务都试过或等待超时时返回 None
+        """
+        with self.condition:
+            while True:
+                endpoint, remaining = self.pick(tried)
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+                wait = deadline - time.monotonic()
+                if not remaining or wait <= 0:
+                    return None
+                self.condition.wait(wait)
+
+    def release(self, endpoint, elapsed=None, error=None):
+        with self.condition:
+            endpoint.outstanding -= 1
+            if error is None:
+                if elapsed is not None:
+                    endpoint.latency = elapsed if endpoint.latency is None else (
+                        LATENCY_SMOOTHING * elapsed + (1 - LATENCY_SMOOTHING) * endpoint.latency)
+                endpoint.healthy = True
+            else:
+                endpoint.failures += 1
+                endpoint.last_error = str(error) or type(error).__name__
+                endpoint.healthy = False
+            self.condition.notify_all()
+
+    def chat(self, messages, options=None):
+        """
+        把一次对话请求交给负载最低的服务，失败时转给下一个服务
+
+        返回:
+            str: 回复内容
+
+        异常:
+            NoEndpointError: 所有服务都失败，或排队超过 queue_timeout
+            Exception: 服务返回 4xx 时原样抛出，见 is_client_error
+        """
+        tried = set()
+        errors = []
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            endpoint = self.acquire(tried, deadline)
+            if endpoint is None:
+                reason = "; ".join(errors) if errors else f"排队超过 {self.queue_timeout:.0f} 秒"
+                raise NoEndpointError(f"没有可用的推理服务: {reason}")
+            tried.add(endpoint)
+            start = time.perf_counter()
+            try:
+                content = endpoint.chat(messages, options or {})
+            except Exception as e:
+                if is_client_error(e):
+                    # 服务能正常应答，只是这条请求有误，不影响服务的状态
+                    self.release(endpoint)
+                    metrics.INFERENCE_REQUESTS.inc(endpoint=endpoint.name, status="client_error")
+                    self.log.log(f"推理服务 {endpoint.name} 拒绝了请求: {e}", "error")
+                    raise
+                self.release(endpoint, error=e)
+                metrics.INFERENCE_REQUESTS.inc(endpoint=endpoint.name, status="error")
+                errors.append(f"{endpoint.name}: {e}")
+                self.log.log(f"推理服务 {endpoint.name} 请求失败，标记为不可用并转给下一个服务: {e}", "error")
+                continue
+            self.release(endpoint, time.perf_counter() - start)
+            metrics.INFERENCE_REQUESTS.inc(endpoint=endpoint.name, status="ok")
+            return content
+
+    def check_health(self):
+        """定期探测：不可用的服务恢复后重新启用，空闲时探测失败的服务标记为不可用"""
+        while not self.stopped.wait(self.health_interval):
+            for endpoint in self.endpoints:
+                if endpoint.healthy and endpoint.outstanding:
+                    continue  # 正在处理请求，请求本身就能说明是否可用
+                ok = endpoint.probe()
+                with self.condition:
+                    if ok and not endpoint.healthy:
+                        endpoint.healthy = True
+                        self.log.log(f"推理服务 {endpoint.name} 已恢复", "key")
+                        self.condition.notify_all()
+                    elif not ok and endpoint.healthy:
+                        endpoint.healthy = False
+                        endpoint.last_error = "健康检查失败"
+                        self.log.log(f"推理服务 {endpoint.name} 健康检查失败，标记为不可用", "error")
+
+    def stats(self):
+        with self.condition:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+
+def from_settings(settings):
+    """
+    按配置创建推理池
+
+    参数:
+        settings (dict): 配置
+            - "inference.endpoints": 服务列表，每项包含 url，可选 backend（"ollama" / "openai"，默认 ollama）、
+              model（默认 qwen2.5:1.5b）、max_concurrency（默认 1）、name（默认为 url）
+            - "inference.timeout": 单个请求的超时时间（秒），默认 120
+            - "inference.health_interval": 健康检查间隔（秒），默认 10
+            - "inference.queue_timeout": 所有服务都占满时最多排队等待的时间（秒），默认 120
+
+    返回:
+        InferencePool: 未配置服务时返回 None
+    """
+    entries = settings.get("inference.endpoints", [])
+    if not entries:
+        return None
+    timeout = settings.get("inference.timeout", 120.0)
+    endpoints = [
+        Endpoint(
+            entry["url"], entry.get("backend", "ollama"), entry.get("model"),
+            entry.get("max_concurrency", 1), timeout, entry.get("name")
+        )
+        for entry in entries
+    ]
+    return InferencePool(
+        endpoints, settings.get("inference.health_interval", 10.0), settings.get("inference.queue_timeout", 120.0)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按配置向推理池并发发送一批请求")
+    parser.add_argument("--settings", default="settings.json", help="配置文件，默认 settings.json")
+    parser.add_argument("--requests", type=int, default=20, help="请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时发送的请求数")
+    parser.add_argument("--prompt", default="你好", help="发送的消息")
+    args = parser.parse_args()
+
+    pool = from_settings(config.load_settings(args.settings))
+    if pool is None:
+        raise SystemExit('没有配置 "inference.endpoints"')
+    pool.start()
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            pool.chat([{"role": "user", "content": args.prompt}])
+            return time.perf_counter() - start
+        except NoEndpointError as e:
+            print(e)
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        latencies = list(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    done = [latency for latency in latencies if latency is not None]
+    print(f"{len(done)}/{args.requests} 成功，用时 {elapsed:.2f} 秒，吞吐 {len(done) / elapsed:.2f} 条/秒")
+    for stats in pool.stats():
+        latency = "-" if stats["latency"] is None else f"{stats['latency']:.2f}s"
+        print(f"  {stats['name']:<32} {'UP' if stats['healthy'] else 'DOWN':<5} "
+              f"请求 {stats['requests']:>4}  失败 {stats['failures']:>3}  平均耗时 {latency}")
+    pool.stop()
+
+
+if __name__ == "__main__":
+    main()
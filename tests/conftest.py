@@ -0,0 +1,22 @@
+"""
+测试的公共设置
+
+在仓库根目录运行: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logs  # noqa: E402
+
+
+@pytest.fixture(autouse=True, scope="session")
+def quiet_log(tmp_path_factory):
+    """日志写到临时目录，不打印到终端，也不改动仓库里的 logs.txt"""
+    log = logs.logging()
+    log.log_file = str(tmp_path_factory.mktemp("logs") / "logs.txt")
+    log.echo = False
+    yield log
@@ -0,0 +1,103 @@
+"""benchmark.py 的对话脚本、延迟统计，以及在模拟的 wxauto 上跑一次短压测"""
+import json
+
+import pytest
+
+import benchmark
+from benchmark import Benchmark, StubModel
+from test_message_backend import SETTINGS
+
+
+def test_script_is_reproducible_and_follows_the_scenario():
+    scenario = {"rate": 1.0, "burst": 3, "media_ratio": 0.5, "contacts": 2, "duration": 20}
+    script = benchmark.build_script(scenario, seed=7)
+    assert script == benchmark.build_script(scenario, seed=7)
+    assert script != benchmark.build_script(scenario, seed=8)
+
+    assert [item["at"] for item in script] == sorted(item["at"] for item in script)
+    assert all(item["at"] < scenario["duration"] + 0.2 * (scenario["burst"] - 1) for item in script)
+    assert {item["sender"] for item in script} <= {"用户1", "用户2"}
+    assert len(script) % scenario["burst"] == 0
+    for item in script:
+        if item["media"]:
+            assert (item["content"], item["token"]) == ("[图片]", None)
+        else:
+            assert item["content"] == f"消息 #{item['token']}"
+    # 每条文本消息的编号都不同
+    tokens = [item["token"] for item in script if item["token"]]
+    assert len(tokens) == len(set(tokens))
+
+
+def test_percentile_uses_nearest_rank():
+    assert benchmark.percentile([], 50) is None
+    values = [5, 1, 4, 2, 3]
+    assert benchmark.percentile(values, 50) == 3
+    assert benchmark.percentile(values, 90) == 5
+    assert benchmark.percentile(values, 0) == 1
+    assert benchmark.percentile(list(range(1, 101)), 99) == 99
+
+
+def test_stub_model_lists_every_token():
+    model = StubModel(latency=0.0)
+    assert model.reply("消息 #3\n消息 #4") == "收到 #3 #4"
+    assert model.reply("[图片]") == "收到"
+    assert model.chat([{"role": "user", "content": "消息 #9"}]) == "收到 #9"
+    assert model.calls == 3
+    jittery = StubModel(latency=0.1, jitter=0.5)
+    assert all(jittery.delay() >= 0.0 for _ in range(50))
+
+
+def test_report_counts_merged_and_missing_replies():
+    run = Benchmark("main", benchmark.SCENARIOS["steady"], {}, StubModel(latency=0.5))
+    run.sent_at = {"1": 10.0, "2": 10.5, "3": 11.0}
+    # 前两条合并成一次回复；第一条后来又被提到一次，只算第一次收到的时间
+    run.replies = [(12.0, "收到 #1 #2"), (13.0, "收到 #1")]
+    assert run.answered() == {"1": 12.0, "2": 12.0}
+
+    report = run.report(elapsed=4.0, cpu=1.0)
+    assert (report["replies"], report["answered"], report["unanswered"]) == (2, 2, 1)
+    assert report["latency"]["mean"] == 1.75
+    assert (report["latency"]["p50"], report["latency"]["max"]) == (1.5, 2.0)
+    assert report["replies_per_sec"] == 0.5
+    assert report["cpu_percent"] == 25.0
+
+
+def test_compare_prints_both_results(tmp_path, capsys):
+    def write(name, **values):
+        result = {
+            "commit": name, "replies_per_sec": 1.0, "latency": {"p50": 1.0, "p99": 2.0},
+            "unanswered": 0, "cpu_percent": 10.0, "max_rss_kb": None,
+        }
+        result.update(values)
+        path = tmp_path / f"{name}.json"
+        path.write_text(json.dumps(result), encoding="utf-8")
+        return str(path)
+
+    benchmark.compare(write("old"), write("new", replies_per_sec=2.5, unanswered=3))
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split()[-2:] == ["old", "new"]
+    assert lines[1].split() == ["replies_per_sec", "1.000", "2.500"]
+    assert lines[4].split() == ["unanswered", "0", "3"]
+    assert lines[6].split() == ["max_rss_kb", "-", "-"]
+
+
+@pytest.mark.parametrize("flavour", ["main", "offline"])
+def test_short_run_on_fake_wxauto(flavour, monkeypatch):
+    if flavour == "offline":
+        import feature.main_offline_model as offline
+        monkeypatch.setattr(offline, "chat", offline.chat)
+    scenario = {"rate": 2.0, "burst": 2, "media_ratio": 0.0, "contacts": 3, "duration": 1.5}
+    settings = dict(benchmark.BASE_SETTINGS, **{
+        key: value for key, value in SETTINGS.items() if key.startswith(("cooldown.", "send_queue.", "pipeline."))
+    }, backend="wxauto")
+    run = Benchmark(flavour, scenario, settings, StubModel(latency=0.05), seed=1)
+    # 回复器第一次轮询之前到达的消息算作历史消息，不回复，所以保留默认的预热时间
+    report = run.run(drain=10.0)
+
+    assert report["flavour"] == flavour
+    assert report["backend"] == "wxauto"
+    assert report["messages"] == len(run.script) > 0
+    assert report["unanswered"] == 0
+    assert report["answered"] == len(run.script)
+    assert 0 <= report["latency"]["p50"] <= report["latency"]["max"]
+    assert report["model"]["calls"] >= 1
@@ -0,0 +1,119 @@
+"""chat_core.calibration：在合成的画面上标定，以及 --write 写回配置文件"""
+import json
+import os
+import sys
+
+import pytest
+from PIL import Image, ImageDraw
+
+from chat_core import calibration, config
+from test_message_backend import SETTINGS
+
+BACKGROUND = (245, 245, 245)
+BUBBLES = [(20, 300, 140, 330), (20, 340, 100, 370)]
+
+
+class FrameGui:
+    """按顺序返回合成的整屏画面，播完后一直停在最后一帧"""
+
+    size = (400, 400)
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def screenshot(self, region=None):
+        frame = self.frames[min(self.index, len(self.frames) - 1)]
+        self.index += 1
+        x, y, width, height = region
+        return frame.crop((x, y, x + width, y + height))
+
+
+def synthetic_frames():
+    """空白聊天窗口里先后出现两条对方的白色气泡"""
+    frames = [Image.new("RGB", FrameGui.size, BACKGROUND)]
+    for bubble in BUBBLES:
+        frame = frames[-1].copy()
+        ImageDraw.Draw(frame).rectangle((bubble[0], bubble[1], bubble[2] - 1, bubble[3] - 1), fill=(255, 255, 255))
+        frames.append(frame)
+    return frames
+
+
+def screen_settings(**overrides):
+    return config.Settings(dict(SETTINGS, wx_reply_window=[[0, 200], [300, 390]], **overrides))
+
+
+def write_json(path, values):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(values, f, ensure_ascii=False)
+
+
+def test_calibrate_finds_window_and_newest_bubble(tmp_path):
+    result = calibration.calibrate(
+        FrameGui(synthetic_frames()), screen_settings(), "wx",
+        seconds=0.3, interval=0.02, margin=10, padding=4, template_dir=str(tmp_path)
+    )
+
+    assert result["wx_reply_window"] == [[16, 296], [144, 374]]
+    # 最新气泡的左下角内侧
+    assert result["wx_reply_coordinate"] == [32, 360]
+    template = Image.open(result["wx_reply_template"])
+    assert result["wx_reply_template"] == os.path.join(str(tmp_path), "wx_reply.png")
+    assert template.size == (16, 9)
+    # 模板截的是气泡底边：上半是气泡的白色，下半是背景
+    assert template.getpixel((0, 0)) == (255, 255, 255)
+    assert template.getpixel((0, 8)) == BACKGROUND
+
+
+def test_calibrate_without_changes_returns_nothing():
+    frames = [Image.new("RGB", FrameGui.size, BACKGROUND)]
+    result = calibration.calibrate(FrameGui(frames), screen_settings(), "wx", seconds=0.1, interval=0.02, margin=10)
+    assert result == {}
+    assert calibration.describe(screen_settings(), result) == "录制期间画面没有变化，没有得到结果"
+
+
+def test_write_settings_keeps_other_keys(tmp_path):
+    path = str(tmp_path / "settings.json")
+    write_json(path, dict(SETTINGS, **{"model.ai_system_prompt": "你是小助手"}))
+    values = calibration.calibrate(
+        FrameGui(synthetic_frames()), screen_settings(), "wx",
+        seconds=0.3, interval=0.02, margin=10, template_dir=str(tmp_path / "templates")
+    )
+
+    calibration.write_settings(path, values)
+    written = config.load_settings(path)
+    for key, value in values.items():
+        assert written[key] == value
+    assert written["model.ai_system_prompt"] == "你是小助手"
+    assert written["ai_reply_window"] == SETTINGS["ai_reply_window"]
+
+
+def test_write_settings_rejects_invalid_values(tmp_path):
+    path = str(tmp_path / "settings.json")
+    write_json(path, SETTINGS)
+    before = open(path, encoding="utf-8").read()
+    with pytest.raises(config.SettingsError):
+        calibration.write_settings(path, {"wx_reply_window": [[100, 100], [50, 50]]})
+    assert open(path, encoding="utf-8").read() == before
+
+
+def test_command_line_write_on_virtual_desktop(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "settings.json")
+    templates = str(tmp_path / "templates")
+    write_json(path, SETTINGS)
+    monkeypatch.setattr(sys, "argv", [
+        "calibration", "--settings", path, "--window", "wx", "--virtual", "--seconds", "2",
+        "--interval", "0.05", "--write", "--template-dir", templates,
+    ])
+    calibration.main()
+
+    output = capsys.readouterr().out
+    assert f"已写入 {path}" in output
+    written = config.load_settings(path)
+    assert written["wx_reply_window"] != SETTINGS["wx_reply_window"]
+    assert calibration.area(written["wx_reply_window"]) < calibration.area(SETTINGS["wx_reply_window"])
+    assert os.path.exists(written["wx_reply_template"])
+    # 新的截图区域仍在原来的区域附近，点击坐标落在新的截图区域内
+    (x1, y1), (x2, y2) = written["wx_reply_window"]
+    x, y = written["wx_reply_coordinate"]
+    assert x1 <= x <= x2 and y1 <= y <= y2
@@ -0,0 +1,140 @@
+"""chat_core.config 的校验和热更新，以及回复器按变化的键应用新配置"""
+import json
+import os
+
+import pytest
+
+from chat_core import config
+from chat_core.message_backend import IncomingMessage
+from model import inference
+from test_message_backend import make_replier
+
+WXAUTO = {"backend": "wxauto"}
+
+
+def write_settings(path, values):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(values, f)
+    # 保证修改时间变化，热更新能发现文件被改过
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_defaults_and_unknown_keys():
+    settings = config.Settings(dict(WXAUTO, custom=1))
+    assert settings["pipeline.check_interval"] == 1.0
+    assert settings["custom"] == 1
+    assert "wxauto.contact" not in settings  # 默认值为 None 的键不填入
+
+
+def test_all_errors_are_reported_at_once():
+    with pytest.raises(config.SettingsError) as error:
+        config.Settings({
+            "backend": "wxauto",
+            "cooldown.wx": -1,
+            "model.message_memory_rounds": 0,
+            "wx_reply_window": [[100, 100], [50, 50]],
+        })
+    keys = sorted(message.split(":")[0] for message in error.value.errors)
+    assert keys == ["cooldown.wx", "model.message_memory_rounds", "wx_reply_window"]
+
+
+def test_screen_backend_requires_coordinates():
+    with pytest.raises(config.SettingsError) as error:
+        config.Settings({"wx_send_coordinate": [1, 2]})
+    assert sorted(message.split(":")[0] for message in error.value.errors) == ["wx_reply_coordinate", "wx_reply_window"]
+
+
+def test_load_settings_reports_bad_json(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text('{"backend": "wxauto",\n  "cooldown.wx": }', encoding="utf-8")
+    with pytest.raises(config.SettingsError, match="第 2 行"):
+        config.load_settings(str(path))
+    with pytest.raises(config.SettingsError, match="无法读取"):
+        config.load_settings(str(tmp_path / "missing.json"))
+
+
+def test_changed_keys():
+    old = config.Settings(dict(WXAUTO, **{"cooldown.wx": 2.0}))
+    new = config.Settings(dict(WXAUTO, **{"cooldown.wx": 3.0, "extra": True}))
+    assert new.changed_keys(old) == {"cooldown.wx", "extra"}
+    assert old.changed_keys(old) == set()
+
+
+def test_watcher_applies_only_valid_changes(tmp_path):
+    path = str(tmp_path / "settings.json")
+    write_settings(path, dict(WXAUTO, **{"cooldown.wx": 2.0}))
+    applied = []
+    watcher = config.SettingsWatcher(path, lambda settings, changed: applied.append(changed),
+                                     current=config.load_settings(path))
+
+    assert watcher.check() == set()  # 文件没有变化
+
+    write_settings(path, dict(WXAUTO, **{"cooldown.wx": "很久"}))
+    assert watcher.check() == set()
+    assert watcher.errors == 1
+    assert watcher.current["cooldown.wx"] == 2.0
+
+    write_settings(path, dict(WXAUTO, **{"cooldown.wx": 5, "pipeline.check_interval": 1.0}))
+    assert watcher.check() == {"cooldown.wx"}
+    assert applied == [{"cooldown.wx"}]
+    assert watcher.current["cooldown.wx"] == 5
+    assert watcher.reloads == 1
+
+
+def test_watcher_keeps_old_settings_when_callback_fails(tmp_path):
+    path = str(tmp_path / "settings.json")
+    write_settings(path, WXAUTO)
+
+    def fail(settings, changed):
+        raise RuntimeError("坏了")
+
+    watcher = config.SettingsWatcher(path, fail, current=config.load_settings(path))
+    write_settings(path, dict(WXAUTO, **{"cooldown.wx": 5}))
+    assert watcher.check() == set()
+    assert watcher.errors == 1
+    assert watcher.current["cooldown.wx"] != 5
+
+
+GROUP_FILTER = {"require_mention": False, "group_rate_limit": {"max": 1, "per_seconds": 600}}
+
+
+def reload(replier, **overrides):
+    settings = config.Settings(dict(replier.settings, **overrides))
+    replier.apply_settings(settings, settings.changed_keys(replier.settings))
+
+
+def test_reload_keeps_message_filter_unless_its_rules_change():
+    replier, _ = make_replier(message_filter=GROUP_FILTER)
+    replier.stop()
+    message_filter = replier.message_filter
+    group_message = IncomingMessage("项目群", "在吗", sender="李四")
+    assert message_filter.filter_messages([group_message])
+
+    # 改别的配置不会清空群聊限频的记录
+    reload(replier, **{"cooldown.wx": 1.0})
+    assert replier.message_filter is message_filter
+    assert replier.message_filter.filter_messages([IncomingMessage("项目群", "还在吗", sender="李四")]) == []
+
+    reload(replier, message_filter=dict(GROUP_FILTER, group_rate_limit={"max": 2, "per_seconds": 600}))
+    assert replier.message_filter is not message_filter
+    assert replier.message_filter.rate_max == 2
+
+
+def test_reload_applies_coordinates_and_cooldown():
+    replier, _ = make_replier()
+    replier.stop()
+    reload(replier, **{"cooldown.wx": 4.0, "wx_reply_window": [[600, 500], [850, 753]]})
+    assert replier.wx_session.cooldown == 4.0
+    assert replier.wx_session.window.region == config.region_of([[600, 500], [850, 753]])
+    assert replier.settings["cooldown.wx"] == 4.0
+
+
+def test_temperature_reaches_model_options(monkeypatch):
+    monkeypatch.setattr(inference, "_options", {})
+    assert inference.build_params()["options"]["temperature"] == 0.8
+    inference.configure(config.Settings(dict(WXAUTO, **{"model.temperature": 0.3})))
+    assert inference.build_params()["options"]["temperature"] == 0.3
+    # 调用时传入的参数仍然优先
+    assert inference.build_params({"temperature": 1.0})["options"]["temperature"] == 1.0
+
@@ -0,0 +1,162 @@
+"""chat_core.control 的控制通道：在临时目录的 Unix socket 上连接真实的监听端"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+from chat_core import config, control
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="测试使用 Unix socket")
+
+
+class FakeReplier:
+    """只实现控制通道用到的接口"""
+
+    def __init__(self, path):
+        self.settings = config.load_settings(path)
+        self.settings_watcher = config.SettingsWatcher(path, self.apply_settings, current=self.settings)
+        self.applied = []
+        self.paused = False
+        self.stopped = False
+
+    def apply_settings(self, settings, changed):
+        self.applied.append(changed)
+        self.settings = settings
+
+    def status(self):
+        return {"paused": self.paused, "cooldown": self.settings["cooldown.wx"]}
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def write_settings(path, **values):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict({"backend": "wxauto", "cooldown.wx": 2.0}, **values), f)
+    # 保证修改时间变化，热更新能发现文件被改过
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+@pytest.fixture
+def replier(tmp_path):
+    path = str(tmp_path / "settings.json")
+    write_settings(path)
+    return FakeReplier(path)
+
+
+@pytest.fixture
+def server(replier, tmp_path):
+    server = control.ControlServer(replier, str(tmp_path / "control.sock"), str(tmp_path / "control.key")).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    client = control.ControlClient(server.address, server.key_file)
+    yield client
+    client.close()
+
+
+def test_status_and_pause(client, replier):
+    assert client.status() == {"paused": False, "cooldown": 2.0}
+    assert client.pause() is True
+    assert replier.paused
+    assert client.status()["paused"] is True
+    client.resume()
+    assert not replier.paused
+
+
+def test_metrics_and_unknown_command(client):
+    assert isinstance(client.metrics(), str)
+    with pytest.raises(RuntimeError, match="未知命令"):
+        client.call("reboot")
+
+
+def test_push_settings_applies_and_validates(client, replier):
+    assert client.push_settings({"cooldown.wx": 5}) == ["cooldown.wx"]
+    assert replier.settings["cooldown.wx"] == 5
+    assert replier.applied == [{"cooldown.wx"}]
+    # 没有变化的键不会再次应用
+    assert client.push_settings({"cooldown.wx": 5}) == []
+    with pytest.raises(RuntimeError, match="cooldown.wx"):
+        client.push_settings({"cooldown.wx": "很久"})
+    assert replier.settings["cooldown.wx"] == 5
+
+
+def test_pushed_settings_become_the_hot_reload_baseline(client, replier):
+    client.push_settings({"cooldown.wx": 5})
+    assert replier.settings_watcher.current is replier.settings
+
+    # 文件改成与推送一致的冷却时间，再改一个别的键：只有那个键算作变化
+    write_settings(replier.settings.path, **{"cooldown.wx": 5, "pipeline.check_interval": 0.5})
+    assert replier.settings_watcher.check() == {"pipeline.check_interval"}
+
+    # 文件与推送的值不同时，以文件为准
+    write_settings(replier.settings.path, **{"cooldown.wx": 3, "pipeline.check_interval": 0.5})
+    assert replier.settings_watcher.check() == {"cooldown.wx"}
+    assert replier.settings["cooldown.wx"] == 3
+
+
+def test_watch_streams_status(client):
+    updates = client.watch(interval=0.05, metrics=True)
+    for _ in range(2):
+        status, text = next(updates)
+        assert status == {"paused": False, "cooldown": 2.0}
+        assert isinstance(text, str)
+
+
+@pytest.mark.parametrize("interval", [-1, 0, "快"])
+def test_watch_rejects_bad_interval(server, interval):
+    client = control.ControlClient(server.address, server.key_file)
+    try:
+        with pytest.raises(RuntimeError, match="interval"):
+            next(client.watch(interval=interval))
+    finally:
+        client.close()
+    # 服务端没有因此退出，新的连接照常工作
+    client = control.ControlClient(server.address, server.key_file)
+    try:
+        assert client.status()["paused"] is False
+    finally:
+        client.close()
+
+
+def test_stop_command(client, replier):
+    assert client.stop() is True
+    assert wait_for(lambda: replier.stopped)
+
+
+def test_setup_is_disabled_by_default(replier, tmp_path):
+    assert control.setup(replier, replier.settings) is None
+    settings = config.Settings({
+        "backend": "wxauto",
+        "control.enabled": True,
+        "control.address": str(tmp_path / "on.sock"),
+        "control.key_file": str(tmp_path / "on.key"),
+    })
+    server = control.setup(replier, settings)
+    try:
+        assert server is not None
+        assert os.path.exists(str(tmp_path / "on.sock"))
+    finally:
+        server.stop()
+    assert not os.path.exists(str(tmp_path / "on.key"))
@@ -0,0 +1,133 @@
+"""chat_core.faq 的 n-gram 倒排索引：Dice 相似度、阈值，以及 FAQ 文件的重新加载"""
+import json
+import os
+
+import pytest
+
+from chat_core import faq
+from chat_core.faq import FaqIndex, FaqResponder
+from chat_core.message_backend import IncomingMessage
+
+ENTRIES = [
+    {"questions": ["营业时间", "几点开门"], "answer": "每天 9:00-21:00 营业"},
+    {"question": "怎么退货", "answer": "七天内在订单页申请退货即可"},
+]
+
+
+def write_faq(path, entries, bump=0):
+    """写入 FAQ 文件，bump 秒把修改时间往后推，避免同一时刻写两次时修改时间不变"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False)
+    if bump:
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump * 10 ** 9))
+
+
+def test_normalize_and_ngrams():
+    assert faq.normalize("ＡＢｃ，营业 时间？") == "abc营业时间"
+    assert faq.ngrams("营业时间?") == {"营业", "业时", "时间"}
+    assert faq.ngrams("好") == {"好"}
+    assert faq.ngrams("？！") == set()
+    assert faq.ngrams("营业时间", n=3) == {"营业时", "业时间"}
+
+
+def test_dice_score():
+    index = FaqIndex(ENTRIES)
+    assert index.lookup("营业时间？").score == 1.0
+    # "你们营业时间" 的片段 {你们, 们营, 营业, 业时, 时间} 与 "营业时间" 共有 3 个: 2*3 / (5+3)
+    match = index.lookup("你们营业时间")
+    assert (match.question, match.answer) == ("营业时间", "每天 9:00-21:00 营业")
+    assert match.score == pytest.approx(0.75)
+    # 另一种问法命中同一个答案
+    assert index.lookup("几点开门呀").answer == "每天 9:00-21:00 营业"
+
+
+def test_threshold():
+    # "营业时间是几点" 与 "营业时间" 共有 3 个片段: 2*3 / (6+3) = 0.67
+    assert FaqIndex(ENTRIES, threshold=0.6).lookup("营业时间是几点") is not None
+    assert FaqIndex(ENTRIES, threshold=0.7).lookup("营业时间是几点") is None
+    # 没有共同片段的消息
+    index = FaqIndex(ENTRIES)
+    assert index.lookup("今天天气不错") is None
+    assert index.lookup("") is None
+    assert (index.lookups, index.hits) == (2, 0)
+
+
+def test_ties_prefer_the_first_question():
+    index = FaqIndex([{"question": "退货", "answer": "甲"}, {"question": "退货", "answer": "乙"}])
+    assert index.lookup("退货").answer == "甲"
+
+
+def test_invalid_entries():
+    with pytest.raises(ValueError):
+        FaqIndex([{"question": "营业时间"}])
+    with pytest.raises(ValueError):
+        FaqIndex([{"answer": "没有问题"}])
+    with pytest.raises(ValueError):
+        FaqIndex({"question": "营业时间", "answer": "9:00"})
+
+
+def test_file_is_reloaded_after_modification(tmp_path):
+    path = str(tmp_path / "faq.json")
+    write_faq(path, ENTRIES)
+    responder = FaqResponder([{"question": "发货", "answer": "当天发货"}], path, check_interval=0)
+    assert responder.lookup("怎么退货").answer == "七天内在订单页申请退货即可"
+    assert responder.lookup("发货").answer == "当天发货"
+
+    write_faq(path, [{"question": "怎么退货", "answer": "请联系客服"}], bump=1)
+    assert responder.lookup("怎么退货").answer == "请联系客服"
+    # 配置中的表保留，统计跨重建累计
+    assert responder.lookup("发货").answer == "当天发货"
+    assert responder.lookup("营业时间") is None
+    assert responder.stats()["lookups"] == 5
+
+
+def test_broken_file_keeps_the_old_index(tmp_path):
+    path = str(tmp_path / "faq.json")
+    write_faq(path, ENTRIES)
+    responder = FaqResponder(path=path, check_interval=0)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[{")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert responder.lookup("怎么退货").answer == "七天内在订单页申请退货即可"
+
+
+def test_file_check_is_throttled(tmp_path, monkeypatch):
+    path = str(tmp_path / "faq.json")
+    write_faq(path, ENTRIES)
+    responder = FaqResponder(path=path, check_interval=60.0)
+    stats = []
+    original = responder.file_signature
+    monkeypatch.setattr(responder, "file_signature", lambda: stats.append(1) or original())
+
+    write_faq(path, [{"question": "怎么退货", "answer": "请联系客服"}], bump=1)
+    for _ in range(50):
+        assert responder.lookup("怎么退货").answer == "七天内在订单页申请退货即可"
+    assert stats == []
+
+    # 过了检查间隔后的第一次查找读到新文件
+    responder.checked_at -= 60.0
+    assert responder.lookup("怎么退货").answer == "请联系客服"
+    assert len(stats) == 2  # 检查一次，重新读取时记录一次
+    assert responder.lookup("怎么退货").answer == "请联系客服"
+    assert len(stats) == 2
+
+
+def test_answer_fills_replies_for_matching_messages():
+    responder = FaqResponder(ENTRIES)
+    messages = [
+        IncomingMessage("小明", "几点开门"),
+        IncomingMessage("小明", "今天天气不错"),
+        IncomingMessage("小明", "怎么退货", reply="已有回复"),
+    ]
+    responder.answer(messages)
+    assert [message.reply for message in messages] == ["每天 9:00-21:00 营业", None, "已有回复"]
+
+
+def test_from_settings(tmp_path):
+    assert faq.from_settings({}) is None
+    assert faq.from_settings({"faq.file": str(tmp_path / "missing.json")}) is None
+    responder = faq.from_settings({"faq.entries": ENTRIES, "faq.threshold": 0.9, "faq.ngram": 3})
+    assert (responder.threshold, responder.n) == (0.9, 3)
+    assert responder.lookup("营业时间").score == 1.0
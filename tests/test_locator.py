@@ -0,0 +1,115 @@
+"""chat_core.locator 的模板匹配：在合成的画面上查找复制按钮"""
+import pytest
+from PIL import Image, ImageDraw
+
+from chat_core import locator
+from chat_core.locator import TemplateLocator
+
+BACKGROUND = 240
+SEARCH_WINDOW = [[100, 50], [300, 450]]
+
+
+def button():
+    """有明暗结构的小图标，纯色模板无法匹配"""
+    image = Image.new("RGB", (16, 12), (BACKGROUND,) * 3)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((2, 2, 9, 9), outline=(60, 60, 60))
+    draw.rectangle((6, 1, 13, 7), fill=(120, 120, 120))
+    return image
+
+
+class SceneGui:
+    """整屏画面，按截图区域裁剪"""
+
+    def __init__(self, size=(400, 500)):
+        self.image = Image.new("RGB", size, (BACKGROUND,) * 3)
+
+    def paste(self, x, y):
+        self.image.paste(button(), (x, y))
+        return self
+
+    def screenshot(self, region=None):
+        x, y, width, height = region
+        return self.image.crop((x, y, x + width, y + height))
+
+
+def make_locator(**kwargs):
+    return TemplateLocator(button(), SEARCH_WINDOW, anchor=[8, 6], **kwargs)
+
+
+@pytest.mark.parametrize("levels", [1, 3])
+def test_single_target_is_found(levels):
+    gui = SceneGui().paste(150, 200)
+    assert make_locator(levels=levels).locate(gui) == [158, 206]
+
+
+def test_multiple_matches_pick_the_bottom_one():
+    gui = SceneGui().paste(150, 120).paste(170, 260).paste(130, 380)
+    found = make_locator().locate(gui)
+    assert found == [138, 386]
+
+
+def test_near_hit_then_newer_target_below():
+    gui = SceneGui().paste(150, 200)
+    target = make_locator()
+    assert target.locate(gui) == [158, 206]
+    assert target.stats()["near_hits"] == 0
+
+    # 目标没动：在上次位置附近就命中
+    assert target.locate(gui) == [158, 206]
+    assert target.stats()["near_hits"] == 1
+
+    # 下面出现了新的回答和新的按钮，附近命中后还要查它下面
+    gui.paste(150, 330)
+    assert target.locate(gui) == [158, 336]
+    stats = target.stats()
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (3, 1, 0)
+
+
+def test_target_moved_far_away_is_found_by_full_search():
+    gui = SceneGui().paste(150, 400)
+    target = make_locator(near=8)
+    assert target.locate(gui) == [158, 406]
+    moved = SceneGui().paste(250, 80)
+    assert target.locate(moved) == [258, 86]
+
+
+def test_miss_returns_none():
+    target = make_locator()
+    assert target.locate(SceneGui()) is None
+    # 相似但不同的图形低于阈值
+    gui = SceneGui()
+    ImageDraw.Draw(gui.image).rectangle((150, 200, 165, 211), outline=(60, 60, 60))
+    assert target.locate(gui) is None
+    assert target.stats()["misses"] == 2
+    assert target.stats()["hits"] == 0
+
+
+def test_template_larger_than_search_image():
+    small = TemplateLocator(button(), [[100, 50], [110, 58]])
+    assert small.locate(SceneGui().paste(100, 50)) is None
+    assert small.misses == 1
+
+
+def test_match_template_scores():
+    gui = SceneGui().paste(20, 30)
+    image = locator.to_gray(gui.image.crop((0, 0, 80, 80)))
+    template = locator.to_gray(button())
+    scores = locator.match_template(image, template)
+    assert scores.shape == (80 - 12 + 1, 80 - 16 + 1)
+    y, x = divmod(int(scores.argmax()), scores.shape[1])
+    assert (y, x) == (30, 20)
+    assert scores[30, 20] == pytest.approx(1.0, abs=1e-4)
+
+
+def test_from_settings(tmp_path):
+    path = str(tmp_path / "ai_reply.png")
+    button().save(path)
+    settings = {"ai_reply_template": path, "ai_reply_window": SEARCH_WINDOW, "locator.threshold": 0.9}
+    target = locator.from_settings(settings, "ai")
+    assert target.threshold == 0.9
+    assert target.anchor == [8, 6]
+    assert target.locate(SceneGui().paste(150, 200)) == [158, 206]
+
+    assert locator.from_settings({"ai_reply_window": SEARCH_WINDOW}, "ai") is None
+    assert locator.from_settings(dict(settings, ai_reply_template=str(tmp_path / "missing.png")), "ai") is None
@@ -0,0 +1,163 @@
+"""main_async.py 的异步回复器：并发生成、同一会话按顺序回复、固定回复和提示词"""
+import asyncio
+
+import pytest
+
+import main_async
+from chat_core.message_backend import IncomingMessage, MessageBackend
+from test_message_backend import SETTINGS
+
+
+class ScriptedBackend(MessageBackend):
+    """每次读取返回脚本中的下一批来信，读完后返回空列表"""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.sent = []
+
+    def receive_messages(self):
+        return self.batches.pop(0) if self.batches else []
+
+    def send_reply(self, contact, message):
+        self.sent.append((contact, message))
+        return True
+
+
+def batch(contact, *contents):
+    return [IncomingMessage(contact, content) for content in contents]
+
+
+class SlowModel:
+    """按 delays 中的耗时生成回复，记录同时在生成的最大数量"""
+
+    def __init__(self, delays=None, default=0.05):
+        self.delays = delays or {}
+        self.default = default
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+
+    async def generate(self, contact, messages):
+        content = "\n".join(message.content for message in messages)
+        self.calls.append((contact, content))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delays.get(content, self.default))
+        finally:
+            self.active -= 1
+        if content == "出错":
+            raise RuntimeError("模型出错")
+        return f"回复:{content}"
+
+
+def make_replier(backends, model, **overrides):
+    settings = dict(SETTINGS, **{"pipeline.check_interval": 0.01}, **overrides)
+    return main_async.AsyncAiAutoReplier(settings, backends=backends, generate=model.generate)
+
+
+def run_until(replier, condition, timeout=5.0):
+    """运行回复器直到 condition 成立，返回是否成立"""
+    async def scenario():
+        task = asyncio.create_task(replier.run())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        await asyncio.sleep(0)
+        while not condition() and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        replier.stopped.set()
+        await task
+        return condition()
+    return asyncio.run(scenario())
+
+
+def test_contacts_are_answered_concurrently_through_their_backend():
+    first = ScriptedBackend([batch("张三", "你好")])
+    second = ScriptedBackend([batch("李四", "在吗"), batch("王五", "早")])
+    model = SlowModel(default=0.3)
+    replier = make_replier([first, second], model)
+    assert run_until(replier, lambda: len(first.sent) + len(second.sent) == 3)
+
+    assert first.sent == [("张三", "回复:你好")]
+    assert sorted(second.sent) == [("李四", "回复:在吗"), ("王五", "回复:早")]
+    # 三个会话的生成同时进行，不是一个接一个
+    assert model.max_active == 3
+
+
+def test_generation_slots_limit_concurrency():
+    backend = ScriptedBackend([batch("张三", "1"), batch("李四", "2"), batch("王五", "3")])
+    model = SlowModel()
+    replier = make_replier([backend], model, **{"async.max_concurrent_generations": 1})
+    assert run_until(replier, lambda: len(backend.sent) == 3)
+    assert model.max_active == 1
+
+
+def test_same_contact_replies_keep_their_order():
+    # 第一批生成得慢，第二批快，回复仍按来信顺序发出
+    backend = ScriptedBackend([batch("张三", "慢"), batch("张三", "快")])
+    model = SlowModel({"慢": 0.3, "快": 0.0})
+    replier = make_replier([backend], model)
+    assert run_until(replier, lambda: len(backend.sent) == 2)
+    assert backend.sent == [("张三", "回复:慢"), ("张三", "回复:快")]
+    assert model.max_active == 1
+
+
+def test_failed_generation_does_not_stop_watching():
+    backend = ScriptedBackend([batch("张三", "出错"), batch("张三", "你好")])
+    replier = make_replier([backend], SlowModel())
+    assert run_until(replier, lambda: backend.sent == [("张三", "回复:你好")])
+
+
+def test_faq_hits_skip_the_model():
+    backend = ScriptedBackend([batch("张三", "几点开门", "营业时间？"), batch("李四", "随便聊聊")])
+    model = SlowModel()
+    faq_entries = [{"questions": ["营业时间", "几点开门"], "answer": "每天 9:00-21:00 营业"}]
+    replier = make_replier([backend], model, **{"faq.entries": faq_entries})
+    assert run_until(replier, lambda: len(backend.sent) == 3)
+    assert backend.sent[:2] == [("张三", "每天 9:00-21:00 营业")] * 2
+    assert backend.sent[2] == ("李四", "回复:随便聊聊")
+    assert model.calls == [("李四", "随便聊聊")]
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """替换 achat，记录每次传给模型的提示词"""
+    prompts = []
+
+    async def fake_achat(messages, params=None):
+        prompts.append(messages)
+        return f"回复{len(prompts)}"
+    monkeypatch.setattr(main_async, "achat", fake_achat)
+    return prompts
+
+
+def test_model_generate_bounds_history_per_contact(prompts):
+    replier = make_replier([ScriptedBackend([])], SlowModel(), **{
+        "model.ai_system_prompt": "你是小助手", "model.message_memory_rounds": 3,
+    })
+    for text in ("一", "二", "三"):
+        asyncio.run(replier.model_generate("张三", batch("张三", text)))
+    asyncio.run(replier.model_generate("李四", batch("李四", "你好")))
+
+    assert prompts[2] == replier.prompt_prefix + [
+        {"role": "user", "content": "二"},
+        {"role": "assistant", "content": "回复2"},
+        {"role": "user", "content": "三"},
+    ]
+    # 其他会话的历史互不影响
+    assert prompts[3] == replier.prompt_prefix + [{"role": "user", "content": "你好"}]
+    assert replier.prompt_prefix[0]["content"] == "你是小助手"
+
+
+def test_model_generate_recalls_older_turns(prompts):
+    replier = make_replier([ScriptedBackend([])], SlowModel(), **{
+        "model.message_memory_rounds": 2, "memory.enabled": True,
+    })
+    for text in ("我下个月去杭州出差", "今天午饭吃了面条", "杭州出差要带什么"):
+        asyncio.run(replier.model_generate("张三", batch("张三", text)))
+
+    prompt = prompts[-1][len(replier.prompt_prefix):]
+    # 窗口外的较早对话取回后放在最新一条消息之前
+    assert prompt[0] == {"role": "assistant", "content": "回复2"}
+    assert prompt[1]["role"] == "system" and "我下个月去杭州出差" in prompt[1]["content"]
+    assert prompt[2] == {"role": "user", "content": "杭州出差要带什么"}
@@ -0,0 +1,105 @@
+"""chat_core.memory 的向量记忆：取回的条数、顺序、跳过最近的对话和相似度下限"""
+import numpy
+import pytest
+
+from chat_core import memory
+from chat_core.memory import ConversationMemory, HashingEmbedder, VectorMemory
+
+# 文本 -> 向量，与查询 "q" 的余弦相似度依次为 0.9、0.8、0.6、0.3、0
+VECTORS = {
+    "q": [1.0, 0.0],
+    "a": [0.9, 0.43588989],
+    "b": [0.8, 0.6],
+    "c": [0.6, 0.8],
+    "d": [0.3, 0.9539392],
+    "e": [0.0, 1.0],
+}
+
+
+def table_embedder(texts):
+    return numpy.array([VECTORS[text] for text in texts])
+
+
+def make_memory(texts, **kwargs):
+    conversation = ConversationMemory(table_embedder, **kwargs)
+    conversation.remember_many("小明", [("user", text) for text in texts])
+    return conversation
+
+
+def test_recall_returns_top_k_in_conversation_order():
+    conversation = make_memory(["e", "c", "a", "d", "b"], top_k=3, min_score=0.0)
+    recalled = conversation.recall("小明", "q")
+    # 取相似度最高的 a、b、c，按对话先后排列
+    assert [text for _, _, text in recalled] == ["c", "a", "b"]
+    assert [score for score, _, _ in recalled] == pytest.approx([0.6, 0.9, 0.8], abs=1e-5)
+    assert [text for _, _, text in conversation.recall("小明", "q", k=1)] == ["a"]
+
+
+def test_recall_skips_recent_turns():
+    conversation = make_memory(["c", "d", "a", "b"], top_k=2, min_score=0.0)
+    # 最近两条 a、b 已经在原始历史中，只在 c、d 中找
+    assert [text for _, _, text in conversation.recall("小明", "q", skip_recent=2)] == ["c", "d"]
+    assert conversation.recall("小明", "q", skip_recent=4) == []
+    assert conversation.recall("小明", "q", skip_recent=10) == []
+
+
+def test_recall_drops_low_scores():
+    conversation = make_memory(["a", "d", "e"], top_k=3, min_score=0.5)
+    assert [text for _, _, text in conversation.recall("小明", "q")] == ["a"]
+
+
+def test_contacts_are_separate():
+    conversation = make_memory(["a"], min_score=0.0)
+    conversation.remember("小红", "assistant", "b")
+    assert [(role, text) for _, role, text in conversation.recall("小红", "q")] == [("assistant", "b")]
+    assert conversation.recall("小刚", "q") == []
+    assert conversation.stats()["contacts"] == 2
+    assert conversation.stats()["turns"] == 2
+
+
+def test_empty_texts_are_not_stored():
+    conversation = ConversationMemory()
+    conversation.remember_many("小明", [("user", ""), ("user", "  "), ("user", "我下个月去杭州出差")])
+    assert conversation.turns("小明") == 1
+    # 全是标点的查询没有向量，不取回
+    assert conversation.recall("小明", "？？") == []
+
+
+def test_store_grows_past_its_capacity():
+    store = VectorMemory(dim=2, capacity=2)
+    store.add(table_embedder(["e", "d", "c", "b", "a"]), [("user", text) for text in "edcba"])
+    assert len(store) == 5
+    assert len(store.vectors) == 8
+    assert numpy.linalg.norm(store.vectors[:5], axis=1) == pytest.approx(numpy.ones(5), abs=1e-6)
+    assert [row for _, row in store.search(numpy.array([1.0, 0.0], dtype=numpy.float32), 2)] == [4, 3]
+    assert [row for _, row in store.search(numpy.array([1.0, 0.0], dtype=numpy.float32), 2, limit=3)] == [2, 1]
+
+
+def test_hashing_embedder_finds_related_turns():
+    conversation = ConversationMemory(HashingEmbedder(), top_k=1)
+    conversation.remember_many("张三", [
+        ("user", "我下个月去杭州出差"),
+        ("assistant", "好的，祝你顺利"),
+        ("user", "今天午饭吃了面条"),
+    ])
+    recalled = conversation.recall("张三", "杭州出差要带什么")
+    assert [text for _, _, text in recalled] == ["我下个月去杭州出差"]
+    # 用词几乎不重合的问题相似度低于默认下限 0.25，不取回
+    assert conversation.recall("张三", "那边天气怎么样") == []
+    # 相同的文本得到相同的向量
+    embedder = HashingEmbedder()
+    assert numpy.array_equal(embedder(["杭州出差"]), HashingEmbedder()(["杭州出差"]))
+
+
+def test_format_recalled():
+    assert memory.format_recalled([]) is None
+    message = memory.format_recalled([(0.9, "user", "我下个月去杭州出差"), (0.5, "assistant", "祝你顺利")])
+    assert message["role"] == "system"
+    assert message["content"].endswith("- 对方: 我下个月去杭州出差\n- 你: 祝你顺利")
+
+
+def test_from_settings():
+    assert memory.from_settings({}) is None
+    assert memory.from_settings({"memory.enabled": True, "memory.embedder": "no_such_module:embed"}) is None
+    conversation = memory.from_settings({"memory.enabled": True, "memory.dim": 64, "memory.top_k": 5})
+    assert (conversation.embedder.dim, conversation.top_k, conversation.min_score) == (64, 5, 0.25)
@@ -0,0 +1,132 @@
+"""chat_core.message_backend：后端接口，以及 main.py 回复器在模拟的 wxauto 和虚拟桌面上的完整流程"""
+import time
+
+import pytest
+
+import main
+from chat_core.message_backend import IncomingMessage, MessageBackend, create_backend, create_desktop
+from feature import fake_wxauto
+from feature.wx_handler import WxHandler
+
+# 与 settings.json 相同的坐标，其余参数调小，让一轮收发在几秒内完成
+SETTINGS = {
+    "backend": "screen",
+    "virtual_desktop": True,
+    "virtual_desktop.reply_delay": 0.1,
+    "virtual_desktop.stream_seconds": 0.1,
+    "wx_send_coordinate": [680, 823],
+    "wx_reply_coordinate": [736, 731],
+    "wx_reply_window": [[666, 500], [850, 753]],
+    "ai_reply_coordinate": [114, 848],
+    "ai_send_coordinate": [100, 929],
+    "ai_reply_window": [[58, 461], [282, 808]],
+    "wxauto.fake": True,
+    "wxauto.contact": "张三",
+    "cooldown.wx": 0.0,
+    "cooldown.ai": 0.0,
+    "send_queue.rate": 100.0,
+    "send_queue.contact_rate": 100.0,
+    "pipeline.check_interval": 0.1,
+    "message_filter": {"require_mention": False},
+    "control.enabled": False,
+}
+
+
+def wait_for(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def make_replier(**overrides):
+    settings = dict(SETTINGS, **overrides)
+    desktop = create_desktop(settings)
+    desktop.windows["AI"].responder = lambda message: f"回复:{message}"
+    return main.AiAutoReplier(desktop=desktop, **settings), desktop
+
+
+class EchoBackend(MessageBackend):
+    def __init__(self, pending):
+        self.pending = pending
+        self.sent = []
+
+    def receive_messages(self):
+        pending, self.pending = self.pending, []
+        return pending
+
+    def send_reply(self, contact, message):
+        self.sent.append((contact, message))
+        return True
+
+
+def test_backend_must_implement_abstract_methods():
+    class ReceiveOnly(MessageBackend):
+        def receive_messages(self):
+            return []
+
+    with pytest.raises(TypeError):
+        MessageBackend()
+    with pytest.raises(TypeError):
+        ReceiveOnly()
+
+
+def test_default_detect_and_extract():
+    message = IncomingMessage("张三", "你好")
+    backend = EchoBackend([message])
+    detected = backend.detect_messages()
+    assert backend.extract_messages(detected) == [message]
+    assert backend.detect_messages() is None
+
+
+def test_create_backend_fake_wxauto():
+    backend = create_backend(dict(SETTINGS, backend="wxauto"))
+    assert isinstance(backend, WxHandler)
+    assert isinstance(backend.wx, fake_wxauto.WeChat)
+    assert backend.current_contact == "张三"
+
+
+def test_create_backend_unknown():
+    with pytest.raises(ValueError):
+        create_backend(dict(SETTINGS, backend="telegram"))
+
+
+def test_wxauto_end_to_end():
+    replier, _ = make_replier(backend="wxauto")
+    wx = replier.wx_session.wx
+    try:
+        assert wait_for(lambda: "张三" in replier.wx_session.cursors)
+        wx.receive("张三", "在吗")
+        assert wait_for(lambda: ("张三", "回复:在吗") in wx.sent)
+        wx.receive("张三", "明天见")
+        assert wait_for(lambda: ("张三", "回复:明天见") in wx.sent)
+    finally:
+        replier.stop()
+    assert wx.sent == [("张三", "回复:在吗"), ("张三", "回复:明天见")]
+
+
+def test_screen_end_to_end():
+    replier, desktop = make_replier()
+    wechat = desktop.windows["WeChat"]
+    try:
+        assert wait_for(lambda: replier.wx_session.last_image is not None)
+        wechat.receive("在吗")
+        assert wait_for(lambda: "回复:在吗" in wechat.sent)
+    finally:
+        replier.stop()
+    assert wechat.sent == ["回复:在吗"]
+
+
+def test_wxauto_multiple_contacts_end_to_end():
+    replier, _ = make_replier(backend="wxauto", listen_contacts=["张三", "李四"], **{"wxauto.contact": ""})
+    wx = replier.wx_session.wx
+    try:
+        wx.receive("李四", "在吗")
+        assert wait_for(lambda: ("李四", "回复:在吗") in wx.sent)
+        wx.receive("张三", "明天见")
+        assert wait_for(lambda: ("张三", "回复:明天见") in wx.sent)
+    finally:
+        replier.stop()
+    assert wx.sent == [("李四", "回复:在吗"), ("张三", "回复:明天见")]
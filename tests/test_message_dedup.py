@@ -0,0 +1,49 @@
+"""chat_core.message_dedup 的消息指纹库"""
+from chat_core.message_dedup import MessageFingerprintStore
+
+
+def test_repeat_within_window_is_seen():
+    store = MessageFingerprintStore(ttl=120, bucket_seconds=60)
+    assert not store.seen("张三", "你好", now=1000.0)
+    assert store.seen("张三", "你好", now=1010.0)
+    assert store.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_normalized_text_matches():
+    store = MessageFingerprintStore()
+    assert not store.seen("张三", "Hello  World！", now=0.0)
+    assert store.seen("张三", " hello world! ", now=1.0)
+
+
+def test_contacts_are_separate():
+    store = MessageFingerprintStore()
+    assert not store.seen("张三", "你好", now=0.0)
+    assert not store.seen("李四", "你好", now=0.0)
+
+
+def test_bucket_boundary_still_deduplicated():
+    store = MessageFingerprintStore(ttl=120, bucket_seconds=60)
+    assert not store.seen("张三", "你好", now=59.0)
+    assert store.seen("张三", "你好", now=61.0)
+
+
+def test_same_text_after_window_is_new():
+    store = MessageFingerprintStore(ttl=120, bucket_seconds=60)
+    assert not store.seen("张三", "你好", now=0.0)
+    assert not store.seen("张三", "你好", now=200.0)
+
+
+def test_bytes_content():
+    store = MessageFingerprintStore()
+    assert not store.seen("WeChat#frame", b"\x00\x01", now=0.0)
+    assert store.seen("WeChat#frame", b"\x00\x01", now=1.0)
+    assert not store.seen("WeChat#frame", b"\x00\x02", now=1.0)
+
+
+def test_capacity_evicts_oldest():
+    store = MessageFingerprintStore(max_entries=2)
+    for i in range(3):
+        store.seen("张三", f"消息{i}", now=float(i))
+    store.seen("张三", "消息3", now=3.0)
+    assert len(store.entries) <= 3
+    assert not store.seen("张三", "消息0", now=4.0)
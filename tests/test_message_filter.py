@@ -0,0 +1,51 @@
+"""chat_core.message_filter 的推理前过滤规则"""
+from chat_core.message_backend import IncomingMessage
+from chat_core.message_filter import MessageFilter
+
+
+def group_message(content, sender="李四", contact="项目群"):
+    return IncomingMessage(contact, content, sender=sender)
+
+
+def test_private_messages_pass():
+    message_filter = MessageFilter({"mention_names": ["小助手"]})
+    assert message_filter.check(IncomingMessage("张三", "在吗", sender="张三")) == (True, "passed")
+
+
+def test_group_requires_mention_and_strips_it():
+    message_filter = MessageFilter({"mention_names": ["小助手"]})
+    mentioned = group_message("@小助手 明天开会吗")
+    passed = message_filter.filter_messages([group_message("大家好"), mentioned])
+    assert passed == [mentioned]
+    assert mentioned.content == "明天开会吗"
+    assert message_filter.stats == {"not_triggered": 1, "passed": 1}
+
+
+def test_group_detected_by_configured_name():
+    message_filter = MessageFilter({"groups": ["项目群"], "mention_names": ["小助手"]})
+    assert message_filter.check(IncomingMessage("项目群", "大家好")) == (False, "not_triggered")
+
+
+def test_allow_senders_and_trigger_keywords():
+    message_filter = MessageFilter({"allow_senders": ["老板"], "trigger_keywords": ["报价"]})
+    assert message_filter.check(group_message("大家好", sender="老板"))[0]
+    assert message_filter.check(group_message("请问报价多少"))[0]
+    assert not message_filter.check(group_message("大家好"))[0]
+
+
+def test_require_mention_disabled():
+    message_filter = MessageFilter({"require_mention": False})
+    assert message_filter.check(group_message("大家好")) == (True, "passed")
+
+
+def test_deny_senders_and_ignore_keywords():
+    message_filter = MessageFilter({"deny_senders": ["广告机器人"], "ignore_keywords": ["推广"]})
+    assert message_filter.check(IncomingMessage("广告机器人", "你好", sender="广告机器人")) == (False, "denied_sender")
+    assert message_filter.check(IncomingMessage("张三", "帮忙推广一下")) == (False, "ignored_keyword")
+
+
+def test_group_rate_limit():
+    message_filter = MessageFilter({"require_mention": False, "group_rate_limit": {"max": 2, "per_seconds": 60}})
+    results = [message_filter.check(group_message(f"消息{i}"), now=float(i))[1] for i in range(3)]
+    assert results == ["passed", "passed", "rate_limited"]
+    assert message_filter.check(group_message("一分钟后"), now=61.0) == (True, "passed")
@@ -0,0 +1,96 @@
+"""chat_core.metrics 的 Prometheus 文本格式输出，以及本机 HTTP 服务"""
+import urllib.error
+import urllib.request
+
+import pytest
+
+from chat_core import metrics
+from chat_core.metrics import Counter, Histogram, Registry
+
+
+@pytest.fixture
+def registry():
+    registry = Registry()
+    registry.enabled = True
+    return registry
+
+
+def test_disabled_registry_records_nothing():
+    registry = Registry()
+    counter = Counter("wxbot_test_total", "测试", registry=registry)
+    histogram = Histogram("wxbot_test_seconds", "测试", buckets=(1.0,), registry=registry)
+    counter.inc()
+    histogram.observe(0.5)
+    assert registry.render() == (
+        "# HELP wxbot_test_total 测试\n"
+        "# TYPE wxbot_test_total counter\n"
+        "# HELP wxbot_test_seconds 测试\n"
+        "# TYPE wxbot_test_seconds histogram\n"
+    )
+
+
+def test_counter_labels_are_sorted_and_escaped(registry):
+    counter = Counter("wxbot_polls_total", "监控轮询次数", registry=registry)
+    counter.inc()
+    counter.inc(window="WeChat", kind="a")
+    counter.inc(2, kind="a", window="WeChat")
+    counter.inc(window='say "hi"\\\n')
+    assert counter.samples() == [
+        "wxbot_polls_total 1",
+        'wxbot_polls_total{kind="a",window="WeChat"} 3',
+        'wxbot_polls_total{window="say \\"hi\\"\\\\\\n"} 1',
+    ]
+    counter.inc(0.5)
+    assert counter.samples()[0] == "wxbot_polls_total 1.5"
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram("wxbot_capture_seconds", "截图耗时", buckets=(0.1, 0.01, 1), registry=registry)
+    for value in (0.005, 0.05, 0.05, 0.5, 3.0):
+        histogram.observe(value, window="WeChat")
+    assert histogram.samples() == [
+        'wxbot_capture_seconds_bucket{window="WeChat",le="0.01"} 1',
+        'wxbot_capture_seconds_bucket{window="WeChat",le="0.1"} 3',
+        'wxbot_capture_seconds_bucket{window="WeChat",le="1.0"} 4',
+        'wxbot_capture_seconds_bucket{window="WeChat",le="+Inf"} 5',
+        'wxbot_capture_seconds_sum{window="WeChat"} 3.605',
+        'wxbot_capture_seconds_count{window="WeChat"} 5',
+    ]
+
+
+def test_gauges(registry):
+    metrics.register_gauge("wxbot_queue_depth", "队列深度", lambda: 3, registry)
+    # 同名的 gauge 替换旧的
+    metrics.register_gauge("wxbot_queue_depth", "队列深度", lambda: [({"queue": "send"}, 2), ({"queue": "ai"}, 0.5)], registry)
+    metrics.register_gauge("wxbot_broken", "出错的回调", lambda: 1 / 0, registry)
+    assert registry.render() == (
+        "# HELP wxbot_queue_depth 队列深度\n"
+        "# TYPE wxbot_queue_depth gauge\n"
+        'wxbot_queue_depth{queue="send"} 2\n'
+        'wxbot_queue_depth{queue="ai"} 0.5\n'
+        "# HELP wxbot_broken 出错的回调\n"
+        "# TYPE wxbot_broken gauge\n"
+    )
+
+
+def test_http_server(registry):
+    Counter("wxbot_sends_total", "发送成功的消息数", registry=registry).inc(4)
+    registry.enabled = False
+    server = metrics.serve(port=0, registry=registry)
+    try:
+        assert registry.enabled
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/metrics?x=1", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "wxbot_sends_total 4\n" in response.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(base + "/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_setup_is_off_by_default():
+    assert metrics.setup({}) is None
+    assert metrics.setup({"metrics.enabled": False, "metrics.port": 0}) is None
@@ -0,0 +1,107 @@
+"""feature.main_offline_model 组装的提示词：上下文和取回的对话的位置"""
+import pytest
+
+import feature.main_offline_model as offline
+from chat_core.message_backend import IncomingMessage
+
+SETTINGS = {
+    "backend": "wxauto",
+    "wxauto.fake": True,
+    "wxauto.contact": "张三",
+    "model.ai_system_prompt": "你是小助手",
+    "model.message_memory_rounds": 4,
+    "model.contact_profiles": {"张三": "大学同学"},
+    "control.enabled": False,
+}
+
+
+def make_replier(monkeypatch, **overrides):
+    prompts = []
+
+    def fake_chat(messages):
+        prompts.append(list(messages))
+        return f"re:{messages[-1]['content']}"
+
+    monkeypatch.setattr(offline, "chat", fake_chat)
+    replier = offline.AiAutoReplier(settings=dict(SETTINGS, **overrides))
+    replier.stopped.set()
+    replier.thread_monitor_window.join(timeout=5)
+    replier.prompts = prompts
+    return replier
+
+
+@pytest.fixture
+def replier(monkeypatch):
+    return make_replier(monkeypatch)
+
+
+def ask(replier, content, contact="张三"):
+    assert replier.handle_message([IncomingMessage(contact, content)])
+    return replier.prompts[-1]
+
+
+def test_context_sits_right_before_newest_message(replier):
+    ask(replier, "在吗")
+    prompt = ask(replier, "最近复习得怎么样")
+    prefix = len(replier.prompt_prefix)
+
+    assert prompt[:prefix] == replier.prompt_prefix
+    assert prompt[prefix:prefix + 2] == [
+        {"role": "user", "content": "在吗"},
+        {"role": "assistant", "content": "re:在吗"},
+    ]
+    context = prompt[-2]
+    assert context["role"] == "system"
+    assert "学习" in context["content"] and "大学同学" in context["content"]
+    assert prompt[-1] == {"role": "user", "content": "最近复习得怎么样"}
+
+
+def test_history_only_holds_the_conversation(replier):
+    ask(replier, "在吗")
+    ask(replier, "最近复习得怎么样")
+    assert [entry["role"] for entry in replier.histories["张三"]] == ["user", "assistant"] * 2
+
+
+def test_history_is_bounded_per_contact(replier):
+    for content in ("第一句", "第二句", "第三句"):
+        ask(replier, content)
+    assert replier.histories["张三"] == [
+        {"role": "user", "content": "第二句"},
+        {"role": "assistant", "content": "re:第二句"},
+        {"role": "user", "content": "第三句"},
+        {"role": "assistant", "content": "re:第三句"},
+    ]
+
+
+def test_histories_are_isolated_per_contact(replier):
+    ask(replier, "我下个月去杭州出差")
+    other = ask(replier, "周末打球吗", contact="李四")
+    assert all("杭州" not in entry["content"] for entry in other)
+    ask(replier, "几点集合", contact="李四")
+
+    prompt = ask(replier, "杭州那边天气怎么样")
+    conversation = prompt[len(replier.prompt_prefix):-2]
+    assert conversation == [
+        {"role": "user", "content": "我下个月去杭州出差"},
+        {"role": "assistant", "content": "re:我下个月去杭州出差"},
+    ]
+    assert all("打球" not in entry["content"] and "集合" not in entry["content"] for entry in prompt)
+
+
+def test_recall_skips_turns_still_in_this_contacts_window(monkeypatch):
+    replier = make_replier(monkeypatch, **{"memory.enabled": True, "memory.min_score": 0.1})
+    ask(replier, "我下个月去杭州出差")
+    ask(replier, "周末打球吗", contact="李四")
+    ask(replier, "几点集合", contact="李四")
+
+    # 李四的对话不占张三的历史窗口，那一轮还在窗口里，不会被重复取回
+    prompt = ask(replier, "杭州那边天气怎么样")
+    assert sum("我下个月去杭州出差" in entry["content"] for entry in prompt) == 2
+    assert prompt[-2]["role"] == "system" and "我下个月去杭州出差" not in prompt[-2]["content"]
+
+    # 再聊两轮，那一轮被挤出窗口后从向量记忆中取回
+    ask(replier, "随便聊聊")
+    prompt = ask(replier, "杭州冷不冷")
+    assert all("杭州出差" not in entry["content"] for entry in prompt if entry["role"] != "system")
+    assert "我下个月去杭州出差" in prompt[-2]["content"]
+    assert prompt[-1] == {"role": "user", "content": "杭州冷不冷"}
@@ -0,0 +1,143 @@
+"""chat_core.pipeline 的多线程流水线：有界队列的背压、阶段出错和停止"""
+import itertools
+import threading
+import time
+
+import pytest
+
+from chat_core.pipeline import Pipeline
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Fatal(Exception):
+    """模拟 pyautogui.FailSafeException 这类需要停止整条流水线的异常"""
+
+
+def counter_source(limit=None):
+    """每次调用产出下一个整数，产完 limit 个后返回 None"""
+    numbers = itertools.count()
+
+    def produce(_):
+        number = next(numbers)
+        return number if limit is None or number < limit else None
+    return produce
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = Pipeline(queue_size=1, fatal_exceptions=(Fatal,))
+    yield pipeline
+    pipeline.stop()
+    for stage in pipeline.stages:
+        if stage.thread is not None:
+            stage.thread.join(timeout=5)
+
+
+def test_items_flow_through_stages_in_order(pipeline):
+    results = []
+    pipeline.add_stage("source", counter_source(5), interval=0.01)
+    pipeline.add_stage("double", lambda n: n * 2, interval=0.01)
+    pipeline.add_stage("sink", results.append, interval=0.01)
+    pipeline.start()
+
+    assert wait_for(lambda: len(results) == 5)
+    assert results == [0, 2, 4, 6, 8]
+    stats = pipeline.stats()
+    assert stats["source"]["processed"] == 5
+    assert stats["double"]["processed"] == 5
+    assert stats["sink"]["processed"] == 5
+    assert stats["double"]["queue_size"] == 1
+
+
+def test_full_queue_blocks_the_upstream_stage(pipeline):
+    release = threading.Event()
+    consumed = []
+
+    def slow_consumer(item):
+        release.wait()
+        consumed.append(item)
+
+    source = pipeline.add_stage("source", counter_source(), interval=0.01)
+    sink = pipeline.add_stage("sink", slow_consumer, interval=0.01)
+    pipeline.start()
+
+    # 下游卡住时：一个在处理，一个在队列里，一个在上游等着放入，上游不再继续产出
+    assert wait_for(lambda: sink.inbox.full())
+    time.sleep(0.2)
+    assert source.processed == 3
+    assert sink.inbox.qsize() == 1
+
+    release.set()
+    assert wait_for(lambda: len(consumed) >= 10)
+    assert consumed[:10] == list(range(10))
+
+
+def test_stage_exception_does_not_kill_the_worker(pipeline):
+    results = []
+
+    def picky(n):
+        if n == 1:
+            raise ValueError("坏数据")
+        return n
+
+    pipeline.add_stage("source", counter_source(4), interval=0.01)
+    pipeline.add_stage("picky", picky, interval=0.01)
+    pipeline.add_stage("sink", results.append, interval=0.01)
+    pipeline.start()
+
+    assert wait_for(lambda: results == [0, 2, 3])
+    assert pipeline.is_running()
+    assert pipeline.stats()["picky"]["processed"] == 4
+
+
+def test_fatal_exception_stops_the_pipeline(pipeline):
+    def fatal(n):
+        if n == 2:
+            raise Fatal
+        return n
+
+    pipeline.add_stage("source", counter_source(), interval=0.01)
+    pipeline.add_stage("fatal", fatal, interval=0.01)
+    pipeline.start()
+
+    assert wait_for(lambda: pipeline.stopped.is_set())
+    assert wait_for(lambda: not any(stage.thread.is_alive() for stage in pipeline.stages))
+    assert not pipeline.is_running()
+
+
+def test_stop_releases_a_stage_blocked_on_a_full_queue(pipeline):
+    release = threading.Event()
+    source = pipeline.add_stage("source", counter_source(), interval=0.05)
+    pipeline.add_stage("sink", lambda item: release.wait(), interval=0.05)
+    pipeline.start()
+    assert wait_for(lambda: source.processed == 3)
+
+    started = time.monotonic()
+    pipeline.stop()
+    # 上游在 put 中等待，每个间隔检查一次停止标记，不会一直卡在满的队列上
+    source.thread.join(timeout=2)
+    assert not source.thread.is_alive()
+    assert time.monotonic() - started < 1.0
+
+    # 正在处理的任务完成后，下游也退出，队列中剩下的任务不再处理
+    release.set()
+    assert wait_for(lambda: not any(stage.thread.is_alive() for stage in pipeline.stages))
+    assert not pipeline.is_running()
+
+
+def test_on_idle_stage_runs_without_input(pipeline):
+    ticks = []
+    pipeline.add_stage("source", lambda _: None, interval=0.01)
+    pipeline.add_stage("deliver", ticks.append, interval=0.02, on_idle=True)
+    pipeline.start()
+    assert wait_for(lambda: len(ticks) >= 3)
+    assert set(ticks) == {None}
+    assert pipeline.stats()["deliver"]["processed"] == 0
@@ -0,0 +1,130 @@
+"""model.pool 的推理池：用 feature.fake_inference 的模拟服务验证分发、并发上限、故障转移和恢复"""
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from feature.fake_inference import FakeInferenceServer
+from model.pool import Endpoint, InferencePool, NoEndpointError, is_client_error
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+@pytest.fixture
+def servers():
+    started = [FakeInferenceServer(delay=0.2, name=name, models=["fake"]).start() for name in "abc"]
+    yield started
+    for server in started:
+        server.stop()
+
+
+def make_pool(servers, max_concurrency=2, health_interval=60.0, queue_timeout=10.0):
+    endpoints = [
+        Endpoint(server.url, "openai", "fake", max_concurrency, timeout=5.0, name=server.name)
+        for server in servers
+    ]
+    return InferencePool(endpoints, health_interval, queue_timeout)
+
+
+def run_batch(pool, count, workers):
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(lambda _: pool.chat(MESSAGES), range(count)))
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_requests_spread_across_endpoints(servers):
+    pool = make_pool(servers)
+    replies = run_batch(pool, 18, 6)
+    assert len(replies) == 18
+    assert all(reply.endswith("re:你好") for reply in replies)
+    assert sum(server.requests for server in servers) == 18
+    assert all(4 <= server.requests <= 8 for server in servers)
+    assert all(server.peak <= 2 for server in servers)
+    assert all(endpoint.outstanding == 0 for endpoint in pool.endpoints)
+
+
+def test_per_endpoint_concurrency_cap(servers):
+    pool = make_pool(servers, max_concurrency=1)
+    run_batch(pool, 12, 8)
+    assert sum(server.requests for server in servers) == 12
+    assert all(server.peak == 1 for server in servers)
+
+
+def test_failover_when_endpoint_down(servers):
+    pool = make_pool(servers)
+    servers[0].down = True
+    replies = run_batch(pool, 8, 4)
+    assert len(replies) == 8
+    assert not any(reply.startswith("[a]") for reply in replies)
+    assert not pool.endpoints[0].healthy
+    assert pool.endpoints[0].failures >= 1
+    assert pool.endpoints[1].healthy and pool.endpoints[2].healthy
+
+
+def test_all_endpoints_down(servers):
+    pool = make_pool(servers)
+    for server in servers:
+        server.down = True
+    with pytest.raises(NoEndpointError):
+        pool.chat(MESSAGES)
+    assert all(endpoint.outstanding == 0 for endpoint in pool.endpoints)
+
+
+def test_recovers_after_health_check(servers):
+    pool = make_pool(servers, health_interval=0.1).start()
+    try:
+        servers[0].down = True
+        run_batch(pool, 4, 4)
+        assert not pool.endpoints[0].healthy
+
+        servers[0].down = False
+        assert wait_until(lambda: pool.endpoints[0].healthy)
+        before = servers[0].requests
+        run_batch(pool, 6, 6)
+        assert servers[0].requests > before
+    finally:
+        pool.stop()
+
+
+def test_client_error_is_raised_without_failover(servers):
+    pool = make_pool(servers)
+    pool.endpoints[0].model = "missing"
+    with pytest.raises(urllib.error.HTTPError) as error:
+        pool.chat(MESSAGES)
+    assert error.value.code == 404
+    assert pool.endpoints[0].healthy
+    assert pool.endpoints[0].failures == 0
+    assert pool.endpoints[0].outstanding == 0
+    # 没有转给其他服务
+    assert [endpoint.requests for endpoint in pool.endpoints] == [1, 0, 0]
+
+
+class ResponseError(Exception):
+    """与 ollama.ResponseError 一样带 status_code"""
+
+    def __init__(self, error, status_code):
+        super().__init__(error)
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("error, expected", [
+    (urllib.error.HTTPError("http://x", 400, "Bad Request", None, None), True),
+    (urllib.error.HTTPError("http://x", 404, "Not Found", None, None), True),
+    (urllib.error.HTTPError("http://x", 429, "Too Many Requests", None, None), False),
+    (urllib.error.HTTPError("http://x", 503, "Service Unavailable", None, None), False),
+    (ResponseError("model not found", 404), True),
+    (ResponseError("server error", 500), False),
+    (TimeoutError("timed out"), False),
+    (ConnectionRefusedError(), False),
+])
+def test_is_client_error(error, expected):
+    assert is_client_error(error) is expected
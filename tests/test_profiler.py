@@ -0,0 +1,120 @@
+"""chat_core.profiler 的调用栈采样：按调用栈汇总、collapsed stack 输出和信号触发"""
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from chat_core import profiler
+from chat_core.profiler import Profiler
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def blocked_in_inner(release):
+    release.wait()
+
+
+def blocked_in_outer(release):
+    blocked_in_inner(release)
+
+
+@pytest.fixture
+def worker():
+    """停在 blocked_in_outer -> blocked_in_inner 中的线程"""
+    release = threading.Event()
+    thread = threading.Thread(target=blocked_in_outer, args=(release,), name="worker", daemon=True)
+    thread.start()
+    yield thread
+    release.set()
+    thread.join(timeout=5)
+
+
+def worker_stacks(sampler):
+    return {stack: count for stack, count in sampler.counts.items() if stack.startswith("worker;")}
+
+
+def test_samples_of_the_same_stack_are_aggregated(worker):
+    sampler = Profiler()
+    for _ in range(5):
+        sampler.sample()
+    assert sampler.samples == 5
+
+    stacks = worker_stacks(sampler)
+    assert len(stacks) == 1
+    (stack, count), = stacks.items()
+    assert count == 5
+    frames = stack.split(";")
+    # 从线程名到最内层函数
+    outer = frames.index(profiler.frame_label(blocked_in_outer.__code__))
+    assert frames[outer + 1] == profiler.frame_label(blocked_in_inner.__code__)
+    assert frames[-1].startswith("wait (")
+    # 采样线程自己不计入
+    assert not any(stack.startswith(threading.current_thread().name + ";") for stack in sampler.counts)
+
+
+def test_frame_label():
+    label = profiler.frame_label(blocked_in_inner.__code__)
+    line = blocked_in_inner.__code__.co_firstlineno
+    assert label == f"blocked_in_inner (tests/test_profiler.py:{line})"
+
+
+def test_summary_ranks_leaf_functions():
+    sampler = Profiler()
+    sampler.counts = {"a;f;g": 3, "b;g": 3, "a;f": 2, "c;h": 2}
+    assert sampler.summary(top=2) == "g 60%, f 20%"
+
+
+def test_run_writes_collapsed_stacks(tmp_path, worker):
+    sampler = Profiler(interval=0.01, duration=10.0, output_dir=str(tmp_path))
+    assert sampler.start(duration=10.0)
+    assert not sampler.start()  # 正在采样时忽略
+    assert wait_for(lambda: sampler.samples >= 3)
+    sampler.stop()
+    assert wait_for(lambda: not sampler.running())
+
+    lines = open(sampler.last_output, encoding="utf-8").read().splitlines()
+    assert lines == sorted(lines)
+    counts = {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in lines}
+    assert counts == sampler.counts
+    assert sum(count for stack, count in counts.items() if stack.startswith("worker;")) == sampler.samples
+
+
+def test_apply_settings_starts_only_when_enabled_changes(tmp_path, monkeypatch):
+    sampler = Profiler()
+    started = []
+    monkeypatch.setattr(sampler, "start", lambda duration=None: started.append(duration))
+    settings = {"profiler.enabled": True, "profiler.interval": 0.05, "profiler.duration": 2, "profiler.output_dir": str(tmp_path)}
+
+    sampler.apply_settings(settings)
+    assert (sampler.interval, sampler.duration, sampler.output_dir) == (0.05, 2, str(tmp_path))
+    assert len(started) == 1
+    sampler.apply_settings(settings, changed={"profiler.interval"})
+    assert len(started) == 1
+    sampler.apply_settings(settings, changed={"profiler.enabled"})
+    assert len(started) == 2
+    sampler.apply_settings(dict(settings, **{"profiler.enabled": False}), changed={"profiler.enabled"})
+    assert len(started) == 2
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="需要 SIGUSR1")
+def test_signal_starts_sampling(tmp_path):
+    previous = signal.getsignal(signal.SIGUSR1)
+    sampler = Profiler(duration=10.0, output_dir=str(tmp_path))
+    try:
+        assert sampler.install_signal()
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert wait_for(sampler.running)
+        sampler.stop()
+        assert wait_for(lambda: not sampler.running())
+        assert os.path.exists(sampler.last_output)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
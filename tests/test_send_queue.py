@@ -0,0 +1,70 @@
+"""chat_core.send_queue 的限速发送队列"""
+from chat_core.send_queue import SendQueue
+
+
+class Recorder:
+    def __init__(self, results=None):
+        self.sent = []
+        self.results = list(results or [])
+
+    def __call__(self, contact, message):
+        ok = self.results.pop(0) if self.results else True
+        if ok:
+            self.sent.append((contact, message))
+        return ok
+
+
+def test_global_rate_limits_sends():
+    queue = SendQueue(global_rate=1.0, contact_rate=10.0, contact_burst=10)
+    for i in range(3):
+        queue.put(f"联系人{i}", "你好")
+    sender = Recorder()
+    assert queue.pump(sender, now=queue.global_bucket.updated) == 1
+    assert queue.stats()["depth"] == 2
+    assert queue.next_ready_in(now=queue.global_bucket.updated) > 0
+
+
+def test_contact_rate_skips_to_other_contacts():
+    queue = SendQueue(global_rate=100.0, global_burst=10, contact_rate=0.1)
+    queue.put("张三", "一")
+    queue.put("张三", "二")
+    queue.put("李四", "三")
+    sender = Recorder()
+    queue.pump(sender)
+    assert sender.sent == [("张三", "一"), ("李四", "三")]
+    assert queue.stats()["depth_by_contact"] == {"张三": 1}
+
+
+def test_replace_pending():
+    queue = SendQueue(replace_pending=True)
+    assert queue.put("张三", "旧回复") is False
+    assert queue.put("张三", "新回复") is True
+    assert [item["message"] for item in queue.items] == ["新回复"]
+    assert queue.stats()["replaced"] == 1
+
+
+def test_failed_send_is_retried_then_dropped():
+    queue = SendQueue(global_rate=1000.0, global_burst=100, contact_rate=1000.0, contact_burst=100, max_retries=2)
+    queue.put("张三", "你好")
+    sender = Recorder([False, False, False])
+    for _ in range(3):
+        queue.pump(sender)
+    assert sender.sent == []
+    assert queue.stats()["failed"] == 1
+    assert queue.stats()["depth"] == 0
+
+
+def test_failed_send_succeeds_on_retry():
+    queue = SendQueue(global_rate=1000.0, global_burst=100, contact_rate=1000.0, contact_burst=100)
+    queue.put("张三", "你好")
+    sender = Recorder([False, True])
+    queue.pump(sender)
+    queue.pump(sender)
+    assert sender.sent == [("张三", "你好")]
+    assert queue.stats()["sent"] == 1
+
+
+def test_empty_queue():
+    queue = SendQueue()
+    assert queue.next_ready_in() is None
+    assert queue.pump(Recorder()) == 0
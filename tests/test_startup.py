@@ -0,0 +1,81 @@
+"""chat_core.startup：LazyModule 第一次访问属性时才导入，以及启动耗时报告"""
+import sys
+
+import pytest
+
+from chat_core import startup
+from chat_core.startup import LazyModule, StartupTimer
+
+
+@pytest.fixture
+def timer(monkeypatch):
+    timer = StartupTimer()
+    monkeypatch.setattr(startup, "TIMER", timer)
+    return timer
+
+
+@pytest.fixture
+def make_module(tmp_path, monkeypatch):
+    """在临时目录中写一个模块，导入时把自己的名字追加到 sys.lazy_test_imports"""
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, "lazy_test_imports", [], raising=False)
+    names = []
+
+    def make(name):
+        (tmp_path / f"{name}.py").write_text(
+            f"import sys\nsys.lazy_test_imports.append({name!r})\nVALUE = 42\n\ndef double(x):\n    return 2 * x\n",
+            encoding="utf-8",
+        )
+        names.append(name)
+        return name
+    yield make
+    for name in names:
+        sys.modules.pop(name, None)
+
+
+def test_import_is_deferred_until_first_attribute(timer, make_module):
+    name = make_module("lazy_target")
+    module = LazyModule(name)
+    assert sys.lazy_test_imports == []
+    assert name not in sys.modules
+
+    assert module.VALUE == 42
+    assert sys.lazy_test_imports == [name]
+    assert module.double(3) == 6
+    # 只导入一次，耗时记在启动报告里
+    assert sys.lazy_test_imports == [name]
+    assert name in timer.report()["imports"]
+
+
+def test_missing_module_fails_on_first_use(make_module):
+    module = LazyModule("no_such_module_for_lazy_test")
+    with pytest.raises(ImportError):
+        module.anything
+
+
+def test_already_imported_module_is_not_recorded(timer, make_module):
+    name = make_module("lazy_loaded")
+    __import__(name)
+    assert LazyModule(name).VALUE == 42
+    assert timer.report()["imports"] == {}
+
+
+def test_preload_imports_in_the_background(timer, make_module):
+    name = make_module("lazy_preloaded")
+    thread = startup.preload(name)
+    thread.join(timeout=5)
+    assert sys.lazy_test_imports == [name]
+    assert timer.imports[name][1] is True
+    assert "（后台）" in timer.format()
+    # 已经导入的模块不再启动线程，LazyModule 直接用已导入的模块
+    assert startup.preload(name) is None
+    assert LazyModule(name).VALUE == 42
+    assert sys.lazy_test_imports == [name]
+
+
+def test_first_poll_reports_once(timer):
+    timer.mark("加载配置")
+    report = timer.first_poll()
+    assert [phase for phase, _ in report["phases"]] == ["加载配置", "首次轮询"]
+    assert report["total"] >= 0
+    assert timer.first_poll() is None
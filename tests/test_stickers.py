@@ -0,0 +1,213 @@
+"""chat_core.stickers 的感知哈希索引，以及截图后端认出表情后的固定回复"""
+import json
+import os
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+import logs
+from chat_core import stickers
+from chat_core.chat_session import ChatSession
+from chat_core.message_dedup import MessageFingerprintStore
+from chat_core.stickers import Sticker, StickerIndex, StickerResponder
+
+BACKGROUND = (245, 245, 245)
+
+
+def sticker_image(variant=0, size=60):
+    """有明暗结构的合成表情，variant 不同时图案不同"""
+    image = Image.new("RGB", (60, 60), (250, 220, 80) if variant == 0 else (80, 160, 250))
+    draw = ImageDraw.Draw(image)
+    if variant == 0:
+        draw.ellipse((8, 8, 52, 52), fill=(255, 200, 0), outline=(120, 60, 0), width=3)
+        draw.ellipse((18, 20, 26, 28), fill=(40, 20, 0))
+        draw.ellipse((34, 20, 42, 28), fill=(40, 20, 0))
+        draw.arc((16, 24, 44, 46), 20, 160, fill=(120, 30, 0), width=3)
+    else:
+        draw.rectangle((5, 30, 55, 55), fill=(20, 40, 90))
+        draw.polygon([(30, 4), (56, 28), (4, 28)], fill=(230, 240, 255))
+    return image.resize((size, size), Image.LANCZOS) if size != 60 else image
+
+
+def chat_frame(sticker=None, left=True, size=(300, 200)):
+    """聊天画面，最下方是一条对方（靠左）或自己（靠右）发来的表情"""
+    frame = Image.new("RGB", size, BACKGROUND)
+    ImageDraw.Draw(frame).rectangle((20, 20, 120, 45), fill=(255, 255, 255))  # 更早的一条文字消息
+    if sticker is not None:
+        frame.paste(sticker, (20 if left else size[0] - 20 - sticker.width, 110))
+    return frame
+
+
+def write_library(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False)
+
+
+def test_phash_is_stable_under_resize_and_differs_between_images():
+    original = stickers.phash(sticker_image())
+    resized = stickers.phash(sticker_image(size=90))
+    compressed = stickers.phash(sticker_image().quantize(64).convert("RGB"))
+    other = stickers.phash(sticker_image(variant=1))
+    assert (original ^ resized).bit_count() <= 4
+    assert (original ^ compressed).bit_count() <= 4
+    assert (original ^ other).bit_count() > 16
+    assert len(stickers.format_hash(original)) == 16
+
+
+def test_index_lookup_respects_hamming_threshold():
+    base = 0x0123456789ABCDEF
+    index = StickerIndex([Sticker(base, "旺柴", "[旺柴]")], max_distance=4)
+    flip = lambda value, bits: value ^ sum(1 << bit for bit in bits)
+    assert index.lookup(base).name == "旺柴"
+    assert index.lookup(flip(base, [0, 17, 33, 63])).name == "旺柴"   # 距离 4，分散在各段
+    assert index.lookup(flip(base, [0, 1, 2, 3])).name == "旺柴"      # 距离 4，集中在一段
+    assert index.lookup(flip(base, [0, 17, 33, 50, 63])) is None      # 距离 5
+    assert (index.lookups, index.hits) == (4, 3)
+
+
+def test_index_returns_the_nearest_sticker():
+    base = 0xFFFF0000FFFF0000
+    index = StickerIndex([Sticker(base ^ 0b111, "远"), Sticker(base ^ 0b1, "近")], max_distance=4)
+    assert index.lookup(base).name == "近"
+
+
+def test_index_matches_brute_force():
+    rng = random.Random(1)
+    library = [Sticker(rng.getrandbits(64), str(i)) for i in range(200)]
+    index = StickerIndex(library, max_distance=6)
+    for _ in range(300):
+        target = rng.choice(library).hash
+        query = target
+        for bit in rng.sample(range(64), rng.randint(0, 9)):
+            query ^= 1 << bit
+        distances = [(sticker.hash ^ query).bit_count() for sticker in library]
+        found = index.lookup(query)
+        if min(distances) <= 6:
+            assert found is not None and (found.hash ^ query).bit_count() == min(distances)
+        else:
+            assert found is None
+
+
+def test_newest_incoming_crop():
+    sticker = sticker_image()
+    crop = stickers.incoming_crop(chat_frame(sticker))
+    assert crop.size == sticker.size
+    assert stickers.incoming_crop(chat_frame(sticker, left=False)) is None
+    assert stickers.newest_message_box(Image.new("RGB", (50, 50), BACKGROUND)) is None
+
+
+def test_responder_matches_and_reloads_library(tmp_path):
+    path = str(tmp_path / "stickers.json")
+    value = stickers.phash(stickers.incoming_crop(chat_frame(sticker_image())))
+    write_library(path, [{"hash": stickers.format_hash(value), "name": "笑脸", "reply": "[呲牙]"}])
+    responder = StickerResponder(path, max_distance=4, unknown_dir=str(tmp_path / "unknown"))
+
+    # 换了大小的同一个表情也能认出来
+    _, sticker, _ = responder.match(chat_frame(sticker_image(size=70)))
+    assert (sticker.name, sticker.reply) == ("笑脸", "[呲牙]")
+    assert responder.match(chat_frame(sticker_image(variant=1)))[1] is None
+
+    # 表情库修改后下一次查找时重新加载
+    other = stickers.phash(sticker_image(variant=1))
+    write_library(path, [{"hash": stickers.format_hash(other), "name": "房子", "reply": ""}])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert responder.match(chat_frame(sticker_image(variant=1)))[1].name == "房子"
+    assert responder.match(chat_frame(sticker_image()))[1] is None
+
+
+def test_unknown_stickers_are_recorded_once(tmp_path):
+    unknown_dir = str(tmp_path / "unknown")
+    responder = StickerResponder(str(tmp_path / "missing.json"), unknown_dir=unknown_dir)
+    value, sticker, crop = responder.match(chat_frame(sticker_image()))
+    assert sticker is None
+    record = responder.record_unknown(value, crop)
+    assert record["count"] == 1
+    assert os.path.exists(record["image"])
+
+    # 相近的哈希（同一个表情换了大小）只累加次数，不再保存截图
+    resized_value, _, resized_crop = responder.match(chat_frame(sticker_image(size=70)))
+    assert responder.record_unknown(resized_value, resized_crop)["count"] == 2
+    assert len(os.listdir(unknown_dir)) == 2  # 一张截图和 unknown.jsonl
+
+    # 重新启动后读回记录
+    reloaded = StickerResponder(str(tmp_path / "missing.json"), unknown_dir=unknown_dir)
+    assert reloaded.unknown[record["hash"]]["count"] == 2
+    assert reloaded.record_unknown(value, crop)["count"] == 3
+
+
+class FakeWindow:
+    """ChatSession 用到的窗口接口，复制时返回 text"""
+
+    name = "WeChat"
+
+    def __init__(self, text=""):
+        self.text = text
+        self.copies = 0
+        self.log = logs.logging()
+
+    def copy_message(self, **kwargs):
+        self.copies += 1
+        return self.text
+
+
+@pytest.fixture
+def library(tmp_path):
+    path = str(tmp_path / "stickers.json")
+    value = stickers.phash(stickers.incoming_crop(chat_frame(sticker_image())))
+    write_library(path, [{"hash": stickers.format_hash(value), "name": "笑脸", "reply": "[呲牙]"}])
+    return StickerResponder(path, unknown_dir=str(tmp_path / "unknown"))
+
+
+def make_session(library, cooldown=0.0, text=""):
+    return ChatSession(FakeWindow(text), cooldown=cooldown, dedup=MessageFingerprintStore(), stickers=library)
+
+
+def extract(session, frame):
+    session.last_image = frame
+    return session.extract_messages(frame)
+
+
+def test_known_sticker_gets_canned_reply_without_copying(library):
+    session = make_session(library)
+    messages = extract(session, chat_frame(sticker_image()))
+    assert [(m.content, m.reply) for m in messages] == [("[表情:笑脸]", "[呲牙]")]
+    assert session.window.copies == 0
+
+
+def test_same_frame_is_answered_once(library):
+    session = make_session(library)
+    frame = chat_frame(sticker_image())
+    assert extract(session, frame)
+    # 切回窗口、重绘后画面完全一样，不再回复
+    assert extract(session, frame.copy()) == []
+    # 对方又发了一次同样的表情，画面变了
+    newer = chat_frame(sticker_image())
+    ImageDraw.Draw(newer).rectangle((20, 60, 90, 80), fill=(255, 255, 255))
+    assert extract(session, newer)
+
+
+def test_sticker_reply_waits_for_cooldown(library):
+    session = make_session(library, cooldown=60.0)
+    assert extract(session, chat_frame(sticker_image()))
+    newer = chat_frame(sticker_image())
+    ImageDraw.Draw(newer).rectangle((20, 60, 90, 80), fill=(255, 255, 255))
+    assert extract(session, newer) == []
+    # 冷却中没有丢掉，保持"有变化"，冷却结束后重新取
+    assert session.had_change
+    session.last_send_time = 0
+    assert extract(session, newer)
+
+
+def test_unknown_sticker_is_recorded_when_copy_is_empty(library):
+    session = make_session(library)
+    assert extract(session, chat_frame(sticker_image(variant=1))) == []
+    assert session.window.copies == 1
+    assert len(library.unknown) == 1
+
+    # 复制到文本的消息不是表情，不记录
+    texts = make_session(library, text="你好")
+    frame = chat_frame(Image.new("RGB", (80, 24), (255, 255, 255)))
+    assert [m.content for m in extract(texts, frame)] == ["你好"]
+    assert len(library.unknown) == 1
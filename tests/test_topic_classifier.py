@@ -0,0 +1,71 @@
+"""chat_core.topic_classifier 的 Aho-Corasick 多关键词匹配"""
+import random
+
+from chat_core.topic_classifier import TopicClassifier
+
+
+def brute_force(topic_keywords, message):
+    """逐个关键词查找，作为对照"""
+    result = {}
+    for topic, words in topic_keywords.items():
+        weighted = words.items() if isinstance(words, dict) else ((word, 1.0) for word in words)
+        for word, weight in weighted:
+            if word and word in message:
+                result[topic] = result.get(topic, 0.0) + float(weight)
+    return result
+
+
+def test_overlapping_keywords_are_all_found():
+    classifier = TopicClassifier({"a": ["he"], "b": ["she"], "c": ["his"], "d": ["hers"]})
+    # "ushers" 中 she、he、hers 相互重叠，都要命中
+    assert dict(classifier.classify("ushers")) == {"a": 1.0, "b": 1.0, "d": 1.0}
+
+
+def test_failure_links_continue_from_longest_suffix():
+    classifier = TopicClassifier({"学习": ["期末考试"], "生活": ["考试焦虑"]})
+    # 读完 "期末考试" 后失配，要沿失配指针回到 "考试" 继续匹配 "考试焦虑"
+    assert dict(classifier.classify("期末考试焦虑")) == {"学习": 1.0, "生活": 1.0}
+    # 走到一半失配后从后缀重新开始
+    assert classifier.classify("期末考考试焦虑") == [("生活", 1.0)]
+
+
+def test_keyword_inside_another_keyword():
+    classifier = TopicClassifier({"长": ["考试焦虑"], "短": ["试"]})
+    assert dict(classifier.classify("考试焦虑")) == {"长": 1.0, "短": 1.0}
+
+
+def test_weights_sum_and_repeats_count_once():
+    classifier = TopicClassifier({"学习": {"考试": 1, "作业": 2}, "生活": {"心情": 2.5}})
+    assert classifier.classify("考试考试考试作业") == [("学习", 3.0)]
+    assert classifier.classify("考试前心情不好") == [("生活", 2.5), ("学习", 1.0)]
+
+
+def test_ties_prefer_the_topic_listed_first():
+    classifier = TopicClassifier({"生活": ["吃饭"], "学习": ["考试"], "工作": ["加班"]})
+    assert classifier.classify("加班考试吃饭") == [("生活", 1.0), ("学习", 1.0), ("工作", 1.0)]
+    assert classifier.best_topic("加班之后考试") == "学习"
+
+
+def test_empty_input_and_empty_keywords():
+    classifier = TopicClassifier({"学习": ["考试", ""]})
+    assert classifier.keyword_count == 1  # 空关键词被跳过
+    assert classifier.classify("") == []
+    assert classifier.best_topic("") is None
+    assert classifier.best_topic("今天天气不错") is None
+
+    empty = TopicClassifier({})
+    assert empty.classify("考试") == []
+    assert empty.best_topic("考试") is None
+
+
+def test_matches_brute_force_on_random_text():
+    rng = random.Random(0)
+    alphabet = "abc"
+    topic_keywords = {
+        f"t{i}": {"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))): rng.randint(1, 3) for _ in range(3)}
+        for i in range(5)
+    }
+    classifier = TopicClassifier(topic_keywords)
+    for _ in range(200):
+        message = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+        assert dict(classifier.classify(message)) == brute_force(topic_keywords, message)
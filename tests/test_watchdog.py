@@ -0,0 +1,85 @@
+"""chat_core.watchdog 的卡死检测，以及 main.py 回复器卡死后的重置和跳过"""
+import time
+
+from chat_core.message_backend import IncomingMessage
+from chat_core.watchdog import StallWatchdog
+from test_message_backend import make_replier, wait_for
+
+
+def test_deadlines_and_remaining():
+    watchdog = StallWatchdog({"waiting_ai": 10.0})
+    watchdog.enter("waiting_ai", now=100.0)
+    assert watchdog.remaining(now=104.0) == 6.0
+    assert not watchdog.expired(now=110.0)
+    assert watchdog.expired(now=110.5)
+    assert watchdog.remaining(now=200.0) == 0.0
+
+    # 空闲状态没有期限
+    watchdog.leave(now=200.0)
+    assert watchdog.remaining(now=1000.0) is None
+    assert not watchdog.expired(now=1000.0)
+
+
+def test_record_stall_and_skip():
+    watchdog = StallWatchdog({"sending": 5.0})
+    watchdog.enter("sending", now=0.0)
+    assert watchdog.record_stall(now=6.0) == 6.0
+    watchdog.enter("waiting_ai", now=10.0)
+    watchdog.record_stall(now=12.5)
+    watchdog.record_skip()
+
+    stats = watchdog.stats()
+    assert stats["stalls"] == {"sending": 1, "waiting_ai": 1}
+    assert stats["blocked_time"] == 8.5
+    assert stats["skipped"] == 1
+
+
+def test_recovery_does_not_wait_forever_for_the_gui_lock():
+    replier, _ = make_replier()
+    replier.stop()
+    resets = []
+    replier.ai_session.reset_state = lambda: resets.append(time.monotonic())
+
+    replier.watchdog.enter("sending")
+    with replier.gui_lock:  # 其他阶段一直占着界面
+        started = time.monotonic()
+        replier.recover_from_stall()
+        assert time.monotonic() - started < 2.0
+    assert resets == []
+    assert replier.ai_reset_pending
+    assert replier.watchdog.stats()["stalls"] == {"sending": 1}
+
+    # 下次提问前拿到锁时补上重置
+    replier.ask_ai([IncomingMessage("张三", "在吗")])
+    assert len(resets) == 1
+    assert not replier.ai_reset_pending
+
+
+def test_recovery_resets_ai_session_when_lock_is_free():
+    replier, _ = make_replier()
+    replier.stop()
+    resets = []
+    replier.ai_session.reset_state = lambda: resets.append(True)
+    replier.watchdog.enter("waiting_ai")
+    replier.recover_from_stall()
+    assert resets == [True]
+    assert not replier.ai_reset_pending
+
+
+def test_stalled_ai_is_skipped_and_later_messages_still_get_replies():
+    replier, desktop = make_replier(**{"watchdog.deadlines": {"waiting_ai": 1.0}, "watchdog.max_retries": 1})
+    ai, wechat = desktop.windows["AI"], desktop.windows["WeChat"]
+    ai.reply_delay = 100.0  # AI 一直不出回复
+    try:
+        assert wait_for(lambda: replier.wx_session.last_image is not None)
+        wechat.receive("在吗")
+        assert wait_for(lambda: replier.watchdog.skipped == 1, timeout=20.0)
+        stats = replier.watchdog.stats()
+        assert sum(stats["stalls"].values()) == 2  # 第一次卡死后重试一次，仍然卡死才跳过
+        assert wechat.sent == []
+
+        ai.reply_delay = 0.1
+        wechat.receive("还在吗")
+        assert wait_for(lambda: "回复:还在吗" in wechat.sent, timeout=20.0)
+    finally:
+        replier.stop()
@@ -0,0 +1,156 @@
+"""feature.wx_handler 的 wxauto 后端，在 feature.fake_wxauto 上运行"""
+import pytest
+
+from chat_core.send_queue import SendQueue
+from feature import fake_wxauto
+from feature.wx_handler import WxHandler
+
+
+@pytest.fixture
+def wx():
+    return fake_wxauto.WeChat()
+
+
+def test_first_send_opens_the_contacts_chat(wx):
+    wx.ChatWith("李四")  # 微信里正好打开着别人的聊天
+    handler = WxHandler(contact="张三", wx=wx)
+    assert handler.send_reply("张三", "你好")
+    assert wx.sent == [("张三", "你好")]
+    assert wx.current == "张三"
+
+
+def test_first_fetch_opens_the_contacts_chat(wx):
+    wx.ChatWith("李四")
+    wx.receive("李四", "不该读到这条")
+    handler = WxHandler(contact="张三", wx=wx)
+    assert handler.check_new_message() == (False, [])
+    wx.receive("张三", "在吗")
+    assert [message.content for message in handler.check_new_message()[1]] == ["在吗"]
+
+
+def test_queued_replies_are_not_dropped_during_cooldown(wx):
+    handler = WxHandler(contact="张三", cooldown=10.0, wx=wx)
+    queue = SendQueue(global_rate=1000.0, global_burst=10, contact_rate=1000.0, contact_burst=10, max_retries=1)
+    handler.send_reply("张三", "第一条")
+    for message in ("第二条", "第三条"):
+        queue.put("张三", message)
+    for _ in range(3):
+        queue.pump(handler.send_reply)
+
+    assert wx.sent == [("张三", "第一条"), ("张三", "第二条"), ("张三", "第三条")]
+    assert queue.stats()["failed"] == 0
+
+
+def test_direct_send_message_still_respects_cooldown(wx):
+    handler = WxHandler(contact="张三", cooldown=10.0, wx=wx)
+    assert handler.send_message("第一条", "张三")
+    assert not handler.send_message("第二条", "张三")
+    assert wx.sent == [("张三", "第一条")]
+
+
+def contents(messages):
+    return [message.content for message in messages]
+
+
+def test_cursor_advances_past_fetched_messages(wx):
+    wx.receive("张三", "旧消息")
+    handler = WxHandler(contact="张三", wx=wx)
+    # 首次获取只建立游标，不返回历史消息
+    assert handler.fetch_new_messages() == []
+    cursor = handler.cursors["张三"]
+
+    wx.receive("张三", "第一条")
+    wx.receive("张三", "第二条")
+    assert contents(handler.fetch_new_messages()) == ["第一条", "第二条"]
+    assert handler.cursors["张三"] != cursor
+    wx.receive("张三", "第三条")
+    assert contents(handler.fetch_new_messages()) == ["第三条"]
+
+
+def test_no_new_messages_keeps_cursor(wx):
+    wx.receive("张三", "旧消息")
+    handler = WxHandler(contact="张三", wx=wx)
+    handler.fetch_new_messages()
+    cursor = handler.cursors["张三"]
+    assert handler.fetch_new_messages() == []
+    assert handler.check_new_message() == (False, [])
+    assert handler.cursors["张三"] == cursor
+
+
+def test_empty_chat_then_first_message(wx):
+    handler = WxHandler(contact="张三", wx=wx)
+    assert handler.fetch_new_messages() == []
+    wx.receive("张三", "你好")
+    assert contents(handler.fetch_new_messages()) == ["你好"]
+
+
+def test_cursor_missing_from_shorter_list_resyncs_to_newest(wx):
+    for content in ("一", "二", "三"):
+        wx.receive("张三", content)
+    handler = WxHandler(contact="张三", wx=wx)
+    handler.fetch_new_messages()
+
+    # 聊天记录被清空或重新加载，列表比原来短，游标已不在其中
+    wx.chats["张三"] = []
+    wx.receive("张三", "四")
+    wx.receive("张三", "五")
+    assert contents(handler.fetch_new_messages()) == ["五"]
+    wx.receive("张三", "六")
+    assert contents(handler.fetch_new_messages()) == ["六"]
+
+
+def test_cursors_are_kept_per_contact(wx):
+    handler = WxHandler(contact="张三", wx=wx)
+    handler.fetch_new_messages()
+    handler.fetch_new_messages("李四")
+    wx.receive("张三", "张三的消息")
+    wx.receive("李四", "李四的消息")
+    assert contents(handler.fetch_new_messages("张三")) == ["张三的消息"]
+    assert contents(handler.fetch_new_messages("李四")) == ["李四的消息"]
+
+
+class Control:
+    """模拟 wxauto 消息列表中的一个控件"""
+    ControlTypeName = "ListItemControl"
+
+    def __init__(self, message):
+        self.message = message
+
+    def GetRuntimeId(self):
+        return list(self.message.id)
+
+
+class ControlWeChat(fake_wxauto.WeChat):
+    """提供消息列表控件的模拟微信，记录每次解析了哪些控件"""
+
+    def __init__(self):
+        super().__init__()
+        self.parsed = []
+
+    @property
+    def C_MsgList(self):
+        wx = self
+
+        class MsgList:
+            def GetChildren(self):
+                return [Control(message) for message in wx.GetAllMessage()]
+        return MsgList()
+
+    def _getmsgs(self, controls):
+        self.parsed.append(len(controls))
+        return [control.message for control in controls]
+
+
+def test_only_new_controls_are_parsed():
+    wx = ControlWeChat()
+    for i in range(50):
+        wx.receive("张三", f"历史{i}")
+    handler = WxHandler(contact="张三", wx=wx)
+    assert handler.fetch_new_messages() == []
+    assert wx.parsed == []  # 建立游标不需要解析
+
+    wx.receive("张三", "新消息")
+    assert contents(handler.fetch_new_messages()) == ["新消息"]
+    assert wx.parsed == [1]
+    assert handler.fetch_new_messages() == []
+    assert wx.parsed == [1]
@@ -0,0 +1,93 @@
+"""feature.wx_scheduler 按未读标记调度多个联系人，在 feature.fake_wxauto 上运行"""
+import pytest
+
+from chat_core.message_backend import create_backend
+from feature import fake_wxauto
+from feature.wx_handler import WxHandler
+from feature.wx_scheduler import WxScheduler
+
+
+@pytest.fixture
+def wx():
+    return fake_wxauto.WeChat()
+
+
+def make_scheduler(wx, contacts=("张三", "李四", "王五"), contact=None):
+    return WxScheduler(WxHandler(contact=contact, cooldown=0.0, wx=wx), list(contacts))
+
+
+def test_plan_orders_by_priority_then_unread(wx):
+    scheduler = WxScheduler(WxHandler(wx=wx), {"张三": 1, "李四": 2, "王五": 2})
+    assert scheduler.plan({"张三": 5, "李四": 1, "王五": 3}) == [("王五", 3), ("李四", 1), ("张三", 5)]
+
+
+def test_plan_puts_current_contact_first(wx):
+    scheduler = make_scheduler(wx)
+    scheduler.wx_handler.switch_contact("王五")
+    # 打开的聊天没有未读标记，也要先检查
+    assert scheduler.plan({"张三": 2}) == [("王五", 0), ("张三", 2)]
+
+
+def test_get_unread_only_reports_watched_contacts(wx):
+    scheduler = make_scheduler(wx, contacts=["张三"])
+    wx.receive("张三", "在吗")
+    wx.receive("路人", "加个好友")
+    assert scheduler.get_unread() == {"张三": 1}
+
+
+def test_receive_messages_visits_one_contact_per_call_by_priority(wx):
+    scheduler = make_scheduler(wx)
+    wx.receive("王五", "王五的消息")
+    wx.receive("李四", "李四的第一条")
+    wx.receive("李四", "李四的第二条")
+
+    first = scheduler.receive_messages()
+    assert [(m.contact, m.content) for m in first] == [("李四", "李四的第一条"), ("李四", "李四的第二条")]
+    second = scheduler.receive_messages()
+    assert [(m.contact, m.content) for m in second] == [("王五", "王五的消息")]
+    assert scheduler.receive_messages() == []
+    assert scheduler.last_status == "unchanged"
+    assert scheduler.switches == 2
+
+
+def test_first_visit_takes_only_unread_messages(wx):
+    scheduler = make_scheduler(wx)
+    wx.chats["张三"] = [fake_wxauto.FriendMessage("张三", "上周的旧消息", wx.next_id())]
+    wx.receive("张三", "今天有空吗")
+    wx.chats["张三"].append(fake_wxauto.TimeMessage("SYS", "12:30", wx.next_id()))
+    wx.receive("张三", "一起吃饭")
+
+    # 夹在中间的时间提示不占未读名额，旧消息不会被当作新消息
+    assert wx.unread["张三"] == 2
+    assert [m.content for m in scheduler.receive_messages()] == ["今天有空吗", "一起吃饭"]
+
+
+def test_messages_arriving_after_switch_away_are_not_lost(wx):
+    scheduler = make_scheduler(wx)
+    wx.receive("张三", "第一条")
+    assert [m.content for m in scheduler.receive_messages()] == ["第一条"]
+    wx.receive("李四", "插一句")
+    assert [m.contact for m in scheduler.receive_messages()] == ["李四"]
+
+    wx.receive("张三", "第二条")
+    assert [(m.contact, m.content) for m in scheduler.receive_messages()] == [("张三", "第二条")]
+
+
+def test_send_reply_switches_to_contact(wx):
+    scheduler = make_scheduler(wx)
+    wx.receive("李四", "在吗")
+    scheduler.receive_messages()
+    assert scheduler.send_reply("张三", "你好")
+    assert wx.sent == [("张三", "你好")]
+    assert scheduler.current_contact == "张三"
+
+
+def test_create_backend_schedules_multiple_listen_contacts():
+    settings = {"backend": "wxauto", "wxauto.fake": True, "listen_contacts": ["张三", "李四"], "cooldown.wx": 1.5}
+    backend = create_backend(settings)
+    assert isinstance(backend, WxScheduler)
+    assert backend.priorities == {"张三": 2, "李四": 1}
+    assert backend.cooldown == 1.5
+
+    assert isinstance(create_backend(dict(settings, listen_contacts=["张三"])), WxHandler)
+    assert isinstance(create_backend(dict(settings, **{"wxauto.contact": "张三"})), WxHandler)